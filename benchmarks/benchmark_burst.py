@@ -0,0 +1,71 @@
+"""
+Measures a burst of requests arriving at once in a warm container whose cached event has expired:
+each fetching the newest event for itself, as before, against coalescing them into a single fetch -
+and against a container a keep-warm ping has already refreshed. Each request to the stand-in
+DynamoDB takes `--latency` seconds, to stand in for the network round trip.
+
+Usage: python benchmarks/benchmark_burst.py [--sizes 1,4,16] [--latency 0.02] [--repeat 5]
+"""
+
+import common
+
+import cache
+import lambda_function
+
+from time import time
+from stand_ins import FakeClock
+from concurrent.futures import ThreadPoolExecutor
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='1,4,16', repeat=5)
+  parser.add_argument('--latency', type=float, default=0.02,
+    help='how long each request to DynamoDB takes, in seconds (default: 0.02)')
+  args = parser.parse_args()
+
+  dynamodb = common.build_event_table(1000, time())
+  dynamodb.latency = args.latency
+  lambda_function._dynamodb = dynamodb
+  lambda_function.DYNAMODB_TABLE = 'events'
+  lambda_function.DYNAMODB_INDEX = 'newest'
+  rows = []
+
+  for size in args.sizes:
+    pool = ThreadPoolExecutor(max_workers=size)
+
+    def burst(request):
+      lambda_function.event_cache = cache.TimedCache('Event', 30, 300, FakeClock())
+      list(pool.map(lambda _: request(), range(size)))
+
+    def uncoalesced():
+      lambda_function.fetch_newest_valid_event(lambda_function.DYNAMODB_PARTITION)
+
+    results = []
+    for run in (
+      lambda: burst(uncoalesced),
+      lambda: burst(lambda_function.get_newest_valid_event),
+    ):
+      dynamodb.calls.clear()
+      run()
+      requests = sum(dynamodb.calls.values())
+      results.append((common.time_call(run, args.repeat), requests))
+
+    # The ping's own refresh happens ahead of time, so only the burst after it is timed.
+    lambda_function.event_cache = cache.TimedCache('Event', 30, 300, FakeClock())
+    lambda_function.refresh_newest_valid_event(lambda_function.DYNAMODB_PARTITION)
+    dynamodb.calls.clear()
+    warm_time = common.time_call(
+      lambda: list(pool.map(lambda _: lambda_function.get_newest_valid_event(), range(size))),
+      args.repeat
+    )
+    results.append((warm_time, sum(dynamodb.calls.values()) // args.repeat))
+    pool.shutdown()
+
+    rows.append([size] + [
+      common.format_duration(timing) + ' (' + str(requests) + ' requests)'
+      for timing, requests in results
+    ])
+
+  common.print_table(['Burst', 'Each fetching', 'Coalesced', 'After a keep-warm ping'], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,136 @@
+"""
+Replays synthetic weeks of commutes through the arrival time estimator, comparing the cost of its
+O(1) update per event against re-scanning the whole trip for each event, and how close the routing,
+trip and blended estimates come to when each commute actually got home in the final week.
+
+Usage: python benchmarks/benchmark_estimator.py [--history-weeks 3] [--repeat 5] [--seed 0]
+"""
+
+import common
+
+import random
+
+import estimator
+import functions
+
+from stand_ins import make_event_item
+
+# Monday 14 January 2019, midnight in Melbourne.
+FIRST_MONDAY = 1547384400
+
+COMMUTE_DISTANCE = 30000
+EVENT_INTERVAL = 120
+
+# How fast the routing estimates assume the trip home is, and how much slower each day actually is.
+ROUTING_SPEED = 10
+DAILY_CONGESTION = (1.2, 1.3, 1.3, 1.4, 1.6)
+
+def _event(event_id, timestamp, distance_from_home, time_from_home):
+  return functions.LocationEvent(make_event_item(
+    event_id, timestamp, distance_from_home=round(distance_from_home),
+    distance_from_work=round(COMMUTE_DISTANCE - distance_from_home),
+    time_from_home=round(time_from_home)
+  ))
+
+def generate_week(week, generator):
+  """
+  Yields each weekday's commute home in a week, as a list of (event, seconds actually left to get
+  home) with an event every couple of minutes - including a wait for the train partway along.
+  """
+
+  for day, congestion in enumerate(DAILY_CONGESTION):
+    timestamp = FIRST_MONDAY + (week * 7 + day) * 86400 + 17 * 3600 + generator.randint(0, 1200)
+    speed = ROUTING_SPEED / (congestion * generator.uniform(0.9, 1.1))
+    wait_at = generator.randint(3000, 8000)
+    waited = 0
+    distance = COMMUTE_DISTANCE
+    points = []
+
+    while distance > 0:
+      points.append((timestamp, distance))
+      timestamp += EVENT_INTERVAL
+      if distance < COMMUTE_DISTANCE - wait_at and waited < 360:
+        waited += EVENT_INTERVAL
+      else:
+        distance -= speed * EVENT_INTERVAL * generator.uniform(0.7, 1.3)
+
+    arrived_at = timestamp
+    points.append((arrived_at, 0))
+
+    yield [
+      (
+        _event(str(week) + '-' + str(day) + '-' + str(index), point_time, point_distance,
+          point_distance / ROUTING_SPEED),
+        arrived_at - point_time
+      )
+      for index, (point_time, point_distance) in enumerate(points)
+    ]
+
+def rescan(trip_events):
+  """Works the trip's estimate out again from every event since it started, for comparison."""
+  trip = estimator.TripEstimator()
+  for event in trip_events:
+    trip.update(event)
+  return trip.estimate_time_from_home()
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], repeat=5)
+  parser.add_argument('--history-weeks', type=int, default=3,
+    help='how many weeks of commutes to replay before the final week (default: 3)')
+  parser.add_argument('--seed', type=int, default=0,
+    help='the seed for the synthetic commutes (default: 0)')
+  args = parser.parse_args()
+
+  generator = random.Random(args.seed)
+  weeks = [list(generate_week(week, generator)) for week in range(args.history_weeks + 1)]
+  final_week = [event for commute in weeks[-1] for event, _ in commute]
+  commute = estimator.Commute()
+
+  for week in weeks[:-1]:
+    for events in week:
+      for event, _ in events:
+        commute.update(event)
+
+  # Accuracy over the final week, of every estimate made on the way home.
+  errors = {'Routing': [], 'Trip': [], 'Blended': []}
+  following = estimator.Commute(estimator.TripEstimator(), commute.history)
+
+  for events in weeks[-1]:
+    for event, actual in events:
+      following.update(event)
+      if not following.trip.on_trip or actual == 0:
+        continue
+      trip_estimate = following.trip.estimate_time_from_home()
+      errors['Routing'].append(abs(event.time_from_home - actual))
+      if trip_estimate is not None: errors['Trip'].append(abs(trip_estimate - actual))
+      errors['Blended'].append(abs(following.estimate_time_from_home(event) - actual))
+
+  common.print_table(['Estimate', 'Estimates', 'Mean absolute error'], [
+    [name, len(values), '{:.1f} minutes'.format(sum(values) / len(values) / 60)]
+    for name, values in errors.items()
+  ])
+
+  # Cost per event of keeping the estimate up to date.
+  def incremental():
+    replayed = estimator.Commute()
+    for event in final_week:
+      replayed.update(event)
+      replayed.estimate_time_from_home(event)
+
+  def rescanned():
+    trip_events = []
+    for event in final_week:
+      if event.distance_from_work <= estimator.AT_WORK_DISTANCE: trip_events = []
+      trip_events.append(event)
+      rescan(trip_events)
+
+  timings = [common.time_call(incremental, args.repeat), common.time_call(rescanned, args.repeat)]
+  common.print_table(['Events', 'Incremental', 'Re-scanned', 'Speed-up'], [[
+    len(final_week),
+    common.format_duration(timings[0] / len(final_week)) + '/event',
+    common.format_duration(timings[1] / len(final_week)) + '/event',
+    '{:.1f}x'.format(timings[1] / timings[0]),
+  ]])
+
+if __name__ == '__main__':
+  main()
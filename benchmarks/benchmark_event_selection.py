@@ -0,0 +1,71 @@
+"""
+Compares selecting the newest valid event one event at a time (the original loop) with the batch
+columnar selector, with and without NumPy, and with the columns already extracted - as they would
+be for event history that's kept around between requests.
+
+Usage: python benchmarks/benchmark_event_selection.py [--sizes 10k,100k] [--repeat 3]
+"""
+
+import common
+
+import functions
+
+from time import time
+from stand_ins import generate_event_items
+
+def loop_newest_valid_event(events):
+  """The one-at-a-time selection that the table scan does, for comparison."""
+  newest_valid_event = None
+  newest_valid_event_timestamp = 0
+
+  for event in events:
+    timestamp = event.timestamp
+
+    if not functions.is_event_accurate_enough(event) or \
+      not functions.is_timestamp_new_enough(timestamp):
+      continue
+
+    if timestamp > newest_valid_event_timestamp:
+      newest_valid_event = event
+      newest_valid_event_timestamp = timestamp
+
+  return newest_valid_event
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='10k,100k', repeat=3)
+  args = parser.parse_args()
+
+  numpy = functions._get_numpy()
+  modes = [('array', None)] + ([('NumPy', numpy)] if numpy is not None else [])
+  rows = []
+
+  for size in args.sizes:
+    # Decode and parse every event once first, as they would be if they were kept as history.
+    events = [functions.LocationEvent(item) for item in generate_event_items(size, time())]
+    loop_newest_valid_event(events)
+
+    row = [size, common.format_duration(
+      common.time_call(lambda: loop_newest_valid_event(events), args.repeat)
+    )]
+
+    for _, module in modes:
+      functions._numpy = module
+      columns = functions.get_event_columns(events)
+      row.append(common.format_duration(
+        common.time_call(lambda: functions.select_newest_valid_event(events), args.repeat)
+      ))
+      row.append(common.format_duration(
+        common.time_call(lambda: functions.select_newest_valid_event(events, columns), args.repeat)
+      ))
+
+    functions._numpy = numpy
+    rows.append(row)
+
+  headers = ['Events', 'Loop']
+  for name, _ in modes:
+    headers += ['Batch (' + name + ')', 'Selection only (' + name + ')']
+
+  common.print_table(headers, rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,55 @@
+"""
+Compares the per-event cost of parsing event dates with the original strptime() approach, the
+fromisoformat() fast path, and the fast path with its cache warmed up by a previous scan. Sizes
+above EVENT_DATE_CACHE_SIZE show the cost of the cache when it can't help.
+
+Usage: python benchmarks/benchmark_event_timestamps.py [--sizes 10k,100k] [--repeat 3]
+"""
+
+import common
+
+import functions
+
+from time import time
+from datetime import datetime
+from stand_ins import generate_event_items
+
+def strptime_timestamp(event):
+  """The original implementation of functions.get_event_timestamp(), for comparison."""
+  event_date = event['event_date']['S']
+  if ':' == event_date[-3:-2]:
+    event_date = event_date[:-3] + event_date[-2:]
+  return datetime.strptime(event_date, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='10k,100k', repeat=3)
+  args = parser.parse_args()
+  uncached = functions.parse_event_date.__wrapped__
+  rows = []
+
+  for size in args.sizes:
+    items = list(generate_event_items(size, time()))
+
+    def cached():
+      for item in items:
+        functions.parse_event_date(item['event_date']['S'])
+
+    functions.parse_event_date.cache_clear()
+    cached() # Warm the cache up, as a previous scan in the same container would.
+
+    timings = [
+      common.time_call(lambda: [strptime_timestamp(item) for item in items], args.repeat),
+      common.time_call(lambda: [uncached(item['event_date']['S']) for item in items], args.repeat),
+      common.time_call(cached, args.repeat),
+    ]
+
+    rows.append([size] + [
+      common.format_duration(timing) + ' (' + common.format_duration(timing / size) + '/event)'
+      for timing in timings
+    ])
+
+  cache_header = 'Cached (' + str(functions.EVENT_DATE_CACHE_SIZE) + ' dates)'
+  common.print_table(['Events', 'strptime()', 'fromisoformat()', cache_header], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,132 @@
+"""
+Measures finding suburbs from coordinates with the memory-mapped suburb index, against reading them
+from the address as before and against checking every suburb's centroid. Indexes are built from
+random centroids across Victoria - which has around 3,000 suburbs and localities - and looked up
+from random points near them. Memory is the growth in resident memory after opening the index and
+looking every point up, against reading the same suburbs from a CSV into Python objects. Only the
+pages of the index that lookups touch are counted, so with random points that's most of it.
+
+Usage: python benchmarks/benchmark_geo_index.py [--sizes 100,3k,30k] [--lookups 20000] [--repeat 3]
+"""
+
+import common
+
+import os
+import random
+import shutil
+import tempfile
+
+import geo_index
+import functions
+
+from time import perf_counter
+
+# Roughly the extent of Victoria, as (south, north) latitudes and (west, east) longitudes.
+LATITUDES = (-39.1, -34.0)
+LONGITUDES = (141.0, 149.9)
+
+def get_resident_memory():
+  """The resident memory of this process in bytes, or None if it can't be read."""
+  try:
+    with open('/proc/self/statm') as file:
+      return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError):
+    return None
+
+def format_memory(size):
+  return 'n/a' if size is None else '{:.1f} KB'.format(size / 1024)
+
+def find_by_checking_everything(suburbs, latitude, longitude):
+  """Finds the nearest suburb without an index, for comparison."""
+  distance, name = min(
+    (geo_index.get_distance(latitude, longitude, suburb_latitude, suburb_longitude), name)
+    for name, suburb_latitude, suburb_longitude in suburbs
+  )
+  return name if distance < geo_index.MAX_DISTANCE_IN_METRES else None
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='100,3k,30k', repeat=3)
+  parser.add_argument('--lookups', type=int, default=20000,
+    help='how many points to look up for each measurement (default: 20000)')
+  args = parser.parse_args()
+  generator = random.Random(0)
+  rows = []
+
+  for size in args.sizes:
+    suburbs = [
+      ('Suburb ' + str(number), generator.uniform(*LATITUDES), generator.uniform(*LONGITUDES))
+      for number in range(size)
+    ]
+    points = []
+    for _ in range(args.lookups):
+      _, latitude, longitude = generator.choice(suburbs)
+      points.append((latitude + generator.uniform(-0.03, 0.03),
+        longitude + generator.uniform(-0.03, 0.03)))
+
+    directory = tempfile.mkdtemp()
+    index_filename = os.path.join(directory, 'suburbs.idx')
+    csv_filename = os.path.join(directory, 'suburbs.csv')
+
+    with open(index_filename, 'wb') as file:
+      file.write(geo_index.build_index(suburbs))
+    with open(csv_filename, 'w') as file:
+      file.write('suburb,latitude,longitude\n')
+      file.writelines(','.join(str(value) for value in suburb) + '\n' for suburb in suburbs)
+
+    before = get_resident_memory()
+    started_at = perf_counter()
+    index = geo_index.GeoIndex.open(index_filename)
+    opened = perf_counter() - started_at
+    looked_up = common.time_call(
+      lambda: [index.find_suburb(latitude, longitude) for latitude, longitude in points],
+      args.repeat
+    )
+    mapped_memory = get_resident_memory() - before if before else None
+
+    # The same suburbs read into Python objects, as if they were loaded rather than mapped.
+    before = get_resident_memory()
+    loaded = geo_index.read_suburbs(csv_filename)
+    loaded_memory = get_resident_memory() - before if before else None
+
+    # Checking every centroid is slow, so only a sample of points is timed.
+    sample = points[:max(1, min(len(points), 200000 // size))]
+    checked = common.time_call(
+      lambda: [find_by_checking_everything(suburbs, *point) for point in sample], 1
+    )
+
+    # A whole event's suburb, from its coordinates and from its address.
+    geo_index._index = index
+    with_coordinates = [
+      {'event_latitude': {'N': str(latitude)}, 'event_longitude': {'N': str(longitude)},
+        'event_address': {'S': '1 Main Street, Richmond, VIC'}}
+      for latitude, longitude in points
+    ]
+    with_address = [{'event_address': item['event_address']} for item in with_coordinates]
+    from_coordinates, from_address = [
+      common.time_call(
+        lambda: [functions.LocationEvent(item).suburb for item in items], args.repeat
+      )
+      for items in (with_coordinates, with_address)
+    ]
+
+    rows.append([
+      size, str(os.path.getsize(index_filename) // 1024) + ' KB', common.format_duration(opened),
+      common.format_duration(looked_up / len(points)),
+      '{:,.0f}/s'.format(len(points) / looked_up),
+      common.format_duration(checked / len(sample)),
+      common.format_duration(from_coordinates / len(points)),
+      common.format_duration(from_address / len(points)),
+      format_memory(mapped_memory), format_memory(loaded_memory),
+    ])
+
+    del index, loaded
+    geo_index._index = None
+    shutil.rmtree(directory, ignore_errors=True)
+
+  common.print_table([
+    'Suburbs', 'Index size', 'Open', 'Lookup', 'Throughput', 'Check every suburb',
+    'Event (coordinates)', 'Event (address)', 'Mapped memory', 'Loaded memory'
+  ], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,71 @@
+"""
+Compares the cost of reading all of someone's commutes - over the last few months, a year, or two -
+by scanning every raw event and picking the commutes out of them, against reading the compacted
+per-month history. Each request to the stand-in DynamoDB takes `--latency` seconds, to stand in for
+the network round trip.
+
+Usage: python benchmarks/benchmark_history.py [--sizes 90,365,730] [--latency 0.005] [--repeat 3]
+"""
+
+import common
+
+import history
+
+from stand_ins import FakeDynamoDB, generate_commute_items
+
+# Monday 1 January 2018, midnight in Melbourne.
+FIRST_DAY = 1514725200
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='90,365,730', repeat=3)
+  parser.add_argument('--latency', type=float, default=0.005,
+    help='how long each request to DynamoDB takes, in seconds (default: 0.005)')
+  args = parser.parse_args()
+  rows = []
+
+  for days in args.sizes:
+    dynamodb = FakeDynamoDB(latency=args.latency)
+    dynamodb.create_simple_table('events')
+    dynamodb.create_simple_table('history', hash_key='event_partition', range_key='month')
+    dynamodb.put_items('events', generate_commute_items(days, FIRST_DAY))
+    history.compact_history(dynamodb, 'events', 'history', 'events')
+
+    def scanned():
+      events_by_partition = history.scan_accurate_events(dynamodb, 'events', 'events')
+      return history.summarise_commutes(events_by_partition['events'])
+
+    def compacted():
+      return history.read_history(dynamodb, 'history', 'events', '2018-01', '2019-12')
+
+    # Both read the same commutes, so it's only the cost of getting to them that's compared.
+    assert scanned() == compacted()
+
+    results = []
+    for read in (scanned, compacted):
+      dynamodb.calls.clear()
+      dynamodb.items_read.clear()
+      read()
+      counts = (sum(dynamodb.calls.values()), sum(dynamodb.items_read.values()))
+      results.append((common.time_call(read, args.repeat),) + counts)
+
+    packed = sum(
+      len(item[history.COMMUTES_ATTRIBUTE]['B'])
+      for item in dynamodb.tables['history'].items.values()
+    )
+
+    rows.append([
+      days, len(dynamodb.tables['events'].items), len(compacted()),
+    ] + [
+      common.format_duration(timing) + ' (' + str(requests) + ' requests, ' + \
+        str(items) + ' items)'
+      for timing, requests, items in results
+    ] + [
+      str(packed) + ' bytes', '{:.1f}x'.format(results[0][0] / results[1][0]),
+    ])
+
+  common.print_table([
+    'Days', 'Events', 'Commutes', 'Scanned events', 'Compacted history', 'History size', 'Speed-up'
+  ], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,77 @@
+"""
+Reports what a cold start spends on imports, from `python -X importtime`, by importing the Lambda
+function in a series of fresh interpreters. The modules that are deferred until first use are
+measured separately, to show what each path that needs them adds.
+
+Usage: python benchmarks/benchmark_import_time.py [--repeat 5] [--top 15]
+"""
+
+import common
+
+import os
+import sys
+import subprocess
+
+from statistics import median
+
+# Modules that lambda_function only imports on the paths that need them.
+DEFERRED_MODULES = ['boto3', 'pytz', 'requests']
+
+def import_times(statement):
+  """
+  Runs a statement in a fresh interpreter with -X importtime, and returns the cumulative import
+  time in microseconds of each module it imported, keyed by name and how deeply nested it was.
+  """
+
+  output = subprocess.run(
+    [sys.executable, '-X', 'importtime', '-c', statement],
+    cwd=common.LAMBDA_DIRECTORY, env=dict(os.environ, LOGGING_LEVEL='INFO'),
+    stderr=subprocess.PIPE, check=True,
+  ).stderr.decode('utf-8')
+
+  # Lines look like `import time:  self [us] | cumulative | imported package`, where the package
+  # name is indented by two spaces for each level of nesting.
+  times = {}
+  for line in output.splitlines():
+    if not line.startswith('import time:') or 'self [us]' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    depth = (len(name) - len(name.lstrip()) - 1) // 2
+    times[(depth, name.strip())] = int(cumulative)
+
+  return times
+
+def median_time(runs, key):
+  return median(run.get(key, 0) for run in runs) / 1000000
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], repeat=5)
+  parser.add_argument('--top', type=int, default=15, help='how many modules to list')
+  args = parser.parse_args()
+
+  runs = [import_times('import lambda_function') for _ in range(args.repeat)]
+
+  print('Cold import of lambda_function: ' + \
+    common.format_duration(median_time(runs, (0, 'lambda_function'))))
+  print()
+
+  # The modules imported directly by lambda_function, or by the modules it imports.
+  nested = [key for key in runs[0] if key[0] in (1, 2)]
+  slowest = sorted(nested, key=lambda key: -median_time(runs, key))[:args.top]
+  common.print_table(['Module', 'Cumulative'], [
+    ['  ' * (key[0] - 1) + key[1], common.format_duration(median_time(runs, key))]
+    for key in slowest
+  ])
+
+  # What each deferred module adds when it's first used, on top of what's already imported.
+  rows = []
+  for module in DEFERRED_MODULES:
+    deferred_runs = [
+      import_times('import lambda_function, ' + module) for _ in range(args.repeat)
+    ]
+    rows.append([module, common.format_duration(median_time(deferred_runs, (0, module)))])
+
+  common.print_table(['Deferred module', 'Added when first used'], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,271 @@
+"""
+Drives lambda_handler end to end with the recorded Alexa envelopes in benchmarks/envelopes, against
+an in-process DynamoDB stand-in seeded with synthetic events and a local Metro Trains stand-in, and
+reports latency percentiles for cold and warm starts along with where the time went.
+
+The day and time checks are skipped, so that the location lookup runs whenever this is run.
+
+Usage: python benchmarks/benchmark_lambda_handler.py [--events 5k] [--invocations 100]
+  [--cold-starts 3] [--index] [--metro-latency 0.05] [--dynamodb-latency 0] [--metrics]
+"""
+
+import common
+
+import io
+import os
+import sys
+import json
+import argparse
+import contextlib
+import threading
+import subprocess
+
+from time import time, perf_counter
+from statistics import mean, median
+from collections import defaultdict
+from stand_ins import FakeMetroTrainsServer
+
+# The Metro Trains line the stand-in reports a suspension on, so the train status is always read.
+METRO_TRAINS_LINE_ID = '86'
+
+class StageTimer:
+  """
+  Times the calls made to functions wrapped with wrap(), as named stages. Time spent in a nested
+  stage is only counted against that stage, so the stages of an invocation add up to its total.
+  """
+
+  def __init__(self):
+    self.totals = defaultdict(float)
+    self.lock = threading.Lock()
+    self.local = threading.local()
+
+  def wrap(self, owner, name, stage):
+    original = getattr(owner, name)
+
+    def timed(*args, **kwargs):
+      stack = self.local.__dict__.setdefault('stack', [])
+      stack.append(0)
+      started_at = perf_counter()
+
+      try:
+        return original(*args, **kwargs)
+      finally:
+        elapsed = perf_counter() - started_at
+        nested = stack.pop()
+        if stack: stack[-1] += elapsed
+        with self.lock:
+          self.totals[stage] += elapsed - nested
+
+    setattr(owner, name, timed)
+
+  def take(self):
+    """Returns the time spent in each stage since the last call, and starts counting again."""
+    with self.lock:
+      totals = dict(self.totals)
+      self.totals.clear()
+    return totals
+
+def configure_environment(args, endpoint):
+  """Sets the configuration lambda_function reads when it's imported."""
+  os.environ['DYNAMODB_TABLE'] = 'events'
+  os.environ['TIMEZONE'] = 'Australia/Melbourne'
+  os.environ['METRO_TRAINS_LINE_ID'] = METRO_TRAINS_LINE_ID
+  os.environ['METRO_TRAINS_ENDPOINT'] = endpoint
+  if args.index: os.environ['DYNAMODB_INDEX'] = 'newest'
+  if args.metrics: os.environ['METRICS_NAMESPACE'] = 'WhereIsTimBenchmark'
+
+def prepare_lambda_function(lambda_function, args):
+  lambda_function._dynamodb = common.build_event_table(
+    args.events, time(), args.dynamodb_latency, with_index=args.index
+  )
+  lambda_function.maybe_get_invalid_date_response = lambda now, templates=None: False
+
+def clear_caches(lambda_function):
+  import functions
+  lambda_function.event_cache.clear()
+  functions.get_metro_trains_client().cache.clear()
+
+def time_stages(lambda_function):
+  """Wraps each stage of handling a request in a StageTimer, and returns the timer."""
+  import events
+  import functions
+  from ask_sdk_core.skill import CustomSkill
+  from ask_sdk_core.serialize import DefaultSerializer
+
+  timer = StageTimer()
+  timer.wrap(DefaultSerializer, 'deserialize', 'Deserialize & serialize')
+  timer.wrap(DefaultSerializer, 'serialize', 'Deserialize & serialize')
+  timer.wrap(CustomSkill, 'invoke', 'Skill dispatch')
+  timer.wrap(lambda_function.GetLocationHandler, 'handle', 'Speech build')
+  timer.wrap(lambda_function, 'get_speech_text_response', 'Speech build')
+  timer.wrap(lambda_function, 'get_location_speech_text_response', 'Speech build')
+  timer.wrap(lambda_function, 'get_newest_valid_event', 'Event lookup')
+  timer.wrap(events, 'query_newest_valid_event', 'DynamoDB read')
+  timer.wrap(events, 'scan_newest_valid_event', 'DynamoDB read')
+  timer.wrap(functions, 'parse_event_date', 'Date parsing')
+  timer.wrap(lambda_function, 'get_train_line_data', 'Train fetch wait')
+  timer.wrap(functions, 'get_metro_trains_line_data', 'Train fetch (background)')
+  return timer
+
+def invoke(lambda_function, envelope):
+  """Calls lambda_handler, keeping the metrics it may write to stdout out of the results."""
+  with contextlib.redirect_stdout(io.StringIO()) as output:
+    lambda_function.lambda_handler(envelope, None)
+  return output.getvalue()
+
+def run_cold_start(args):
+  """
+  Runs in a fresh interpreter: imports the Lambda function and handles two requests, printing how
+  long each step took as JSON for the parent process to collect.
+  """
+
+  envelope = json.loads(common.load_envelope('get_location'))
+
+  started_at = perf_counter()
+  import lambda_function
+  import_time = perf_counter() - started_at
+
+  prepare_lambda_function(lambda_function, args)
+
+  timings = {'import': import_time}
+  for invocation in ('first', 'second'):
+    started_at = perf_counter()
+    invoke(lambda_function, envelope)
+    timings[invocation] = perf_counter() - started_at
+
+  # The stand-in replaces the boto3 client, so creating the real one is timed separately.
+  started_at = perf_counter()
+  from boto3 import client
+  client('dynamodb', region_name='us-east-1')
+  timings['dynamodb_client'] = perf_counter() - started_at
+
+  print(json.dumps(timings))
+
+def run_warm(lambda_function, envelope, invocations, cold_caches=False, timer=None):
+  """
+  Invokes lambda_handler repeatedly, returning the duration and stage timings of each call, and the
+  metrics written by the last one.
+  """
+
+  durations = []
+  stages = []
+  output = None
+
+  for _ in range(invocations):
+    if cold_caches: clear_caches(lambda_function)
+    if timer: timer.take()
+
+    started_at = perf_counter()
+    output = invoke(lambda_function, envelope)
+    durations.append(perf_counter() - started_at)
+
+    if timer: stages.append(timer.take())
+
+  return durations, stages, output
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument('--events', type=lambda text: common.parse_sizes(text)[0], default=5000,
+    help='how many synthetic events to seed the table with, eg. 10k (default: 5k)')
+  parser.add_argument('--invocations', type=int, default=100,
+    help='how many warm invocations to make in each scenario (default: 100)')
+  parser.add_argument('--cold-starts', type=int, default=3,
+    help='how many fresh interpreters to time cold starts in (default: 3)')
+  parser.add_argument('--index', action='store_true',
+    help='query the event index, instead of scanning the table')
+  parser.add_argument('--metro-latency', type=float, default=0.05,
+    help='seconds the Metro Trains stand-in takes to respond (default: 0.05)')
+  parser.add_argument('--dynamodb-latency', type=float, default=0,
+    help='seconds the DynamoDB stand-in takes to respond to each request (default: 0)')
+  parser.add_argument('--metrics', action='store_true',
+    help='record metrics, as if METRICS_NAMESPACE was set, to measure their overhead')
+  parser.add_argument('--cold-start', action='store_true', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.cold_start:
+    return run_cold_start(args)
+
+  with FakeMetroTrainsServer(latency=args.metro_latency) as metro_trains:
+    configure_environment(args, metro_trains.endpoint)
+
+    print(str(args.events) + ' events, read with a ' + ('query' if args.index else 'scan') + \
+      '. Metro Trains latency: ' + common.format_duration(args.metro_latency) + \
+      ', DynamoDB latency: ' + common.format_duration(args.dynamodb_latency) + '.')
+    print()
+
+    cold_starts = [
+      json.loads(subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--cold-start'] + sys.argv[1:],
+        cwd=common.LAMBDA_DIRECTORY,
+      ).decode('utf-8'))
+      for _ in range(args.cold_starts)
+    ]
+
+    if cold_starts:
+      common.print_table(
+        ['Cold start', 'Import', 'First invocation', 'DynamoDB client', 'Second invocation'],
+        [['Median'] + [
+          common.format_duration(median(run[step] for run in cold_starts))
+          for step in ('import', 'first', 'dynamodb_client', 'second')
+        ]]
+      )
+
+    import lambda_function
+    prepare_lambda_function(lambda_function, args)
+    timer = time_stages(lambda_function)
+
+    scenarios = [
+      ('GetLocation, warm caches', 'get_location', False),
+      ('GetLocation, cold caches', 'get_location', True),
+      ('LaunchRequest, warm caches', 'launch_request', False),
+    ]
+
+    rows = []
+    breakdowns = []
+    metrics_output = None
+
+    for name, envelope_name, cold_caches in scenarios:
+      envelope = json.loads(common.load_envelope(envelope_name))
+      durations, stages, output = run_warm(
+        lambda_function, envelope, args.invocations, cold_caches, timer
+      )
+      if cold_caches: metrics_output = output
+
+      rows.append([name] + [
+        common.format_duration(value) for value in (
+          common.percentile(durations, 50), common.percentile(durations, 95),
+          common.percentile(durations, 99), mean(durations),
+        )
+      ])
+
+      # Anything not covered by a stage is listed as other, which includes the SDK's JSON handling.
+      for duration, stage in zip(durations, stages):
+        foreground = sum(value for key, value in stage.items() if 'background' not in key)
+        stage['Other'] = max(0, duration - foreground)
+
+      breakdowns.append(stages)
+
+    common.print_table(['Warm invocations', 'p50', 'p95', 'p99', 'Mean'], rows)
+
+    stage_names = sorted(
+      {stage for stages in breakdowns for timings in stages for stage in timings},
+      key=lambda stage: ('background' in stage, stage == 'Other', stage)
+    )
+
+    common.print_table(
+      ['Median per stage'] + [name for name, _, _ in scenarios],
+      [
+        [stage] + [
+          common.format_duration(median(timings.get(stage, 0) for timings in stages))
+          for stages in breakdowns
+        ]
+        for stage in stage_names
+      ]
+    )
+
+    if args.metrics:
+      print('Metrics from the last invocation with cold caches:')
+      print(metrics_output)
+
+if __name__ == '__main__':
+  main()
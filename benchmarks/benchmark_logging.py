@@ -0,0 +1,105 @@
+"""
+Compares the per-invocation overhead of the request and response logging interceptors: the
+original ones, which always encoded with jsonpickle, against the current ones, which only encode
+when the log will be written - at INFO and DEBUG levels, and with 1 in LOG_SAMPLE_RATE sampling.
+
+Usage: python benchmarks/benchmark_logging.py [--sizes 1k,10k] [--repeat 3] [--sample-rate 100]
+"""
+
+import common
+
+import io
+import logging
+import warnings
+import functions
+import lambda_function
+
+from ask_sdk_core.response_helper import ResponseFactory
+from ask_sdk_core.attributes_manager import AttributesManager
+
+try:
+  import jsonpickle
+except ImportError:
+  jsonpickle = None
+
+class OriginalRequestLogger:
+  """The original RequestLogger, for comparison."""
+  def process(self, handler_input):
+    lambda_function.logger.debug("Alexa Request: " + \
+      jsonpickle.pickler.encode(handler_input.request_envelope.request, unpicklable=False))
+
+class OriginalResponseLogger:
+  """The original ResponseLogger, for comparison."""
+  def process(self, handler_input, response):
+    lambda_function.logger.debug("Alexa Response: " + \
+      jsonpickle.pickler.encode(response, unpicklable=False))
+
+def run_interceptors(handler_input, response, request_logger, response_logger, invocations):
+  for _ in range(invocations):
+    # Each invocation gets its own request attributes, as it would from the skill.
+    handler_input.attributes_manager = AttributesManager(handler_input.request_envelope)
+    request_logger.process(handler_input)
+    response_logger.process(handler_input, response)
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='1k,10k', repeat=3)
+  parser.add_argument('--sample-rate', type=int, default=100,
+    help='the LOG_SAMPLE_RATE to benchmark sampling with (default: 100)')
+  args = parser.parse_args()
+
+  # Newer jsonpickle releases warn about a future change in defaults on every call.
+  warnings.simplefilter('ignore', DeprecationWarning)
+
+  # Logs are formatted into memory, so the cost of writing them is included but not the I/O.
+  stream = io.StringIO()
+  lambda_function.logger.handlers = [logging.StreamHandler(stream)]
+  lambda_function.logger.propagate = False
+
+  handler_input = common.make_handler_input(common.load_envelope('get_location'))
+  response = ResponseFactory().speak('Tim is currently in Box Hill, about 15 kilometres from ' + \
+    'home and 2 kilometres from work.').set_should_end_session(True).response
+
+  encoded_request = functions.json_encode(handler_input.request_envelope.request)
+  print('Encoded request size: ' + str(len(encoded_request)) + ' bytes with json_encode' + (
+    ', ' + str(len(jsonpickle.pickler.encode(handler_input.request_envelope.request,
+    unpicklable=False))) + ' bytes with jsonpickle' if jsonpickle else ''))
+  print()
+
+  original = (OriginalRequestLogger(), OriginalResponseLogger())
+  current = (lambda_function.RequestLogger(), lambda_function.ResponseLogger())
+
+  scenarios = [
+    ('Current, INFO', logging.INFO, 0, current),
+    ('Current, DEBUG', logging.DEBUG, 0, current),
+    ('Current, INFO, 1 in ' + str(args.sample_rate), logging.INFO, args.sample_rate, current),
+  ]
+
+  if jsonpickle:
+    scenarios = [
+      ('Original, INFO', logging.INFO, 0, original),
+      ('Original, DEBUG', logging.DEBUG, 0, original),
+    ] + scenarios
+  else:
+    print('jsonpickle is not installed, so the original interceptors are not being compared.')
+    print()
+
+  rows = []
+
+  for size in args.sizes:
+    for name, level, sample_rate, interceptors in scenarios:
+      lambda_function.logger.setLevel(level)
+      lambda_function.LOG_SAMPLE_RATE = sample_rate
+
+      timing = common.time_call(
+        lambda: run_interceptors(handler_input, response, *interceptors, size), args.repeat
+      )
+
+      stream.seek(0)
+      stream.truncate()
+
+      rows.append([size, name, common.format_duration(timing / size)])
+
+  common.print_table(['Invocations', 'Interceptors', 'Overhead per invocation'], rows)
+
+if __name__ == '__main__':
+  main()
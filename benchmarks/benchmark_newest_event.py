@@ -0,0 +1,55 @@
+"""
+Compares the cost of finding the newest valid event by scanning the table, and by querying the
+keyed event index, as the table grows - and reading the current event record kept by ingest.py,
+which doesn't grow at all.
+
+Usage: python benchmarks/benchmark_newest_event.py [--sizes 10k,100k,1M] [--repeat 5]
+"""
+
+import common
+
+import events
+
+from time import time
+
+def main():
+  args = common.argument_parser(__doc__.strip().splitlines()[0]).parse_args()
+  rows = []
+
+  for size in args.sizes:
+    dynamodb = common.build_event_table(size, time())
+
+    scan_time = common.time_call(
+      lambda: events.scan_newest_valid_event(dynamodb, 'events'), args.repeat
+    )
+    scan_items = dynamodb.items_read['Scan'] // args.repeat
+
+    query_time = common.time_call(
+      lambda: events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events'), args.repeat
+    )
+    query_items = dynamodb.items_read['Query'] // args.repeat
+
+    # The current event record, as ingest.py would have kept it.
+    dynamodb.create_simple_table('current', hash_key=events.EVENT_PARTITION_ATTRIBUTE)
+    newest_item = dynamodb.query(
+      TableName='events', IndexName='newest', ScanIndexForward=False, Limit=1,
+      KeyConditionExpression='event_partition = :partition',
+      ExpressionAttributeValues={':partition': {'S': 'events'}},
+    )['Items'][0]
+    events.put_current_event(dynamodb, 'current', 'events', newest_item)
+
+    current_time = common.time_call(
+      lambda: events.get_current_event(dynamodb, 'current', 'events'), args.repeat
+    )
+
+    rows.append([
+      size, common.format_duration(scan_time), scan_items,
+      common.format_duration(query_time), query_items, common.format_duration(current_time),
+    ])
+
+  common.print_table(
+    ['Items', 'Scan', 'Items read', 'Query', 'Items read', 'Current event GetItem'], rows
+  )
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,84 @@
+"""
+Compares the cost of looking up one person's newest event as more people share the events table:
+querying the event index for their partition, scanning the table for their events, and the warm
+container's shared event cache - both when it holds everyone, and when it's too small to. Times are
+per lookup, with everyone asked about in turn.
+
+Usage: python benchmarks/benchmark_people.py [--sizes 1,10,100] [--events 200] [--repeat 3]
+"""
+
+import common
+
+import events
+import lambda_function
+
+from time import time
+from stand_ins import FakeDynamoDB, generate_event_items
+
+def build_shared_table(people, events_per_person, now):
+  """Builds a table of events for `people` people, each in their own partition of the index."""
+
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('events')
+  dynamodb.add_index(
+    'events', 'newest', events.EVENT_PARTITION_ATTRIBUTE, events.EVENT_TIMESTAMP_ATTRIBUTE
+  )
+
+  for person in range(people):
+    partition = 'person-' + str(person)
+    items = list(generate_event_items(events_per_person, now, seed=person))
+    for item in items:
+      item['eventId'] = {'S': partition + '-' + item['eventId']['S']}
+      item.update(events.get_index_attributes(item, partition))
+    dynamodb.put_items('events', items)
+
+  dynamodb.tables['events'].sorted_partitions('newest')
+  return dynamodb
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='1,10,100', repeat=3)
+  parser.add_argument('--events', type=int, default=200,
+    help='how many events each person has in the table (default: 200)')
+  args = parser.parse_args()
+
+  lambda_function.logger.disabled = True
+  lambda_function.DYNAMODB_TABLE = 'events'
+  lambda_function.people_registry.partitioned = True
+  rows = []
+
+  for people in args.sizes:
+    lambda_function._dynamodb = build_shared_table(people, args.events, time())
+    partitions = ['person-' + str(person) for person in range(people)]
+
+    def look_up_everyone():
+      for partition in partitions:
+        lambda_function.get_newest_valid_event(partition)
+
+    def read_everyone(index):
+      lambda_function.DYNAMODB_INDEX = index
+      for partition in partitions:
+        lambda_function.read_newest_valid_event(partition)
+
+    timings = [
+      common.time_call(lambda: read_everyone('newest'), args.repeat),
+      common.time_call(lambda: read_everyone(None), args.repeat),
+    ]
+
+    # The cache is warmed up by a first round of requests, as it would be in a busy container.
+    lambda_function.DYNAMODB_INDEX = 'newest'
+    for max_entries in (people, max(1, people // 2)):
+      lambda_function.event_cache.clear()
+      lambda_function.event_cache.max_entries = max_entries
+      look_up_everyone()
+      timings.append(common.time_call(look_up_everyone, args.repeat))
+
+    rows.append([people, people * args.events] + [
+      common.format_duration(timing / people) for timing in timings
+    ])
+
+  common.print_table([
+    'People', 'Events', 'Index query', 'Partition scan', 'Cache (everyone)', 'Cache (half)'
+  ], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,69 @@
+"""
+Compares the per-event cost of making distances and times readable by building each one from
+scratch, as originally done, against looking them up once built - one at a time, and a whole
+column of events at once with the batch formatters.
+
+Usage: python benchmarks/benchmark_readable_formatting.py [--sizes 10k,100k] [--repeat 5]
+"""
+
+import common
+
+import functions
+
+from time import time
+from stand_ins import generate_event_items
+
+def built_distance(distance):
+  """The original implementation of functions.get_readable_distance_from_metres(), for comparison."""
+  if distance < 950:
+    return str(round(distance)) + 'm'
+  else:
+    return str(round(distance / 1000)) + 'km'
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='10k,100k', repeat=5)
+  args = parser.parse_args()
+  rows = []
+
+  for size in args.sizes:
+    columns = functions.get_event_columns(
+      generate_event_items(size, time()), ('distance_from_home', 'time_from_home')
+    )
+    distances = columns['distance_from_home']
+    times = columns['time_from_home']
+
+    # Events give their times in whole seconds.
+    distances_list = distances.tolist()
+    times_list = [int(seconds) for seconds in times.tolist()]
+
+    def original():
+      for distance, seconds in zip(distances_list, times_list):
+        built_distance(distance)
+        functions._build_readable_time(seconds)
+
+    def looked_up():
+      for distance, seconds in zip(distances_list, times_list):
+        functions.get_readable_distance_from_metres(distance)
+        functions.get_readable_time_from_seconds(seconds)
+
+    def batch():
+      functions.get_readable_distances_from_metres(distances)
+      functions.get_readable_times_from_seconds(times)
+
+    looked_up() # Fill the tables in, as earlier requests in the same container would.
+
+    timings = [
+      common.time_call(original, args.repeat),
+      common.time_call(looked_up, args.repeat),
+      common.time_call(batch, args.repeat),
+    ]
+
+    rows.append([size] + [
+      common.format_duration(timing) + ' (' + common.format_duration(timing / size) + '/event)'
+      for timing in timings
+    ] + ['{:.1f}x'.format(timings[0] / timings[1])])
+
+  common.print_table(['Events', 'Built', 'Looked up', 'Batch', 'Speed-up'], rows)
+
+if __name__ == '__main__':
+  main()
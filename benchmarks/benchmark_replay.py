@@ -0,0 +1,86 @@
+"""
+Measures replaying what the skill would have said every 10 minutes of each weekday evening, from
+exports of `--sizes` days of commutes for two people, split into monthly files - read in one process,
+and across a pool of `--processes`. Memory is the growth in peak resident memory while replaying in
+one process, against the size of the exports it read.
+
+Usage: python benchmarks/benchmark_replay.py [--sizes 90,365,730] [--processes 4] [--repeat 3]
+"""
+
+import common
+
+import os
+import json
+import shutil
+import resource
+import tempfile
+
+import replay
+
+from datetime import date, timedelta
+from stand_ins import generate_commute_items
+
+# Monday 1 January 2018, midnight in Melbourne.
+FIRST_DAY = 1514725200
+
+def get_peak_memory():
+  """The peak resident memory of this process so far, in bytes (on Linux, where it's in KB)."""
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def write_exports(directory, days):
+  """Writes each month of events as its own DynamoDB export file, returning their names."""
+
+  files = {}
+  for seed, partition in enumerate(('tim', 'sam')):
+    for item in generate_commute_items(days, FIRST_DAY, partition, seed=seed):
+      month = item['event_date']['S'][:7]
+      if month not in files:
+        files[month] = open(os.path.join(directory, month + '.json'), 'w')
+      files[month].write(json.dumps({'Item': item}) + '\n')
+
+  for file in files.values():
+    file.close()
+
+  return sorted(file.name for file in files.values())
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='90,365,730', repeat=3)
+  parser.add_argument('--processes', type=int, default=os.cpu_count(),
+    help='how many processes to read files across (default: one per CPU)')
+  args = parser.parse_args()
+  rows = []
+
+  for days in args.sizes:
+    directory = tempfile.mkdtemp()
+    exports = write_exports(directory, days)
+    size = sum(os.path.getsize(filename) for filename in exports)
+    first_day = date(2018, 1, 1)
+    moments = replay.get_moments(first_day, first_day + timedelta(days=days - 1))
+
+    def replayed(processes):
+      newest, counts = replay.process_files(exports, moments, processes=processes)
+      said = sum(1 for _ in replay.replay(newest, ['tim', 'sam'], moments))
+      return counts['items'], said
+
+    before = get_peak_memory()
+    items, said = replayed(1)
+    grown = get_peak_memory() - before
+
+    one_process = common.time_call(lambda: replayed(1), args.repeat)
+    pool = common.time_call(lambda: replayed(args.processes), args.repeat)
+
+    rows.append([
+      days, len(exports), items, '{:.1f} MB'.format(size / 1024 / 1024), said,
+      common.format_duration(one_process), common.format_duration(pool),
+      '{:,.0f}/s'.format(items / pool), '{:.1f} MB'.format(grown / 1024 / 1024),
+    ])
+
+    shutil.rmtree(directory, ignore_errors=True)
+
+  common.print_table([
+    'Days', 'Files', 'Items', 'Export size', 'Moments replayed', '1 process',
+    str(args.processes) + ' processes', 'Throughput', 'Memory growth'
+  ], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,48 @@
+"""
+Measures the wall-clock time of a full paginated scan for the newest valid event, against table
+size and the number of parallel scan segments.
+
+Each DynamoDB request waits for a simulated network round trip (--latency), which is the part of a
+real scan that parallel segments are able to overlap.
+
+Usage: python benchmarks/benchmark_scan_segments.py [--sizes 10k,100k] [--segments 1,2,4,8]
+"""
+
+import common
+
+import events
+
+from time import time
+from stand_ins import FakeDynamoDB, generate_event_items
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='10k,100k', repeat=3)
+  parser.add_argument('--segments', type=common.parse_sizes, default=[1, 2, 4, 8],
+    help='comma-separated segment counts to compare (default: 1,2,4,8)')
+  parser.add_argument('--latency', type=float, default=0.02,
+    help='simulated round trip per DynamoDB request, in seconds (default: 0.02)')
+  args = parser.parse_args()
+
+  rows = []
+
+  for size in args.sizes:
+    dynamodb = FakeDynamoDB(latency=args.latency)
+    dynamodb.create_simple_table('events')
+    dynamodb.put_items('events', generate_event_items(size, time()))
+
+    # Count the pages a single unsegmented scan reads, before timing anything.
+    events.scan_newest_valid_event(dynamodb, 'events')
+    row = [size, dynamodb.calls['Scan']]
+
+    for segments in args.segments:
+      row.append(common.format_duration(common.time_call(
+        lambda: events.scan_newest_valid_event(dynamodb, 'events', segments), args.repeat
+      )))
+
+    rows.append(row)
+
+  headers = ['Items', 'Pages'] + [str(segments) + ' segment(s)' for segments in args.segments]
+  common.print_table(headers, rows)
+
+if __name__ == '__main__':
+  main()
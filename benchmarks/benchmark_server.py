@@ -0,0 +1,133 @@
+"""
+Load-tests server.py locally: serves the skill against an in-process DynamoDB stand-in seeded with
+synthetic events and a local Metro Trains stand-in, then sends the recorded GetLocation envelope
+from `--sizes` concurrent keep-alive connections, and reports requests per second and latency. The
+cached event is cleared every `--cache-every` requests, so some requests go to DynamoDB. Invoking
+lambda_handler one request at a time - as each Lambda container does - is measured for comparison.
+
+The load is generated in the same process as the server, so the numbers are for comparing
+concurrency levels rather than for predicting a real deployment.
+
+Usage: python benchmarks/benchmark_server.py [--sizes 1,8,32] [--requests 2000] [--workers 16]
+  [--dynamodb-latency 0.005] [--metro-latency 0.05] [--cache-every 50]
+"""
+
+import common
+
+import os
+import io
+import json
+import asyncio
+import contextlib
+
+from time import time, perf_counter
+from stand_ins import FakeMetroTrainsServer
+
+def configure(lambda_function, args):
+  lambda_function._dynamodb = common.build_event_table(
+    1000, time(), args.dynamodb_latency, with_index=True
+  )
+  lambda_function.maybe_get_invalid_date_response = lambda now, templates=None: False
+
+async def send_requests(port, body, count, latencies, clear_cache):
+  """Sends `count` requests over one keep-alive connection, recording each one's latency."""
+
+  reader, writer = await asyncio.open_connection('127.0.0.1', port)
+  request = (
+    'POST / HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n' + \
+    'Content-Length: ' + str(len(body)) + '\r\n\r\n'
+  ).encode('latin-1') + body
+
+  for _ in range(count):
+    clear_cache()
+    started_at = perf_counter()
+    writer.write(request)
+    status = await reader.readline()
+    length = 0
+    while True:
+      line = await reader.readline()
+      if line == b'\r\n': break
+      if line.lower().startswith(b'content-length:'): length = int(line.split(b':')[1])
+    await reader.readexactly(length)
+    latencies.append(perf_counter() - started_at)
+    assert status.split()[1] == b'200', status
+
+  writer.close()
+
+async def load_test(server, body, connections, requests, clear_cache):
+  port = await server.start('127.0.0.1', 0)
+  latencies = []
+  started_at = perf_counter()
+
+  await asyncio.gather(*[
+    send_requests(port, body, requests // connections, latencies, clear_cache)
+    for _ in range(connections)
+  ])
+
+  elapsed = perf_counter() - started_at
+  await server.shutdown(timeout=5)
+  return len(latencies) / elapsed, latencies
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='1,8,32', repeat=1)
+  parser.add_argument('--requests', type=int, default=2000,
+    help='how many requests to send at each concurrency (default: 2000)')
+  parser.add_argument('--workers', type=int, default=16,
+    help='how many requests the server handles at once (default: 16)')
+  parser.add_argument('--dynamodb-latency', type=float, default=0.005,
+    help='seconds the DynamoDB stand-in takes to respond to each request (default: 0.005)')
+  parser.add_argument('--metro-latency', type=float, default=0.05,
+    help='seconds the Metro Trains stand-in takes to respond (default: 0.05)')
+  parser.add_argument('--cache-every', type=int, default=50,
+    help='how often to clear the cached event, in requests (default: 50)')
+  args = parser.parse_args()
+
+  with FakeMetroTrainsServer(latency=args.metro_latency) as metro_trains:
+    os.environ['DYNAMODB_TABLE'] = 'events'
+    os.environ['DYNAMODB_INDEX'] = 'newest'
+    os.environ['TIMEZONE'] = 'Australia/Melbourne'
+    os.environ['METRO_TRAINS_LINE_ID'] = '86'
+    os.environ['METRO_TRAINS_ENDPOINT'] = metro_trains.endpoint
+
+    import server
+    import lambda_function
+    configure(lambda_function, args)
+
+    body = common.load_envelope('get_location').encode('utf-8')
+    sent = [0]
+
+    def clear_cache():
+      sent[0] += 1
+      if sent[0] % args.cache_every == 0:
+        lambda_function.event_cache.clear()
+
+    # One request at a time, as a Lambda container handles them.
+    envelope = json.loads(body)
+    latencies = []
+    started_at = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+      for _ in range(args.requests):
+        clear_cache()
+        request_started_at = perf_counter()
+        lambda_function.lambda_handler(envelope, None)
+        latencies.append(perf_counter() - request_started_at)
+    rate = args.requests / (perf_counter() - started_at)
+    rows = [['lambda_handler', 1, '{:,.0f}'.format(rate)] + [
+      common.format_duration(common.percentile(latencies, percentile)) for percentile in (50, 99)
+    ]]
+
+    for connections in args.sizes:
+      testable = server.SkillServer(
+        server.create_dispatcher(verify=False), workers=args.workers, stats_interval=0
+      )
+      rate, latencies = server.run(
+        load_test(testable, body, connections, args.requests, clear_cache)
+      )
+      rows.append(['server.py', connections, '{:,.0f}'.format(rate)] + [
+        common.format_duration(common.percentile(latencies, percentile)) for percentile in (50, 99)
+      ])
+
+  common.print_table(['Handled by', 'Connections', 'Requests/s', 'p50', 'p99'], rows)
+
+if __name__ == '__main__':
+  main()
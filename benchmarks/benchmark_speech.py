@@ -0,0 +1,198 @@
+"""
+Compares the cost of building the location response for each row of the speech ladder: the
+original approach, which built every phrasing for the chosen branch (and every train status
+phrasing) on each request, against rendering a single precompiled template.
+
+The templated response does more than the original - it looks up the person asked about, and
+resolves the time from home from the configured time sources - so the cost of just picking the row
+of the ladder and rendering it is measured on its own too.
+
+Usage: python benchmarks/benchmark_speech.py [--repeat 5] [--iterations 20000]
+"""
+
+import common
+
+import os
+import random
+
+os.environ.setdefault('PRONOUN', 'he/him')
+
+import speech
+import functions
+import time_sources
+import lambda_function
+
+from time import time
+from datetime import datetime
+from concurrent import futures
+from stand_ins import make_event_item
+
+PRONOUN = lambda_function.PRONOUN
+
+# An event for each row of the ladder, as (distance from home, distance from work, time from home).
+BRANCHES = [
+  ('at_work', 30000, 10, 3600),
+  ('just_left_work', 29700, 300, 3500),
+  ('at_home', 10, 30000, 0),
+  ('any_minute', 400, 29600, 60),
+  ('around_the_corner', 500, 29500, 150),
+  ('under_5_minutes', 600, 29400, 290),
+  ('almost_here', 150, 29850, 400),
+  ('almost_home', 1500, 28500, 600),
+  ('on_the_way', 15000, 15000, 1800),
+]
+
+LINE_DATA = {'name': 'Craigieburn', 'status': 'minor'}
+
+def original_speech(now, train_line_fetch):
+  """The original lambda_function.get_location_speech_text_response(), for comparison."""
+
+  event = lambda_function.get_newest_valid_event()
+  lambda_function.logger.info('Newest valid event: %s', event)
+
+  suburb = event.suburb
+  distance_from_home = event.distance_from_home
+  distance_from_work = event.distance_from_work
+  readable_distance_from_home = functions.get_readable_distance_from_metres(distance_from_home)
+  readable_distance_from_work = functions.get_readable_distance_from_metres(distance_from_work)
+  time_from_home = event.time_from_home
+  readable_time_from_home = functions.get_readable_time_from_seconds(time_from_home)
+
+  lambda_function.logger.debug(
+    'Currently in ' + suburb + ', ' + readable_distance_from_home + ' (' + \
+    readable_time_from_home + ') from home and ' + readable_distance_from_work + ' from work.'
+  )
+
+  if distance_from_work <= 50:
+    if now.hour < 17:
+      speech = random.choice([
+        PRONOUN[0] + " hasn't left work yet." + functions.alexa_sound_effect('typing_medium_01'),
+        PRONOUN[0] + "'s still at work." + functions.alexa_sound_effect('typing_medium_01')
+      ])
+    else:
+      speech = random.choice([
+        functions.alexa_sound_effect('clear_throat_ahem_01') + \
+          "I don't think " + PRONOUN[0] + "'s left work yet.",
+        "I'm pretty sure " + PRONOUN[0] + "'s still in the office."
+      ])
+  elif distance_from_work <= 500:
+    speech = \
+      PRONOUN[0] + "'s just left work!" + functions.alexa_sound_effect('crowd_cheer_med_01') + \
+      PRONOUN[0] + " should be home in about " + readable_time_from_home + "."
+  elif distance_from_home <= 50:
+    return random.choice([
+      "I think " + PRONOUN[0] + "'s at home already!",
+      "Looks like " + PRONOUN[0] + "'s already home!"
+    ])
+  elif time_from_home // 60 == 1:
+    return PRONOUN[0] + "'ll be here any minute!"
+  elif time_from_home // 60 < 3:
+    return PRONOUN[0] + "'s just around the corner."
+  elif time_from_home // 60 <= 5:
+    return PRONOUN[0] + "'ll be home in less than 5 minutes."
+  elif distance_from_home <= 200:
+    return random.choice([
+      PRONOUN[0] + "'s almost here! Around " + readable_time_from_home + " away.",
+      "Not much longer - about " + readable_time_from_home + " to go."
+    ])
+  elif distance_from_home <= 1800:
+    return random.choice([
+      PRONOUN[0] + "'s almost home! About " + readable_time_from_home + " away, " + \
+        "depending on how the bus goes.",
+      PRONOUN[0] + "'s not far - around " + readable_time_from_home + " to go, " + \
+        "depending on the bus."
+    ])
+  else:
+    speech = random.choice([
+      PRONOUN[0] + "'s on his way - " + PRONOUN[0] + " should be home " + \
+        "in around " + readable_time_from_home + ".",
+      PRONOUN[0] + "'s about " + readable_time_from_home + " from home.",
+      PRONOUN[0] + "'s currently in " + suburb + ", about " + readable_time_from_home + " away."
+    ])
+
+  line_data = lambda_function.get_train_line_data(train_line_fetch)
+  line_name = line_data['name']
+  train_speech_choices = {
+    "travel": ["Metro have adjusted some services today though, " + \
+      "so " + PRONOUN[0] + " may be a little longer than usual."],
+    "works": ["Metro are currently doing works on the " + line_name + " line though, " + \
+      "so this may delay " + PRONOUN[1] + "."],
+    "minor": [
+      "There's a disruption on the " + line_name + " line though, " + \
+        "which may slow " + PRONOUN[1] + " down a little.",
+      "But, there's a disruption on the " + line_name + " line, " + \
+        "so " + PRONOUN[0] + " might take a little longer."
+    ],
+    "major": [
+      "There are major delays on the " + line_name + " line though, " + \
+        "so " + PRONOUN[0] + " might take longer.",
+      "But, there's major issues on the " + line_name + " line at the moment, " + \
+        "which might slow " + PRONOUN[1] + " down."
+    ],
+    "suspended": ["However, Metro tells me the " + line_name + " line is suspended, " + \
+      "so " + PRONOUN[0] + " could be a lot later."]
+  }
+
+  if line_data['status'] in train_speech_choices:
+    speech += " " + random.choice(train_speech_choices[line_data['status']])
+
+  return speech
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], repeat=5)
+  parser.add_argument('--iterations', type=int, default=20000,
+    help='how many responses to build for each measurement (default: 20000)')
+  args = parser.parse_args()
+
+  now = datetime(2019, 1, 14, 16, 30)
+  train_line_future = futures.Future()
+  train_line_future.set_result(LINE_DATA)
+  train_line_fetch = (train_line_future, float('inf'))
+
+  rows = []
+
+  for name, distance_from_home, distance_from_work, time_from_home in BRANCHES:
+    event = functions.LocationEvent(make_event_item(
+      name, time(), distance_from_home=distance_from_home, distance_from_work=distance_from_work,
+      time_from_home=time_from_home
+    ))
+
+    # The lookup is taken out of the picture, leaving just the cost of building the response.
+    lambda_function.get_newest_valid_event = lambda partition=None: event
+    lambda_function.logger.disabled = True
+
+    original = common.time_call(
+      lambda: [original_speech(now, train_line_fetch) for _ in range(args.iterations)],
+      args.repeat
+    )
+    templated = common.time_call(
+      lambda: [
+        lambda_function.get_location_speech_text_response(now, train_line_fetch)
+        for _ in range(args.iterations)
+      ],
+      args.repeat
+    )
+
+    templates = lambda_function.get_speech_templates(lambda_function.people_registry.default)
+    time_from_home = time_sources.TimeFromHome(event, lambda_function.compiled_time_sources)
+    time_from_home.seconds
+
+    def render():
+      location, _ = speech.select_event_location(
+        lambda_function.location_ladder, event, now, time_from_home
+      )
+      return speech.render_location(templates, location, event, now, time_from_home)
+
+    rendered = common.time_call(lambda: [render() for _ in range(args.iterations)], args.repeat)
+
+    rows.append([
+      name, common.format_duration(original / args.iterations),
+      common.format_duration(templated / args.iterations),
+      '{:.1f}x'.format(original / templated),
+      common.format_duration(rendered / args.iterations),
+    ])
+
+  common.print_table(['Branch', 'Original', 'Templates', 'Speed-up', 'Ladder + render'], rows)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,74 @@
+"""
+Measures what requests cost while DynamoDB throttles `--sizes` percent of them, with and without the
+circuit breaker in dynamodb_client.py: how long each takes to answer, how many are answered with the
+newest event rather than "not sure where they are", and how many requests DynamoDB is sent. Each
+request misses the cache, and they arrive `--interval` seconds apart on a simulated clock, so the
+breaker's reset timeout plays out as it would.
+
+Throttled requests here fail after a single round trip. For real, botocore retries them first, so
+each one that isn't failed fast costs several round trips plus backoff.
+
+Usage: python benchmarks/benchmark_throttling.py [--sizes 0,10,50,100] [--requests 300]
+  [--latency 0.01] [--interval 1]
+"""
+
+import common
+
+import speech
+import dynamodb_client
+import lambda_function
+
+from time import time, perf_counter
+from datetime import datetime
+from stand_ins import FakeClock
+
+def run(args, throttle_rate, with_breaker):
+  dynamodb = common.build_event_table(1000, time(), args.latency)
+  dynamodb.throttle_rate = throttle_rate / 100
+  clock = FakeClock()
+  breaker = dynamodb_client.CircuitBreaker('DynamoDB', clock=clock) if with_breaker else None
+  lambda_function._dynamodb = dynamodb_client.Client(dynamodb, breaker)
+
+  not_sure = speech.render(lambda_function.speech_templates, 'no_event')
+  now = datetime.now()
+  latencies = []
+  answered = 0
+
+  for _ in range(args.requests):
+    clock.now += args.interval
+    lambda_function.event_cache.clear()
+    started_at = perf_counter()
+    text = lambda_function.get_location_speech_text_response(now)
+    latencies.append(perf_counter() - started_at)
+    answered += text != not_sure
+
+  return [
+    str(throttle_rate) + '%', 'On' if with_breaker else 'Off',
+    '{:.0%}'.format(answered / args.requests), sum(dynamodb.calls.values()),
+  ] + [common.format_duration(common.percentile(latencies, percent)) for percent in (50, 99)]
+
+def main():
+  parser = common.argument_parser(__doc__.strip().splitlines()[0], sizes='0,10,50,100', repeat=1)
+  parser.add_argument('--requests', type=int, default=300,
+    help='how many requests to make at each throttle rate (default: 300)')
+  parser.add_argument('--latency', type=float, default=0.01,
+    help='how long each request to DynamoDB takes, in seconds (default: 0.01)')
+  parser.add_argument('--interval', type=float, default=1,
+    help='simulated seconds between requests (default: 1)')
+  args = parser.parse_args()
+
+  lambda_function.DYNAMODB_TABLE = 'events'
+  lambda_function.DYNAMODB_INDEX = 'newest'
+  lambda_function.logger.disabled = dynamodb_client.logger.disabled = True
+  rows = []
+
+  for throttle_rate in args.sizes:
+    for with_breaker in (False, True):
+      rows.append(run(args, throttle_rate, with_breaker))
+
+  common.print_table(
+    ['Throttled', 'Breaker', 'Answered', 'DynamoDB requests', 'p50', 'p99'], rows
+  )
+
+if __name__ == '__main__':
+  main()
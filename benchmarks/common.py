@@ -0,0 +1,113 @@
+"""
+Shared helpers for the local benchmarks, which can all be run with `make benchmark`.
+
+Each benchmark runs against the in-process stand-ins in stand_ins.py rather than real AWS services,
+so results are only useful for comparing approaches - not for predicting production latency.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import os
+import sys
+import argparse
+
+from glob import glob
+from time import perf_counter
+from statistics import median
+
+# Make the Lambda function's modules importable, the same way `make test` does.
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIRECTORY = sorted(glob(os.path.join(ROOT_DIRECTORY, 'lambda', '*', '')))[0]
+sys.path.insert(0, LAMBDA_DIRECTORY)
+
+def time_call(function, repeat=5):
+  """Returns the median wall-clock time, in seconds, of calling `function` `repeat` times."""
+  timings = []
+  for _ in range(repeat):
+    start = perf_counter()
+    function()
+    timings.append(perf_counter() - start)
+  return median(timings)
+
+def parse_sizes(text):
+  """Parses a comma-separated list of sizes, eg. '10000,100000' or '10k,1M'."""
+  multipliers = {'k': 1000, 'm': 1000000}
+  sizes = []
+  for size in text.split(','):
+    size = size.strip().lower()
+    if size[-1] in multipliers:
+      sizes.append(int(float(size[:-1]) * multipliers[size[-1]]))
+    else:
+      sizes.append(int(size))
+  return sizes
+
+def argument_parser(description, sizes='10k,100k,1M', repeat=5):
+  """Builds an argument parser with the --sizes and --repeat options most benchmarks share."""
+  parser = argparse.ArgumentParser(description=description)
+  parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes(sizes),
+    help='comma-separated sizes to benchmark, eg. 10k,100k (default: ' + sizes + ')')
+  parser.add_argument('--repeat', type=int, default=repeat,
+    help='how many times to repeat each measurement (default: ' + str(repeat) + ')')
+  return parser
+
+def percentile(values, percent):
+  """Returns the value below which `percent` percent of `values` fall, by the nearest-rank method."""
+  values = sorted(values)
+  rank = max(1, -(-len(values) * percent // 100))
+  return values[int(rank) - 1]
+
+def build_event_table(size, now, latency=0, with_index=True):
+  """
+  Builds a FakeDynamoDB with an `events` table of `size` synthetic events, and optionally the
+  `newest` event index that events.query_newest_valid_event() reads.
+  """
+  import events
+  from stand_ins import FakeDynamoDB, generate_event_items
+
+  dynamodb = FakeDynamoDB(latency=latency)
+  dynamodb.create_simple_table('events')
+
+  if with_index:
+    dynamodb.add_index(
+      'events', 'newest', events.EVENT_PARTITION_ATTRIBUTE, events.EVENT_TIMESTAMP_ATTRIBUTE
+    )
+
+  for item in generate_event_items(size, now):
+    if with_index: item.update(events.get_index_attributes(item, 'events'))
+    dynamodb.put_items('events', [item])
+
+  # Sort the index up front, so that isn't counted against the first query.
+  if with_index: dynamodb.tables['events'].sorted_partitions('newest')
+  return dynamodb
+
+def format_duration(seconds):
+  if seconds >= 1:
+    return '{:.2f} s'.format(seconds)
+  if seconds >= 0.001:
+    return '{:.2f} ms'.format(seconds * 1000)
+  return '{:.2f} us'.format(seconds * 1000000)
+
+def print_table(headers, rows):
+  """Prints rows of values as a plain text table, with a column for each header."""
+  rows = [[str(value) for value in row] for row in rows]
+  widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+
+  print('  '.join(str(header).ljust(width) for header, width in zip(headers, widths)))
+  print('  '.join('-' * width for width in widths))
+  for row in rows:
+    print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)))
+  print()
+
+def load_envelope(name):
+  """Loads one of the recorded Alexa request envelopes in benchmarks/envelopes, as raw JSON text."""
+  with open(os.path.join(ROOT_DIRECTORY, 'benchmarks', 'envelopes', name + '.json')) as file:
+    return file.read()
+
+def make_handler_input(envelope):
+  """Deserializes a recorded request envelope into a HandlerInput, as the skill would receive it."""
+  from ask_sdk_core.serialize import DefaultSerializer
+  from ask_sdk_core.handler_input import HandlerInput
+  from ask_sdk_core.attributes_manager import AttributesManager
+
+  request_envelope = DefaultSerializer().deserialize(envelope, 'ask_sdk_model.RequestEnvelope')
+  return HandlerInput(request_envelope, AttributesManager(request_envelope))
@@ -0,0 +1,121 @@
+"""
+Migrates an existing location events table so that it can be read with the keyed query path.
+
+Optionally creates the event index, then backfills the attributes the index is keyed on into every
+existing event. Events written after this also need these attributes, so whatever populates the
+table should add them too - see events.get_index_attributes().
+
+Usage: python backfill.py TABLE [--partition events] [--create-index INDEX] [--dry-run]
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import sys
+import events
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+def create_event_index(dynamodb, table, index):
+  """Adds the event index to a table, matching the table's provisioned capacity if it has any."""
+
+  index_definition = {
+    'IndexName': index,
+    'KeySchema': [
+      {'AttributeName': events.EVENT_PARTITION_ATTRIBUTE, 'KeyType': 'HASH'},
+      {'AttributeName': events.EVENT_TIMESTAMP_ATTRIBUTE, 'KeyType': 'RANGE'},
+    ],
+    'Projection': {'ProjectionType': 'ALL'},
+  }
+
+  # On-demand tables report zero provisioned capacity, and mustn't be given any for the index.
+  throughput = dynamodb.describe_table(TableName=table)['Table'].get('ProvisionedThroughput', {})
+  if throughput.get('ReadCapacityUnits'):
+    index_definition['ProvisionedThroughput'] = {
+      'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+      'WriteCapacityUnits': throughput['WriteCapacityUnits'],
+    }
+
+  dynamodb.update_table(
+    TableName=table,
+    AttributeDefinitions=[
+      {'AttributeName': events.EVENT_PARTITION_ATTRIBUTE, 'AttributeType': 'S'},
+      {'AttributeName': events.EVENT_TIMESTAMP_ATTRIBUTE, 'AttributeType': 'N'},
+    ],
+    GlobalSecondaryIndexUpdates=[{'Create': index_definition}],
+  )
+
+def backfill_event_index(dynamodb, table, partition, dry_run=False):
+  """
+  Adds the event index attributes to every event in a table that doesn't already have them, and
+  returns the number of events that were (or with `dry_run`, would have been) updated.
+  """
+
+  key_names = [
+    key['AttributeName'] for key in dynamodb.describe_table(TableName=table)['Table']['KeySchema']
+  ]
+
+  params = {'TableName': table}
+  updated = 0
+
+  while True:
+    page = dynamodb.scan(**params)
+
+    for event in page['Items']:
+      try:
+        attributes = events.get_index_attributes(event, partition)
+      except (KeyError, ValueError) as error:
+        logger.warning('Skipping event with missing or invalid data: ' + repr(error))
+        continue
+
+      if all(event.get(name) == value for name, value in attributes.items()):
+        continue
+
+      updated += 1
+      if dry_run: continue
+
+      dynamodb.update_item(
+        TableName=table,
+        Key={name: event[name] for name in key_names},
+        UpdateExpression='SET #partition = :partition, #timestamp = :timestamp, ' + \
+          '#accuracy = :accuracy',
+        ExpressionAttributeNames={
+          '#partition': events.EVENT_PARTITION_ATTRIBUTE,
+          '#timestamp': events.EVENT_TIMESTAMP_ATTRIBUTE,
+          '#accuracy': events.EVENT_ACCURACY_ATTRIBUTE,
+        },
+        ExpressionAttributeValues={
+          ':partition': attributes[events.EVENT_PARTITION_ATTRIBUTE],
+          ':timestamp': attributes[events.EVENT_TIMESTAMP_ATTRIBUTE],
+          ':accuracy': attributes[events.EVENT_ACCURACY_ATTRIBUTE],
+        },
+      )
+
+    if 'LastEvaluatedKey' not in page:
+      return updated
+
+    params['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Adds the event index to a location events table.')
+  parser.add_argument('table', help='the name of the DynamoDB table to migrate')
+  parser.add_argument('--partition', default='events', help='the DYNAMODB_PARTITION to use')
+  parser.add_argument('--create-index', metavar='INDEX', help='also create an index with this name')
+  parser.add_argument('--dry-run', action='store_true', help='count events without updating them')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  from boto3 import client
+  dynamodb = client('dynamodb')
+
+  if args.create_index and not args.dry_run:
+    create_event_index(dynamodb, args.table, args.create_index)
+    logger.info('Creating index ' + args.create_index + ' on ' + args.table)
+
+  updated = backfill_event_index(dynamodb, args.table, args.partition, args.dry_run)
+  logger.info(('Would update ' if args.dry_run else 'Updated ') + str(updated) + ' events')
+
+if __name__ == '__main__':
+  sys.exit(main())
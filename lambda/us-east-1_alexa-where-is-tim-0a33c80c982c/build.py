@@ -0,0 +1,367 @@
+"""
+Builds a slim deployment package for the Lambda function, to cut what each cold start spends
+unpacking and compiling it.
+
+Starting from the function's own modules and the dependencies `make install` put in vendor/:
+
+  - Only the modules the handlers can import are included - found by following the imports of
+    ENTRY_POINTS - so tests, stand-ins and tools (such as this one) are left out. So are packages
+    the Lambda runtime already provides, such as boto3, and the tests, type stubs and metadata of
+    the packages that are left.
+  - Everything is compiled to bytecode. /var/task is read-only, so otherwise every cold start
+    compiles every module it imports and can't keep the result. The bytecode is checked by hash
+    without being re-checked against the source, as zipping doesn't keep timestamps exactly - and
+    it's only used by the same minor version of Python, so the build must be run with the Python of
+    the Lambda runtime. Python 3.6 has no hash-based bytecode, so there the sources' timestamps are
+    rounded to what a zip keeps instead, and stamped into the zip in UTC, as Lambda unpacks it.
+  - With --bundle, dependencies that are pure Python - nothing but .py files - are bundled as
+    bytecode into a single vendor.zip, which is imported with zipimport. The function's PYTHONPATH
+    then needs /var/task/vendor.zip ahead of /var/task/vendor.
+
+The result is zipped, and its size and how long a fresh interpreter takes to import the handler and
+its deferred dependencies are reported against the current layout - everything as it is, without
+bytecode, as `make lambda` deploys it.
+
+Usage: python build.py [--output ../../build] [--bundle] [--optimize 0] [--repeat 5]
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import os
+import ast
+import sys
+import json
+import shutil
+import logging
+import zipfile
+import argparse
+import tempfile
+import compileall
+import subprocess
+
+from fnmatch import fnmatch
+from time import gmtime
+from statistics import median
+
+# Bytecode is hash-based where Python supports it (from 3.7), and timestamp-based otherwise.
+try:
+  from py_compile import PycInvalidationMode
+  COMPILE_OPTIONS = {'invalidation_mode': PycInvalidationMode.UNCHECKED_HASH}
+except ImportError:
+  COMPILE_OPTIONS = {}
+
+# The modules Lambda calls into: the skill's handler, and the ingest function's.
+ENTRY_POINTS = ('lambda_function', 'ingest')
+
+# Files the modules read at runtime.
+DATA_FILES = ('suburbs.idx',)
+
+# Packages the Lambda Python runtime already includes, so there's no need to ship them.
+RUNTIME_PACKAGES = ('boto3', 'botocore', 's3transfer', 'jmespath', 'dateutil', 'six')
+
+# Anything in vendor/ matching these - at any depth - is left out.
+PRUNED_PATTERNS = (
+  '__pycache__', 'tests', 'test', 'testing', '*.dist-info', '*.egg-info', '*.pyi', '*.pyx', '*.c',
+  '*.h', '*.pxd', 'py.typed',
+)
+
+# Left out of vendor/ at its top level only, where pip puts scripts.
+PRUNED_TOP_LEVEL = ('bin',)
+
+# What a cold start imports: the handler when it's loaded, then what the first request defers to.
+IMPORT_STATEMENT = 'import lambda_function, ingest, pytz, metro_trains'
+
+# Checks that the dependencies still work from where they've been put - eg. data files are found.
+SMOKE_TEST = 'import pytz, requests; pytz.timezone("Australia/Melbourne"); requests.Session()'
+
+logger = logging.getLogger(__name__)
+
+def find_local_modules(directory, entry_points=ENTRY_POINTS):
+  """
+  Returns the names of the modules in a directory that the entry points import, directly or through
+  each other. Imports inside functions count too, as so many are deferred until they're needed.
+  """
+
+  local = {
+    name[:-3] for name in os.listdir(directory)
+    if name.endswith('.py') and os.path.isfile(os.path.join(directory, name))
+  }
+  found = set()
+  pending = [name for name in entry_points if name in local]
+
+  while pending:
+    name = pending.pop()
+    if name in found:
+      continue
+    found.add(name)
+
+    with open(os.path.join(directory, name + '.py'), encoding='utf-8') as file:
+      tree = ast.parse(file.read(), name + '.py')
+
+    for node in ast.walk(tree):
+      if isinstance(node, ast.Import):
+        imported = [alias.name.split('.')[0] for alias in node.names]
+      elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+        imported = [node.module.split('.')[0]]
+      else:
+        continue
+      pending.extend(module for module in imported if module in local and module not in found)
+
+  return found
+
+def is_pruned(name, top_level=False):
+  return any(fnmatch(name, pattern) for pattern in PRUNED_PATTERNS) or \
+    (top_level and name in PRUNED_TOP_LEVEL)
+
+def copy_vendor(vendor, destination, excluded=RUNTIME_PACKAGES):
+  """Copies dependencies, leaving out excluded packages and anything that isn't needed to run."""
+
+  def ignore(directory, names):
+    top_level = os.path.samefile(directory, vendor)
+    return [
+      name for name in names
+      if is_pruned(name, top_level) or (top_level and name.split('-')[0] in excluded)
+    ]
+
+  shutil.copytree(vendor, destination, ignore=ignore)
+
+def is_pure_python(path):
+  """Whether a package (or single module) is nothing but Python source."""
+
+  if os.path.isfile(path):
+    return path.endswith('.py')
+
+  return all(
+    name.endswith('.py') for _, _, names in os.walk(path) for name in names
+  )
+
+def round_timestamps(directory):
+  """
+  Rounds the modification time of every module under a directory down to an even second, which is
+  as precise as a zip keeps it - so timestamp-based bytecode still matches once it's unzipped.
+  """
+  for root, _, files in os.walk(directory):
+    for file in files:
+      if file.endswith('.py'):
+        path = os.path.join(root, file)
+        rounded = int(os.stat(path).st_mtime) // 2 * 2
+        os.utime(path, (rounded, rounded))
+
+def compile_tree(directory, optimize=0, legacy=False):
+  """Compiles every module under a directory, raising a ValueError if any can't be."""
+  if not COMPILE_OPTIONS:
+    round_timestamps(directory)
+  if not compileall.compile_dir(directory, quiet=1, legacy=legacy, optimize=optimize,
+    **COMPILE_OPTIONS):
+    raise ValueError('Some modules under ' + directory + ' could not be compiled')
+
+def bundle_vendor(vendor, bundle, optimize=0):
+  """
+  Moves the pure Python packages in a vendor directory into a zip, as bytecode alongside where the
+  source would be - which is where zipimport looks for it. Returns the names of what was bundled.
+  """
+
+  names = sorted(
+    name for name in os.listdir(vendor)
+    if not name.startswith('.') and is_pure_python(os.path.join(vendor, name))
+  )
+
+  with zipfile.ZipFile(bundle, 'w', zipfile.ZIP_DEFLATED) as archive:
+    for name in names:
+      path = os.path.join(vendor, name)
+
+      if os.path.isdir(path):
+        compile_tree(path, optimize, legacy=True)
+        compiled = [
+          os.path.join(root, file) for root, _, files in sorted(os.walk(path))
+          for file in sorted(files) if file.endswith('.pyc')
+        ]
+      else:
+        compileall.compile_file(path, quiet=1, legacy=True, optimize=optimize, **COMPILE_OPTIONS)
+        compiled = [path + 'c']
+
+      for full_path in compiled:
+        archive.write(full_path, os.path.relpath(full_path, vendor))
+
+      if os.path.isdir(path):
+        shutil.rmtree(path)
+      else:
+        os.remove(path)
+        os.remove(path + 'c')
+
+  return names
+
+def make_zip(directory, filename):
+  """
+  Zips a directory's contents, returning the zip's size in bytes. Each file's modification time is
+  stamped in UTC, which Lambda unpacks it in.
+  """
+
+  with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as archive:
+    for root, directories, files in os.walk(directory):
+      directories.sort()
+      for file in sorted(files):
+        full_path = os.path.join(root, file)
+        info = zipfile.ZipInfo.from_file(full_path, os.path.relpath(full_path, directory))
+        info.date_time = gmtime(os.stat(full_path).st_mtime)[:6]
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with open(full_path, 'rb') as source:
+          archive.writestr(info, source.read())
+
+  return os.path.getsize(filename)
+
+def get_tree_stats(directory):
+  """Returns how many files there are under a directory, and their total size in bytes."""
+  sizes = [
+    os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory)
+    for name in names
+  ]
+  return len(sizes), sum(sizes)
+
+def get_python_path(directory):
+  """The PYTHONPATH the function needs, as Lambda would be configured for a package."""
+  return os.pathsep.join(
+    os.path.join(directory, name) for name in ('vendor.zip', 'vendor')
+    if os.path.exists(os.path.join(directory, name))
+  )
+
+def run_python(directory, statement):
+  """
+  Runs a statement in a fresh interpreter from a package's directory, as Lambda would - without
+  writing bytecode, as /var/task is read-only.
+  """
+  return subprocess.run(
+    [sys.executable, '-c', statement], cwd=directory, check=True, stdout=subprocess.PIPE,
+    stderr=subprocess.PIPE, env=dict(
+      os.environ, PYTHONPATH=get_python_path(directory), PYTHONDONTWRITEBYTECODE='1',
+      LOGGING_LEVEL='INFO',
+    ),
+  ).stdout.decode('utf-8')
+
+def measure_import_time(directory, statement=IMPORT_STATEMENT, repeat=5):
+  """Returns the median time a fresh interpreter takes to run an import statement, in seconds."""
+  timer = 'import time; started_at = time.perf_counter(); ' + statement + \
+    '; print(time.perf_counter() - started_at)'
+  return median(float(run_python(directory, timer)) for _ in range(repeat))
+
+def stage_current(directory, vendor, destination):
+  """
+  Copies the function as `make lambda` deploys it after a fresh `make install`: everything, without
+  bytecode.
+  """
+  ignore = shutil.ignore_patterns('__pycache__', '.pytest_cache', '*.pyc', 'venv')
+  shutil.copytree(directory, destination, ignore=ignore)
+  if vendor and os.path.isdir(vendor) and not os.path.isdir(os.path.join(destination, 'vendor')):
+    shutil.copytree(vendor, os.path.join(destination, 'vendor'), ignore=ignore)
+
+def build(directory, vendor, destination, bundle=False, optimize=0, excluded=RUNTIME_PACKAGES,
+  entry_points=ENTRY_POINTS, data_files=DATA_FILES):
+  """
+  Builds the slim package into `destination`, returning what it's made of: the modules included,
+  and the dependencies bundled into vendor.zip.
+  """
+
+  os.makedirs(destination)
+  modules = sorted(find_local_modules(directory, entry_points))
+
+  for name in modules:
+    shutil.copy2(os.path.join(directory, name + '.py'), destination)
+
+  for name in data_files:
+    if os.path.exists(os.path.join(directory, name)):
+      shutil.copy2(os.path.join(directory, name), destination)
+    else:
+      logger.info('Leaving out %s, as it has not been built - see the Makefile', name)
+
+  bundled = []
+  if vendor and os.path.isdir(vendor):
+    copy_vendor(vendor, os.path.join(destination, 'vendor'), excluded)
+    if bundle:
+      bundled = bundle_vendor(
+        os.path.join(destination, 'vendor'), os.path.join(destination, 'vendor.zip'), optimize
+      )
+
+  compile_tree(destination, optimize)
+  return {'modules': modules, 'bundled': bundled}
+
+def format_size(size):
+  return '{:.1f} KB'.format(size / 1024) if size < 1024 * 1024 else \
+    '{:.2f} MB'.format(size / 1024 / 1024)
+
+def print_report(rows):
+  headings = ['Layout', 'Files', 'Unpacked', 'Zipped', 'Import time']
+  widths = [max(len(str(row[index])) for row in [headings] + rows) for index in range(5)]
+  for row in [headings, ['-' * width for width in widths]] + rows:
+    print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+
+def main(argv=None):
+  directory = os.path.dirname(os.path.abspath(__file__))
+
+  parser = argparse.ArgumentParser(description='Builds a slim deployment package.')
+  parser.add_argument('--vendor', default=os.path.join(directory, 'vendor'),
+    help='where `make install` put the dependencies (default: vendor)')
+  parser.add_argument('--output', default=os.path.join(directory, '..', '..', 'build'),
+    help='the directory to build into, which is replaced (default: build/ in the repository)')
+  parser.add_argument('--bundle', action='store_true',
+    help='bundle pure Python dependencies into vendor.zip')
+  parser.add_argument('--optimize', type=int, default=0, choices=(0, 1, 2),
+    help='the bytecode optimisation level - only used if PYTHONOPTIMIZE is set to the same on ' + \
+      'the function (default: 0)')
+  parser.add_argument('--exclude', default=','.join(RUNTIME_PACKAGES),
+    help='dependencies to leave out, as the runtime provides them (default: ' + \
+      ','.join(RUNTIME_PACKAGES) + ')')
+  parser.add_argument('--repeat', type=int, default=5,
+    help='how many times to time imports (default: 5)')
+  parser.add_argument('--no-report', action='store_true',
+    help="don't compare against the current layout")
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  output = os.path.abspath(args.output)
+  package = os.path.join(output, 'lambda')
+  shutil.rmtree(output, ignore_errors=True)
+  os.makedirs(output)
+
+  if not os.path.isdir(args.vendor):
+    logger.warning('There are no dependencies in %s - run `make install` first', args.vendor)
+
+  built = build(directory, args.vendor, package, args.bundle, args.optimize,
+    [name.strip() for name in args.exclude.split(',') if name.strip()])
+  logger.info('Included %s', ', '.join(built['modules']))
+  if built['bundled']:
+    logger.info('Bundled %s into vendor.zip', ', '.join(built['bundled']))
+
+  run_python(package, SMOKE_TEST)
+  zip_size = make_zip(package, os.path.join(output, 'lambda.zip'))
+  logger.info('Wrote %s (%s)', os.path.join(output, 'lambda.zip'), format_size(zip_size))
+
+  if args.no_report:
+    return
+
+  with tempfile.TemporaryDirectory() as temporary:
+    current = os.path.join(temporary, 'current')
+    stage_current(directory, args.vendor, current)
+    rows = []
+
+    for name, layout, size in (
+      ('Current', current, make_zip(current, os.path.join(temporary, 'current.zip'))),
+      ('Slim' + (' + vendor.zip' if args.bundle else ''), package, zip_size),
+    ):
+      files, unpacked = get_tree_stats(layout)
+      rows.append([
+        name, files, format_size(unpacked), format_size(size),
+        '{:.1f} ms'.format(measure_import_time(layout, repeat=args.repeat) * 1000),
+      ])
+
+  print()
+  print_report(rows)
+  print()
+  print('Import time is the median for `' + IMPORT_STATEMENT + '` in a fresh interpreter, ' + \
+    'without writing bytecode.')
+
+  with open(os.path.join(output, 'report.json'), 'w') as file:
+    json.dump({'built': built, 'layouts': rows}, file, indent=2)
+
+if __name__ == '__main__':
+  sys.exit(main())
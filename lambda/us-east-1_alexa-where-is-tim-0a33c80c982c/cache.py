@@ -0,0 +1,176 @@
+"""
+A small in-memory cache for Where Is Tim?, which lives for as long as the warm Lambda container.
+
+Entries are fresh for `ttl` seconds, after which they're stale: still returned, so the caller can
+decide whether to refresh them cheaply, but no longer trusted as-is. Entries older than
+`max_staleness` seconds are evicted. If `max_entries` is set, the least recently used entries are
+evicted to make room for new ones, so memory stays bounded however many keys are cached. Caches
+can be shared between threads, such as those of server.py.
+
+Hit, miss and eviction counts are kept so they can be logged, and hits and misses are also recorded
+as metrics.
+
+SingleFlight goes with it, so that when a burst of requests all miss the cache at once, only one of
+them goes to the backend and the rest wait for its result.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import logging
+import metrics
+import threading
+
+from time import monotonic
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class CacheEntry:
+  __slots__ = ('value', 'stored_at', 'fresh')
+
+  def __init__(self, value, stored_at, fresh=True):
+    self.value = value
+    self.stored_at = stored_at
+    self.fresh = fresh
+
+class TimedCache:
+
+  def __init__(self, name, ttl, max_staleness=None, clock=monotonic, max_entries=None):
+    self.name = name
+    self.metric_name = name.replace(' ', '') + 'Cache'
+    self.ttl = ttl
+    self.max_staleness = max(ttl, max_staleness or 0)
+    self.clock = clock
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.lock = threading.RLock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.refreshes = 0
+
+  def get(self, key, is_valid=None):
+    """
+    Returns the entry for a key - with `fresh` set if it's within the TTL - or None if there isn't
+    one, or it's been evicted for being too old (or for its value failing `is_valid`). Fresh
+    entries count as hits, and anything else as a miss.
+    """
+
+    with self.lock:
+      entry = self.entries.get(key)
+
+      if entry is not None:
+        age = self.clock() - entry.stored_at
+
+        if age > self.max_staleness or self.ttl <= 0 or (is_valid and not is_valid(entry.value)):
+          self.evict(key)
+          entry = None
+        else:
+          entry.fresh = age <= self.ttl
+          self.entries.move_to_end(key)
+
+      hit = entry is not None and entry.fresh
+      if hit:
+        self.hits += 1
+      else:
+        self.misses += 1
+
+    metrics.count(self.metric_name + 'Hits', int(hit))
+    metrics.count(self.metric_name + 'Misses', int(not hit))
+
+    return entry
+
+  def put(self, key, value):
+    with self.lock:
+      self.entries[key] = CacheEntry(value, self.clock())
+      self.entries.move_to_end(key)
+
+      while self.max_entries and len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+        self.evictions += 1
+
+  def refresh(self, key):
+    """
+    Marks an entry as fresh again, once the caller has checked that nothing newer exists - unless
+    another thread has evicted it in the meantime.
+    """
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is not None:
+        self.refreshes += 1
+        entry.stored_at = self.clock()
+
+  def evict(self, key):
+    with self.lock:
+      if self.entries.pop(key, None) is not None:
+        self.evictions += 1
+
+  def clear(self):
+    self.entries.clear()
+
+  def log_stats(self, outcome, started_at=None):
+    """Logs the outcome of a lookup along with running totals, and how long the lookup took."""
+
+    if not logger.isEnabledFor(logging.INFO):
+      return
+
+    duration = ''
+    if started_at is not None:
+      duration = ' in {:.2f}ms'.format((self.clock() - started_at) * 1000)
+
+    logger.info(
+      '%s cache %s%s (hits: %d, misses: %d, refreshes: %d, evictions: %d)', self.name, outcome,
+      duration, self.hits, self.misses, self.refreshes, self.evictions
+    )
+
+class Flight:
+  __slots__ = ('done', 'result', 'error')
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+class SingleFlight:
+  """
+  Coalesces concurrent calls for the same key: the first caller runs the function, and anyone else
+  asking for that key while it's in flight waits for - and shares - its result or exception. Once
+  it's finished, the next call runs the function again, so nothing is cached here.
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.metric_name = name.replace(' ', '') + 'Coalesced'
+    self.lock = threading.Lock()
+    self.flights = {}
+    self.calls = 0
+    self.coalesced = 0
+
+  def call(self, key, function, *args):
+    with self.lock:
+      flight = self.flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self.flights[key] = Flight()
+        self.calls += 1
+      else:
+        self.coalesced += 1
+
+    if not leader:
+      metrics.count(self.metric_name)
+      logger.debug('%s for %s is already in flight, so waiting for it', self.name, key)
+      flight.done.wait()
+      if flight.error is not None:
+        raise flight.error
+      return flight.result
+
+    try:
+      flight.result = function(*args)
+      return flight.result
+    except Exception as error:
+      flight.error = error
+      raise
+    finally:
+      with self.lock:
+        del self.flights[key]
+      flight.done.set()
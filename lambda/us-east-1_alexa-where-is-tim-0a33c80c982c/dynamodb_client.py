@@ -0,0 +1,230 @@
+"""
+The DynamoDB client for Where Is Tim?, tuned for answering within Alexa's deadline.
+
+create_client() sets timeouts short enough that a slow connection or response is retried - or
+given up on - well before Alexa stops waiting, uses botocore's adaptive retry mode, which backs off
+and rate-limits itself when throttled, and keeps pooled connections alive between requests.
+
+Client wraps it - or a stand-in - so that every read and write asks for its consumed capacity,
+which is recorded as metrics and logged with each request at debug level - a scan can take many
+requests, so they're only logged when asked for. It also goes through a CircuitBreaker:
+once DynamoDB has been throttling or timing out request after request, calls fail fast with
+Unavailable for a while rather than each waiting out their own retries, so the skill can quickly
+say it's not sure where someone is.
+
+boto3 and botocore are only imported once a client is created, as they're slow to import.
+
+@see https://boto3.amazonaws.com/v1/documentation/api/latest/guide/retries.html
+@see https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/read-write-operations.html
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import logging
+import metrics
+import threading
+
+from os import getenv
+from time import monotonic, perf_counter
+from functools import partial
+from collections import Counter
+
+# How long to wait for a connection, and then for a response, in seconds. Each attempt can take up
+# to both, and Alexa waits 8 seconds for the whole response.
+DYNAMODB_CONNECT_TIMEOUT_IN_SECONDS = float(getenv('DYNAMODB_CONNECT_TIMEOUT_IN_SECONDS', '0.5'))
+DYNAMODB_READ_TIMEOUT_IN_SECONDS = float(getenv('DYNAMODB_READ_TIMEOUT_IN_SECONDS', '1'))
+
+# How many times each request is attempted, including the first, with botocore's retry mode.
+DYNAMODB_MAX_ATTEMPTS = int(getenv('DYNAMODB_MAX_ATTEMPTS', 3))
+DYNAMODB_RETRY_MODE = getenv('DYNAMODB_RETRY_MODE', 'adaptive')
+
+# How many connections are kept open, for requests made at once - eg. by parallel scan segments.
+DYNAMODB_MAX_POOL_CONNECTIONS = int(getenv('DYNAMODB_MAX_POOL_CONNECTIONS', 10))
+
+# How many requests in a row can be throttled or time out before the circuit breaker opens, and for
+# how long it stays open before a request is tried again, in seconds.
+DYNAMODB_CIRCUIT_FAILURE_THRESHOLD = int(getenv('DYNAMODB_CIRCUIT_FAILURE_THRESHOLD', 3))
+DYNAMODB_CIRCUIT_RESET_IN_SECONDS = float(getenv('DYNAMODB_CIRCUIT_RESET_IN_SECONDS', '30'))
+
+# The consumed capacity each request asks for: TOTAL, INDEXES, or NONE to not ask for it at all.
+DYNAMODB_RETURN_CONSUMED_CAPACITY = getenv('DYNAMODB_RETURN_CONSUMED_CAPACITY', 'TOTAL')
+
+# The operations that consume capacity, and whether each reads or writes.
+OPERATIONS = {
+  'get_item': 'Read',
+  'batch_get_item': 'Read',
+  'query': 'Read',
+  'scan': 'Read',
+  'put_item': 'Write',
+  'update_item': 'Write',
+  'delete_item': 'Write',
+  'batch_write_item': 'Write',
+}
+
+# Errors that mean DynamoDB is struggling, rather than that the request was wrong.
+TRANSIENT_ERROR_CODES = (
+  'ProvisionedThroughputExceededException',
+  'RequestLimitExceeded',
+  'ThrottlingException',
+  'InternalServerError',
+  'ServiceUnavailable',
+)
+
+logger = logging.getLogger(__name__)
+
+class Unavailable(Exception):
+  """
+  Raised when DynamoDB is throttling or timing out, or the circuit breaker is open. It isn't a
+  ClientError, so it isn't caught by fallbacks to other ways of reading the same data - which would
+  only add to the load.
+  """
+
+def create_client(connect_timeout=DYNAMODB_CONNECT_TIMEOUT_IN_SECONDS,
+  read_timeout=DYNAMODB_READ_TIMEOUT_IN_SECONDS, max_attempts=DYNAMODB_MAX_ATTEMPTS,
+  retry_mode=DYNAMODB_RETRY_MODE, max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS):
+  """Creates a boto3 DynamoDB client with the timeouts, retries and connection pool above."""
+
+  from boto3 import client
+  from botocore.config import Config
+
+  return client('dynamodb', config=Config(
+    connect_timeout=connect_timeout,
+    read_timeout=read_timeout,
+    retries={'mode': retry_mode, 'total_max_attempts': max_attempts},
+    max_pool_connections=max_pool_connections,
+    # Keeps idle pooled connections open while the container is frozen between invocations.
+    tcp_keepalive=True,
+  ))
+
+def is_transient_error(error):
+  """Whether an error from botocore means DynamoDB is throttling, struggling or unreachable."""
+
+  from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+  if isinstance(error, ClientError):
+    return error.response.get('Error', {}).get('Code') in TRANSIENT_ERROR_CODES
+
+  return isinstance(error, (ConnectionError, HTTPClientError))
+
+class CircuitBreaker:
+  """
+  Opens after `threshold` failures in a row, and then rejects calls for `reset_timeout` seconds, so
+  a backend that's struggling is left alone and callers fail fast. After that, a single trial call
+  is let through: if it succeeds the breaker closes again, and if it fails it stays open.
+  """
+
+  def __init__(self, name, threshold=DYNAMODB_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=DYNAMODB_CIRCUIT_RESET_IN_SECONDS, clock=monotonic):
+    self.name = name
+    self.metric_name = name.replace(' ', '') + 'CircuitRejections'
+    self.threshold = threshold
+    self.reset_timeout = reset_timeout
+    self.clock = clock
+    self.failures = 0
+    self.opened_at = None
+    self.trying = False
+    self.rejections = 0
+    self.lock = threading.Lock()
+
+  @property
+  def state(self):
+    if self.opened_at is None:
+      return 'closed'
+    return 'half-open' if self.trying else 'open'
+
+  def allow(self):
+    """Whether a call can go ahead, counting it as rejected if not."""
+
+    with self.lock:
+      if self.opened_at is None:
+        return True
+
+      if not self.trying and self.clock() - self.opened_at >= self.reset_timeout:
+        self.trying = True
+        return True
+
+      self.rejections += 1
+
+    metrics.count(self.metric_name)
+    return False
+
+  def succeeded(self):
+    with self.lock:
+      if self.opened_at is not None:
+        logger.info('%s circuit closed again, after a successful trial call', self.name)
+      self.failures = 0
+      self.opened_at = None
+      self.trying = False
+
+  def failed(self):
+    with self.lock:
+      self.failures += 1
+      self.trying = False
+
+      if self.opened_at is None and self.failures < self.threshold:
+        return
+
+      if self.opened_at is None:
+        logger.warning('%s circuit opened, after %d failures in a row', self.name, self.failures)
+      self.opened_at = self.clock()
+
+class Client:
+  """
+  Wraps a DynamoDB client, passing everything through to it - but reads and writes ask for their
+  consumed capacity, which is logged and counted, and go through the circuit breaker if there is
+  one. Throttling and timeouts are raised as Unavailable.
+  """
+
+  def __init__(self, client, breaker=None,
+    return_consumed_capacity=DYNAMODB_RETURN_CONSUMED_CAPACITY):
+    self.client = client
+    self.breaker = breaker
+    self.return_consumed_capacity = return_consumed_capacity
+    self.consumed = Counter()
+    self.lock = threading.Lock()
+
+  def __getattr__(self, name):
+    method = getattr(self.client, name)
+    return partial(self.call, name, method) if name in OPERATIONS else method
+
+  def call(self, name, method, **params):
+    if self.breaker is not None and not self.breaker.allow():
+      raise Unavailable('Not calling DynamoDB ' + name + ', as the ' + self.breaker.name + \
+        ' circuit is open')
+
+    if self.return_consumed_capacity != 'NONE':
+      params.setdefault('ReturnConsumedCapacity', self.return_consumed_capacity)
+
+    started_at = perf_counter()
+    try:
+      response = method(**params)
+    except Exception as error:
+      if not is_transient_error(error):
+        if self.breaker is not None: self.breaker.succeeded()
+        raise
+      if self.breaker is not None: self.breaker.failed()
+      raise Unavailable('DynamoDB ' + name + ' failed: ' + str(error)) from error
+
+    if self.breaker is not None: self.breaker.succeeded()
+    self.record(name, params, response, perf_counter() - started_at)
+    return response
+
+  def record(self, name, params, response, duration):
+    """Counts the capacity a request consumed, and logs it along with the request at debug level."""
+
+    consumed = response.get('ConsumedCapacity')
+    if isinstance(consumed, dict):
+      consumed = [consumed]
+    units = sum(capacity.get('CapacityUnits', 0) for capacity in consumed or ())
+
+    kind = OPERATIONS[name]
+    with self.lock:
+      self.consumed[kind] += units
+    metrics.count('DynamoDB' + kind + 'CapacityUnits', units)
+
+    if not logger.isEnabledFor(logging.DEBUG):
+      return
+
+    table = params.get('TableName', '') + \
+      (' (' + params['IndexName'] + ')' if 'IndexName' in params else '')
+    logger.debug('DynamoDB %s on %s took %.1fms and consumed %s %s capacity units', name, table,
+      duration * 1000, units if consumed is not None else 'unknown', kind.lower())
@@ -0,0 +1,279 @@
+"""
+Estimates how long someone will take to get home, from the trip they're on and from how long their
+commute has usually taken at the same time of the week.
+
+TripEstimator follows the current trip. It keeps a rolling window of the trip's most recent legs
+with running totals over them, so each new event is an O(1) update rather than a re-scan of the
+trip so far. A trip starts when someone leaves work, and ends once they're home. After a long gap
+between events the trip is picked up again from the next event, but isn't counted as a commute.
+
+CommuteHistory keeps the average duration of finished commutes for each hour of each day of the
+week, in two flat arrays that are also updated in O(1). Both pack into a few KB of bytes, so that
+ingest.py can keep them on the current event record as each event arrives. The skill then reads
+the blended estimate off the current event, without any extra reads of its own.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import struct
+import functions
+
+from os import getenv
+from array import array
+from datetime import datetime, timezone
+from collections import deque
+
+# How many of the most recent legs of a trip its speed is worked out over.
+ESTIMATOR_WINDOW_SIZE = int(getenv('ESTIMATOR_WINDOW_SIZE', 6))
+
+# A gap between events longer than this means the trip can't be followed, so it's picked up again.
+TRIP_GAP_IN_SECONDS = 1800
+
+# How close to work and home someone is when they're there, in metres - as in speech.py.
+AT_WORK_DISTANCE = 50
+AT_HOME_DISTANCE = 50
+
+# Below this speed towards home, in metres per second, the trip's own estimate can't be trusted -
+# eg. when waiting for a train, or not heading home at all.
+MIN_SPEED = 0.5
+
+# How much each estimate counts towards the blend. The trip's own estimate only gets its full
+# weight once the window is full of legs.
+ROUTING_WEIGHT = 1.0
+TRIP_WEIGHT = 1.0
+HISTORY_WEIGHT = 0.5
+
+# The name of the time from home mode that blended estimates are stored as on the current event.
+ESTIMATED_MODE = 'estimated'
+
+TRIP_STATE_ATTRIBUTE = 'trip_state'
+COMMUTE_HISTORY_ATTRIBUTE = 'commute_history'
+
+HOURS_IN_A_WEEK = 7 * 24
+
+# started_at, last_timestamp, last_distance, week_hour, from_work, then the number of legs.
+_TRIP_HEADER = struct.Struct('<dddh?B')
+_LEG = struct.Struct('<dd')
+
+class TripEstimator:
+  """The current trip: when it started, where it's got to, and the legs in its rolling window."""
+
+  __slots__ = (
+    'legs', 'window_time', 'window_distance', 'started_at', 'week_hour', 'from_work',
+    'last_timestamp', 'last_distance'
+  )
+
+  def __init__(self, window_size=ESTIMATOR_WINDOW_SIZE):
+    self.legs = deque(maxlen=window_size)
+    self.reset()
+
+  def reset(self, event=None, from_work=False):
+    """Ends the current trip, and starts a new one from an event if there is one."""
+    self.legs.clear()
+    self.window_time = 0.0
+    self.window_distance = 0.0
+    self.started_at = self.last_timestamp = event and event.timestamp
+    self.last_distance = event and event.distance_from_home
+    self.week_hour = get_week_hour(event) if event and from_work else -1
+    self.from_work = from_work
+
+  @property
+  def on_trip(self):
+    return self.started_at is not None
+
+  def update(self, event):
+    """
+    Follows the trip on to a new event. Returns the trip's duration in seconds if this event
+    finishes a commute home from work, or otherwise None. Events that aren't newer than the last
+    one are ignored.
+    """
+
+    timestamp = event.timestamp
+
+    if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+      return None
+
+    if event.distance_from_work <= AT_WORK_DISTANCE:
+      self.reset(event, from_work=True)
+      return None
+
+    if not self.on_trip or timestamp - self.last_timestamp > TRIP_GAP_IN_SECONDS:
+      if event.distance_from_home <= AT_HOME_DISTANCE:
+        self.reset()
+      else:
+        self.reset(event)
+      return None
+
+    leg_time = timestamp - self.last_timestamp
+    leg_distance = self.last_distance - event.distance_from_home
+
+    # The deque drops its oldest leg when it's full, so that leg is taken off the totals first.
+    if len(self.legs) == self.legs.maxlen:
+      oldest_time, oldest_distance = self.legs[0]
+      self.window_time -= oldest_time
+      self.window_distance -= oldest_distance
+
+    self.legs.append((leg_time, leg_distance))
+    self.window_time += leg_time
+    self.window_distance += leg_distance
+    self.last_timestamp = timestamp
+    self.last_distance = event.distance_from_home
+
+    if event.distance_from_home > AT_HOME_DISTANCE:
+      return None
+
+    duration = timestamp - self.started_at if self.from_work else None
+    self.reset()
+    return duration
+
+  def estimate_time_from_home(self):
+    """
+    The time left to get home at the speed of the trip's recent legs, in seconds - or None if
+    there's no trip, or it isn't heading home fast enough to tell.
+    """
+
+    if not self.legs or self.window_time <= 0:
+      return None
+
+    speed = self.window_distance / self.window_time
+    if speed < MIN_SPEED:
+      return None
+
+    return self.last_distance / speed
+
+  def to_bytes(self):
+    nan = float('nan')
+    data = _TRIP_HEADER.pack(
+      nan if self.started_at is None else self.started_at,
+      nan if self.last_timestamp is None else self.last_timestamp,
+      nan if self.last_distance is None else self.last_distance,
+      self.week_hour, self.from_work, len(self.legs)
+    )
+    return data + b''.join(_LEG.pack(*leg) for leg in self.legs)
+
+  @classmethod
+  def from_bytes(cls, data, window_size=ESTIMATOR_WINDOW_SIZE):
+    trip = cls(window_size)
+    started_at, last_timestamp, last_distance, trip.week_hour, trip.from_work, count = \
+      _TRIP_HEADER.unpack_from(data)
+
+    trip.started_at = None if started_at != started_at else started_at
+    trip.last_timestamp = None if last_timestamp != last_timestamp else last_timestamp
+    trip.last_distance = None if last_distance != last_distance else last_distance
+
+    for leg in _LEG.iter_unpack(data[_TRIP_HEADER.size:_TRIP_HEADER.size + count * _LEG.size]):
+      trip.legs.append(leg)
+
+    trip.window_time = sum(leg_time for leg_time, _ in trip.legs)
+    trip.window_distance = sum(leg_distance for _, leg_distance in trip.legs)
+    return trip
+
+class CommuteHistory:
+  """The average duration of commutes home, by the hour of the week they started in."""
+
+  __slots__ = ('counts', 'durations')
+
+  def __init__(self):
+    self.counts = array('I', bytes(4 * HOURS_IN_A_WEEK))
+    self.durations = array('d', bytes(8 * HOURS_IN_A_WEEK))
+
+  def add(self, week_hour, duration):
+    """Adds a finished commute's duration to the running average for the hour it started in."""
+    self.counts[week_hour] += 1
+    self.durations[week_hour] += (duration - self.durations[week_hour]) / self.counts[week_hour]
+
+  def get_typical_duration(self, week_hour):
+    """The average duration of commutes started in an hour of the week, or None if there's none."""
+    if week_hour < 0 or not self.counts[week_hour]:
+      return None
+    return self.durations[week_hour]
+
+  def to_bytes(self):
+    return self.counts.tobytes() + self.durations.tobytes()
+
+  @classmethod
+  def from_bytes(cls, data):
+    history = cls()
+    history.counts = array('I', data[:4 * HOURS_IN_A_WEEK])
+    history.durations = array('d', data[4 * HOURS_IN_A_WEEK:])
+    return history
+
+class Commute:
+  """Someone's current trip, along with their commute history, as kept on the current event."""
+
+  __slots__ = ('trip', 'history')
+
+  def __init__(self, trip=None, history=None):
+    self.trip = trip or TripEstimator()
+    self.history = history or CommuteHistory()
+
+  @classmethod
+  def from_item(cls, item):
+    """Restores the commute kept on a current event record, or starts afresh if there isn't one."""
+    item = item or {}
+    trip = item.get(TRIP_STATE_ATTRIBUTE)
+    history = item.get(COMMUTE_HISTORY_ATTRIBUTE)
+    return cls(
+      trip and TripEstimator.from_bytes(bytes(trip['B'])),
+      history and CommuteHistory.from_bytes(bytes(history['B']))
+    )
+
+  def to_attributes(self):
+    return {
+      TRIP_STATE_ATTRIBUTE: {'B': self.trip.to_bytes()},
+      COMMUTE_HISTORY_ATTRIBUTE: {'B': self.history.to_bytes()},
+    }
+
+  def update(self, event):
+    """Follows the trip on to a new event, adding it to the history if it finishes a commute."""
+    week_hour = self.trip.week_hour
+    duration = self.trip.update(event)
+    if duration is not None:
+      self.history.add(week_hour, duration)
+
+  def estimate_time_from_home(self, event):
+    """
+    Estimates the time from home, in seconds, as of the newest event the trip has been followed on
+    to. This blends the event's own routing estimate, the trip's recent speed, and how much longer
+    commutes started at the same time of the week usually take. Returns None if someone isn't on a
+    trip - eg. they're at work - or there's nothing to estimate from.
+    """
+
+    if not self.trip.on_trip:
+      return None
+
+    estimates = []
+
+    try:
+      estimates.append((event.time_from_home, ROUTING_WEIGHT))
+    except (KeyError, ValueError):
+      pass
+
+    trip_estimate = self.trip.estimate_time_from_home()
+    if trip_estimate is not None:
+      estimates.append((trip_estimate, TRIP_WEIGHT * len(self.trip.legs) / self.trip.legs.maxlen))
+
+    typical_duration = self.history.get_typical_duration(self.trip.week_hour)
+    if typical_duration is not None:
+      remaining = typical_duration - (event.timestamp - self.trip.started_at)
+      if remaining > 0:
+        estimates.append((remaining, HISTORY_WEIGHT))
+
+    if not estimates:
+      return None
+
+    return int(sum(estimate * weight for estimate, weight in estimates) / \
+      sum(weight for _, weight in estimates))
+
+def get_local_datetime(event):
+  """When an event was, in its own local time - or in UTC, if it doesn't say."""
+
+  try:
+    return functions.parse_event_datetime(event.event_date)
+  except (TypeError, ValueError):
+    return datetime.fromtimestamp(event.timestamp, timezone.utc)
+
+def get_week_hour(event):
+  """The hour of the week - from 0 at midnight on Monday - of an event, in its own local time."""
+  local_date = get_local_datetime(event)
+  return local_date.weekday() * 24 + local_date.hour
@@ -0,0 +1,238 @@
+"""
+Reads the newest valid location event for Where Is Tim? out of DynamoDB, as a LocationEvent.
+
+There are two ways of selecting it from the events table. The keyed query path reads a global
+secondary index that is partitioned by `event_partition` and sorted by `event_timestamp`, newest
+first, so only the newest few events are ever read no matter how big the table grows. Each person
+being tracked has their own partition - see people.py. The scan path reads the whole table, and is
+used when no index is configured or as a fallback when the index can't be queried.
+
+Better still, the newest valid event can be kept as it arrives in a separate table of current
+events, keyed by `event_partition`, so reading it takes a single GetItem.
+
+@see backfill.py for adding the index to an existing table.
+@see ingest.py for keeping the current event up to date.
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import logging
+import metrics
+import functions
+import time_sources
+
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+
+EVENT_ACCURACY_ATTRIBUTE = 'event_accuracy'
+EVENT_PARTITION_ATTRIBUTE = 'event_partition'
+EVENT_TIMESTAMP_ATTRIBUTE = 'event_timestamp'
+
+# The attributes that are read from each event when scanning, so nothing else is transferred - along
+# with the `time_from_home_*` attributes the time sources read. See get_scan_attributes().
+EVENT_ATTRIBUTES = (
+  'eventId',
+  'event_date',
+  'event_accuracy_m',
+  'event_address',
+  'event_latitude',
+  'event_longitude',
+  'distance_from_home',
+  'distance_from_work',
+)
+
+# How many events to ask for in each query page. The first valid event is usually the first one
+# returned, so this only needs to be big enough to skip past a few inaccurate fixes.
+QUERY_PAGE_SIZE = 10
+
+logger = logging.getLogger(__name__)
+
+def get_scan_attributes(sources):
+  """Returns the attributes to scan events with, for the given compiled time sources."""
+  return EVENT_ATTRIBUTES + time_sources.get_attributes(sources)
+
+# The attributes to scan events with, for the time sources configured by TIME_SOURCES.
+SCAN_ATTRIBUTES = get_scan_attributes(time_sources.compile_sources())
+
+def client_error():
+  """
+  Returns botocore's ClientError, for use in `except` clauses - which are only evaluated when there
+  is an exception to check - so that botocore doesn't need to be imported before it's used.
+  """
+  from botocore.exceptions import ClientError
+  return ClientError
+
+def get_index_attributes(event, partition):
+  """
+  Returns the attributes an event needs for it to be included in the event index. Proximity Events
+  stores `event_accuracy_m` as a string, so a numeric copy is added for filtering on the server.
+  """
+  accuracy = event['event_accuracy_m']
+
+  return {
+    EVENT_PARTITION_ATTRIBUTE: {'S': partition},
+    EVENT_TIMESTAMP_ATTRIBUTE: {'N': str(int(functions.get_event_timestamp(event)))},
+    EVENT_ACCURACY_ATTRIBUTE: {'N': accuracy['S'] if 'S' in accuracy else accuracy['N']},
+  }
+
+def get_current_event(dynamodb, table, partition):
+  """
+  Reads the current event record that ingest.py keeps up to date, as a LocationEvent - or None, if
+  there isn't one yet. It's up to the caller to check it's still valid.
+  """
+  item = get_current_item(dynamodb, table, partition)
+  return None if item is None else functions.LocationEvent(item)
+
+def get_current_item(dynamodb, table, partition):
+  """Reads the current event record as it's stored - or None, if there isn't one yet."""
+
+  response = dynamodb.get_item(TableName=table, Key={EVENT_PARTITION_ATTRIBUTE: {'S': partition}})
+  metrics.count('EventsRead', int('Item' in response))
+  return response.get('Item')
+
+def put_current_event(dynamodb, table, partition, event):
+  """
+  Makes an event (as a DynamoDB item) the current event record, unless the current one is already
+  at least as new. The check is part of the write, so concurrent writers can't go backwards in time.
+  Returns whether the record was replaced.
+  """
+
+  item = dict(event)
+  item.update(get_index_attributes(event, partition))
+
+  try:
+    dynamodb.put_item(
+      TableName=table,
+      Item=item,
+      ConditionExpression='attribute_not_exists(#timestamp) OR #timestamp < :timestamp',
+      ExpressionAttributeNames={'#timestamp': EVENT_TIMESTAMP_ATTRIBUTE},
+      ExpressionAttributeValues={':timestamp': item[EVENT_TIMESTAMP_ATTRIBUTE]},
+    )
+  except client_error() as error:
+    if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+      raise
+    return False
+
+  return True
+
+def is_event_valid(event):
+  """Whether a LocationEvent is both accurate enough and new enough to be trusted."""
+  return functions.is_event_accurate_enough(event) and \
+    functions.is_timestamp_new_enough(event.timestamp)
+
+def query_newest_valid_event(dynamodb, table, index, partition, page_size=QUERY_PAGE_SIZE,
+  newer_than=None):
+  """
+  Gets the newest valid event by querying the event index in descending time order. Events that
+  are too old are excluded by the key condition and inaccurate ones by the filter, so in the usual
+  case this reads a single page of `page_size` events.
+
+  If `newer_than` is given, only events after that timestamp are considered - which is a cheap way
+  of checking whether an event we already have is still the newest.
+  """
+
+  oldest = int(time() - functions.VALID_EVENT_MAX_AGE_IN_SECONDS)
+  if newer_than is not None:
+    oldest = max(oldest, int(newer_than) + 1)
+
+  params = {
+    'TableName': table,
+    'IndexName': index,
+    'KeyConditionExpression': '#partition = :partition AND #timestamp >= :oldest',
+    'FilterExpression': '#accuracy <= :accuracy',
+    'ExpressionAttributeNames': {
+      '#partition': EVENT_PARTITION_ATTRIBUTE,
+      '#timestamp': EVENT_TIMESTAMP_ATTRIBUTE,
+      '#accuracy': EVENT_ACCURACY_ATTRIBUTE,
+    },
+    'ExpressionAttributeValues': {
+      ':partition': {'S': partition},
+      ':oldest': {'N': str(oldest)},
+      ':accuracy': {'N': str(functions.VALID_EVENT_MAX_ACCURACY_IN_METRES)},
+    },
+    'ScanIndexForward': False,
+    'Limit': page_size,
+  }
+
+  while True:
+    response = dynamodb.query(**params)
+    metrics.count('EventsRead', len(response['Items']))
+
+    # The index attributes are copies, so the original attributes are checked again here too.
+    for item in response['Items']:
+      event = functions.LocationEvent(item)
+      if is_event_valid(event):
+        logger.debug('Event %s is the newest valid event', event.event_id)
+        metrics.count('ValidEventsRead')
+        return event
+
+    if 'LastEvaluatedKey' not in response:
+      return None
+
+    params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def scan_newest_valid_event(dynamodb, table, segments=1, attributes=SCAN_ATTRIBUTES,
+  partition=None):
+  """
+  Gets the newest valid event by scanning the table. As every event is read, for best performance
+  the table should only contain the most recent entries - i.e. a TTL attribute should be used to
+  clean it out regularly.
+
+  With more than one segment, the table is split into that many parallel scans, each of which is
+  reduced to its newest valid event before the results are merged. Only `attributes` are fetched,
+  and if a `partition` is given, only events in that partition are returned.
+  """
+
+  if segments <= 1:
+    return _scan_segment(dynamodb, table, attributes, partition)[0]
+
+  with ThreadPoolExecutor(max_workers=segments) as executor:
+    results = executor.map(
+      lambda segment: _scan_segment(dynamodb, table, attributes, partition, segment, segments),
+      range(segments)
+    )
+    return max(results, key=lambda result: result[1])[0]
+
+def _scan_segment(dynamodb, table, attributes, partition=None, segment=None, total_segments=None):
+  """Scans every page of a table (or one segment of it), returning its newest valid event."""
+
+  params = {'TableName': table}
+
+  if attributes:
+    params['ProjectionExpression'] = ', '.join(attributes)
+
+  if partition is not None:
+    params['FilterExpression'] = '#partition = :partition'
+    params['ExpressionAttributeNames'] = {'#partition': EVENT_PARTITION_ATTRIBUTE}
+    params['ExpressionAttributeValues'] = {':partition': {'S': partition}}
+
+  if total_segments:
+    params['Segment'] = segment
+    params['TotalSegments'] = total_segments
+
+  newest_valid_event = None
+  newest_valid_event_timestamp = 0
+  valid_events = 0
+
+  while True:
+    page = dynamodb.scan(**params)
+    metrics.count('EventsRead', len(page['Items']))
+
+    for item in page['Items']:
+      event = functions.LocationEvent(item)
+      timestamp = event.timestamp
+
+      if not functions.is_event_accurate_enough(event) or \
+        not functions.is_timestamp_new_enough(timestamp):
+        continue
+
+      valid_events += 1
+      if timestamp > newest_valid_event_timestamp:
+        newest_valid_event = event
+        newest_valid_event_timestamp = timestamp
+        logger.debug('Event %s is the newest so far', event.event_id)
+
+    if 'LastEvaluatedKey' not in page:
+      metrics.count('ValidEventsRead', valid_events)
+      return newest_valid_event, newest_valid_event_timestamp
+
+    params['ExclusiveStartKey'] = page['LastEvaluatedKey']
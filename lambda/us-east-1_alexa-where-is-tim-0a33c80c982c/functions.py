@@ -5,111 +5,252 @@ Assorted custom utility functions for Where Is Tim?.
 """
 
 import json
-import requests
-import jsonpickle
+import metrics
+import geo_index
 
 from os import getenv
+from enum import Enum
+from array import array
 from time import time
 from datetime import datetime
+from functools import lru_cache
 
 METRO_TRAINS_ENDPOINT = \
   getenv('METRO_TRAINS_ENDPOINT', 'http://www.metrotrains.com.au/api?op=get_healthboard_alerts')
 
+# The health board is cached for METRO_TRAINS_CACHE_TTL_IN_SECONDS, and the last known board is used
+# for up to METRO_TRAINS_MAX_STALENESS_IN_SECONDS if it can't be fetched.
+METRO_TRAINS_CACHE_TTL_IN_SECONDS = float(getenv('METRO_TRAINS_CACHE_TTL_IN_SECONDS', '60'))
+METRO_TRAINS_MAX_STALENESS_IN_SECONDS = \
+  float(getenv('METRO_TRAINS_MAX_STALENESS_IN_SECONDS', '3600'))
+
+# Strict timeouts, so that a slow Metro Trains website can't make us miss Alexa's response deadline.
+METRO_TRAINS_CONNECT_TIMEOUT_IN_SECONDS = \
+  float(getenv('METRO_TRAINS_CONNECT_TIMEOUT_IN_SECONDS', '0.5'))
+METRO_TRAINS_READ_TIMEOUT_IN_SECONDS = float(getenv('METRO_TRAINS_READ_TIMEOUT_IN_SECONDS', '1.5'))
+
 VALID_EVENT_MAX_AGE_IN_SECONDS = float(getenv('VALID_EVENT_MAX_AGE_IN_SECONDS', '86400'))
 VALID_EVENT_MAX_ACCURACY_IN_METRES = float(getenv('VALID_EVENT_MAX_ACCURACY_IN_METRES', '65'))
 
+# The newest valid event is cached in the warm container for EVENT_CACHE_TTL_IN_SECONDS. After that,
+# up to EVENT_CACHE_MAX_STALENESS_IN_SECONDS, it's kept if no newer events are found by a (cheaper)
+# conditional refresh. Set the TTL to 0 to disable the cache.
+EVENT_CACHE_TTL_IN_SECONDS = float(getenv('EVENT_CACHE_TTL_IN_SECONDS', '30'))
+EVENT_CACHE_MAX_STALENESS_IN_SECONDS = float(getenv('EVENT_CACHE_MAX_STALENESS_IN_SECONDS', '300'))
+
+# How many people's newest events the warm container keeps at most, dropping the least recently
+# asked about first. Each takes ~1KB.
+EVENT_CACHE_SIZE = int(getenv('EVENT_CACHE_SIZE', 1024))
+
 SECONDS_IN_AN_HOUR = 3600
 SECONDS_IN_A_MINUTE = 60
 MINUTES_IN_AN_HOUR = 60
 
+# Readable times and distances come from a small set of values - whole minutes, metres under 950 and
+# whole kilometres - so each is only built once. Each table stops growing once it holds this many
+# entries (~100 bytes each); a whole day is 1440 minutes.
+READABLE_CACHE_SIZE = int(getenv('READABLE_CACHE_SIZE', 4096))
+
+# How many distinct event dates to remember the parsed timestamps of. Each takes ~200 bytes. Scans
+# of tables with more events than this get no benefit from the cache.
+EVENT_DATE_CACHE_SIZE = int(getenv('EVENT_DATE_CACHE_SIZE', 16384))
+
+# The LocationEvent fields that get_event_columns() extracts, other than the timestamp.
+EVENT_COLUMNS = ('accuracy', 'distance_from_home', 'distance_from_work', 'time_from_home')
+
+# The prefix of the attributes holding the time to get home by each mode of transport.
+TIME_FROM_HOME_PREFIX = 'time_from_home_'
+
+# The format event dates are parsed with where datetime.fromisoformat() isn't available (before
+# Python 3.7), once the colon is taken out of their offset.
+EVENT_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+_metro_trains_client = None
+_readable_times = {}
+_readable_metres = {}
+_readable_kilometres = {}
+_numpy = False # Not yet imported; None if it isn't available.
+_fromisoformat = getattr(datetime, 'fromisoformat', None) # Only from Python 3.7.
+
 def alexa_sound_effect(sound_effect_name):
   """@see https://developer.amazon.com/docs/custom-skills/ask-soundlibrary.html"""
   return "<audio src='soundbank://soundlibrary/office/amzn_sfx_" + sound_effect_name + "'/>"
 
-def get_event_suburb(event):
+def _as_list(values):
+  """Converts NumPy arrays and `array`s into lists of plain Python numbers."""
+  return values.tolist() if hasattr(values, 'tolist') else values
+
+def as_location_event(event):
+  """Returns a LocationEvent for an event, decoding it first if it's still a DynamoDB item."""
+  return event if isinstance(event, LocationEvent) else LocationEvent(event)
+
+def _build_readable_time(seconds):
+  """Builds a readable time from scratch. @see get_readable_time_from_seconds()"""
+
+  hours = seconds // SECONDS_IN_AN_HOUR
+  minutes = seconds // SECONDS_IN_A_MINUTE - hours * MINUTES_IN_AN_HOUR
+
+  if hours >= 1:
+
+    readable_time = str(hours) + ' ' + maybe_pluralise('hour', hours)
+    minutes = round_to_nearest(minutes, 5)
+
+    if minutes > 5:
+      readable_time += ' and ' + str(minutes) + ' ' + maybe_pluralise('minute', minutes)
+
+  else:
+
+    if minutes > 10:
+      minutes = round_to_nearest(minutes, 5)
+
+    readable_time = str(minutes) + ' ' + maybe_pluralise('minute', minutes)
+
+  return readable_time
+
+def get_event_columns(events, columns=None):
   """
-  Returns the second to last comma-separated portion of a Proximity Events address, which basically
-  appears to always be the suburb. eg. '20 Main Street, Box Hill, VIC'
+  Converts a list of events into compact columns of floats - a NumPy array per column if NumPy is
+  available, or an `array` of doubles if not - so that they can be filtered in bulk. Only the named
+  columns are extracted, if given. Missing or invalid values are NaN.
   """
-  event_address_parts = event['event_address']['S'].split(', ')
-  return event_address_parts[len(event_address_parts) - 2] # eg. in 3 part list of 0,1,2, we want 1.
+
+  events = [as_location_event(event) for event in events]
+  extracted = {}
+
+  for column in columns or ('timestamp',) + EVENT_COLUMNS:
+    extracted[column] = array('d', [_get_field_or_nan(event, column) for event in events])
+
+  numpy = _get_numpy()
+  if numpy is not None:
+    extracted = {column: numpy.frombuffer(values, dtype=numpy.float64) \
+      for column, values in extracted.items()}
+
+  return extracted
+
+def get_event_suburb(event):
+  return as_location_event(event).suburb
 
 def get_event_timestamp(event):
-  event_date = event['event_date']['S']
-  event_date_format = '%Y-%m-%dT%H:%M:%S%z'
+  return as_location_event(event).timestamp
 
-  # Since event_date comes through with eg. ...+11:00 and %z expects +1100, we remove the colon.
-  # @see https://stackoverflow.com/questions/30999230/parsing-timezone-with-colon
-  if ':' == event_date[-3:-2]:
-    event_date = event_date[:-3] + event_date[-2:]
+def _get_field_or_nan(event, field):
+  try:
+    return getattr(event, field)
+  except (KeyError, ValueError):
+    return float('nan')
+
+def _get_numpy():
+  """Imports NumPy on first use, so it doesn't slow down cold starts. Returns None without it."""
+  global _numpy
+
+  if _numpy is False:
+    try:
+      import numpy
+      _numpy = numpy
+    except ImportError:
+      _numpy = None
+
+  return _numpy
+
+def get_metro_trains_client():
+  """
+  Returns the Metro Trains client, which is kept for the life of the warm container. It's only
+  imported when it's first needed, as `requests` is slow to import on a cold start.
+  """
+  global _metro_trains_client
+
+  if _metro_trains_client is None:
+    import metro_trains
+    _metro_trains_client = metro_trains.MetroTrainsClient(
+      METRO_TRAINS_ENDPOINT,
+      ttl=METRO_TRAINS_CACHE_TTL_IN_SECONDS,
+      max_staleness=METRO_TRAINS_MAX_STALENESS_IN_SECONDS,
+      connect_timeout=METRO_TRAINS_CONNECT_TIMEOUT_IN_SECONDS,
+      read_timeout=METRO_TRAINS_READ_TIMEOUT_IN_SECONDS,
+    )
 
-  return datetime.strptime(event_date, event_date_format).timestamp()
+  return _metro_trains_client
 
+@metrics.timed('MetroTrainsFetchTime')
 def get_metro_trains_line_data(line_id):
   """
   Returns the most recent status currently set on a Metro Trains line (Melbourne, Australia), along
   with the line name.
   """
+  return get_metro_trains_client().get_line_data(line_id)
 
-  data = json.loads(requests.get(METRO_TRAINS_ENDPOINT).content)
+def get_readable_clock_time(when):
+  """Make a time of day nice and readable (speakable), to the nearest 5 minutes. eg. '5:45 pm'"""
 
-  # Line IDs currently range from 82-98, with some missing, plus 168307. You can find your line ID
-  # in the source of metrotrains.com.au.
-  if str(line_id) not in data:
-    raise ValueError('The Metro Trains line ID ' + str(line_id) + ' could not be found.')
+  minutes = round_to_nearest(when.hour * MINUTES_IN_AN_HOUR + when.minute, 5) % (24 * 60)
+  hours, minutes = divmod(minutes, MINUTES_IN_AN_HOUR)
+  readable_time = str(hours % 12 or 12)
 
-  line_data = data[str(line_id)]
-  response = {}
+  if minutes:
+    readable_time += ':' + str(minutes).zfill(2)
 
-  # We need a fallback for lines that don't have their line_name set.
-  if 'line_name' in line_data:
-    response['name'] = line_data['line_name']
-  else:
-    response['name'] = 'train' # This way, 'the train line' will still make sense ;)
-
-  # If `alerts` is a string, it always means good service. Otherwise, the most recent alert is first
-  # in a list. `alert_type` (in order of increasing severity) can be 'travel', 'works', 'minor',
-  # 'major' or 'suspended'.
-  if isinstance(line_data['alerts'], str):
-    response['status'] = 'good'
-  else:
-    response['status'] = line_data['alerts'][0]['alert_type']
-
-  return response
+  return readable_time + (' am' if hours < 12 else ' pm')
 
 def get_readable_distance_from_metres(distance):
-  """We'll generally read distances in kilometres, unless it's less than .95 of a kilometre."""
+  """
+  We'll generally read distances in kilometres, unless it's less than .95 of a kilometre. Each
+  readable distance is only built once, and then looked up - see READABLE_CACHE_SIZE.
+  """
+
   if distance < 950:
-    return str(round(distance)) + 'm'
+    table, rounded, unit = _readable_metres, round(distance), 'm'
   else:
-    return str(round(distance / 1000)) + 'km'
-
-def get_readable_time_from_seconds(seconds  ):
-  """Make the time nice and readable (speakable)."""
-
-  hours = seconds // SECONDS_IN_AN_HOUR
-  minutes = seconds // SECONDS_IN_A_MINUTE - hours * MINUTES_IN_AN_HOUR
-
-  if hours >= 1:
+    table, rounded, unit = _readable_kilometres, round(distance / 1000), 'km'
 
-    readable_time = str(hours) + ' ' + maybe_pluralise('hour', hours)
-    minutes = round_to_nearest(minutes, 5)
+  try:
+    return table[rounded]
+  except KeyError:
+    return _remember_readable(table, rounded, str(rounded) + unit)
 
-    if minutes > 5:
-      readable_time += ' and ' + str(minutes) + ' ' + maybe_pluralise('minute', minutes)
+def get_readable_distances_from_metres(distances):
+  """
+  Makes a whole column of distances - eg. from get_event_columns() - readable at once, for summaries
+  of many events. Missing (NaN) distances are None.
+  """
+  return [
+    None if distance != distance else get_readable_distance_from_metres(distance)
+    for distance in _as_list(distances)
+  ]
 
-  else:
+def get_readable_time_from_seconds(seconds):
+  """
+  Make the time nice and readable (speakable). Readable times only depend on the whole number of
+  minutes, so times in whole seconds are built once per minute, and then looked up.
+  """
 
-    if minutes > 10:
-      minutes = round_to_nearest(minutes, 5)
+  if seconds.__class__ is not int:
+    return _build_readable_time(seconds)
 
-    readable_time = str(minutes) + ' ' + maybe_pluralise('minute', minutes)
+  minutes = seconds // SECONDS_IN_A_MINUTE
 
-  return readable_time
+  try:
+    return _readable_times[minutes]
+  except KeyError:
+    return _remember_readable(
+      _readable_times, minutes, _build_readable_time(minutes * SECONDS_IN_A_MINUTE)
+    )
 
-def is_event_accurate_enough(event):
-  event_accuracy = float(event['event_accuracy_m']['S'])
-  if event_accuracy > VALID_EVENT_MAX_ACCURACY_IN_METRES:
+def get_readable_times_from_seconds(times):
+  """
+  Makes a whole column of times - eg. from get_event_columns() - readable at once, for summaries of
+  many events. Times are truncated to whole seconds, as LocationEvent does, and missing (NaN) times
+  are None.
+  """
+  return [
+    None if seconds != seconds else get_readable_time_from_seconds(int(seconds))
+    for seconds in _as_list(times)
+  ]
+
+def is_event_accurate_enough(event, max_accuracy=None):
+  """Whether an event is accurate to within `max_accuracy`, or else the configured limit."""
+  if max_accuracy is None: max_accuracy = VALID_EVENT_MAX_ACCURACY_IN_METRES
+  event_accuracy = as_location_event(event).accuracy
+  if event_accuracy > max_accuracy:
     return False
   return True
 
@@ -120,15 +261,220 @@ def is_timestamp_new_enough(timestamp):
 
 def json_encode(object):
   """
-  Passes custom JSON encoding to an alternative method. Mainly used for compacting log output.
-  @see http://jsonpickle.github.io/api.html#customizing-json-output
+  Compactly encodes an object as JSON, mainly for log output. Alexa SDK models are encoded through
+  their to_dict(), and anything else JSON can't encode through its attributes, or as a string.
   """
-  return jsonpickle.pickler.encode(object, unpicklable=False)
+  return json.dumps(object, default=_json_default, separators=(',', ':'))
+
+def _json_default(value):
+  if hasattr(value, 'to_dict'): return value.to_dict()
+  if isinstance(value, Enum): return value.value
+  if isinstance(value, datetime): return value.isoformat()
+  if hasattr(value, '__dict__'): return vars(value)
+  return str(value)
 
 def maybe_pluralise(word, number):
   if number == 1: return word
   else: return word + 's'
 
+@lru_cache(maxsize=EVENT_DATE_CACHE_SIZE)
+def parse_event_date(event_date):
+  """
+  Returns the timestamp of an ISO 8601 event date, eg. 2018-12-30T17:58:37+11:00. The results are
+  cached, as the same events are parsed again on each scan.
+  """
+
+  metrics.count('EventDatesParsed')
+
+  # fromisoformat() is many times faster than strptime(), but doesn't accept quite the same things.
+  if _fromisoformat is not None:
+    try:
+      parsed = _fromisoformat(event_date)
+      if parsed.tzinfo is not None:
+        return parsed.timestamp()
+    except ValueError:
+      pass
+
+  return _strptime_event_date(event_date).timestamp()
+
+def parse_event_datetime(event_date):
+  """
+  Returns an ISO 8601 event date as a datetime, in the event's own timezone if it has an offset.
+  Raises a ValueError if it can't be parsed.
+  """
+  if _fromisoformat is not None:
+    return _fromisoformat(event_date)
+  return _strptime_event_date(event_date)
+
+def _strptime_event_date(event_date):
+  # Since event_date comes through with eg. ...+11:00 and %z expects +1100, we remove the colon.
+  # @see https://stackoverflow.com/questions/30999230/parsing-timezone-with-colon
+  if ':' == event_date[-3:-2]:
+    event_date = event_date[:-3] + event_date[-2:]
+
+  return datetime.strptime(event_date, EVENT_DATE_FORMAT)
+
+def _remember_readable(table, key, readable):
+  if len(table) < READABLE_CACHE_SIZE:
+    table[key] = readable
+  return readable
+
 def round_to_nearest(number, nearest=5):
   """@see https://stackoverflow.com/questions/2272149/round-to-5-or-other-number-in-python"""
   return int(nearest * round(float(number) / nearest))
+
+def select_newest_valid_event(events, columns=None):
+  """
+  Returns the index of the newest event that is both accurate enough and new enough, or None if
+  there isn't one. The validity checks and the selection are done in one pass over the columns from
+  get_event_columns(), which can be passed in if they've already been extracted.
+  """
+
+  if columns is None:
+    columns = get_event_columns(events, ('timestamp', 'accuracy'))
+
+  oldest_valid_timestamp = time() - VALID_EVENT_MAX_AGE_IN_SECONDS
+  timestamps = columns['timestamp']
+  accuracies = columns['accuracy']
+
+  numpy = _get_numpy()
+  if numpy is not None and isinstance(timestamps, numpy.ndarray):
+    if not len(timestamps):
+      return None
+
+    # NaNs fail both comparisons, so events with missing data are never valid.
+    valid = (accuracies <= VALID_EVENT_MAX_ACCURACY_IN_METRES) & \
+      (timestamps >= oldest_valid_timestamp)
+    newest = int(numpy.argmax(numpy.where(valid, timestamps, -numpy.inf)))
+    return newest if valid[newest] else None
+
+  newest = None
+  newest_timestamp = 0
+
+  for index, timestamp in enumerate(timestamps):
+    if timestamp > newest_timestamp and timestamp >= oldest_valid_timestamp and \
+      accuracies[index] <= VALID_EVENT_MAX_ACCURACY_IN_METRES:
+      newest = index
+      newest_timestamp = timestamp
+
+  return newest
+
+############################
+# Location events
+############################
+
+class LocationEvent:
+  """
+  A location event from Proximity Events, decoded once from its DynamoDB item. Each field is kept
+  as its raw string until it's first used, and is then parsed and remembered - so events can be
+  passed around, cached and held in bulk without re-parsing or holding on to the whole item.
+  Fields missing from the item raise a KeyError when they're used.
+  """
+
+  __slots__ = (
+    'event_id', 'event_date', '_address', '_suburb', '_timestamp', '_accuracy',
+    '_distance_from_home', '_distance_from_work', '_times_from_home', '_latitude', '_longitude'
+  )
+
+  def __init__(self, item):
+    self.event_id = _unwrap(item.get('eventId'))
+    self.event_date = _unwrap(item.get('event_date'))
+    self._address = _unwrap(item.get('event_address'))
+    self._latitude = _unwrap(item.get('event_latitude'))
+    self._longitude = _unwrap(item.get('event_longitude'))
+    self._accuracy = _unwrap(item.get('event_accuracy_m'))
+    self._distance_from_home = _unwrap(item.get('distance_from_home'))
+    self._distance_from_work = _unwrap(item.get('distance_from_work'))
+    self._suburb = None
+    self._timestamp = None
+
+    self._times_from_home = {
+      name[len(TIME_FROM_HOME_PREFIX):]: _unwrap(value)
+      for name, value in item.items() if name.startswith(TIME_FROM_HOME_PREFIX)
+    }
+
+  def __repr__(self):
+    return 'LocationEvent(' + str(self.event_id) + ' at ' + str(self.event_date) + ')'
+
+  @property
+  def coordinates(self):
+    """The event's latitude and longitude, or None if it doesn't have them."""
+    try:
+      return float(self._latitude), float(self._longitude)
+    except (TypeError, ValueError):
+      return None
+
+  @property
+  def suburb(self):
+    """
+    The second to last comma-separated portion of a Proximity Events address, which basically
+    appears to always be the suburb. eg. '20 Main Street, Box Hill, VIC'
+
+    Only if there's no address to take it from is the suburb nearest to the event's coordinates
+    used instead, from the offline suburb index - see geo_index.py. The index only knows roughly
+    where the middle of each suburb is, so it can easily name the suburb next door.
+    """
+    if self._suburb is None:
+      event_address_parts = (self._address or '').split(', ')
+      if len(event_address_parts) > 1:
+        self._suburb = event_address_parts[len(event_address_parts) - 2] # eg. of 0,1,2, we want 1.
+    if self._suburb is None:
+      coordinates = self.coordinates
+      if coordinates is not None:
+        self._suburb = geo_index.find_suburb(*coordinates)
+    if self._suburb is None:
+      event_address_parts = _require(self._address, 'event_address').split(', ')
+      self._suburb = event_address_parts[len(event_address_parts) - 2]
+    return self._suburb
+
+  @property
+  def timestamp(self):
+    if self._timestamp is None:
+      self._timestamp = parse_event_date(_require(self.event_date, 'event_date'))
+    return self._timestamp
+
+  @property
+  def accuracy(self):
+    if not isinstance(self._accuracy, float):
+      self._accuracy = float(_require(self._accuracy, 'event_accuracy_m'))
+    return self._accuracy
+
+  @property
+  def distance_from_home(self):
+    if not isinstance(self._distance_from_home, float):
+      self._distance_from_home = float(_require(self._distance_from_home, 'distance_from_home'))
+    return self._distance_from_home
+
+  @property
+  def distance_from_work(self):
+    if not isinstance(self._distance_from_work, float):
+      self._distance_from_work = float(_require(self._distance_from_work, 'distance_from_work'))
+    return self._distance_from_work
+
+  @property
+  def time_from_home(self):
+    """The time to get home by public transport, in seconds."""
+    return self.get_time_from_home('public_transport')
+
+  @property
+  def time_from_home_modes(self):
+    """The modes of transport this event has a time to get home for, eg. 'public_transport'."""
+    return list(self._times_from_home)
+
+  def get_time_from_home(self, mode):
+    """The time to get home by a mode of transport, in seconds."""
+    time_from_home = _require(self._times_from_home.get(mode), TIME_FROM_HOME_PREFIX + mode)
+    if not isinstance(time_from_home, int):
+      time_from_home = self._times_from_home[mode] = int(time_from_home)
+    return time_from_home
+
+def _require(value, attribute):
+  if value is None:
+    raise KeyError(attribute)
+  return value
+
+def _unwrap(value):
+  """Returns the raw string from a DynamoDB number or string attribute value, or None."""
+  if value is None:
+    return None
+  return value['N'] if 'N' in value else value.get('S')
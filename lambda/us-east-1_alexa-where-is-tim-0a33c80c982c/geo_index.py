@@ -0,0 +1,237 @@
+"""
+An offline index of suburbs, for working out which suburb a location event was in from its
+coordinates when its address can't be read.
+
+The index is built from a CSV of suburb names and centroids into a single binary file, which is
+memory-mapped the first time a suburb is looked up, so it costs nothing on a cold start. Only the
+pages a lookup touches are read in. Suburbs are bucketed into a grid of cells at least
+MAX_DISTANCE_IN_METRES across, so a lookup only checks the centroids in the nine cells around a
+point, and picks the nearest. A point further than that from every centroid isn't matched.
+
+The nearest centroid isn't always the suburb a point is in, so the index is only a fallback, and
+isn't built by default. The bundled suburbs.csv has approximate centroids for a sample of Melbourne
+suburbs and regional Victorian cities - it should be replaced with a complete list, eg. from the
+ABS's suburbs and localities, before being relied on. Build it with `make geo-index`, or:
+
+Usage: python geo_index.py suburbs.csv suburbs.idx
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import sys
+import csv
+import struct
+import logging
+import argparse
+
+from os import getenv, path
+from math import cos, hypot, radians
+from array import array
+from bisect import bisect_left
+
+# Where the built index is read from.
+GEO_INDEX_PATH = \
+  getenv('GEO_INDEX_PATH', path.join(path.dirname(path.abspath(__file__)), 'suburbs.idx'))
+
+# How far a point can be from a suburb's centroid and still be matched to it, in metres.
+MAX_DISTANCE_IN_METRES = 4000
+
+METRES_PER_DEGREE = 111195
+
+# The magic number, the number of suburbs, the grid's rows and columns, the latitude and longitude
+# of its south-west corner, the size of its cells in degrees, and the maximum distance in metres.
+# This is followed by each suburb's latitude and longitude (as doubles), the index of the first
+# suburb in each cell (as unsigned ints), and the offset of each suburb's name in the UTF-8 names
+# that finish the file. Everything is little-endian, and suburbs are sorted by cell.
+_HEADER = struct.Struct('<4sIIIdddd')
+_MAGIC = b'SUB1'
+
+logger = logging.getLogger(__name__)
+
+# The index is opened the first time it's needed - see get_index(). False means it's unavailable.
+_index = None
+
+class GeoIndex:
+  """Finds the nearest suburb to a point, from an index built by build_index()."""
+
+  __slots__ = (
+    'buffer', 'suburbs', 'rows', 'columns', 'min_latitude', 'min_longitude', 'cell_size',
+    'max_distance', 'latitudes', 'longitudes', 'cell_starts', 'name_offsets', 'names', '_decoded'
+  )
+
+  def __init__(self, buffer):
+    if sys.byteorder != 'little':
+      raise ValueError('The suburb index can only be read on little-endian machines')
+
+    magic, self.suburbs, self.rows, self.columns, self.min_latitude, self.min_longitude, \
+      self.cell_size, self.max_distance = _HEADER.unpack_from(buffer)
+
+    if magic != _MAGIC:
+      raise ValueError('Not a suburb index')
+
+    # Views straight onto the buffer, so nothing is copied out of a memory-mapped file.
+    self.buffer = buffer
+    view = memoryview(buffer)
+    offset = _HEADER.size
+    self.latitudes, offset = _view(view, offset, 'd', self.suburbs)
+    self.longitudes, offset = _view(view, offset, 'd', self.suburbs)
+    self.cell_starts, offset = _view(view, offset, 'I', self.rows * self.columns + 1)
+    self.name_offsets, offset = _view(view, offset, 'I', self.suburbs + 1)
+    self.names = view[offset:]
+    self._decoded = {}
+
+  @classmethod
+  def open(cls, filename):
+    """Memory-maps an index file."""
+    import mmap
+    with open(filename, 'rb') as file:
+      return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+  def find_suburb(self, latitude, longitude):
+    """Returns the name of the suburb nearest to a point, or None if none are close enough."""
+
+    row = int((latitude - self.min_latitude) // self.cell_size)
+    column = int((longitude - self.min_longitude) // self.cell_size)
+
+    if row < -1 or row > self.rows or column < -1 or column > self.columns:
+      return None
+
+    # Distances are compared in degrees of latitude, with longitude scaled to match.
+    scale = cos(radians(latitude))
+    nearest = None
+    nearest_distance = (self.max_distance / METRES_PER_DEGREE) ** 2
+    latitudes, longitudes, cell_starts = self.latitudes, self.longitudes, self.cell_starts
+
+    for cell_row in range(max(0, row - 1), min(self.rows, row + 2)):
+      first_cell = cell_row * self.columns
+      for cell in range(
+        first_cell + max(0, column - 1), first_cell + min(self.columns, column + 2)
+      ):
+        for suburb in range(cell_starts[cell], cell_starts[cell + 1]):
+          latitude_distance = latitudes[suburb] - latitude
+          longitude_distance = (longitudes[suburb] - longitude) * scale
+          distance = latitude_distance * latitude_distance + \
+            longitude_distance * longitude_distance
+          if distance < nearest_distance:
+            nearest, nearest_distance = suburb, distance
+
+    return None if nearest is None else self.get_name(nearest)
+
+  def get_name(self, suburb):
+    name = self._decoded.get(suburb)
+    if name is None:
+      start, end = self.name_offsets[suburb], self.name_offsets[suburb + 1]
+      name = self._decoded[suburb] = bytes(self.names[start:end]).decode('utf-8')
+    return name
+
+def get_distance(latitude, longitude, other_latitude, other_longitude):
+  """
+  The distance between two points in metres, measured on a flat projection around the first. This
+  is what the index finds the nearest suburb by, and is close enough over the distances it matches.
+  """
+  scale = cos(radians(latitude))
+  return METRES_PER_DEGREE * hypot(other_latitude - latitude, (other_longitude - longitude) * scale)
+
+def _view(view, offset, typecode, count):
+  """Casts part of a buffer to an array-like view of `count` values, returning the next offset."""
+  size = array(typecode).itemsize * count
+  return view[offset:offset + size].cast(typecode), offset + size
+
+def build_index(suburbs, max_distance=MAX_DISTANCE_IN_METRES):
+  """Builds an index from a list of (name, latitude, longitude), and returns it as bytes."""
+
+  if not suburbs:
+    raise ValueError('At least one suburb is needed to build an index')
+
+  # Cells are at least `max_distance` across, even where degrees of longitude are narrowest - which
+  # is as far from the equator as a point can be and still be matched.
+  furthest_from_equator = \
+    max(abs(latitude) for _, latitude, _ in suburbs) + max_distance / METRES_PER_DEGREE
+  cell_size = max_distance / (METRES_PER_DEGREE * cos(radians(furthest_from_equator)))
+
+  min_latitude = min(latitude for _, latitude, _ in suburbs)
+  min_longitude = min(longitude for _, _, longitude in suburbs)
+  rows = int((max(latitude for _, latitude, _ in suburbs) - min_latitude) // cell_size) + 1
+  columns = int((max(longitude for _, _, longitude in suburbs) - min_longitude) // cell_size) + 1
+
+  def get_cell(suburb):
+    _, latitude, longitude = suburb
+    return int((latitude - min_latitude) // cell_size) * columns + \
+      int((longitude - min_longitude) // cell_size)
+
+  suburbs = sorted(suburbs, key=get_cell)
+  cells = [get_cell(suburb) for suburb in suburbs]
+  names = [name.encode('utf-8') for name, _, _ in suburbs]
+
+  name_offsets = array('I', [0])
+  for name in names:
+    name_offsets.append(name_offsets[-1] + len(name))
+
+  parts = [
+    _HEADER.pack(
+      _MAGIC, len(suburbs), rows, columns, min_latitude, min_longitude, cell_size, max_distance
+    ),
+    array('d', [latitude for _, latitude, _ in suburbs]),
+    array('d', [longitude for _, _, longitude in suburbs]),
+    array('I', [bisect_left(cells, cell) for cell in range(rows * columns + 1)]),
+    name_offsets,
+  ]
+
+  for part in parts[1:]:
+    if sys.byteorder != 'little': part.byteswap()
+
+  return b''.join(part if isinstance(part, bytes) else part.tobytes() for part in parts) + \
+    b''.join(names)
+
+def read_suburbs(filename):
+  """Reads (name, latitude, longitude) from a CSV with `suburb`, `latitude` and `longitude`."""
+  with open(filename, newline='', encoding='utf-8') as file:
+    return [
+      (row['suburb'], float(row['latitude']), float(row['longitude']))
+      for row in csv.DictReader(file)
+    ]
+
+def get_index():
+  """
+  Returns the index, memory-mapping it on first use and keeping it for the life of the warm
+  container - or None, if it isn't available.
+  """
+  global _index
+
+  if _index is None:
+    try:
+      _index = GeoIndex.open(GEO_INDEX_PATH)
+    except (OSError, ValueError, struct.error) as error:
+      logger.info('Finding suburbs from addresses, as the suburb index is unavailable: ' + \
+        repr(error))
+      _index = False
+
+  return _index or None
+
+def find_suburb(latitude, longitude):
+  """Returns the suburb nearest to a point, or None if none are close enough or there's no index."""
+  index = get_index()
+  return None if index is None else index.find_suburb(latitude, longitude)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Builds the suburb index from a CSV of centroids.')
+  parser.add_argument('csv', help='a CSV of suburbs, with suburb, latitude and longitude columns')
+  parser.add_argument('index', help='the path to write the index to')
+  parser.add_argument('--max-distance', type=float, default=MAX_DISTANCE_IN_METRES,
+    help='how far from a centroid a point can be matched to it, in metres (default: ' + \
+      str(MAX_DISTANCE_IN_METRES) + ')')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  suburbs = read_suburbs(args.csv)
+  data = build_index(suburbs, args.max_distance)
+
+  with open(args.index, 'wb') as file:
+    file.write(data)
+
+  logger.info('Wrote ' + str(len(suburbs)) + ' suburbs to ' + args.index + ' (' + \
+    str(len(data)) + ' bytes)')
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Compacts location events into a summary of each day's commute home, so that questions about the
+past - eg. "is he later than usual?" - can be answered without scanning every event ever recorded.
+
+Each commute is summarised by when it left work and when it got home, in seconds since local
+midnight, along with the routing estimate for each `time_from_home_*` mode of transport as it left.
+A person's commutes for a month are packed into a single item of the history table, as a flat array
+of unsigned 32-bit integers - around 20 bytes a day - so a whole year of history is a single Query
+of twelve small items. Commutes are picked out of the events the same way estimator.py follows
+trips home.
+
+The history table needs `event_partition` (a string) as its partition key and `month` (a string,
+eg. '2019-01') as its sort key. Each run merges the commutes it finds into the months already
+stored, day by day, so it can be run as often as is useful - eg. nightly - and again after events
+are backfilled, without losing commutes whose events have since expired from the events table.
+
+Usage: python history.py EVENTS_TABLE HISTORY_TABLE [--partition events] [--dry-run]
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import sys
+import events
+import logging
+import argparse
+import estimator
+import functions
+
+from array import array
+from datetime import date
+
+MONTH_ATTRIBUTE = 'month'
+COMMUTES_ATTRIBUTE = 'commutes'
+COMMUTE_MODES_ATTRIBUTE = 'commute_modes'
+
+# Stands in for a mode of transport that a commute has no routing estimate for.
+MISSING = 0xFFFFFFFF
+
+# Each commute is packed as its day of the month, when it left work and when it got home, followed
+# by the routing estimate for each of the month's modes of transport.
+_COMMUTE_FIELDS = 3
+
+logger = logging.getLogger(__name__)
+
+class DaySummary:
+  """A commute home: the day it was on, and when it left work and got home, in local time."""
+
+  __slots__ = ('date', 'departed_at', 'arrived_at', 'times_from_home')
+
+  def __init__(self, date, departed_at, arrived_at, times_from_home=None):
+    self.date = date
+    self.departed_at = departed_at
+    self.arrived_at = arrived_at
+    self.times_from_home = times_from_home or {}
+
+  def __repr__(self):
+    return 'DaySummary(' + self.date.isoformat() + ', ' + str(self.departed_at) + ', ' + \
+      str(self.arrived_at) + ')'
+
+  def __eq__(self, other):
+    return isinstance(other, DaySummary) and all(
+      getattr(self, name) == getattr(other, name) for name in self.__slots__
+    )
+
+  @property
+  def duration(self):
+    """How long the commute took, in seconds."""
+    return self.arrived_at - self.departed_at
+
+def summarise_commutes(location_events):
+  """
+  Picks each commute home out of a person's events, which must be oldest first, and returns a
+  DaySummary for each. A commute leaves work at the last fix there, and is dated by that fix.
+  """
+
+  trip = estimator.TripEstimator()
+  departure = None
+  summaries = []
+
+  for event in location_events:
+    if event.distance_from_work <= estimator.AT_WORK_DISTANCE:
+      departure = event
+
+    duration = trip.update(event)
+    if duration is None or departure is None:
+      continue
+
+    local_date = estimator.get_local_datetime(departure)
+    departed_at = local_date.hour * 3600 + local_date.minute * 60 + local_date.second
+    times_from_home = {}
+
+    for mode in departure.time_from_home_modes:
+      try:
+        times_from_home[mode] = departure.get_time_from_home(mode)
+      except (KeyError, ValueError):
+        pass
+
+    summaries.append(DaySummary(
+      local_date.date(), departed_at, departed_at + int(duration), times_from_home
+    ))
+
+  return summaries
+
+def pack_commutes(summaries):
+  """Packs a month of commutes into bytes. Returns the modes of transport, and the bytes."""
+
+  modes = sorted({mode for summary in summaries for mode in summary.times_from_home})
+  values = array('I')
+
+  for summary in summaries:
+    values.extend((summary.date.day, summary.departed_at, summary.arrived_at))
+    values.extend(
+      min(max(0, summary.times_from_home.get(mode, MISSING)), MISSING) for mode in modes
+    )
+
+  # Stored little-endian, whatever the machine doing the packing.
+  if sys.byteorder == 'big': values.byteswap()
+  return modes, values.tobytes()
+
+def unpack_commutes(year, month, modes, data):
+  """Unpacks a month of commutes packed by pack_commutes(), as DaySummaries."""
+
+  values = array('I', data)
+  if sys.byteorder == 'big': values.byteswap()
+
+  stride = _COMMUTE_FIELDS + len(modes)
+  summaries = []
+
+  for start in range(0, len(values), stride):
+    times = values[start + _COMMUTE_FIELDS:start + stride]
+    summaries.append(DaySummary(
+      date(year, month, values[start]), values[start + 1], values[start + 2],
+      {mode: seconds for mode, seconds in zip(modes, times) if seconds != MISSING}
+    ))
+
+  return summaries
+
+def merge_commutes(stored, summaries, first_day=None):
+  """
+  Merges freshly summarised commutes into those already stored for a month, day by day: days with
+  fresh commutes replace what was stored for them, and other stored days are kept as they are. The
+  stored commutes are kept for `first_day` - the day of the oldest event left - as some of its
+  events may have expired.
+  """
+
+  stored_days = {summary.date for summary in stored}
+  fresh = [
+    summary for summary in summaries
+    if summary.date != first_day or summary.date not in stored_days
+  ]
+  fresh_days = {summary.date for summary in fresh}
+
+  merged = [summary for summary in stored if summary.date not in fresh_days] + fresh
+  merged.sort(key=lambda summary: (summary.date, summary.departed_at))
+  return merged
+
+def get_month(day):
+  """The history table's sort key for the month a date is in, eg. '2019-01'."""
+  return day.strftime('%Y-%m')
+
+def to_history_item(partition, month, summaries):
+  """Builds the history table item for a person's month of commutes."""
+  modes, data = pack_commutes(summaries)
+
+  return {
+    events.EVENT_PARTITION_ATTRIBUTE: {'S': partition},
+    MONTH_ATTRIBUTE: {'S': month},
+    COMMUTE_MODES_ATTRIBUTE: {'L': [{'S': mode} for mode in modes]},
+    COMMUTES_ATTRIBUTE: {'B': data},
+  }
+
+def from_history_item(item):
+  """Unpacks the commutes in a history table item, as DaySummaries."""
+  year, month = (int(part) for part in item[MONTH_ATTRIBUTE]['S'].split('-'))
+  modes = [mode['S'] for mode in item.get(COMMUTE_MODES_ATTRIBUTE, {}).get('L', [])]
+  return unpack_commutes(year, month, modes, bytes(item[COMMUTES_ATTRIBUTE]['B']))
+
+def scan_accurate_events(dynamodb, table, default_partition):
+  """
+  Reads every event in a table that's accurate enough to be trusted, as LocationEvents grouped by
+  their partition (ie. the person), oldest first.
+  """
+
+  params = {'TableName': table}
+  events_by_partition = {}
+
+  while True:
+    page = dynamodb.scan(**params)
+
+    for item in page['Items']:
+      try:
+        event = functions.LocationEvent(item)
+        if not functions.is_event_accurate_enough(event): continue
+        # Reading these up front means an event missing them is skipped here, not part way through.
+        event.timestamp, event.distance_from_home, event.distance_from_work
+      except (KeyError, ValueError) as error:
+        logger.warning('Skipping event with missing or invalid data: ' + repr(error))
+        continue
+
+      partition = item.get(events.EVENT_PARTITION_ATTRIBUTE, {}).get('S', default_partition)
+      events_by_partition.setdefault(partition, []).append(event)
+
+    if 'LastEvaluatedKey' not in page:
+      break
+
+    params['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+  for partition_events in events_by_partition.values():
+    partition_events.sort(key=lambda event: event.timestamp)
+
+  return events_by_partition
+
+def compact_history(dynamodb, table, history_table, default_partition, dry_run=False):
+  """
+  Summarises the commutes in every event in a table into the history table, a month to an item,
+  merged with the month's commutes already there. Returns the number of months that changed, and
+  so were (or with `dry_run`, would have been) written.
+  """
+
+  events_by_partition = scan_accurate_events(dynamodb, table, default_partition)
+  written = 0
+
+  for partition, partition_events in events_by_partition.items():
+    first_day = estimator.get_local_datetime(partition_events[0]).date()
+    summaries_by_month = {}
+
+    for summary in summarise_commutes(partition_events):
+      summaries_by_month.setdefault(get_month(summary.date), []).append(summary)
+
+    for month, summaries in sorted(summaries_by_month.items()):
+      stored = read_history_item(dynamodb, history_table, partition, month)
+      merged = merge_commutes(stored, summaries, first_day)
+      if merged == stored: continue
+
+      written += 1
+      if dry_run: continue
+      dynamodb.put_item(TableName=history_table, Item=to_history_item(partition, month, merged))
+
+  return written
+
+def read_history_item(dynamodb, history_table, partition, month):
+  """Reads a person's stored commutes for a month (eg. '2019-01'), or an empty list if none."""
+
+  response = dynamodb.get_item(TableName=history_table, ConsistentRead=True, Key={
+    events.EVENT_PARTITION_ATTRIBUTE: {'S': partition},
+    MONTH_ATTRIBUTE: {'S': month},
+  })
+
+  return from_history_item(response['Item']) if 'Item' in response else []
+
+def read_history(dynamodb, history_table, partition, first_month, last_month):
+  """Reads a person's commutes between two months (eg. '2019-01'), inclusive, oldest first."""
+
+  params = {
+    'TableName': history_table,
+    'KeyConditionExpression': '#partition = :partition AND #month BETWEEN :first AND :last',
+    'ExpressionAttributeNames': {
+      '#partition': events.EVENT_PARTITION_ATTRIBUTE,
+      '#month': MONTH_ATTRIBUTE,
+    },
+    'ExpressionAttributeValues': {
+      ':partition': {'S': partition},
+      ':first': {'S': first_month},
+      ':last': {'S': last_month},
+    },
+  }
+
+  summaries = []
+
+  while True:
+    page = dynamodb.query(**params)
+
+    for item in page['Items']:
+      summaries.extend(from_history_item(item))
+
+    if 'LastEvaluatedKey' not in page:
+      return summaries
+
+    params['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Compacts location events into commute history.')
+  parser.add_argument('table', help='the name of the DynamoDB table of location events')
+  parser.add_argument('history_table', help='the name of the DynamoDB table to write history to')
+  parser.add_argument('--partition', default='events',
+    help='the DYNAMODB_PARTITION of events without an event_partition')
+  parser.add_argument('--dry-run', action='store_true', help='count months without writing them')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  from boto3 import client
+  dynamodb = client('dynamodb')
+
+  written = compact_history(dynamodb, args.table, args.history_table, args.partition, args.dry_run)
+  logger.info(('Would write ' if args.dry_run else 'Wrote ') + str(written) + ' months of history')
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Keeps the current event record up to date as new location events arrive, so that the skill can
+read the newest valid event with a single GetItem rather than selecting it at read time.
+
+This is deployed as a second Lambda function from this directory, with the handler
+`ingest.lambda_handler`, and subscribed to either the events table's DynamoDB stream (with new
+images) or the SNS topic that the webhook parser publishes events to. Events that aren't accurate
+enough or new enough are ignored, using the same rules as the skill, and the current record is
+only ever replaced by a newer event.
+
+Each person's current trip and commute history are kept on their current event record too, and
+followed on to each new event to estimate how long they'll be getting home - see estimator.py.
+That estimate is stored as the `time_from_home_estimated` attribute of the current event.
+
+The current events table needs `event_partition` (a string) as its partition key. The skill reads
+it when DYNAMODB_CURRENT_TABLE is set there too. Events are kept current for the partition - ie. the
+person - in their `event_partition` attribute, or DYNAMODB_PARTITION if they don't have one.
+
+@see events.put_current_event()
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import json
+import events
+import logging
+import estimator
+import functions
+import dynamodb_client
+
+from os import getenv
+
+DYNAMODB_CURRENT_TABLE = getenv('DYNAMODB_CURRENT_TABLE')
+DYNAMODB_PARTITION = getenv('DYNAMODB_PARTITION', 'events')
+
+# The DynamoDB attribute value types, which values already in DynamoDB's format are wrapped in.
+ATTRIBUTE_TYPES = ('S', 'N', 'B', 'SS', 'NS', 'BS', 'M', 'L', 'NULL', 'BOOL')
+
+# @see https://docs.python.org/3/library/logging.html#logging-levels
+LOGGING_LEVEL = getenv('LOGGING_LEVEL', 'INFO')
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOGGING_LEVEL)
+
+# The DynamoDB client is created the first time it's needed - see get_dynamodb(). It has no circuit
+# breaker, as batches that fail are retried by the stream or SNS anyway.
+_dynamodb = None
+
+def get_dynamodb():
+  global _dynamodb
+
+  if _dynamodb is None:
+    _dynamodb = dynamodb_client.Client(dynamodb_client.create_client())
+
+  return _dynamodb
+
+def get_event_items(event):
+  """
+  Yields each location event - as a DynamoDB item - in a batch of DynamoDB stream or SNS records.
+  Stream records for deleted events, which have no new image, are skipped.
+  """
+
+  for record in event.get('Records', []):
+
+    if record.get('eventSource') == 'aws:dynamodb':
+      if 'NewImage' in record.get('dynamodb', {}):
+        yield record['dynamodb']['NewImage']
+
+    elif 'Sns' in record:
+      yield to_item(json.loads(record['Sns']['Message']))
+
+    else:
+      logger.warning('Skipping a record from an unsupported source: %s', record.get('eventSource'))
+
+def to_item(message):
+  """
+  Converts a JSON event into a DynamoDB item. Values that are already typed DynamoDB attribute
+  values are kept as they are.
+  """
+  return {name: _to_attribute_value(value) for name, value in message.items()}
+
+def _to_attribute_value(value):
+  if isinstance(value, dict):
+    if len(value) == 1 and next(iter(value)) in ATTRIBUTE_TYPES:
+      return value
+    return {'M': to_item(value)}
+  if isinstance(value, bool): return {'BOOL': value}
+  if isinstance(value, (int, float)): return {'N': str(value)}
+  if isinstance(value, list): return {'L': [_to_attribute_value(entry) for entry in value]}
+  if value is None: return {'NULL': True}
+  return {'S': str(value)}
+
+def get_valid_events(items):
+  """Returns the valid events in a batch of event items, as (event, item) pairs, oldest first."""
+
+  valid_events = []
+
+  for item in items:
+    try:
+      event = functions.LocationEvent(item)
+      if events.is_event_valid(event):
+        valid_events.append((event, item))
+    except (KeyError, ValueError) as error:
+      logger.warning('Skipping event with missing or invalid data: ' + repr(error))
+
+  valid_events.sort(key=lambda pair: pair[0].timestamp)
+  return valid_events
+
+def get_newest_valid_item(items):
+  """Returns the newest of a batch of event items that is valid, or None if none of them are."""
+  valid_events = get_valid_events(items)
+  return valid_events[-1][1] if valid_events else None
+
+def add_commute_estimate(partition, valid_events):
+  """
+  Follows a person's trip on through a batch of their valid events, starting from the commute kept
+  on their current event record. Returns the newest event's item, with the updated commute and - if
+  there is one - the estimated time from home added.
+  """
+
+  current_item = events.get_current_item(get_dynamodb(), DYNAMODB_CURRENT_TABLE, partition)
+  commute = estimator.Commute.from_item(current_item)
+
+  for event, _ in valid_events:
+    commute.update(event)
+
+  newest_event, newest_item = valid_events[-1]
+  item = dict(newest_item)
+  item.update(commute.to_attributes())
+
+  estimate = commute.estimate_time_from_home(newest_event)
+  if estimate is not None:
+    item[functions.TIME_FROM_HOME_PREFIX + estimator.ESTIMATED_MODE] = {'N': str(estimate)}
+
+  return item
+
+def get_partition(item):
+  """Returns the partition - ie. the person - an event item belongs to."""
+  return item.get(events.EVENT_PARTITION_ATTRIBUTE, {}).get('S', DYNAMODB_PARTITION)
+
+def lambda_handler(event, context):
+  items = list(get_event_items(event))
+  items_by_partition = {}
+  updated = False
+
+  for item in items:
+    items_by_partition.setdefault(get_partition(item), []).append(item)
+
+  for partition, partition_items in items_by_partition.items():
+    valid_events = get_valid_events(partition_items)
+
+    if not valid_events:
+      logger.info('None of the %d events received for %s are valid',
+        len(partition_items), partition)
+      continue
+
+    newest_item = add_commute_estimate(partition, valid_events)
+
+    partition_updated = events.put_current_event(
+      get_dynamodb(), DYNAMODB_CURRENT_TABLE, partition, newest_item
+    )
+    updated = updated or partition_updated
+
+    logger.info('%s the current event for %s with event %s, out of %d received',
+      'Replaced' if partition_updated else 'Kept a newer event than', partition,
+      newest_item.get('eventId'), len(partition_items))
+
+  return {'received': len(items), 'updated': updated}
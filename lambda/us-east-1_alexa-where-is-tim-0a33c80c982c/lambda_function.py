@@ -9,220 +9,450 @@ Depends on the particular structure of geo events placed by the Proximity Events
 @author Tim Malone <tim@timmalone.id.au>
 """
 
+import cache
+import events
+import people
+import speech
+import metrics
 import functions
+import time_sources
+import dynamodb_client
 
 import random
 import logging
 
 from os import getenv
-from pytz import timezone
-from boto3 import client
+from time import monotonic
 from datetime import datetime
+from concurrent import futures
 from ask_sdk_core import skill_builder, dispatch_components, utils
 
+DYNAMODB_CURRENT_TABLE = getenv('DYNAMODB_CURRENT_TABLE')
+DYNAMODB_INDEX = getenv('DYNAMODB_INDEX')
+DYNAMODB_PARTITION = getenv('DYNAMODB_PARTITION', 'events')
+DYNAMODB_SCAN_SEGMENTS = int(getenv('DYNAMODB_SCAN_SEGMENTS', 1))
 DYNAMODB_TABLE = getenv('DYNAMODB_TABLE')
 EXCEPTION_MESSAGE = getenv('EXCEPTION_MESSAGE', 'Sorry, something went wrong.')
 FALLBACK_MESSAGE = getenv('FALLBACK_MESSAGE', 'I\'m not sure exactly what you\'re after.')
 FALLBACK_REPROMPT = getenv('FALLBACK_REPROMPT', 'What would you like me to do?')
 METRO_TRAINS_LINE_ID = int(getenv('METRO_TRAINS_LINE_ID', 0))
+METRO_TRAINS_BUDGET_IN_SECONDS = float(getenv('METRO_TRAINS_BUDGET_IN_SECONDS', '2'))
 PRONOUN = getenv('PRONOUN', 'they/their').split('/')
 TIMEZONE = getenv('TIMEZONE')
 
+# The people the skill can be asked about, as JSON - see people.py. Without it, there's just the one
+# person, configured by the variables above.
+PEOPLE = getenv('PEOPLE')
+
+# Scheduled keep-warm pings on weekdays from KEEP_WARM_REFRESH_FROM_HOUR until
+# KEEP_WARM_REFRESH_UNTIL_HOUR, in each person's time, also refresh their event and train line
+# status ahead of the evening's requests.
+KEEP_WARM_REFRESH_FROM_HOUR = int(getenv('KEEP_WARM_REFRESH_FROM_HOUR', 15))
+KEEP_WARM_REFRESH_UNTIL_HOUR = int(getenv('KEEP_WARM_REFRESH_UNTIL_HOUR', 19))
+
 # @see https://docs.python.org/3/library/logging.html#logging-levels
 LOGGING_LEVEL = getenv('LOGGING_LEVEL', 'INFO')
 
+# If set, 1 in every LOG_SAMPLE_RATE requests has its request and response logged as structured
+# JSON, regardless of LOGGING_LEVEL.
+LOG_SAMPLE_RATE = int(getenv('LOG_SAMPLE_RATE', 0))
+
 skill = skill_builder.SkillBuilder()
 logger = logging.getLogger(__name__)
 logger.setLevel(LOGGING_LEVEL)
 
-dynamodb = client('dynamodb')
+# The DynamoDB client is created the first time it's needed - see get_dynamodb().
+_dynamodb = None
+
+# Once DynamoDB has been throttling or timing out request after request, requests stop waiting on
+# it for a while, and the skill says it's not sure where someone is instead.
+dynamodb_breaker = dynamodb_client.CircuitBreaker('DynamoDB')
+
+# Runs backend lookups in the background, so they can overlap with each other.
+executor = futures.ThreadPoolExecutor(max_workers=2)
+
+people_registry = people.load_registry(PEOPLE, DYNAMODB_PARTITION)
+
+# Everything the skill says, compiled once with the configured pronouns, and when to say it. People
+# with other pronouns have their own templates compiled the first time they're asked about.
+speech_templates = speech.compile_templates(PRONOUN)
+location_ladder = speech.compile_ladder(speech.LOCATION_LADDER)
+compiled_time_sources = time_sources.compile_sources()
+scan_attributes = events.get_scan_attributes(compiled_time_sources)
+_speech_templates_by_pronoun = {}
+
+# Everyone's newest events share the one cache, keyed by their partition.
+event_cache = cache.TimedCache(
+  'Event', functions.EVENT_CACHE_TTL_IN_SECONDS, functions.EVENT_CACHE_MAX_STALENESS_IN_SECONDS,
+  max_entries=functions.EVENT_CACHE_SIZE
+)
+
+# When several requests arrive at once, only one fetch per person - or per train line - goes to the
+# backend, and the rest wait for its result.
+event_fetches = cache.SingleFlight('Event fetch')
+train_line_fetches = cache.SingleFlight('Metro Trains fetch')
+
+# The partitions whose newest event had to be scanned for, as it wasn't in the event index - eg.
+# because it was written without the index attributes. Querying the index for anything newer than
+# their cached event would miss newer events too, so they aren't refreshed that way.
+unindexed_partitions = set()
+
+def get_dynamodb():
+  """
+  Returns the DynamoDB client, creating it on first use and reusing it - along with its pooled
+  connections - for the life of the warm container. boto3 is only imported then, as it's one of the
+  slowest parts of a cold start. See dynamodb_client.py for how it's tuned.
+  """
+  global _dynamodb
+
+  if _dynamodb is None:
+    _dynamodb = dynamodb_client.Client(dynamodb_client.create_client(), dynamodb_breaker)
+
+  return _dynamodb
+
+def get_person(handler_input):
+  """
+  Works out who a request is about: whoever in the household asking was asked about by name, or
+  else the person belonging to it. Returns None if the name asked about isn't anyone in the
+  household, or - with PEOPLE set - if the user asking isn't in any household.
+  """
+
+  name = None
+  if utils.is_intent_name("GetLocation")(handler_input):
+    slot = utils.get_slot(handler_input, 'person')
+    name = slot and slot.value
+
+  return people_registry.find(name, utils.get_user_id(handler_input))
+
+def get_speech_templates(person=None):
+  """Returns the speech templates for a person, with their own pronouns if they have them."""
+
+  if person is None or person.pronoun is None:
+    return speech_templates
 
-def maybe_get_invalid_date_response(now):
+  pronoun = tuple(person.pronoun)
+  if pronoun not in _speech_templates_by_pronoun:
+    _speech_templates_by_pronoun[pronoun] = speech.compile_templates(pronoun)
+
+  return _speech_templates_by_pronoun[pronoun]
+
+def get_local_time(person=None, moment=None):
+  """Returns the time now - or at `moment` - in a person's timezone."""
+
+  from pytz import timezone, utc # Deferred, so it isn't loaded on cold starts that don't need it.
+
+  person = person or people_registry.default
+  moment = moment or datetime.now(utc)
+  return moment.astimezone(timezone(person.timezone or TIMEZONE))
+
+def maybe_get_invalid_date_response(now, templates=None):
   """Checks the current day & time, returning appropriate speech if it's not the right moment."""
 
-  speech = False
+  name = speech.select_moment(now)
+  if name is None:
+    return False
+
+  return speech.render(templates or speech_templates, name)
+
+@metrics.timed('EventLookupTime')
+def get_newest_valid_event(partition=None):
+  """
+  Gets most recent location in a partition - ie. for a person - from the warm container's cache if
+  it's fresh enough, or otherwise from DynamoDB. A stale cached event is kept if the event index
+  shows nothing newer has arrived, or if DynamoDB is unavailable.
+  """
+
+  partition = partition or DYNAMODB_PARTITION
+  started_at = event_cache.clock()
+  entry = get_cached_event(partition)
+
+  if entry is not None and entry.fresh:
+    event_cache.log_stats('hit', started_at)
+    return entry.value
 
-  if now.isoweekday() > 5:
-    speech = PRONOUN[0] + "'s not at work today, so I'm not really sure!"
+  try:
+    return event_fetches.call(partition, fetch_newest_valid_event, partition, entry, started_at)
+  except dynamodb_client.Unavailable as error:
+    if entry is None or entry.value is None:
+      raise
+    logger.warning('Using the cached event, as DynamoDB is unavailable: ' + str(error))
+    return entry.value
 
-  elif now.hour <= 13:
-    speech = "It's too early for " + PRONOUN[1] + " to have left work yet. " + \
-      "Check back with me later."
+def get_cached_event(partition):
+  """Returns the cache entry for a partition's event, if it has one that's still valid."""
 
-  elif now.hour <= 15:
-    speech = "It's a bit too early for " + PRONOUN[1] + " to have left work yet."
+  # The cached event may have aged out of validity, even if it hasn't expired from the cache.
+  return event_cache.get(partition, lambda event: event is None or \
+    functions.is_timestamp_new_enough(event.timestamp))
 
-  return speech
+def fetch_newest_valid_event(partition, entry=None, started_at=None):
+  """
+  Refreshes a partition's cached event with a query for anything newer, if that's cheaper than
+  reading it, or otherwise reads it from DynamoDB - and caches it either way. Only one fetch for
+  each partition is in flight at a time, through `event_fetches`.
+  """
 
-def get_newest_valid_event():
+  if started_at is None:
+    started_at = event_cache.clock()
+
+  # A conditional refresh is only cheaper than a read if there's no current event record to read.
+  if entry is not None and entry.value is not None and DYNAMODB_INDEX and \
+    not DYNAMODB_CURRENT_TABLE and partition not in unindexed_partitions:
+    try:
+      newer_event = events.query_newest_valid_event(
+        get_dynamodb(), DYNAMODB_TABLE, DYNAMODB_INDEX, partition,
+        newer_than=entry.value.timestamp
+      )
+    except events.client_error() as error:
+      logger.warning('Could not refresh the cached event from the event index: ' + str(error))
+    else:
+      if newer_event is None:
+        event_cache.refresh(partition)
+        event_cache.log_stats('refresh', started_at)
+        return entry.value
+
+      event_cache.put(partition, newer_event)
+      event_cache.log_stats('refresh with a newer event', started_at)
+      return newer_event
+
+  event = read_newest_valid_event(partition)
+  event_cache.put(partition, event)
+  event_cache.log_stats('miss', started_at)
+  return event
+
+@metrics.timed('DynamoDBReadTime')
+def read_newest_valid_event(partition=None):
   """
-  Gets most recent location from DynamoDB.
-  Note that as a scan is done on this table, for best performance it should only contain the
-  most recent entries - i.e. a TTL attribute should be used to clean it out regularly.
+  Reads most recent location in a partition from DynamoDB.
+  If DYNAMODB_CURRENT_TABLE is set, the current event record kept by ingest.py is read, and used
+  as long as it's still valid. Otherwise - or if it's missing or stale - the event is selected from
+  the events table instead.
+  If DYNAMODB_INDEX is set, the event index is queried so that only the newest events are read.
+  Otherwise - or if the index can't be queried, or has no valid event, as events written without
+  the index attributes aren't in it - the table is scanned, so for best performance it should only
+  contain the most recent entries - i.e. a TTL attribute should be used to clean it out.
+  If PEOPLE is set, the scan is filtered to the partition, as the table is shared between people.
   """
 
-  newest_valid_event = None
-  newest_valid_event_timestamp = 0
+  partition = partition or DYNAMODB_PARTITION
 
-  for event in dynamodb.scan(TableName=DYNAMODB_TABLE)['Items']:
-    timestamp = functions.get_event_timestamp(event)
+  if DYNAMODB_CURRENT_TABLE:
+    try:
+      event = events.get_current_event(get_dynamodb(), DYNAMODB_CURRENT_TABLE, partition)
+    except events.client_error() as error:
+      logger.warning('Could not read the current event, so falling back to selecting it: ' + \
+        str(error))
+    else:
+      if event is not None and events.is_event_valid(event):
+        return event
+      logger.info('The current event is missing or stale, so falling back to selecting it')
+
+  if DYNAMODB_INDEX:
+    try:
+      event = events.query_newest_valid_event(
+        get_dynamodb(), DYNAMODB_TABLE, DYNAMODB_INDEX, partition
+      )
+    except events.client_error() as error:
+      logger.warning('Could not query the event index, so falling back to a scan: ' + str(error))
+    else:
+      if event is not None:
+        unindexed_partitions.discard(partition)
+        return event
+      logger.info('There is no valid event in the event index, so falling back to a scan')
+
+  event = events.scan_newest_valid_event(
+    get_dynamodb(), DYNAMODB_TABLE, DYNAMODB_SCAN_SEGMENTS, scan_attributes,
+    partition=partition if people_registry.partitioned else None
+  )
 
-    if not functions.is_event_accurate_enough(event) or \
-      not functions.is_timestamp_new_enough(timestamp):
-      continue
+  if DYNAMODB_INDEX and event is not None:
+    unindexed_partitions.add(partition)
 
-    if timestamp > newest_valid_event_timestamp:
-      newest_valid_event = event
-      newest_valid_event_timestamp = timestamp
-      logger.debug('Event ' + event['eventId']['S'] + ' is the newest so far')
+  return event
 
-  return newest_valid_event
+def get_train_line_id(person=None):
+  """Returns the Metro Trains line set for a person, or else the skill's own."""
+  if person is not None and person.metro_trains_line_id is not None:
+    return person.metro_trains_line_id
+  return METRO_TRAINS_LINE_ID
 
-def get_speech_text_response():
+def submit_train_line_fetch(line_id):
+  """Fetches a train line's status in the background, sharing any fetch already in flight."""
+  return executor.submit(
+    train_line_fetches.call, line_id, functions.get_metro_trains_line_data, line_id
+  )
+
+def start_train_line_fetch(person=None):
   """
-  This is where the main work is done!
+  Speculatively starts fetching the Metro Trains line status in the background, if a line is set
+  for the person, so that it overlaps with looking up the newest event. Returns the future, along
+  with the deadline by which it must be done to be used.
   """
 
-  now = datetime.today().astimezone(timezone(TIMEZONE))
+  line_id = get_train_line_id(person)
+  if not line_id:
+    return None
 
-  # Return early if it's not a valid day of the week or time of day.
-  # TODO: You can comment this out to avoid the date/time checks, if desired.
-  speech = maybe_get_invalid_date_response(now)
-  if speech is not False: return speech
+  return submit_train_line_fetch(line_id), monotonic() + METRO_TRAINS_BUDGET_IN_SECONDS
 
-  # Return early if there's no new enough event. Too old, we can't trust it's current.
-  event = get_newest_valid_event()
-  logger.info(event)
-  if event is None: return "I'm sorry, I'm not sure where " + PRONOUN[0] + " is at the moment."
+@metrics.timed('MetroTrainsWaitTime')
+def get_train_line_data(train_line_fetch):
+  """
+  Waits for a background train line fetch until its deadline. If it's too slow or it failed, the
+  train line status is dropped and None is returned, rather than holding up the response.
+  """
+
+  future, deadline = train_line_fetch
+
+  try:
+    return future.result(timeout=max(0, deadline - monotonic()))
+  except futures.TimeoutError:
+    logger.warning('Dropping the Metro Trains line status, as it took too long to fetch')
+  except Exception as error:
+    logger.warning('Dropping the Metro Trains line status, as fetching failed: ' + repr(error))
+
+  metrics.count('MetroTrainsDropped')
+  return None
+
+def call_once(function, *args):
+  """Returns a function that calls `function` with `args` the first time, then returns the same."""
+  results = []
+
+  def call():
+    if not results: results.append(function(*args))
+    return results[0]
+
+  return call
+
+@metrics.timed('SpeechTime')
+def get_speech_text_response(person=None):
+  """
+  This is where the main work is done! Speaks about the default person, unless another is given.
+  """
+
+  person = person or people_registry.default
+  now = get_local_time(person)
 
-  suburb = functions.get_event_suburb(event)
+  # Return early if it's not a valid day of the week or time of day.
+  # TODO: You can comment this out to avoid the date/time checks, if desired.
+  invalid_date_speech = maybe_get_invalid_date_response(now, get_speech_templates(person))
+  if invalid_date_speech is not False: return invalid_date_speech
 
-  distance_from_home = float(event['distance_from_home']['N'])
-  distance_from_work = float(event['distance_from_work']['N'])
+  train_line_fetch = start_train_line_fetch(person)
 
-  readable_distance_from_home = functions.get_readable_distance_from_metres(distance_from_home)
-  readable_distance_from_work = functions.get_readable_distance_from_metres(distance_from_work)
+  try:
+    return get_location_speech_text_response(now, train_line_fetch, person)
+  finally:
+    # If the train line status wasn't needed, there's no point fetching it any further.
+    if train_line_fetch is not None:
+      train_line_fetch[0].cancel()
 
-  # TODO: Work out the best framework for accessing alternative time values here, rather than just
-  #       always `time_from_home_public_transport`.
-  time_from_home = int(event['time_from_home_public_transport']['N'])
-  readable_time_from_home = functions.get_readable_time_from_seconds(time_from_home)
+def get_location_speech_text_response(now, train_line_fetch=None, person=None):
+  """
+  Works out what to say based on a person's newest valid event, and the train line status if it's
+  needed and arrives in time.
+  """
 
-  logger.debug(
-    'Currently in ' + suburb + ', ' + readable_distance_from_home + ' (' + \
-    readable_time_from_home + ') from home and ' + readable_distance_from_work + ' from work.'
+  person = person or people_registry.default
+  templates = get_speech_templates(person)
+
+  # Return early if there's no new enough event. Too old, we can't trust it's current - and if
+  # DynamoDB is unavailable, we can't know.
+  try:
+    event = get_newest_valid_event(person.key)
+  except dynamodb_client.Unavailable as error:
+    logger.warning('Could not get the newest valid event: ' + str(error))
+    event = None
+
+  logger.info('Newest valid event: %s', event)
+  if event is None: return speech.render(templates, 'no_event')
+
+  # The train line status is waited for at most once, whether it's for the time or the speech.
+  train_line_data = None
+  if train_line_fetch is not None:
+    train_line_data = call_once(get_train_line_data, train_line_fetch)
+
+  # The time from home comes from the most accurate source that has one, but isn't worked out until
+  # it's needed - which it isn't for many responses, such as when someone is at work or home.
+  time_from_home = time_sources.TimeFromHome(
+    event, compiled_time_sources, {'train_line_data': train_line_data},
+    train_line_fetch and train_line_fetch[1]
   )
 
+  if logger.isEnabledFor(logging.DEBUG):
+    logger.debug(
+      'Currently in %s, %s from home and %s from work.', event.suburb,
+      functions.get_readable_distance_from_metres(event.distance_from_home),
+      functions.get_readable_distance_from_metres(event.distance_from_work)
+    )
+
   # Work out what to say based on distance from work/home or time to home.
-  if distance_from_work <= 50:
+  location, with_train_status = \
+    speech.select_event_location(location_ladder, event, now, time_from_home)
+  text = speech.render_location(templates, location, event, now, time_from_home)
 
-    if now.hour < 17:
-      speech_choices = [
-        PRONOUN[0] + " hasn't left work yet." + functions.alexa_sound_effect('typing_medium_01'),
-        PRONOUN[0] + "'s still at work." + functions.alexa_sound_effect('typing_medium_01')
-      ]
-      speech = random.choice(speech_choices)
+  logger.debug('Time from home: %s', time_from_home)
 
-    else:
-      speech_choices = [
-        functions.alexa_sound_effect('clear_throat_ahem_01') + \
-          "I don't think " + PRONOUN[0] + "'s left work yet.",
-        "I'm pretty sure " + PRONOUN[0] + "'s still in the office."
-      ]
-      speech = random.choice(speech_choices)
-
-  elif distance_from_work <= 500:
-    speech = \
-      PRONOUN[0] + "'s just left work!" + functions.alexa_sound_effect('crowd_cheer_med_01') + \
-      PRONOUN[0] + " should be home in about " + readable_time_from_home + "."
-
-  elif distance_from_home <= 50:
-    speech_choices = [
-      "I think " + PRONOUN[0] + "'s at home already!",
-      "Looks like " + PRONOUN[0] + "'s already home!"
-    ]
-    speech = random.choice(speech_choices)
-    return speech # No need for optional data to be added on to this.
-
-  elif time_from_home // 60 == 1:
-    speech = PRONOUN[0] + "'ll be here any minute!"
-    return speech # No need for optional data to be added on to this.
-
-  elif time_from_home // 60 < 3:
-    speech = PRONOUN[0] + "'s just around the corner."
-    return speech # No need for optional data to be added on to this.
-
-  elif time_from_home // 60 <= 5:
-    speech = PRONOUN[0] + "'ll be home in less than 5 minutes."
-    return speech # No need for optional data to be added on to this.
-
-  elif distance_from_home <= 200:
-    speech_choices = [
-      PRONOUN[0] + "'s almost here! Around " + readable_time_from_home + " away.",
-      "Not much longer - about " + readable_time_from_home + " to go."
-    ]
-    speech = random.choice(speech_choices)
-    return speech # No need for optional data to be added on to this.
-
-  elif distance_from_home <= 1800:
-    speech_choices = [
-      PRONOUN[0] + "'s almost home! About " + readable_time_from_home + " away, " + \
-        "depending on how the bus goes.",
-      PRONOUN[0] + "'s not far - around " + readable_time_from_home + " to go, " + \
-        "depending on the bus."
-    ]
-    speech = random.choice(speech_choices)
-    return speech # No need for optional data to be added on to this.
-
-  else:
-    speech_choices = [
-      PRONOUN[0] + "'s on his way - " + PRONOUN[0] + " should be home " + \
-        "in around " + readable_time_from_home + ".",
-      PRONOUN[0] + "'s about " + readable_time_from_home + " from home.",
-      PRONOUN[0] + "'s currently in " + suburb + ", about " + readable_time_from_home + " away."
-    ]
-    speech = random.choice(speech_choices)
-
-  # Return early now if we don't have a Metro Trains line ID set.
-  if not METRO_TRAINS_LINE_ID:
-    return speech
+  # Return early now if there's no need for optional data, or we don't have a Metro Trains line ID.
+  if not with_train_status or train_line_data is None:
+    return text
 
   # Potentially add some notes on train line performance.
 
-  line_data = functions.get_metro_trains_line_data(METRO_TRAINS_LINE_ID)
-  line_name = line_data['name']
-
-  train_speech_choices = {
-    "travel": [
-      "Metro have adjusted some services today though, " + \
-        "so " + PRONOUN[0] + " may be a little longer than usual."
-    ],
-    "works": [
-      "Metro are currently doing works on the " + line_name + " line though, " + \
-        "so this may delay " + PRONOUN[1] + "."
-    ],
-    "minor": [
-      "There's a disruption on the " + line_name + " line though, " + \
-        "which may slow " + PRONOUN[1] + " down a little.",
-      "But, there's a disruption on the " + line_name + " line, " + \
-        "so " + PRONOUN[0] + " might take a little longer."
-    ],
-    "major": [
-      "There are major delays on the " + line_name + " line though, " + \
-        "so " + PRONOUN[0] + " might take longer.",
-      "But, there's major issues on the " + line_name + " line at the moment, " + \
-        "which might slow " + PRONOUN[1] + " down."
-    ],
-    "suspended": [
-      "However, Metro tells me the " + line_name + " line is suspended, " + \
-        "so " + PRONOUN[0] + " could be a lot later."
-    ]
-  }
-
-  if line_data['status'] in train_speech_choices:
-    speech += " " + random.choice(train_speech_choices[line_data['status']])
-
-  return speech
+  line_data = train_line_data()
+  if line_data is None:
+    return text
+
+  train_status = 'train_' + line_data['status']
+  if train_status in templates:
+    text += " " + speech.render(templates, train_status, line=line_data['name'])
+
+  return text
+
+def is_keep_warm_event(event):
+  """Whether a Lambda event is a ping from a scheduled EventBridge rule, rather than from Alexa."""
+  return isinstance(event, dict) and event.get('source') == 'aws.events' and \
+    event.get('detail-type') == 'Scheduled Event'
+
+def is_keep_warm_refresh_time(now):
+  """Whether it's a weekday between the keep-warm refresh hours, in local time."""
+  return now.isoweekday() <= 5 and \
+    KEEP_WARM_REFRESH_FROM_HOUR <= now.hour < KEEP_WARM_REFRESH_UNTIL_HOUR
+
+def refresh_newest_valid_event(partition):
+  """Fetches a partition's newest event into the cache, even if the cached one is still fresh."""
+  return event_fetches.call(partition, fetch_newest_valid_event, partition,
+    get_cached_event(partition))
+
+def keep_warm(moment=None):
+  """
+  Handles a scheduled keep-warm ping. Answering it is enough to keep the container warm, but in
+  the evening - when people are likely to be asked about - each of their newest events and train
+  line statuses are refreshed too, in parallel, so the requests that follow find them cached.
+  Returns who was refreshed.
+  """
+
+  people_to_refresh = [
+    person for person in people_registry.people.values()
+    if is_keep_warm_refresh_time(get_local_time(person, moment))
+  ]
+
+  pending = [
+    executor.submit(refresh_newest_valid_event, person.key) for person in people_to_refresh
+  ]
+  line_ids = set(get_train_line_id(person) for person in people_to_refresh)
+  pending += [submit_train_line_fetch(line_id) for line_id in line_ids if line_id]
+
+  # The container is frozen as soon as the ping is answered, so everything is waited for first.
+  for future in pending:
+    try:
+      future.result()
+    except Exception as error:
+      logger.warning('Could not refresh ahead of time: ' + repr(error))
+
+  logger.info('Kept warm, refreshing %s', [person.key for person in people_to_refresh])
+  metrics.count('KeepWarmRefreshes', len(pending))
+  return {'refreshed': [person.key for person in people_to_refresh]}
 
 ############################
 # Built-in intent handlers
@@ -243,8 +473,17 @@ class GetLocationHandler(dispatch_components.AbstractRequestHandler):
   def handle(self, handler_input):
     # type: (HandlerInput) -> Response
     logger.info("In GetLocationHandler")
-    speech = get_speech_text_response()
-    handler_input.response_builder.speak(speech).set_should_end_session(True)
+    person = get_person(handler_input)
+
+    if person is None:
+      slot = utils.get_slot(handler_input, 'person')
+      name = slot and slot.value
+      speech_text = speech.render(speech_templates, 'unknown_person', person=name) if name else \
+        speech.render(speech_templates, 'unknown_person_unnamed')
+    else:
+      speech_text = get_speech_text_response(person)
+
+    handler_input.response_builder.speak(speech_text).set_should_end_session(True)
     return handler_input.response_builder.response
 
 class FallbackIntentHandler(dispatch_components.AbstractRequestHandler):
@@ -273,8 +512,7 @@ class SessionEndedRequestHandler(dispatch_components.AbstractRequestHandler):
   def handle(self, handler_input):
     # type: (HandlerInput) -> Response
     logger.info("In SessionEndedRequestHandler")
-    session_end_reason = handler_input.request_envelope.request.reason
-    logger.debug("Session end: " + functions.json_encode(session_end_reason))
+    logger.debug("Session end: %s", handler_input.request_envelope.request.reason)
     return handler_input.response_builder.response
 
 class CatchAllExceptionHandler(dispatch_components.AbstractExceptionHandler):
@@ -291,19 +529,43 @@ class CatchAllExceptionHandler(dispatch_components.AbstractExceptionHandler):
     handler_input.response_builder.speak(EXCEPTION_MESSAGE)
     return handler_input.response_builder.response
 
+def is_log_sampled(handler_input):
+  """
+  Decides - once per request - whether this is one of the 1 in LOG_SAMPLE_RATE requests that gets
+  a structured log of its request and response.
+  """
+
+  attributes = handler_input.attributes_manager.request_attributes
+
+  if 'log_sampled' not in attributes:
+    attributes['log_sampled'] = LOG_SAMPLE_RATE > 0 and random.randrange(LOG_SAMPLE_RATE) == 0
+
+  return attributes['log_sampled']
+
 class RequestLogger(dispatch_components.AbstractRequestInterceptor):
-  """Log the Alexa requests."""
+  """Log the Alexa requests - at debug level, or for a sample of requests."""
 
   def process(self, handler_input):
     # type: (HandlerInput) -> None
-    logger.debug("Alexa Request: " + functions.json_encode(handler_input.request_envelope.request))
+    request = handler_input.request_envelope.request
+
+    if is_log_sampled(handler_input):
+      logger.info('%s', functions.json_encode({'alexa_request': request}))
+    elif logger.isEnabledFor(logging.DEBUG):
+      logger.debug("Alexa Request: %s", functions.json_encode(request))
 
 class ResponseLogger(dispatch_components.AbstractResponseInterceptor):
-  """Log the Alexa responses."""
+  """Log the Alexa responses - at debug level, or for a sample of requests."""
 
   def process(self, handler_input, response):
     # type: (HandlerInput, Response) -> None
-    logger.debug("Alexa Response: " + functions.json_encode(response))
+    if is_log_sampled(handler_input):
+      logger.info('%s', functions.json_encode({
+        'alexa_request_id': handler_input.request_envelope.request.request_id,
+        'alexa_response': response,
+      }))
+    elif logger.isEnabledFor(logging.DEBUG):
+      logger.debug("Alexa Response: %s", functions.json_encode(response))
 
 # Register intent handlers.
 skill.add_request_handler(GetLocationHandler())
@@ -313,9 +575,23 @@ skill.add_request_handler(SessionEndedRequestHandler())
 # Register exception handlers.
 skill.add_exception_handler(CatchAllExceptionHandler())
 
-# Uncomment the following lines for request & response logs.
-skill.add_global_request_interceptor(RequestLogger())
-skill.add_global_response_interceptor(ResponseLogger())
+# Request & response logs are only written at debug level or when sampling, so the interceptors are
+# only registered when they'll be used.
+if logger.isEnabledFor(logging.DEBUG) or LOG_SAMPLE_RATE:
+  skill.add_global_request_interceptor(RequestLogger())
+  skill.add_global_response_interceptor(ResponseLogger())
+
+skill_handler = skill.lambda_handler()
+
+def handle_event(event, context):
+  """Answers scheduled keep-warm pings before they get to the skill, which only knows Alexa."""
+
+  if is_keep_warm_event(event):
+    metrics.set_property(metrics.DIMENSION, 'KeepWarm')
+    return keep_warm()
+
+  return skill_handler(event, context)
 
 # Handler name that is used on AWS lambda.
-lambda_handler = skill.lambda_handler()
+# Each invocation's metrics are emitted as it finishes, if METRICS_NAMESPACE is set.
+lambda_handler = metrics.instrument_handler(handle_event)
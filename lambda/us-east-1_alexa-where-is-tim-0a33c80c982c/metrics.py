@@ -0,0 +1,143 @@
+"""
+Per-invocation metrics for Where Is Tim?: how long each stage of handling a request took, how many
+events were read, cache hits and misses, and payload sizes.
+
+Everything recorded during an invocation is written as a single log line in CloudWatch Embedded
+Metric Format, which CloudWatch turns into metrics without any extra calls being made. Metrics are
+only recorded if METRICS_NAMESPACE is set. Otherwise, timed() leaves functions as they are and the
+other functions return straight away, so there's next to no cost.
+
+@see https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import sys
+import json
+
+from os import getenv
+from time import time, perf_counter
+from functools import wraps
+
+METRICS_NAMESPACE = getenv('METRICS_NAMESPACE')
+ENABLED = bool(METRICS_NAMESPACE)
+
+# The property each invocation's metrics are split up by, as a CloudWatch dimension.
+DIMENSION = 'RequestType'
+
+# The invocation currently being recorded, if any.
+_invocation = None
+
+class Invocation:
+  __slots__ = ('metrics', 'properties')
+
+  def __init__(self):
+    self.metrics = {}
+    self.properties = {}
+
+  def add(self, name, value, unit):
+    previous = self.metrics.get(name)
+    self.metrics[name] = (value + previous[0] if previous else value, unit)
+
+  def to_embedded_metrics(self, namespace, timestamp=None):
+    """Returns the invocation as a document in CloudWatch Embedded Metric Format."""
+
+    document = {
+      '_aws': {
+        'Timestamp': int((timestamp or time()) * 1000),
+        'CloudWatchMetrics': [{
+          'Namespace': namespace,
+          'Dimensions': [[DIMENSION]],
+          'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in self.metrics.items()],
+        }],
+      },
+      DIMENSION: 'Unknown',
+    }
+
+    document.update(self.properties)
+    document.update({name: round(value, 3) for name, (value, _) in self.metrics.items()})
+    return document
+
+def start():
+  """Starts recording metrics for a new invocation, discarding anything not yet emitted."""
+  global _invocation
+  if ENABLED: _invocation = Invocation()
+
+def emit(stream=None):
+  """Writes the current invocation's metrics as one line of JSON, and stops recording them."""
+  global _invocation
+
+  invocation, _invocation = _invocation, None
+  if invocation is None:
+    return
+
+  # Lambda's logging handler adds a prefix to each line, which CloudWatch wouldn't recognise.
+  stream = stream or sys.stdout
+  stream.write(json.dumps(invocation.to_embedded_metrics(METRICS_NAMESPACE)) + '\n')
+  stream.flush()
+
+def count(name, value=1):
+  if _invocation is not None: _invocation.add(name, value, 'Count')
+
+def size(name, value):
+  """Records a size, in bytes."""
+  if _invocation is not None: _invocation.add(name, value, 'Bytes')
+
+def set_property(name, value):
+  """Adds a value to the metrics log line that isn't a metric, such as the request ID."""
+  if _invocation is not None: _invocation.properties[name] = value
+
+def timed(name):
+  """
+  Decorates a function to record the total time spent in it during each invocation, in
+  milliseconds, as the metric `name`. Times of nested functions are included in their callers'.
+  """
+
+  def decorator(function):
+    if not ENABLED:
+      return function
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+      # Held on to, so a background thread that outlives its invocation doesn't record to the next.
+      invocation = _invocation
+      if invocation is None:
+        return function(*args, **kwargs)
+
+      started_at = perf_counter()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        invocation.add(name, (perf_counter() - started_at) * 1000, 'Milliseconds')
+
+    return wrapper
+
+  return decorator
+
+def instrument_handler(handler):
+  """
+  Wraps a Lambda handler so that each invocation's metrics are recorded and then emitted, along
+  with the overall time taken and the size of the request and response.
+  """
+
+  if not ENABLED:
+    return handler
+
+  timed_handler = timed('InvocationTime')(handler)
+
+  @wraps(handler)
+  def wrapper(event, context):
+    start()
+
+    request = event.get('request', {}) if isinstance(event, dict) else {}
+    set_property(DIMENSION, request.get('type', 'Unknown'))
+    set_property('RequestId', request.get('requestId'))
+    size('RequestSize', len(json.dumps(event)))
+
+    try:
+      response = timed_handler(event, context)
+      size('ResponseSize', len(json.dumps(response)))
+      return response
+    finally:
+      emit()
+
+  return wrapper
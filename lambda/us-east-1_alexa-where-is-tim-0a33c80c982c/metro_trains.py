@@ -0,0 +1,99 @@
+"""
+A client for the Metro Trains (Melbourne, Australia) health board, which lists the current status
+of every train line.
+
+The client keeps a persistent HTTP session alive between requests, with strict timeouts so a slow
+response can't hold up Alexa's response deadline. The parsed health board is cached in the warm
+container, revalidated with a conditional GET once stale, and the last known board is served if a
+fetch fails.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import cache
+import logging
+import requests
+
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+class MetroTrainsClient:
+
+  def __init__(self, endpoint, ttl=60, max_staleness=3600, connect_timeout=0.5, read_timeout=1.5,
+    clock=monotonic):
+    self.endpoint = endpoint
+    self.timeout = (connect_timeout, read_timeout)
+    self.cache = cache.TimedCache('Metro Trains', ttl, max_staleness, clock)
+    self.session = requests.Session()
+
+  def get_health_board(self):
+    """
+    Returns the parsed health board, from the cache if it's fresh. Once stale it's revalidated
+    with the server, and if the server can't be reached the stale board is returned instead.
+    """
+
+    entry = self.cache.get(self.endpoint)
+    if entry is not None and entry.fresh:
+      return entry.value['board']
+
+    headers = {}
+    if entry is not None:
+      if entry.value['etag']: headers['If-None-Match'] = entry.value['etag']
+      if entry.value['last_modified']: headers['If-Modified-Since'] = entry.value['last_modified']
+
+    try:
+      response = self.session.get(self.endpoint, headers=headers, timeout=self.timeout)
+
+      if response.status_code == 304 and entry is not None:
+        self.cache.refresh(self.endpoint)
+        return entry.value['board']
+
+      response.raise_for_status()
+      board = response.json()
+
+    except (requests.RequestException, ValueError) as error:
+      if entry is None:
+        raise
+      logger.warning('Using the last known Metro Trains health board, as fetching failed: ' + \
+        repr(error))
+      return entry.value['board']
+
+    self.cache.put(self.endpoint, {
+      'board': board,
+      'etag': response.headers.get('ETag'),
+      'last_modified': response.headers.get('Last-Modified'),
+    })
+
+    return board
+
+  def get_line_data(self, line_id):
+    """
+    Returns the most recent status currently set on a line, along with the line name.
+    """
+
+    data = self.get_health_board()
+
+    # Line IDs currently range from 82-98, with some missing, plus 168307. You can find your line ID
+    # in the source of metrotrains.com.au.
+    if str(line_id) not in data:
+      raise ValueError('The Metro Trains line ID ' + str(line_id) + ' could not be found.')
+
+    line_data = data[str(line_id)]
+    response = {}
+
+    # We need a fallback for lines that don't have their line_name set.
+    if 'line_name' in line_data:
+      response['name'] = line_data['line_name']
+    else:
+      response['name'] = 'train' # This way, 'the train line' will still make sense ;)
+
+    # If `alerts` is a string, it always means good service. Otherwise, the most recent alert is
+    # first in a list. `alert_type` (in order of increasing severity) can be 'travel', 'works',
+    # 'minor', 'major' or 'suspended'.
+    if isinstance(line_data['alerts'], str):
+      response['status'] = 'good'
+    else:
+      response['status'] = line_data['alerts'][0]['alert_type']
+
+    return response
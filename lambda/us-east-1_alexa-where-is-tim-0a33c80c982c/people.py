@@ -0,0 +1,110 @@
+"""
+The people Where Is Tim? can be asked about, so that one deployment can serve a whole household -
+or several households - from a single table of events.
+
+Each person has a key, which is also the `event_partition` their events are written to. Their
+newest event is then found by querying the event index (or reading the current events table) for
+that key alone, so it costs the same no matter how many people share the table.
+
+People are configured with the PEOPLE environment variable, as a JSON object keyed by each
+person's key. The first person is the default. For example:
+
+  {"tim": {"name": "Tim", "aliases": ["Timmy"], "pronoun": "he/him", "metro_trains_line_id": 2,
+    "timezone": "Australia/Melbourne", "users": ["amzn1.ask.account.XYZ"]}}
+
+Anything left out falls back to the skill's own environment variables (PRONOUN, TIMEZONE and
+METRO_TRAINS_LINE_ID). `users` are the Alexa user IDs of the household a person belongs to, whose
+requests are about that person unless someone else in the household is asked about by name. Nobody
+can be asked about by anyone outside their household, so with PEOPLE set, requests from users who
+aren't in any household aren't about anyone at all. Without PEOPLE there is just one person, keyed
+by DYNAMODB_PARTITION, who can be asked about by anyone, as there always has been - by whatever name
+they're asked about by, as there's nobody else it could be.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import json
+
+class Person:
+  __slots__ = ('key', 'name', 'aliases', 'pronoun', 'timezone', 'metro_trains_line_id', 'users')
+
+  def __init__(self, key, name=None, aliases=(), pronoun=None, timezone=None,
+    metro_trains_line_id=None, users=()):
+    self.key = key
+    self.name = name or key
+    self.aliases = tuple(aliases)
+    self.pronoun = pronoun.split('/') if isinstance(pronoun, str) else pronoun
+    self.timezone = timezone
+    self.metro_trains_line_id = \
+      None if metro_trains_line_id is None else int(metro_trains_line_id)
+    self.users = tuple(users)
+
+  def __repr__(self):
+    return 'Person(' + repr(self.key) + ')'
+
+class Registry:
+  """
+  Looks people up by their key, or by the household asking and a name they're asked about by. If
+  the registry isn't `partitioned` - ie. there's just the one person - anyone can ask about them.
+  """
+
+  def __init__(self, people, partitioned=True):
+    if not people:
+      raise ValueError('At least one person must be configured')
+
+    self.people = {person.key: person for person in people}
+    self.default = people[0]
+    self.partitioned = partitioned
+    self.users = {}
+    self.households = {}
+
+    for person in people:
+      names = [normalise_name(name) for name in (person.name,) + person.aliases]
+      for user in person.users:
+        self.users.setdefault(user, person)
+        self.households.setdefault(user, {}).update((name, person) for name in names)
+
+  def __len__(self):
+    return len(self.people)
+
+  def get(self, key):
+    return self.people.get(key)
+
+  def find(self, name=None, user_id=None):
+    """
+    Returns the person asked about by name, if there was one - or None, if nobody in the user's
+    household has that name. Otherwise, returns the first person in the user's household. Returns
+    None if the user isn't in any household. If the registry isn't partitioned, the one person is
+    returned whatever the name and user - the default person is keyed by the partition, not named.
+    """
+
+    if not self.partitioned:
+      return self.default
+
+    household = self.households.get(user_id)
+    if household is None:
+      return None
+
+    return household.get(normalise_name(name)) if name else self.users[user_id]
+
+def normalise_name(name):
+  return ' '.join(name.lower().split())
+
+def load_registry(config, default_key):
+  """
+  Builds a Registry from the PEOPLE JSON configuration. If there is none, there's just the one
+  person, keyed by `default_key`, and the events table isn't expected to be partitioned by person.
+  """
+
+  if not config:
+    return Registry([Person(default_key)], partitioned=False)
+
+  people = []
+
+  for key, options in json.loads(config).items():
+    try:
+      people.append(Person(key, **options))
+    except TypeError as error:
+      raise ValueError('Invalid configuration for ' + repr(key) + ': ' + str(error))
+
+  return Registry(people)
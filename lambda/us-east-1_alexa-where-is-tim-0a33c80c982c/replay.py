@@ -0,0 +1,320 @@
+"""
+Replays what Where Is Tim? would have said at moments in the past, from exports of the events table
+rather than by calling the live Lambda function - so the validity limits and the distance limits of
+the location ladder can be tuned against months of real history.
+
+Exports are read as JSON lines: either DynamoDB's own export to S3 in DynamoDB JSON, with one
+`{"Item": ...}` per line (gzipped or not), or recorded scan pages, with one `{"Items": [...]}` per
+line - eg. from `aws dynamodb scan --table-name events | jq -c`. Plain files are read a line at a
+time from a memory map, and gzipped ones are streamed, through a pipeline of generators - so memory
+use doesn't grow with the size of the files.
+
+Each file is reduced in its own process to the newest valid event for each person at each moment
+being replayed - the same way each segment of a parallel scan is - and the results are merged. The
+skill's own checks of the day and time, and its speech, are then used to work out what it would
+have said. There's no Metro Trains history, so no train line status is added, and train-adjusted
+times are skipped.
+
+Usage: python replay.py EXPORT [EXPORT ...] --first-day 2019-01-01 --last-day 2019-12-31
+         [--every 10] [--hours 16-19] [--max-accuracy 65] [--max-age 86400]
+         [--ladder '{"almost_home": {"distance_from_home": 2500}}'] [--summary] [--processes 4]
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import os
+import sys
+import csv
+import gzip
+import json
+import mmap
+import events
+import speech
+import logging
+import argparse
+import functions
+import time_sources
+
+from time import perf_counter
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import repeat
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# The timezone moments are replayed in, if --timezone isn't given.
+TIMEZONE = os.getenv('TIMEZONE', 'Australia/Melbourne')
+
+# The pronouns speech is replayed with, as in lambda_function.py.
+PRONOUN = os.getenv('PRONOUN', 'they/their')
+
+logger = logging.getLogger(__name__)
+
+def read_lines(filename):
+  """Yields each line of a file, memory-mapping it - or streaming it, if it's gzipped."""
+
+  if filename.endswith('.gz'):
+    with gzip.open(filename, 'rb') as file:
+      yield from file
+    return
+
+  with open(filename, 'rb') as file:
+    if os.fstat(file.fileno()).st_size == 0:
+      return
+
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as lines:
+      yield from iter(lines.readline, b'')
+
+def read_items(lines, counts):
+  """Yields the DynamoDB items in lines of an export or of recorded scan pages."""
+
+  for line in lines:
+    if not line.strip():
+      continue
+
+    record = json.loads(line)
+    if 'Item' in record:
+      counts['items'] += 1
+      yield record['Item']
+    else:
+      counts['items'] += len(record.get('Items', ()))
+      yield from record.get('Items', ())
+
+def read_valid_events(items, counts, default_partition, max_accuracy=None):
+  """
+  Yields each item as a LocationEvent, along with its partition (ie. the person), if it's accurate
+  to within `max_accuracy` - or VALID_EVENT_MAX_ACCURACY_IN_METRES. Whether it's new enough depends
+  on the moment, so that's left to reduce_newest_events().
+  """
+
+  for item in items:
+    event = functions.LocationEvent(item)
+    try:
+      accurate = functions.is_event_accurate_enough(event, max_accuracy)
+      event.timestamp
+    except (KeyError, ValueError):
+      counts['unreadable'] += 1
+      continue
+
+    if not accurate:
+      counts['inaccurate'] += 1
+      continue
+
+    counts['accurate'] += 1
+    yield item.get(events.EVENT_PARTITION_ATTRIBUTE, {}).get('S', default_partition), event
+
+def reduce_newest_events(partition_events, moments, max_age, newest=None):
+  """
+  Reduces events to the newest one each partition had at each of the (sorted) moments - ie. the
+  newest event no later than the moment, and no more than `max_age` seconds before it. Returns a
+  dict of (partition, moment) to event.
+  """
+
+  newest = {} if newest is None else newest
+
+  for partition, event in partition_events:
+    timestamp = event.timestamp
+    first = bisect_left(moments, timestamp)
+    last = bisect_right(moments, timestamp + max_age)
+
+    for moment in moments[first:last]:
+      key = (partition, moment)
+      current = newest.get(key)
+      if current is None or timestamp > current.timestamp:
+        newest[key] = event
+
+  return newest
+
+def process_file(filename, moments, max_accuracy, max_age, default_partition):
+  """
+  Runs one export file through the pipeline - usually in a worker process - with its own limit on
+  accuracy. Returns the newest events, along with a count of what was read.
+  """
+
+  counts = Counter()
+  partition_events = read_valid_events(
+    read_items(read_lines(filename), counts), counts, default_partition, max_accuracy
+  )
+  return reduce_newest_events(partition_events, moments, max_age), counts
+
+def merge_newest_events(results):
+  """Merges the newest events from each file, keeping the newest at each moment."""
+
+  newest = {}
+  counts = Counter()
+
+  for file_newest, file_counts in results:
+    counts.update(file_counts)
+    for key, event in file_newest.items():
+      current = newest.get(key)
+      if current is None or event.timestamp > current.timestamp:
+        newest[key] = event
+
+  return newest, counts
+
+def process_files(filenames, moments, max_accuracy=None, max_age=None, default_partition='events',
+  processes=1):
+  """
+  Runs export files through the pipeline, across a pool of `processes` if there's more than one,
+  and merges the newest events from each. Returns them along with a count of what was read.
+  """
+
+  if max_accuracy is None: max_accuracy = functions.VALID_EVENT_MAX_ACCURACY_IN_METRES
+  if max_age is None: max_age = functions.VALID_EVENT_MAX_AGE_IN_SECONDS
+
+  arguments = (repeat(moments), repeat(max_accuracy), repeat(max_age), repeat(default_partition))
+
+  if processes > 1 and len(filenames) > 1:
+    with ProcessPoolExecutor(max_workers=min(processes, len(filenames))) as pool:
+      return merge_newest_events(pool.map(process_file, filenames, *arguments))
+
+  return merge_newest_events(map(process_file, filenames, *arguments))
+
+def get_moments(first_day, last_day, every=10, hours=(16, 19), timezone=TIMEZONE):
+  """
+  Returns the timestamps of every `every` minutes from the first of the hours until the last, in
+  local time, on each weekday between two dates - when the skill would say where someone is.
+  """
+
+  import pytz
+  zone = pytz.timezone(timezone)
+  moments = []
+  day = first_day
+
+  while day <= last_day:
+    if day.isoweekday() <= 5:
+      for minutes in range(hours[0] * 60, hours[1] * 60, every):
+        local = datetime(day.year, day.month, day.day, minutes // 60, minutes % 60)
+        moments.append(zone.localize(local).timestamp())
+    day += timedelta(days=1)
+
+  return moments
+
+def tune_ladder(overrides, ladder=speech.LOCATION_LADDER):
+  """
+  Returns a copy of a location ladder with some rows' limits changed, from a dict of row names to
+  the limits to change - eg. {'almost_home': {'distance_from_home': 2500}}.
+  """
+
+  names = set(name for name, _, _ in ladder)
+  unknown = set(overrides) - names
+  if unknown:
+    raise ValueError('The location ladder has no rows named ' + ', '.join(sorted(unknown)))
+
+  return tuple(
+    (name, dict(limits, **overrides.get(name, {})), with_train_status)
+    for name, limits, with_train_status in ladder
+  )
+
+def replay(newest, partitions, moments, ladder=None, timezone=TIMEZONE, templates=None,
+  sources=None):
+  """
+  Yields what the skill would have said about each partition at each moment, as tuples of the
+  moment (as a local datetime), the partition, the event used (or None), and the phrasings chosen
+  and the speech rendered from them.
+  """
+
+  import pytz
+  zone = pytz.timezone(timezone)
+  ladder = speech.compile_ladder(ladder or speech.LOCATION_LADDER)
+  templates = templates or speech.compile_templates(PRONOUN.split('/'))
+  sources = sources or time_sources.compile_sources()
+
+  for moment in moments:
+    now = datetime.fromtimestamp(moment, zone)
+    invalid_moment = speech.select_moment(now)
+
+    for partition in partitions:
+      if invalid_moment is not None:
+        yield now, partition, None, invalid_moment, speech.render(templates, invalid_moment)
+        continue
+
+      event = newest.get((partition, moment))
+      if event is None:
+        yield now, partition, None, 'no_event', speech.render(templates, 'no_event')
+        continue
+
+      time_from_home = time_sources.TimeFromHome(event, sources)
+      location, _ = speech.select_event_location(ladder, event, now, time_from_home)
+      yield now, partition, event, location, \
+        speech.render_location(templates, location, event, now, time_from_home)
+
+def _parse_day(text):
+  # date.fromisoformat() only exists from Python 3.7.
+  return datetime.strptime(text, '%Y-%m-%d').date()
+
+def _parse_hours(text):
+  first, last = text.split('-')
+  return int(first), int(last)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+    description='Replays what the skill would have said, from exports of the events table.'
+  )
+  parser.add_argument('exports', nargs='+', help='export files, in DynamoDB JSON lines')
+  parser.add_argument('--first-day', type=_parse_day, required=True,
+    help='the first day to replay, eg. 2019-01-01')
+  parser.add_argument('--last-day', type=_parse_day, required=True,
+    help='the last day to replay, eg. 2019-12-31')
+  parser.add_argument('--every', type=int, default=10,
+    help='how often to replay, in minutes (default: 10)')
+  parser.add_argument('--hours', type=_parse_hours, default=(16, 19),
+    help='the local hours of each weekday to replay (default: 16-19)')
+  parser.add_argument('--timezone', default=TIMEZONE,
+    help='the timezone to replay in (default: ' + TIMEZONE + ')')
+  parser.add_argument('--max-accuracy', type=float,
+    default=functions.VALID_EVENT_MAX_ACCURACY_IN_METRES,
+    help='VALID_EVENT_MAX_ACCURACY_IN_METRES to replay with (default: ' + \
+      str(functions.VALID_EVENT_MAX_ACCURACY_IN_METRES) + ')')
+  parser.add_argument('--max-age', type=float, default=functions.VALID_EVENT_MAX_AGE_IN_SECONDS,
+    help='VALID_EVENT_MAX_AGE_IN_SECONDS to replay with (default: ' + \
+      str(functions.VALID_EVENT_MAX_AGE_IN_SECONDS) + ')')
+  parser.add_argument('--ladder', type=json.loads, default={},
+    help='changes to the limits of the location ladder, as JSON - see speech.LOCATION_LADDER')
+  parser.add_argument('--partition', default='events',
+    help='the DYNAMODB_PARTITION of events without an event_partition')
+  parser.add_argument('--summary', action='store_true',
+    help='count how often each location was said, rather than writing out everything')
+  parser.add_argument('--processes', type=int, default=os.cpu_count(),
+    help='how many files to read at once (default: one per CPU)')
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  started_at = perf_counter()
+  ladder = tune_ladder(args.ladder)
+  moments = get_moments(args.first_day, args.last_day, args.every, args.hours, args.timezone)
+  newest, counts = process_files(args.exports, moments, args.max_accuracy, args.max_age,
+    args.partition, args.processes)
+
+  partitions = sorted(set(partition for partition, _ in newest)) or [args.partition]
+  replayed = replay(newest, partitions, moments, ladder, args.timezone)
+
+  if args.summary:
+    said = Counter((partition, location) for _, partition, _, location, _ in replayed)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['person', 'location', 'times', 'share'])
+    for partition in partitions:
+      for location, times in sorted(
+        ((location, times) for (person, location), times in said.items() if person == partition),
+        key=lambda row: -row[1]
+      ):
+        writer.writerow([partition, location, times, '{:.1%}'.format(times / len(moments))])
+  else:
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['moment', 'person', 'event', 'age_in_minutes', 'location', 'speech'])
+    for now, partition, event, location, text in replayed:
+      writer.writerow([
+        now.isoformat(), partition, event and event.event_id,
+        event and round((now.timestamp() - event.timestamp) / 60), location, text,
+      ])
+
+  duration = perf_counter() - started_at
+  logger.info(
+    'Replayed %d moments from %d items (%d accurate, %d inaccurate, %d unreadable) in %.2fs, ' + \
+    'at %d items/s', len(moments), counts['items'], counts['accurate'], counts['inaccurate'],
+    counts['unreadable'], duration, counts['items'] / duration if duration else 0
+  )
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,352 @@
+"""
+Serves Where Is Tim? over HTTP as a long-lived process - eg. as a container behind Alexa's HTTPS
+endpoint option - rather than as a Lambda function, so there are no cold starts and the caches in
+lambda_function.py stay warm across every request.
+
+Each POST's body is an Alexa request envelope, which is dispatched through the same SkillBuilder
+handlers as lambda_handler. The asyncio event loop only reads and writes HTTP, and each envelope is
+handled in a bounded pool of SERVER_WORKERS threads, as the handlers block on DynamoDB and Metro
+Trains. Once SERVER_MAX_PENDING requests are waiting, any more are turned away with a 503 rather
+than queued. Requests per second are logged every SERVER_STATS_INTERVAL_IN_SECONDS, and GET /health
+returns the same stats as JSON.
+
+On SIGTERM or SIGINT, the server stops accepting connections, finishes the requests it has - for up
+to SERVER_SHUTDOWN_TIMEOUT_IN_SECONDS - then exits.
+
+Alexa requires HTTPS endpoints to check each request's signature and timestamp, and without the
+checks anyone could ask where someone is - so they're always made, with ask-sdk-webservice-support,
+which needs to be installed. They can only be skipped with --no-verify or SERVER_VERIFY_REQUESTS set
+to false, which is for load testing locally and never for serving Alexa. TLS is expected to be
+terminated in front of the server, eg. by a load balancer.
+
+Usage: python server.py [--host 127.0.0.1] [--port 8080] [--workers 16] [--no-verify]
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import sys
+import json
+import signal
+import asyncio
+import logging
+import argparse
+
+from os import getenv
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor
+
+SERVER_HOST = getenv('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(getenv('SERVER_PORT', 8080))
+
+# How many requests are handled at once, each in its own thread.
+SERVER_WORKERS = int(getenv('SERVER_WORKERS', 16))
+
+# How many requests can be handled or waiting for a thread before more are turned away.
+SERVER_MAX_PENDING = int(getenv('SERVER_MAX_PENDING', 256))
+
+# The largest request body accepted, in bytes. Alexa's request envelopes are a few KB.
+SERVER_MAX_BODY_BYTES = int(getenv('SERVER_MAX_BODY_BYTES', 65536))
+
+# How long to wait for requests to finish when shutting down, in seconds.
+SERVER_SHUTDOWN_TIMEOUT_IN_SECONDS = float(getenv('SERVER_SHUTDOWN_TIMEOUT_IN_SECONDS', '10'))
+
+# How often requests per second are logged, in seconds. 0 turns it off.
+SERVER_STATS_INTERVAL_IN_SECONDS = float(getenv('SERVER_STATS_INTERVAL_IN_SECONDS', '60'))
+
+# Whether to check the signature and timestamp of each request, as Alexa requires of HTTPS
+# endpoints. Needs ask-sdk-webservice-support. Only ever turn it off to load test locally.
+SERVER_VERIFY_REQUESTS = \
+  getenv('SERVER_VERIFY_REQUESTS', 'true').lower() not in ('0', 'false', 'no')
+
+STATUS_TEXT = {
+  200: 'OK',
+  400: 'Bad Request',
+  404: 'Not Found',
+  405: 'Method Not Allowed',
+  413: 'Payload Too Large',
+  500: 'Internal Server Error',
+  503: 'Service Unavailable',
+}
+
+logger = logging.getLogger(__name__)
+
+# asyncio.current_task() only exists from Python 3.7 - before that, it's on Task.
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+class ServerStats:
+  """Counts requests, and works out how many there have been per second."""
+
+  __slots__ = ('started_at', 'requests', 'errors', 'rejected', 'pending', '_last_at',
+    '_last_requests')
+
+  def __init__(self, clock=monotonic):
+    self.started_at = self._last_at = clock()
+    self.requests = self.errors = self.rejected = self.pending = self._last_requests = 0
+
+  def take_rate(self, clock=monotonic):
+    """Returns requests per second since this was last called, and starts counting again."""
+    now = clock()
+    rate = (self.requests - self._last_requests) / max(now - self._last_at, 1e-9)
+    self._last_at, self._last_requests = now, self.requests
+    return rate
+
+  def to_dict(self, clock=monotonic):
+    uptime = clock() - self.started_at
+    return {
+      'uptime': round(uptime, 3),
+      'requests': self.requests,
+      'errors': self.errors,
+      'rejected': self.rejected,
+      'pending': self.pending,
+      'requests_per_second': round(self.requests / max(uptime, 1e-9), 1),
+    }
+
+def create_dispatcher(verify=SERVER_VERIFY_REQUESTS):
+  """
+  Returns a function that handles a request envelope's body (and headers) with the skill's
+  handlers, returning the response envelope as a dict. The skill is built once, and shared.
+  """
+
+  import lambda_function
+  from ask_sdk_model import RequestEnvelope
+
+  skill = lambda_function.skill.create()
+
+  if not verify:
+    logger.warning('Requests are not being verified, so this must only be used for local testing')
+
+  if verify:
+    from ask_sdk_webservice_support.webservice_handler import WebserviceSkillHandler
+    handler = WebserviceSkillHandler(skill=skill, verify_signature=True, verify_timestamp=True)
+    return lambda body, headers: handler.verify_request_and_dispatch(headers, body.decode('utf-8'))
+
+  def dispatch(body, headers=None):
+    envelope = skill.serializer.deserialize(payload=body.decode('utf-8'), obj_type=RequestEnvelope)
+    return skill.serializer.serialize(skill.invoke(request_envelope=envelope, context=None))
+
+  return dispatch
+
+class SkillServer:
+  """An asyncio HTTP/1.1 server, handing each request envelope to `dispatch` in a thread pool."""
+
+  def __init__(self, dispatch, workers=SERVER_WORKERS, max_pending=SERVER_MAX_PENDING,
+    stats_interval=SERVER_STATS_INTERVAL_IN_SECONDS):
+    self.dispatch = dispatch
+    self.workers = workers
+    self.max_pending = max_pending
+    self.stats_interval = stats_interval
+    self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='skill')
+    self.stats = ServerStats()
+    self.server = None
+    self.stopping = None
+    self.connections = {}
+    self.idle = set()
+
+  async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+    """Starts listening, returning the port - which is picked if `port` is 0."""
+    self.stopping = asyncio.Event()
+    self.server = await asyncio.start_server(self.handle_connection, host, port)
+    return self.server.sockets[0].getsockname()[1]
+
+  async def serve(self, host=SERVER_HOST, port=SERVER_PORT):
+    """Serves until SIGTERM or SIGINT, then shuts down gracefully."""
+
+    port = await self.start(host, port)
+    loop = asyncio.get_event_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+      loop.add_signal_handler(signal_number, self.stopping.set)
+
+    logger.info('Serving on %s:%d with %d workers', host, port, self.workers)
+    reporter = asyncio.ensure_future(self.report_stats()) if self.stats_interval > 0 else None
+
+    await self.stopping.wait()
+    if reporter: reporter.cancel()
+    await self.shutdown()
+
+  async def shutdown(self, timeout=SERVER_SHUTDOWN_TIMEOUT_IN_SECONDS):
+    """
+    Stops accepting connections, closes idle ones, and waits for requests being handled to finish
+    - with their connections closed after them - before stopping the workers.
+    """
+
+    logger.info('Shutting down, with %d requests pending', self.stats.pending)
+    self.stopping.set()
+    self.server.close()
+
+    for writer in list(self.idle):
+      writer.close()
+
+    deadline = monotonic() + timeout
+    while self.stats.pending and monotonic() < deadline:
+      await asyncio.sleep(0.01)
+
+    for writer in list(self.connections):
+      writer.close()
+
+    # Each connection's handler finishes once its connection is closed.
+    if self.connections:
+      await asyncio.wait(list(self.connections.values()), timeout=1)
+
+    await self.server.wait_closed()
+    self.executor.shutdown(wait=False)
+    logger.info('Shut down: %s', json.dumps(self.stats.to_dict()))
+
+  async def report_stats(self):
+    while True:
+      await asyncio.sleep(self.stats_interval)
+      logger.info('%.1f requests/s (%s)', self.stats.take_rate(), json.dumps(self.stats.to_dict()))
+
+  async def handle_connection(self, reader, writer):
+    """Handles each request on a connection in turn, for as long as it's kept alive."""
+
+    self.connections[writer] = _current_task()
+    try:
+      while not self.stopping.is_set():
+        self.idle.add(writer)
+        try:
+          request = await read_request(reader)
+        finally:
+          self.idle.discard(writer)
+
+        if request is None:
+          break
+
+        method, path, headers, body, keep_alive = request
+        status, response = await self.respond(method, path, headers, body)
+        keep_alive = keep_alive and not self.stopping.is_set()
+        writer.write(format_response(status, response, keep_alive))
+        await writer.drain()
+
+        if not keep_alive:
+          break
+
+    except (ConnectionError, asyncio.IncompleteReadError):
+      pass
+    except RequestError as error:
+      writer.write(format_response(error.status, {'error': str(error)}, False))
+    finally:
+      self.connections.pop(writer, None)
+      writer.close()
+
+  async def respond(self, method, path, headers, body):
+    """Works out the status and JSON response for a request."""
+
+    if method == 'GET' and path == '/health':
+      return 200, self.stats.to_dict()
+
+    if method != 'POST':
+      return 405, {'error': 'Only POST requests are accepted'}
+
+    if self.stats.pending >= self.max_pending:
+      self.stats.rejected += 1
+      return 503, {'error': 'Too many requests are pending'}
+
+    self.stats.pending += 1
+    try:
+      response = await asyncio.get_event_loop().run_in_executor(
+        self.executor, self.dispatch, body, headers
+      )
+      return 200, response
+    except Exception as error:
+      self.stats.errors += 1
+      if is_verification_error(error):
+        logger.warning('Rejecting a request that failed verification: %s', error)
+        return 400, {'error': 'The request could not be verified'}
+      logger.error('Could not handle a request', exc_info=True)
+      return 500, {'error': 'The request could not be handled'}
+    finally:
+      self.stats.pending -= 1
+      self.stats.requests += 1
+
+class RequestError(Exception):
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+
+def is_verification_error(error):
+  return type(error).__name__ == 'VerificationException'
+
+async def read_request(reader, max_body_bytes=SERVER_MAX_BODY_BYTES):
+  """
+  Reads an HTTP/1.1 request, returning its method, path, headers, body, and whether the connection
+  should be kept alive - or None, if the connection closed before a request started.
+  """
+
+  request_line = await reader.readline()
+  if not request_line.strip():
+    return None
+
+  try:
+    method, path, version = request_line.decode('latin-1').split()
+  except ValueError:
+    raise RequestError(400, 'Malformed request line')
+
+  headers = {}
+  while True:
+    line = await reader.readline()
+    if line in (b'\r\n', b'\n', b''):
+      break
+    name, _, value = line.decode('latin-1').partition(':')
+    headers[name.strip()] = value.strip()
+
+  lowered = {name.lower(): value for name, value in headers.items()}
+
+  try:
+    length = int(lowered.get('content-length', 0))
+  except ValueError:
+    raise RequestError(400, 'Malformed Content-Length')
+
+  if length > max_body_bytes:
+    raise RequestError(413, 'The request body is too large')
+
+  body = await reader.readexactly(length) if length else b''
+
+  connection = lowered.get('connection', '').lower()
+  keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+  return method, path, headers, body, keep_alive
+
+def format_response(status, response, keep_alive=True):
+  body = json.dumps(response).encode('utf-8')
+  return (
+    'HTTP/1.1 ' + str(status) + ' ' + STATUS_TEXT.get(status, '') + '\r\n' + \
+    'Content-Type: application/json;charset=UTF-8\r\n' + \
+    'Content-Length: ' + str(len(body)) + '\r\n' + \
+    'Connection: ' + ('keep-alive' if keep_alive else 'close') + '\r\n\r\n'
+  ).encode('latin-1') + body
+
+def run(coroutine):
+  """Runs a coroutine on a new event loop, as asyncio.run() does from Python 3.7."""
+
+  if hasattr(asyncio, 'run'):
+    return asyncio.run(coroutine)
+
+  loop = asyncio.new_event_loop()
+  asyncio.set_event_loop(loop)
+  try:
+    return loop.run_until_complete(coroutine)
+  finally:
+    asyncio.set_event_loop(None)
+    loop.close()
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Serves the skill over HTTP.')
+  parser.add_argument('--host', default=SERVER_HOST,
+    help='the address to listen on (default: ' + SERVER_HOST + ')')
+  parser.add_argument('--port', type=int, default=SERVER_PORT,
+    help='the port to listen on (default: ' + str(SERVER_PORT) + ')')
+  parser.add_argument('--workers', type=int, default=SERVER_WORKERS,
+    help='how many requests to handle at once (default: ' + str(SERVER_WORKERS) + ')')
+  parser.add_argument('--no-verify', action='store_true',
+    help="don't check request signatures and timestamps - only for load testing locally")
+  args = parser.parse_args(argv)
+
+  logging.basicConfig(level=logging.INFO)
+
+  server = SkillServer(
+    create_dispatcher(SERVER_VERIFY_REQUESTS and not args.no_verify), workers=args.workers
+  )
+  run(server.serve(args.host, args.port))
+
+if __name__ == '__main__':
+  sys.exit(main())
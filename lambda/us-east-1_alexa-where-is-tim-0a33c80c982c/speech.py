@@ -0,0 +1,245 @@
+"""
+Everything Where Is Tim? can say, compiled into templates once when the container starts, so that
+each request only renders the one phrasing it picks.
+
+Phrasings use `{they}` and `{them}` for the configured pronouns, and `{sound:name}` for Alexa sound
+effects, which are all filled in when they're compiled. Anything else - such as `{time}`,
+`{arrival}`, `{suburb}`, `{line}` or `{person}` - is filled in when rendering, and only if the
+chosen phrasing uses it.
+
+Which phrasings describe a location is decided by LOCATION_LADDER: a table of limits, checked in
+order, where the first row whose limits are all met wins. It's compiled once too.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import re
+import random
+import functions
+
+from string import Formatter
+from datetime import timedelta
+
+PHRASINGS = {
+  'not_at_work_today': ["{they}'s not at work today, so I'm not really sure!"],
+  'too_early': [
+    "It's too early for {them} to have left work yet. Check back with me later."
+  ],
+  'bit_too_early': ["It's a bit too early for {them} to have left work yet."],
+  'no_event': ["I'm sorry, I'm not sure where {they} is at the moment."],
+  'unknown_person': ["I'm sorry, I don't know who {person} is."],
+  'unknown_person_unnamed': ["I'm sorry, I don't know who you'd like me to find."],
+
+  'at_work': [
+    "{they} hasn't left work yet.{sound:typing_medium_01}",
+    "{they}'s still at work.{sound:typing_medium_01}",
+  ],
+  'at_work_late': [
+    "{sound:clear_throat_ahem_01}I don't think {they}'s left work yet.",
+    "I'm pretty sure {they}'s still in the office.",
+  ],
+  'just_left_work': [
+    "{they}'s just left work!{sound:crowd_cheer_med_01}{they} should be home in about {time}."
+  ],
+  'at_home': [
+    "I think {they}'s at home already!",
+    "Looks like {they}'s already home!",
+  ],
+  'any_minute': ["{they}'ll be here any minute!"],
+  'around_the_corner': ["{they}'s just around the corner."],
+  'under_5_minutes': ["{they}'ll be home in less than 5 minutes."],
+  'almost_here': [
+    "{they}'s almost here! Around {time} away.",
+    "Not much longer - about {time} to go.",
+  ],
+  'almost_home': [
+    "{they}'s almost home! About {time} away, depending on how the bus goes.",
+    "{they}'s not far - around {time} to go, depending on the bus.",
+  ],
+  'on_the_way': [
+    "{they}'s on his way - {they} should be home in around {time}.",
+    "{they}'s about {time} from home.",
+    "{they}'s currently in {suburb}, about {time} away.",
+    "{they} should be home at about {arrival}.",
+  ],
+
+  # Added on to a location by the Metro Trains status of the configured line, if it's not good.
+  'train_travel': [
+    "Metro have adjusted some services today though, so {they} may be a little longer than usual."
+  ],
+  'train_works': [
+    "Metro are currently doing works on the {line} line though, so this may delay {them}."
+  ],
+  'train_minor': [
+    "There's a disruption on the {line} line though, which may slow {them} down a little.",
+    "But, there's a disruption on the {line} line, so {they} might take a little longer.",
+  ],
+  'train_major': [
+    "There are major delays on the {line} line though, so {they} might take longer.",
+    "But, there's major issues on the {line} line at the moment, which might slow {them} down.",
+  ],
+  'train_suspended': [
+    "However, Metro tells me the {line} line is suspended, so {they} could be a lot later."
+  ],
+}
+
+# Each row is the phrasings to use, the highest value of each field they're used for - or a
+# (lowest, highest) pair - and whether the train line status should be added on. Fields are
+# `distance_from_home` and `distance_from_work` in metres, `minutes_from_home`, and the local `hour`
+# of the day.
+LOCATION_LADDER = (
+  ('at_work', {'distance_from_work': 50, 'hour': 16}, True),
+  ('at_work_late', {'distance_from_work': 50}, True),
+  ('just_left_work', {'distance_from_work': 500}, True),
+  ('at_home', {'distance_from_home': 50}, False),
+  ('any_minute', {'minutes_from_home': (1, 1)}, False),
+  ('around_the_corner', {'minutes_from_home': 2}, False),
+  ('under_5_minutes', {'minutes_from_home': 5}, False),
+  ('almost_here', {'distance_from_home': 200}, False),
+  ('almost_home', {'distance_from_home': 1800}, False),
+  ('on_the_way', {}, True),
+)
+
+_SOUND_EFFECT = re.compile(r'\{sound:(\w+)\}')
+
+class Template:
+  __slots__ = ('text', 'fields')
+
+  def __init__(self, text):
+    self.text = text
+    self.fields = tuple({field for _, field, _, _ in Formatter().parse(text) if field})
+
+  def render(self, values):
+    """
+    Fills the template in from `values`. Values can be functions, which are only called if the
+    template uses them, so that values that are expensive to work out aren't wasted.
+    """
+
+    if not self.fields:
+      return self.text
+
+    filled = {}
+    for field in self.fields:
+      value = values[field]
+      filled[field] = value() if callable(value) else value
+
+    return self.text.format_map(filled)
+
+def _escape(text):
+  return text.replace('{', '{{').replace('}', '}}')
+
+def compile_phrasing(phrasing, pronoun):
+  """Fills a phrasing in with the pronouns - eg. ['he', 'him'] - and sound effects."""
+  phrasing = phrasing.replace('{they}', _escape(pronoun[0])).replace('{them}', _escape(pronoun[1]))
+  return _SOUND_EFFECT.sub(
+    lambda match: _escape(functions.alexa_sound_effect(match.group(1))), phrasing
+  )
+
+def compile_templates(pronoun, phrasings=PHRASINGS):
+  """Compiles every phrasing, returning lists of Templates keyed by name."""
+  return {
+    name: [Template(compile_phrasing(phrasing, pronoun)) for phrasing in choices]
+    for name, choices in phrasings.items()
+  }
+
+def compile_ladder(ladder=LOCATION_LADDER):
+  """
+  Flattens a ladder's limits into (field, lowest, highest) tuples, which are quicker to check on
+  each request.
+  """
+  return tuple(
+    (
+      name, tuple(_compile_limit(field, limit) for field, limit in limits.items()),
+      with_train_status,
+    )
+    for name, limits, with_train_status in ladder
+  )
+
+def _compile_limit(field, limit):
+  if isinstance(limit, (tuple, list)):
+    return (field,) + tuple(limit)
+  return field, float('-inf'), limit
+
+def choose(templates, name):
+  """Chooses one of the templates with a name at random - without asking for one if there's one."""
+  choices = templates[name]
+  return choices[0] if len(choices) == 1 else random.choice(choices)
+
+def render(templates, name, **values):
+  """Renders one of the templates with a name, chosen at random."""
+  return choose(templates, name).render(values)
+
+def select_moment(now):
+  """
+  Returns the name of the phrasings for a local time when there's no point looking for someone -
+  at the weekend, or before they could have left work - or None if it's the right moment.
+  """
+
+  if now.isoweekday() > 5:
+    return 'not_at_work_today'
+
+  elif now.hour <= 13:
+    return 'too_early'
+
+  elif now.hour <= 15:
+    return 'bit_too_early'
+
+  return None
+
+def select_location(ladder, values):
+  """
+  Returns the name of the phrasings that describe a location, and whether the train line status
+  should be added on, from the first row of a compiled ladder whose limits `values` are all within.
+  Values can be functions, which are only called once a row checks them.
+  """
+
+  for name, limits, with_train_status in ladder:
+    for field, lowest, highest in limits:
+      value = values[field]
+      if callable(value):
+        value = values[field] = value()
+      if value > highest or value < lowest:
+        break
+    else:
+      return name, with_train_status
+
+  raise ValueError('No row of the ladder matches ' + repr(values))
+
+def select_event_location(ladder, event, now, time_from_home):
+  """
+  Selects the phrasings that describe where an event puts someone as of `now`, from a compiled
+  ladder. The time from home - anything with `seconds`, such as a time_sources.TimeFromHome - is
+  only worked out if a row checks it.
+  """
+  return select_location(ladder, {
+    'distance_from_home': event.distance_from_home,
+    'distance_from_work': event.distance_from_work,
+    'minutes_from_home': lambda: time_from_home.seconds // 60,
+    'hour': now.hour,
+  })
+
+def _get_arrival(event, now, time_from_home):
+  seconds = max(0, event.timestamp + time_from_home.seconds - now.timestamp())
+  return functions.get_readable_clock_time(now + timedelta(seconds=seconds))
+
+# How each field a location phrasing can use is worked out, from the event, now, and time from home.
+LOCATION_FIELDS = {
+  'suburb': lambda event, now, time_from_home: event.suburb,
+  'time': lambda event, now, time_from_home:
+    functions.get_readable_time_from_seconds(time_from_home.seconds),
+  'arrival': _get_arrival,
+}
+
+def render_location(templates, name, event, now, time_from_home):
+  """
+  Renders one of the phrasings for an event's location, working out only the fields it uses - and
+  without formatting at all if it doesn't use any.
+  """
+
+  template = choose(templates, name)
+  if not template.fields:
+    return template.text
+
+  return template.text.format_map({
+    field: LOCATION_FIELDS[field](event, now, time_from_home) for field in template.fields
+  })
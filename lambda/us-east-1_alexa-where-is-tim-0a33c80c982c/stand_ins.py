@@ -0,0 +1,823 @@
+"""
+Local stand-ins for the external services Where Is Tim? talks to, for use in tests and benchmarks.
+
+FakeDynamoDB implements the subset of the boto3 DynamoDB client that the skill uses, in memory,
+with the same request and response shapes - so it can be passed anywhere `client('dynamodb')` is.
+FakeMetroTrainsServer serves a health board over real local HTTP, with a configurable latency.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import re
+import json
+import math
+import random
+import hashlib
+import threading
+
+from bisect import bisect_left, bisect_right
+from time import sleep
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from botocore.exceptions import ClientError
+
+# DynamoDB stops reading a page of scan or query results once it has read 1 MB of items.
+# @see https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Scan.html#Scan.Pagination
+MAX_PAGE_BYTES = 1024 * 1024
+
+# DynamoDB charges a read capacity unit for each 4 KB read (or half of one, if eventually
+# consistent), and a write capacity unit for each 1 KB written - rounding up, and at least one.
+# @see https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/read-write-operations.html
+READ_UNIT_BYTES = 4096
+WRITE_UNIT_BYTES = 1024
+
+def client_error(code, message, operation):
+  """Builds the same exception botocore raises for a failed DynamoDB call."""
+  return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+class FakeClock:
+  """A clock that only moves when `now` is changed, for use in place of time() or monotonic()."""
+
+  def __init__(self, now=1000.0):
+    self.now = now
+
+  def __call__(self):
+    return self.now
+
+############################
+# Expression parsing
+# Supports the parts of the DynamoDB expression syntax used in this repo: comparisons, BETWEEN,
+# AND/OR/NOT, attribute_exists()/attribute_not_exists()/begins_with(), and SET/REMOVE updates.
+# @see https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Expressions.html
+############################
+
+_TOKEN_PATTERN = re.compile(r'\s*(<>|<=|>=|[=<>(),]|[#:]?[A-Za-z_][A-Za-z0-9_.]*)')
+_COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+
+def _tokenise(expression):
+  tokens = []
+  position = 0
+  expression = expression.rstrip()
+
+  while position < len(expression):
+    match = _TOKEN_PATTERN.match(expression, position)
+    if not match:
+      raise ValueError('Unsupported expression syntax: ' + expression[position:])
+    tokens.append(match.group(1))
+    position = match.end()
+
+  return tokens
+
+class _ExpressionParser:
+  """Parses a condition expression into a nested tuple tree, resolving names and values."""
+
+  def __init__(self, expression, names=None, values=None):
+    self.tokens = _tokenise(expression)
+    self.position = 0
+    self.names = names or {}
+    self.values = values or {}
+
+  def parse_condition(self):
+    tree = self._or()
+    if self.position != len(self.tokens):
+      raise ValueError('Unexpected token: ' + self.tokens[self.position])
+    return tree
+
+  def parse_names(self):
+    """Parses a comma-separated list of attribute names, eg. a ProjectionExpression."""
+    names = [self._name(self._take())]
+    while self._peek() == ',':
+      self._take()
+      names.append(self._name(self._take()))
+    return names
+
+  def _peek(self):
+    return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+  def _peek_keyword(self):
+    token = self._peek()
+    return token.upper() if token else None
+
+  def _take(self, expected=None):
+    token = self._peek()
+    if token is None or (expected is not None and token.upper() != expected):
+      raise ValueError('Expected ' + str(expected) + ' but found ' + str(token))
+    self.position += 1
+    return token
+
+  def _name(self, token):
+    if token.startswith('#'):
+      return self.names[token]
+    return token
+
+  def _or(self):
+    tree = self._and()
+    while self._peek_keyword() == 'OR':
+      self._take()
+      tree = ('or', tree, self._and())
+    return tree
+
+  def _and(self):
+    tree = self._not()
+    while self._peek_keyword() == 'AND':
+      self._take()
+      tree = ('and', tree, self._not())
+    return tree
+
+  def _not(self):
+    if self._peek_keyword() == 'NOT':
+      self._take()
+      return ('not', self._not())
+    return self._primary()
+
+  def _primary(self):
+    if self._peek() == '(':
+      self._take()
+      tree = self._or()
+      self._take(')')
+      return tree
+
+    token = self._take()
+
+    if self._peek() == '(' and token in ('attribute_exists', 'attribute_not_exists', 'begins_with'):
+      self._take()
+      arguments = [self._operand(self._take())]
+      while self._peek() == ',':
+        self._take()
+        arguments.append(self._operand(self._take()))
+      self._take(')')
+      return ('function', token, arguments)
+
+    left = self._operand(token)
+
+    if self._peek_keyword() == 'BETWEEN':
+      self._take()
+      low = self._operand(self._take())
+      self._take('AND')
+      high = self._operand(self._take())
+      return ('between', left, low, high)
+
+    comparator = self._take()
+    if comparator not in _COMPARATORS:
+      raise ValueError('Unsupported comparator: ' + comparator)
+    return ('compare', comparator, left, self._operand(self._take()))
+
+  def _operand(self, token):
+    if token.startswith(':'):
+      return ('value', self.values[token])
+    return ('path', self._name(token))
+
+def _decode(value):
+  """Turns a typed attribute value into something comparable, tagged with its DynamoDB type."""
+  if value is None:
+    return None
+  if 'N' in value:
+    return ('N', Decimal(value['N']))
+  if 'S' in value:
+    return ('S', value['S'])
+  if 'BOOL' in value:
+    return ('BOOL', value['BOOL'])
+  if 'B' in value:
+    return ('B', bytes(value['B']))
+  return ('?', repr(value))
+
+def _resolve(operand, item):
+  kind, argument = operand
+  if kind == 'value':
+    return argument
+  return item.get(argument)
+
+def _compare(comparator, left, right):
+  left = _decode(left)
+  right = _decode(right)
+
+  # Comparisons against missing attributes, or between different types, are never true.
+  if left is None or right is None or left[0] != right[0]:
+    return comparator == '<>' and not (left is None and right is None)
+
+  if comparator == '=': return left[1] == right[1]
+  if comparator == '<>': return left[1] != right[1]
+  if comparator == '<': return left[1] < right[1]
+  if comparator == '<=': return left[1] <= right[1]
+  if comparator == '>': return left[1] > right[1]
+  return left[1] >= right[1]
+
+def evaluate(tree, item):
+  """Evaluates a parsed condition expression against an item."""
+  kind = tree[0]
+
+  if kind == 'or':
+    return evaluate(tree[1], item) or evaluate(tree[2], item)
+
+  if kind == 'and':
+    return evaluate(tree[1], item) and evaluate(tree[2], item)
+
+  if kind == 'not':
+    return not evaluate(tree[1], item)
+
+  if kind == 'compare':
+    return _compare(tree[1], _resolve(tree[2], item), _resolve(tree[3], item))
+
+  if kind == 'between':
+    value = _resolve(tree[1], item)
+    return _compare('>=', value, _resolve(tree[2], item)) and \
+      _compare('<=', value, _resolve(tree[3], item))
+
+  name, arguments = tree[1], tree[2]
+
+  if name == 'attribute_exists':
+    return _resolve(arguments[0], item) is not None
+
+  if name == 'attribute_not_exists':
+    return _resolve(arguments[0], item) is None
+
+  value, prefix = _decode(_resolve(arguments[0], item)), _decode(_resolve(arguments[1], item))
+  return value is not None and prefix is not None and value[0] == prefix[0] == 'S' and \
+    value[1].startswith(prefix[1])
+
+def find_equality(tree, attribute):
+  """Finds the value an attribute is tested for equality against, within a tree of ANDs."""
+
+  if tree[0] == 'and':
+    return find_equality(tree[1], attribute) or find_equality(tree[2], attribute)
+
+  if tree[0] == 'compare' and tree[1] == '=':
+    for this, other in ((tree[2], tree[3]), (tree[3], tree[2])):
+      if this == ('path', attribute) and other[0] == 'value':
+        return other[1]
+
+  return None
+
+def compile_condition(expression, names=None, values=None):
+  return _ExpressionParser(expression, names, values).parse_condition()
+
+def apply_update(item, expression, names=None, values=None):
+  """Applies a `SET a = :a, b = :b REMOVE c` style update expression to an item, in place."""
+
+  clauses = re.split(r'\b(SET|REMOVE)\b', expression, flags=re.IGNORECASE)
+
+  for action, body in zip(clauses[1::2], clauses[2::2]):
+    for assignment in (part.strip() for part in body.split(',') if part.strip()):
+      parser = _ExpressionParser(assignment, names, values)
+
+      if action.upper() == 'REMOVE':
+        item.pop(parser.parse_names()[0], None)
+        continue
+
+      name = parser._name(parser._take())
+      parser._take('=')
+      item[name] = _resolve(parser._operand(parser._take()), item)
+
+############################
+# DynamoDB
+############################
+
+def estimate_item_size(item):
+  """Roughly estimates an item's size in bytes, the way DynamoDB counts it against page limits."""
+  size = 0
+  for name, value in item.items():
+    size += len(name) + len(str(next(iter(value.values()))))
+  return size
+
+class _Table:
+
+  def __init__(self, name, key_names):
+    self.name = name
+    self.key_names = key_names
+    self.items = {}
+    self.sizes = {}
+    self.indexes = {}
+    self.version = 0
+    self._order = None
+    self._sorted = {}
+
+  def key_of(self, item, key_names=None):
+    return tuple((name, _decode(item[name])) for name in (key_names or self.key_names))
+
+  def put(self, item):
+    key = self.key_of(item)
+    if key not in self.items:
+      self._order = None
+    self.items[key] = item
+    self.sizes[key] = estimate_item_size(item)
+    self.version += 1
+    self._sorted.clear()
+
+  def order(self):
+    """Returns the keys of all items, in a stable order, along with each key's position."""
+    if self._order is None:
+      keys = list(self.items)
+      self._order = (keys, {key: position for position, key in enumerate(keys)})
+    return self._order
+
+  def sorted_partitions(self, index_name):
+    """
+    Returns items grouped by partition key, and sorted by their sort key within each partition.
+    Items that don't have all of an index's key attributes aren't in that index.
+    """
+
+    if index_name in self._sorted:
+      return self._sorted[index_name]
+
+    hash_key, range_key = self.indexes[index_name] if index_name else \
+      (self.key_names + [None])[:2]
+
+    partitions = {}
+    for key, item in self.items.items():
+      if hash_key not in item or (range_key and range_key not in item):
+        continue
+      sort_value = _decode(item[range_key])[1] if range_key else 0
+      partitions.setdefault(_decode(item[hash_key]), []).append((sort_value, key))
+
+    for rows in partitions.values():
+      rows.sort()
+
+    self._sorted[index_name] = partitions
+    return partitions
+
+class FakeDynamoDB:
+  """
+  An in-memory stand-in for the boto3 DynamoDB client.
+
+  Scans and queries are paginated the same way as DynamoDB's - by Limit, and by an estimated 1 MB
+  per page - so callers that ignore LastEvaluatedKey misbehave here just like they do for real.
+  `calls` counts requests by operation, and `items_read` counts the items each operation read.
+  Every request waits for `latency` seconds first, to stand in for the network round trip.
+
+  Requests can be throttled, as if the table's capacity was exceeded: the next few of them with
+  throttle(), or a `throttle_rate` share of them at random. Consumed capacity is returned when it's
+  asked for, the way DynamoDB rounds it up.
+  """
+
+  def __init__(self, max_page_bytes=MAX_PAGE_BYTES, latency=0, throttle_rate=0, seed=0):
+    self.max_page_bytes = max_page_bytes
+    self.latency = latency
+    self.throttle_rate = throttle_rate
+    self.throttled = 0
+    self.tables = {}
+    self.calls = Counter()
+    self.items_read = Counter()
+    self._pending_throttles = 0
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+
+  def _request(self, operation):
+    with self._lock:
+      self.calls[operation] += 1
+      throttle = self._pending_throttles > 0 or \
+        (self.throttle_rate and self._random.random() < self.throttle_rate)
+      if self._pending_throttles > 0:
+        self._pending_throttles -= 1
+      if throttle:
+        self.throttled += 1
+
+    if self.latency:
+      sleep(self.latency)
+
+    if throttle:
+      raise client_error(
+        'ProvisionedThroughputExceededException',
+        'The level of configured provisioned throughput for the table was exceeded', operation
+      )
+
+  def _read(self, operation, count):
+    with self._lock:
+      self.items_read[operation] += count
+
+  def _table(self, name, operation):
+    if name not in self.tables:
+      raise client_error('ResourceNotFoundException', 'Requested resource not found', operation)
+    return self.tables[name]
+
+  def _consumed_capacity(self, table, kwargs, size, write=False):
+    """Returns the capacity a request consumed, as DynamoDB would report it - if it was asked."""
+
+    if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+      return None
+
+    if write:
+      units = max(1, math.ceil(size / WRITE_UNIT_BYTES))
+    else:
+      units = max(1, math.ceil(size / READ_UNIT_BYTES)) * \
+        (1 if kwargs.get('ConsistentRead') else 0.5)
+
+    return {'TableName': table.name, 'CapacityUnits': units}
+
+  def _respond(self, response, table, kwargs, size, write=False):
+    consumed = self._consumed_capacity(table, kwargs, size, write)
+    if consumed is not None:
+      response['ConsumedCapacity'] = consumed
+    return response
+
+  ############################
+  # Conveniences for seeding tables and injecting failures; these aren't part of the boto3 API.
+  ############################
+
+  def throttle(self, count=1):
+    """Throttles the next `count` requests."""
+    with self._lock:
+      self._pending_throttles += count
+
+  def create_simple_table(self, name, hash_key='eventId', range_key=None):
+    self.tables[name] = _Table(name, [hash_key] + ([range_key] if range_key else []))
+    return self.tables[name]
+
+  def add_index(self, table, index, hash_key, range_key=None):
+    self.tables[table].indexes[index] = (hash_key, range_key)
+    self.tables[table]._sorted.clear()
+
+  def put_items(self, table, items):
+    for item in items:
+      self.tables[table].put(item)
+
+  ############################
+  # The boto3 client API.
+  ############################
+
+  def create_table(self, TableName, KeySchema, **kwargs):
+    self._request('CreateTable')
+    key_names = [key['AttributeName'] for key in sorted(KeySchema, key=lambda key: key['KeyType'])]
+    self.tables[TableName] = _Table(TableName, key_names)
+    for index in kwargs.get('GlobalSecondaryIndexes', []):
+      self._create_index(TableName, index)
+    return self.describe_table(TableName=TableName)
+
+  def describe_table(self, TableName):
+    self._request('DescribeTable')
+    table = self._table(TableName, 'DescribeTable')
+    key_types = ('HASH', 'RANGE')
+
+    return {'Table': {
+      'TableName': TableName,
+      'ItemCount': len(table.items),
+      'KeySchema': [
+        {'AttributeName': name, 'KeyType': key_type}
+        for name, key_type in zip(table.key_names, key_types)
+      ],
+      'ProvisionedThroughput': {'ReadCapacityUnits': 0, 'WriteCapacityUnits': 0},
+      'GlobalSecondaryIndexes': [
+        {
+          'IndexName': name,
+          'IndexStatus': 'ACTIVE',
+          'KeySchema': [
+            {'AttributeName': attribute, 'KeyType': key_type}
+            for attribute, key_type in zip(keys, key_types) if attribute
+          ],
+        }
+        for name, keys in table.indexes.items()
+      ],
+    }}
+
+  def _create_index(self, table, index):
+    keys = {key['KeyType']: key['AttributeName'] for key in index['KeySchema']}
+    self.add_index(table, index['IndexName'], keys['HASH'], keys.get('RANGE'))
+
+  def update_table(self, TableName, **kwargs):
+    self._request('UpdateTable')
+    self._table(TableName, 'UpdateTable')
+    for update in kwargs.get('GlobalSecondaryIndexUpdates', []):
+      if 'Create' in update:
+        self._create_index(TableName, update['Create'])
+    return self.describe_table(TableName=TableName)
+
+  def get_item(self, TableName, Key, **kwargs):
+    self._request('GetItem')
+    table = self._table(TableName, 'GetItem')
+    key = table.key_of(Key)
+    item = table.items.get(key)
+    if item is None:
+      return self._respond({}, table, kwargs, 0)
+    self._read('GetItem', 1)
+    return self._respond({'Item': self._project(item, kwargs)}, table, kwargs, table.sizes[key])
+
+  def put_item(self, TableName, Item, **kwargs):
+    self._request('PutItem')
+    table = self._table(TableName, 'PutItem')
+    self._check_condition(table, table.key_of(Item), kwargs, 'PutItem')
+    table.put(dict(Item))
+    return self._respond({}, table, kwargs, estimate_item_size(Item), write=True)
+
+  def update_item(self, TableName, Key, UpdateExpression, **kwargs):
+    self._request('UpdateItem')
+    table = self._table(TableName, 'UpdateItem')
+    key = table.key_of(Key)
+    self._check_condition(table, key, kwargs, 'UpdateItem')
+
+    item = dict(table.items.get(key, Key))
+    apply_update(
+      item, UpdateExpression,
+      kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues')
+    )
+    table.put(item)
+    return self._respond({}, table, kwargs, estimate_item_size(item), write=True)
+
+  def _check_condition(self, table, key, kwargs, operation):
+    if 'ConditionExpression' not in kwargs:
+      return
+
+    condition = compile_condition(
+      kwargs['ConditionExpression'],
+      kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues')
+    )
+
+    if not evaluate(condition, table.items.get(key, {})):
+      raise client_error(
+        'ConditionalCheckFailedException', 'The conditional request failed', operation
+      )
+
+  def _project(self, item, kwargs):
+    if 'ProjectionExpression' not in kwargs:
+      return dict(item)
+
+    names = _ExpressionParser(
+      kwargs['ProjectionExpression'], kwargs.get('ExpressionAttributeNames')
+    ).parse_names()
+
+    return {name: item[name] for name in names if name in item}
+
+  def _last_evaluated_key(self, table, item, index_name=None):
+    key_names = list(table.key_names)
+    if index_name:
+      key_names += [name for name in table.indexes[index_name] if name and name not in key_names]
+    return {name: item[name] for name in key_names}
+
+  def _page(self, table, keys, kwargs, operation, index_name=None, key_condition=None):
+    """Reads a page of items in the given key order, applying limits, filters and projection."""
+
+    limit = kwargs.get('Limit')
+    filter_tree = None
+    if 'FilterExpression' in kwargs:
+      filter_tree = compile_condition(
+        kwargs['FilterExpression'],
+        kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues')
+      )
+
+    items = []
+    scanned = 0
+    page_bytes = 0
+    last_item = None
+    stopped_early = False
+    matched_key_condition = False
+
+    for key in keys:
+      item = table.items[key]
+
+      if key_condition is not None:
+        if not evaluate(key_condition, item):
+          # Items matching a key condition are contiguous in sort order, so once we've passed them
+          # there's nothing left to read.
+          if matched_key_condition: break
+          continue
+        matched_key_condition = True
+
+      if (limit is not None and scanned >= limit) or page_bytes >= self.max_page_bytes:
+        stopped_early = True
+        break
+
+      scanned += 1
+      page_bytes += table.sizes[key]
+      last_item = item
+
+      if filter_tree is None or evaluate(filter_tree, item):
+        items.append(self._project(item, kwargs))
+
+    self._read(operation, scanned)
+    response = self._respond(
+      {'Items': items, 'Count': len(items), 'ScannedCount': scanned}, table, kwargs, page_bytes
+    )
+
+    # Like DynamoDB, a full page always comes with a key to continue from, even if it's the end.
+    if last_item is not None and (stopped_early or (limit is not None and scanned >= limit)):
+      response['LastEvaluatedKey'] = self._last_evaluated_key(table, last_item, index_name)
+
+    return response
+
+  def scan(self, TableName, **kwargs):
+    self._request('Scan')
+    table = self._table(TableName, 'Scan')
+    keys, positions = table.order()
+
+    # Each segment is a contiguous share of the table's items.
+    start, end = 0, len(keys)
+    if 'TotalSegments' in kwargs:
+      start = len(keys) * kwargs['Segment'] // kwargs['TotalSegments']
+      end = len(keys) * (kwargs['Segment'] + 1) // kwargs['TotalSegments']
+
+    if 'ExclusiveStartKey' in kwargs:
+      start = positions[table.key_of(kwargs['ExclusiveStartKey'])] + 1
+
+    positions = range(start, end)
+    return self._page(table, (keys[position] for position in positions), kwargs, 'Scan')
+
+  def query(self, TableName, KeyConditionExpression, **kwargs):
+    self._request('Query')
+    table = self._table(TableName, 'Query')
+    index_name = kwargs.get('IndexName')
+
+    if index_name and index_name not in table.indexes:
+      raise client_error(
+        'ValidationException',
+        'The table does not have the specified index: ' + index_name, 'Query'
+      )
+
+    hash_key, range_key = table.indexes[index_name] if index_name else \
+      (table.key_names + [None])[:2]
+
+    key_condition = compile_condition(
+      KeyConditionExpression,
+      kwargs.get('ExpressionAttributeNames'), kwargs.get('ExpressionAttributeValues')
+    )
+
+    partition_value = find_equality(key_condition, hash_key)
+    if partition_value is None:
+      raise client_error(
+        'ValidationException', 'Query condition missed key schema element', 'Query'
+      )
+
+    rows = table.sorted_partitions(index_name).get(_decode(partition_value), [])
+    forward = kwargs.get('ScanIndexForward', True)
+
+    if 'ExclusiveStartKey' in kwargs:
+      start_key = kwargs['ExclusiveStartKey']
+      start_row = (
+        _decode(start_key[range_key])[1] if range_key else 0,
+        table.key_of(start_key)
+      )
+      if forward:
+        positions = range(bisect_right(rows, start_row), len(rows))
+      else:
+        positions = range(bisect_left(rows, start_row) - 1, -1, -1)
+    else:
+      positions = range(len(rows)) if forward else range(len(rows) - 1, -1, -1)
+
+    return self._page(
+      table, (rows[position][1] for position in positions), kwargs, 'Query',
+      index_name, key_condition
+    )
+
+############################
+# Metro Trains
+############################
+
+SAMPLE_HEALTH_BOARD = {
+  '82': {'line_name': 'Alamein', 'alerts': 'Good service'},
+  '84': {'line_name': 'Belgrave', 'alerts': [{'alert_type': 'minor'}, {'alert_type': 'works'}]},
+  '86': {'line_name': 'Craigieburn', 'alerts': [{'alert_type': 'suspended'}]},
+  '168307': {'alerts': 'Good service'},
+}
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  """http.server.ThreadingHTTPServer, which only exists from Python 3.7."""
+  daemon_threads = True
+
+class FakeMetroTrainsServer:
+  """
+  Serves a Metro Trains health board on a local port, in a background thread. Responses carry an
+  ETag and honour If-None-Match. Set `latency` to slow responses down, or `failing` to return
+  errors. Use as a context manager, with `endpoint` as the URL to request.
+  """
+
+  def __init__(self, board=None, latency=0):
+    self.board = board if board is not None else SAMPLE_HEALTH_BOARD
+    self.latency = latency
+    self.failing = False
+    self.requests = Counter()
+
+    stand_in = self
+
+    class Handler(BaseHTTPRequestHandler):
+
+      def do_GET(self):
+        stand_in.requests['total'] += 1
+        if stand_in.latency: sleep(stand_in.latency)
+
+        if stand_in.failing:
+          self.send_response(503)
+          self.end_headers()
+          return
+
+        body = json.dumps(stand_in.board).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+
+        if self.headers.get('If-None-Match') == etag:
+          stand_in.requests['not_modified'] += 1
+          self.send_response(304)
+          self.end_headers()
+          return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.endpoint = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/api'
+    self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+  def __enter__(self):
+    self.thread.start()
+    return self
+
+  def __exit__(self, *args):
+    self.server.shutdown()
+    self.server.server_close()
+
+############################
+# Synthetic Proximity Events data
+############################
+
+# Shared attribute values, to keep the memory used by very large synthetic tables down.
+_ADDRESSES = [
+  {'S': str(number) + ' Main Street, ' + suburb + ', VIC'}
+  for number, suburb in enumerate(['Box Hill', 'Richmond', 'Melbourne', 'Footscray', 'Carlton'])
+]
+
+def make_event_item(event_id, timestamp, accuracy=10, distance_from_home=5000,
+  distance_from_work=5000, time_from_home=1200, utc_offset_hours=11, address=None,
+  coordinates=None):
+  """Builds a location event in the shape the Proximity Events pipeline stores in DynamoDB."""
+
+  offset = timezone(timedelta(hours=utc_offset_hours))
+  event_date = datetime.fromtimestamp(timestamp, offset).isoformat(timespec='seconds')
+
+  item = {
+    'eventId': {'S': str(event_id)},
+    'event_date': {'S': event_date},
+    'event_accuracy_m': {'S': str(accuracy)},
+    'event_address': address or _ADDRESSES[hash(event_id) % len(_ADDRESSES)],
+    'distance_from_home': {'N': str(distance_from_home)},
+    'distance_from_work': {'N': str(distance_from_work)},
+    'time_from_home_public_transport': {'N': str(time_from_home)},
+  }
+
+  if coordinates is not None:
+    item['event_latitude'] = {'N': str(coordinates[0])}
+    item['event_longitude'] = {'N': str(coordinates[1])}
+
+  return item
+
+def generate_event_items(count, now, max_age=30 * 86400, seed=0):
+  """
+  Yields `count` synthetic events spread randomly across the `max_age` seconds before `now`, with a
+  realistic share of inaccurate fixes.
+  """
+  generator = random.Random(seed)
+
+  for event_id in range(count):
+    distance_from_home = generator.randint(0, 30000)
+    yield make_event_item(
+      event_id,
+      timestamp=int(now - generator.random() * max_age),
+      accuracy=generator.choice((5, 10, 30, 65, 100, 1500)),
+      distance_from_home=distance_from_home,
+      distance_from_work=30000 - distance_from_home,
+      time_from_home=distance_from_home // 10,
+    )
+
+def generate_commute_items(days, first_day, partition=None, interval=120, seed=0):
+  """
+  Yields the events for `days` days of commutes home, starting at midnight (Melbourne time) at the
+  `first_day` timestamp. Each weekday has some fixes at work, an event every `interval` seconds on
+  the way home - at a different speed each day - then a fix at home. The odd fix on the way is
+  inaccurate.
+  """
+  generator = random.Random(seed)
+  event_id = 0
+
+  for day in range(days):
+    midnight = first_day + day * 86400
+    if datetime.fromtimestamp(midnight, timezone(timedelta(hours=11))).weekday() >= 5:
+      continue
+
+    departed_at = midnight + 17 * 3600 + generator.randint(0, 3600)
+    speed = generator.uniform(5, 10)
+    points = [(timestamp, 0) for timestamp in range(departed_at - 3600, departed_at + 1, 600)]
+    points[-1] = (departed_at, 0)
+    timestamp = departed_at
+    travelled = 0
+
+    while travelled < 30000:
+      timestamp += interval
+      travelled = min(30000, travelled + speed * interval * generator.uniform(0.5, 1.5))
+      points.append((timestamp, travelled))
+
+    for index, (timestamp, travelled) in enumerate(points):
+      event_id += 1
+      accurate = timestamp == departed_at or index == len(points) - 1
+      item = make_event_item(
+        (partition + '-' + str(event_id)) if partition else event_id, timestamp,
+        accuracy=10 if accurate else generator.choice((5, 10, 30, 1500)),
+        distance_from_home=round(30000 - travelled), distance_from_work=round(travelled),
+        time_from_home=round((30000 - travelled) / 8)
+      )
+      item['time_from_home_driving'] = {'N': str(round((30000 - travelled) / 15))}
+      if partition: item['event_partition'] = {'S': partition}
+      yield item
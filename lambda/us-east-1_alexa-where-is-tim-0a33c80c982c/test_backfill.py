@@ -0,0 +1,53 @@
+from time import time
+
+import events
+import backfill
+
+from stand_ins import FakeDynamoDB, make_event_item
+
+def _make_table(count=5):
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('events')
+  dynamodb.put_items('events', [make_event_item(n, time() - n * 60) for n in range(count)])
+  return dynamodb
+
+def test_create_event_index():
+  dynamodb = _make_table()
+  backfill.create_event_index(dynamodb, 'events', 'newest')
+
+  index = dynamodb.describe_table(TableName='events')['Table']['GlobalSecondaryIndexes'][0]
+  assert index['IndexName'] == 'newest'
+  assert [key['AttributeName'] for key in index['KeySchema']] == \
+    [events.EVENT_PARTITION_ATTRIBUTE, events.EVENT_TIMESTAMP_ATTRIBUTE]
+
+def test_backfill_event_index():
+  dynamodb = _make_table()
+
+  # A dry run counts events but doesn't change them.
+  assert backfill.backfill_event_index(dynamodb, 'events', 'events', dry_run=True) == 5
+  assert dynamodb.calls['UpdateItem'] == 0
+
+  # Every event is updated with its index attributes.
+  assert backfill.backfill_event_index(dynamodb, 'events', 'events') == 5
+  for event in dynamodb.scan(TableName='events')['Items']:
+    assert event[events.EVENT_PARTITION_ATTRIBUTE] == {'S': 'events'}
+    assert event[events.EVENT_TIMESTAMP_ATTRIBUTE] == \
+      events.get_index_attributes(event, 'events')[events.EVENT_TIMESTAMP_ATTRIBUTE]
+
+  # Running it again finds nothing left to do.
+  assert backfill.backfill_event_index(dynamodb, 'events', 'events') == 0
+
+def test_backfill_event_index_follows_pagination():
+  dynamodb = _make_table(50)
+  dynamodb.max_page_bytes = 1000 # Just a few events per page.
+
+  assert backfill.backfill_event_index(dynamodb, 'events', 'events') == 50
+  assert dynamodb.calls['Scan'] > 1
+
+def test_backfilled_table_can_be_queried():
+  dynamodb = _make_table()
+  backfill.create_event_index(dynamodb, 'events', 'newest')
+  backfill.backfill_event_index(dynamodb, 'events', 'events')
+
+  event = events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events')
+  assert event.event_id == '0'
@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import zipfile
+import subprocess
+
+import build
+
+def _write(directory, name, content=''):
+  filename = os.path.join(str(directory), name)
+  os.makedirs(os.path.dirname(filename), exist_ok=True)
+  with open(filename, 'w') as file:
+    file.write(content)
+
+def _write_function(directory):
+  _write(directory, 'handler.py',
+    'import json\n\ndef handle():\n  import helper\n  return helper.x\n')
+  _write(directory, 'helper.py', 'from shared import y\nx = y + 1\n')
+  _write(directory, 'shared.py', 'y = 41\n')
+  _write(directory, 'unused.py', 'import handler\n')
+  _write(directory, 'test_handler.py', 'import handler\n')
+  _write(directory, 'data.idx', 'data')
+
+def _write_vendor(directory):
+  _write(directory, 'pure/__init__.py', 'from pure.core import value\n')
+  _write(directory, 'pure/core.py', 'value = "pure"\n')
+  _write(directory, 'pure/tests/test_core.py', 'assert False\n')
+  _write(directory, 'pure/__pycache__/core.cpython-311.pyc', 'stale')
+  _write(directory, 'pure/py.typed')
+  _write(directory, 'pure/core.pyi', 'value: str\n')
+  _write(directory, 'single.py', 'value = "single"\n')
+  _write(directory, 'data/__init__.py', 'import os\nwhere = os.path.dirname(__file__)\n')
+  _write(directory, 'data/bundle.pem', 'certificates')
+  _write(directory, 'pure-1.0.dist-info/METADATA')
+  _write(directory, 'bin/pure', '#!/usr/bin/env python\n')
+  _write(directory, 'boto3/__init__.py')
+
+def test_find_local_modules(tmp_path):
+  _write_function(tmp_path)
+
+  # Modules are found through imports at any depth, including those deferred into functions - but
+  # not modules that only import the entry points themselves.
+  assert build.find_local_modules(str(tmp_path), ['handler']) == {'handler', 'helper', 'shared'}
+
+  # The function's own entry points leave out tests, stand-ins and tools.
+  directory = os.path.dirname(os.path.abspath(__file__))
+  modules = build.find_local_modules(directory)
+  assert {'lambda_function', 'ingest', 'functions', 'speech', 'metro_trains'} <= modules
+  assert not {'test_build', 'stand_ins', 'build', 'replay', 'server', 'history'} & modules
+
+def test_copy_vendor(tmp_path):
+  _write_vendor(tmp_path / 'vendor')
+  build.copy_vendor(str(tmp_path / 'vendor'), str(tmp_path / 'copy'))
+
+  # Packages are copied without their tests, stubs, metadata or bytecode, and without scripts or
+  # packages the runtime provides.
+  assert sorted(os.listdir(str(tmp_path / 'copy'))) == ['data', 'pure', 'single.py']
+  assert sorted(os.listdir(str(tmp_path / 'copy' / 'pure'))) == ['__init__.py', 'core.py']
+  assert sorted(os.listdir(str(tmp_path / 'copy' / 'data'))) == ['__init__.py', 'bundle.pem']
+
+def test_bundle_vendor(tmp_path):
+  _write_vendor(tmp_path / 'vendor')
+  build.copy_vendor(str(tmp_path / 'vendor'), str(tmp_path / 'copy'))
+  bundle = str(tmp_path / 'vendor.zip')
+
+  # Only packages with nothing but Python source are bundled, as bytecode.
+  assert build.bundle_vendor(str(tmp_path / 'copy'), bundle) == ['pure', 'single.py']
+  assert sorted(zipfile.ZipFile(bundle).namelist()) == \
+    ['pure/__init__.pyc', 'pure/core.pyc', 'single.pyc']
+  assert os.listdir(str(tmp_path / 'copy')) == ['data']
+
+  # And they're imported from the bundle.
+  output = subprocess.check_output([
+    sys.executable, '-c', 'import pure, single; print(pure.value, single.value, pure.__file__)'
+  ], env=dict(os.environ, PYTHONPATH=bundle)).decode('utf-8').split()
+  assert output[:2] == ['pure', 'single']
+  assert output[2].startswith(bundle)
+
+def test_build(tmp_path):
+  _write_function(tmp_path / 'function')
+  _write_vendor(tmp_path / 'vendor')
+  package = str(tmp_path / 'package')
+
+  built = build.build(str(tmp_path / 'function'), str(tmp_path / 'vendor'), package, bundle=True,
+    entry_points=['handler'], data_files=['data.idx', 'missing.idx'])
+
+  # The package has only what the entry points need, with everything else bundled or compiled.
+  assert built == {'modules': ['handler', 'helper', 'shared'], 'bundled': ['pure', 'single.py']}
+  assert sorted(os.listdir(package)) == \
+    ['__pycache__', 'data.idx', 'handler.py', 'helper.py', 'shared.py', 'vendor', 'vendor.zip']
+
+  # The bytecode is hash-based, and isn't checked against the source.
+  for name in os.listdir(os.path.join(package, '__pycache__')):
+    with open(os.path.join(package, '__pycache__', name), 'rb') as file:
+      assert int.from_bytes(file.read(8)[4:], 'little') == 0b01
+
+  # And the package works from where it's been put.
+  assert build.run_python(package, 'import handler, pure, data; print(handler.handle())') == '42\n'
+
+def test_build_with_timestamp_bytecode(tmp_path, monkeypatch):
+  monkeypatch.setattr(build, 'COMPILE_OPTIONS', {})
+  _write_function(tmp_path / 'function')
+  os.utime(str(tmp_path / 'function' / 'handler.py'), (1547445601.5, 1547445601.5))
+  package = str(tmp_path / 'package')
+  build.build(str(tmp_path / 'function'), str(tmp_path / 'vendor'), package,
+    entry_points=['handler'], data_files=[])
+
+  # Without hash-based bytecode (before Python 3.7), the bytecode matches the source's timestamp,
+  # rounded down to an even second as a zip keeps it.
+  source = os.path.join(package, 'handler.py')
+  assert os.stat(source).st_mtime == 1547445600
+  for name in os.listdir(os.path.join(package, '__pycache__')):
+    with open(os.path.join(package, '__pycache__', name), 'rb') as file:
+      header = file.read(12)
+    assert int.from_bytes(header[4:8], 'little') == 0
+    if name.startswith('handler.'):
+      assert int.from_bytes(header[8:12], 'little') == 1547445600
+
+  # And it's stamped into the zip in UTC, as Lambda unpacks it.
+  filename = str(tmp_path / 'lambda.zip')
+  build.make_zip(package, filename)
+  assert zipfile.ZipFile(filename).getinfo('handler.py').date_time == \
+    time.gmtime(1547445600)[:6]
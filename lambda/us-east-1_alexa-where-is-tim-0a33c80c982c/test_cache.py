@@ -0,0 +1,133 @@
+import cache
+
+from time import sleep
+from threading import Event
+from concurrent.futures import ThreadPoolExecutor
+
+from stand_ins import FakeClock
+
+def test_TimedCache_get():
+  clock = FakeClock()
+  testable = cache.TimedCache('Test', ttl=10, max_staleness=60, clock=clock)
+
+  # Misses when there's no entry.
+  assert testable.get('key') is None
+  assert testable.misses == 1
+
+  # Hits within the TTL.
+  testable.put('key', 'value')
+  clock.now += 10
+  entry = testable.get('key')
+  assert entry.value == 'value' and entry.fresh == True
+  assert testable.hits == 1
+
+  # Returns a stale entry (counted as a miss) after the TTL, up to the max staleness.
+  clock.now += 50
+  entry = testable.get('key')
+  assert entry.value == 'value' and entry.fresh == False
+  assert testable.misses == 2
+
+  # Evicts entries beyond the max staleness.
+  clock.now += 1
+  assert testable.get('key') is None
+  assert testable.evictions == 1
+
+def test_TimedCache_get_with_is_valid():
+  testable = cache.TimedCache('Test', ttl=10, clock=FakeClock())
+  testable.put('key', 'value')
+
+  # Evicts entries whose value is no longer valid.
+  assert testable.get('key', lambda value: value != 'value') is None
+  assert testable.evictions == 1 and testable.hits == 0
+
+def test_TimedCache_max_entries():
+  testable = cache.TimedCache('Test', ttl=10, clock=FakeClock(), max_entries=2)
+  testable.put('a', 1)
+  testable.put('b', 2)
+
+  # Evicts the least recently used entry to make room for a new one.
+  assert testable.get('a').value == 1
+  testable.put('c', 3)
+  assert list(testable.entries) == ['a', 'c']
+  assert testable.evictions == 1
+
+  # Replacing an entry doesn't evict anything else.
+  testable.put('a', 4)
+  assert list(testable.entries) == ['c', 'a']
+  assert testable.evictions == 1
+
+def test_TimedCache_refresh():
+  clock = FakeClock()
+  testable = cache.TimedCache('Test', ttl=10, max_staleness=60, clock=clock)
+  testable.put('key', 'value')
+
+  # A refreshed entry is fresh again.
+  clock.now += 30
+  assert testable.get('key').fresh == False
+  testable.refresh('key')
+  assert testable.get('key').fresh == True
+  assert testable.refreshes == 1
+
+def test_TimedCache_disabled():
+  testable = cache.TimedCache('Test', ttl=0, clock=FakeClock())
+  testable.put('key', 'value')
+
+  # Nothing is ever returned with a TTL of 0.
+  assert testable.get('key') is None
+
+def test_TimedCache_log_stats(caplog):
+  testable = cache.TimedCache('Test', ttl=10, clock=FakeClock())
+  testable.get('key')
+
+  with caplog.at_level('INFO'):
+    testable.log_stats('miss', testable.clock())
+
+  assert 'Test cache miss in 0.00ms (hits: 0, misses: 1, refreshes: 0, evictions: 0)' in caplog.text
+
+def _wait_for(condition):
+  for _ in range(1000):
+    if condition(): return
+    sleep(0.001)
+
+def test_SingleFlight_call():
+  testable = cache.SingleFlight('Test')
+  release = Event()
+  calls = []
+
+  def slow_double(value):
+    calls.append(value)
+    release.wait()
+    return value * 2
+
+  # Calls for a key that's already in flight wait for its result, rather than calling again.
+  with ThreadPoolExecutor(max_workers=4) as pool:
+    results = [pool.submit(testable.call, 'key', slow_double, 1)]
+    _wait_for(lambda: calls)
+    results += [pool.submit(testable.call, 'key', slow_double, 1) for _ in range(3)]
+    _wait_for(lambda: testable.coalesced == 3)
+    release.set()
+    assert [result.result() for result in results] == [2, 2, 2, 2]
+
+  assert calls == [1] and testable.calls == 1 and testable.coalesced == 3
+
+  # Once it's finished, the next call goes ahead.
+  assert testable.call('key', slow_double, 2) == 4
+  assert calls == [1, 2]
+
+def test_SingleFlight_call_failing():
+  testable = cache.SingleFlight('Test')
+  release = Event()
+
+  def slow_failure():
+    release.wait()
+    raise ValueError('Failed')
+
+  # Everyone waiting gets the exception.
+  with ThreadPoolExecutor(max_workers=2) as pool:
+    results = [pool.submit(testable.call, 'key', slow_failure) for _ in range(2)]
+    _wait_for(lambda: testable.coalesced == 1)
+    release.set()
+    assert [type(result.exception()) for result in results] == [ValueError, ValueError]
+
+  # And nothing is left in flight.
+  assert testable.flights == {}
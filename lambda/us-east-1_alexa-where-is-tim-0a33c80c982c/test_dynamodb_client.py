@@ -0,0 +1,132 @@
+import logging
+
+from pytest import raises
+from botocore.exceptions import ClientError, ReadTimeoutError
+
+import dynamodb_client
+
+from stand_ins import FakeClock, FakeDynamoDB, client_error, make_event_item
+
+def _make_dynamodb(**kwargs):
+  dynamodb = FakeDynamoDB(**kwargs)
+  dynamodb.create_simple_table('events')
+  dynamodb.put_items('events', [make_event_item('event-' + str(index), 1000) for index in range(3)])
+  return dynamodb
+
+def test_create_client(monkeypatch):
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  config = dynamodb_client.create_client(read_timeout=2, max_attempts=4).meta.config
+
+  # Timeouts and retries are tuned for Alexa's deadline, and idle connections are kept alive.
+  assert (config.connect_timeout, config.read_timeout) == (0.5, 2)
+  assert config.retries == {'mode': 'adaptive', 'total_max_attempts': 4}
+  assert config.tcp_keepalive
+
+def test_is_transient_error():
+
+  # Throttling, server errors and timeouts are transient.
+  assert dynamodb_client.is_transient_error(
+    client_error('ProvisionedThroughputExceededException', 'Throttled', 'Query')
+  )
+  assert dynamodb_client.is_transient_error(client_error('InternalServerError', 'Oops', 'Query'))
+  assert dynamodb_client.is_transient_error(ReadTimeoutError(endpoint_url='https://dynamodb'))
+
+  # But bad requests aren't.
+  assert not dynamodb_client.is_transient_error(
+    client_error('ConditionalCheckFailedException', 'The conditional request failed', 'PutItem')
+  )
+  assert not dynamodb_client.is_transient_error(ValueError())
+
+def test_CircuitBreaker():
+  clock = FakeClock()
+  breaker = dynamodb_client.CircuitBreaker('DynamoDB', threshold=2, reset_timeout=30, clock=clock)
+
+  # Calls are allowed until there have been enough failures in a row.
+  breaker.failed()
+  breaker.succeeded()
+  breaker.failed()
+  assert breaker.allow() and breaker.state == 'closed'
+  breaker.failed()
+  assert not breaker.allow() and breaker.state == 'open' and breaker.rejections == 1
+
+  # Once it's been open long enough, a single trial call is let through, and if it fails the breaker
+  # stays open for longer.
+  clock.now += 30
+  assert breaker.allow() and breaker.state == 'half-open'
+  assert not breaker.allow()
+  breaker.failed()
+  clock.now += 20
+  assert not breaker.allow() and breaker.state == 'open'
+
+  # And if the next trial call succeeds, it closes again.
+  clock.now += 10
+  assert breaker.allow()
+  breaker.succeeded()
+  assert breaker.allow() and breaker.allow() and breaker.state == 'closed'
+
+def test_Client(caplog):
+  caplog.set_level(logging.INFO, dynamodb_client.logger.name)
+  dynamodb = _make_dynamodb()
+  client = dynamodb_client.Client(dynamodb)
+
+  # Reads and writes ask for the capacity they consume, and it's counted.
+  response = client.scan(TableName='events')
+  assert len(response['Items']) == 3
+  assert response['ConsumedCapacity'] == {'TableName': 'events', 'CapacityUnits': 0.5}
+  client.get_item(TableName='events', Key={'eventId': {'S': 'event-0'}}, ConsistentRead=True)
+  client.put_item(TableName='events', Item=make_event_item('event-3', 1000))
+  assert client.consumed == {'Read': 1.5, 'Write': 1}
+
+  # Each request is only logged at debug level, so pages of a scan don't flood the logs.
+  assert not caplog.records
+  caplog.set_level(logging.DEBUG, dynamodb_client.logger.name)
+  client.scan(TableName='events')
+  assert [record.levelno for record in caplog.records] == [logging.DEBUG]
+  assert 'consumed 0.5 read capacity units' in caplog.text
+
+  # Unless it's turned off.
+  response = dynamodb_client.Client(dynamodb, return_consumed_capacity='NONE').scan(
+    TableName='events'
+  )
+  assert 'ConsumedCapacity' not in response
+
+  # Anything else is passed through to the client as it is.
+  assert client.tables is dynamodb.tables
+
+  # Errors from bad requests are raised as they are, but throttling is raised as Unavailable.
+  with raises(ClientError):
+    client.scan(TableName='missing')
+  dynamodb.throttle()
+  with raises(dynamodb_client.Unavailable):
+    client.scan(TableName='events')
+  assert dynamodb.throttled == 1
+
+def test_Client_circuit_breaker():
+  clock = FakeClock()
+  dynamodb = _make_dynamodb()
+  breaker = dynamodb_client.CircuitBreaker('DynamoDB', threshold=3, reset_timeout=30, clock=clock)
+  client = dynamodb_client.Client(dynamodb, breaker)
+
+  # Once DynamoDB has throttled enough requests in a row, requests fail fast without being sent.
+  dynamodb.throttle(3)
+  for _ in range(4):
+    with raises(dynamodb_client.Unavailable):
+      client.query(TableName='events', KeyConditionExpression='eventId = :id',
+        ExpressionAttributeValues={':id': {'S': 'event-0'}})
+  assert dynamodb.calls['Query'] == 3 and breaker.rejections == 1
+
+  # Requests that fail for other reasons don't count against DynamoDB.
+  breaker = dynamodb_client.CircuitBreaker('DynamoDB', threshold=1, clock=clock)
+  client = dynamodb_client.Client(dynamodb, breaker)
+  with raises(ClientError):
+    client.scan(TableName='missing')
+  assert breaker.state == 'closed'
+
+  # And once it recovers, requests go through again.
+  client = dynamodb_client.Client(dynamodb, breaker)
+  dynamodb.throttle()
+  with raises(dynamodb_client.Unavailable):
+    client.scan(TableName='events')
+  clock.now += breaker.reset_timeout
+  assert len(client.scan(TableName='events')['Items']) == 3
+  assert breaker.state == 'closed'
@@ -0,0 +1,157 @@
+import random
+
+import estimator
+import functions
+
+from stand_ins import make_event_item
+
+# Monday 14 January 2019, 5pm in Melbourne.
+LEFT_WORK_AT = 1547445600
+
+def _event(minutes, distance_from_home, distance_from_work=None, time_from_home=None):
+  if distance_from_work is None: distance_from_work = 30000 - distance_from_home
+  if time_from_home is None: time_from_home = distance_from_home // 10
+  return functions.LocationEvent(make_event_item(
+    'at-' + str(minutes), LEFT_WORK_AT + minutes * 60, distance_from_home=distance_from_home,
+    distance_from_work=distance_from_work, time_from_home=time_from_home
+  ))
+
+def _commute(minutes_per_km=2, finish=True):
+  """A commute home from work, with an event every 2 minutes."""
+  yield _event(0, 30000, 0)
+  for minutes in range(2, 60 * minutes_per_km, 2):
+    yield _event(minutes, max(100, 30000 - minutes * 1000 // minutes_per_km))
+  if finish:
+    yield _event(60 * minutes_per_km + 2, 10)
+
+def test_TripEstimator_update():
+  trip = estimator.TripEstimator(window_size=3)
+  durations = [trip.update(event) for event in _commute()]
+
+  # The trip is over once home, and it's counted as a commute as it started at work.
+  assert durations[-1] == 122 * 60
+  assert not any(durations[:-1])
+  assert not trip.on_trip
+
+  # Events at home don't start a trip, but leaving home does (without it being a commute).
+  assert trip.update(_event(200, 0)) is None and not trip.on_trip
+  assert trip.update(_event(202, 500)) is None and trip.on_trip and not trip.from_work
+
+  # Events that aren't newer than the last are ignored.
+  assert trip.update(_event(201, 5000)) is None and trip.last_distance == 500
+
+def test_TripEstimator_update_after_a_gap():
+  trip = estimator.TripEstimator()
+  for event in _commute(finish=False):
+    trip.update(event)
+
+  # A long gap picks the trip up again from the next event, which isn't a commute any more.
+  assert trip.update(_event(200, 1000)) is None
+  assert trip.on_trip and not trip.from_work and len(trip.legs) == 0
+  assert trip.update(_event(202, 10)) is None
+
+def test_TripEstimator_estimate_time_from_home():
+  trip = estimator.TripEstimator(window_size=3)
+
+  # There's nothing to go on at work, before the first leg.
+  trip.update(_event(0, 30000, 0))
+  assert trip.estimate_time_from_home() is None
+
+  # 1km every 2 minutes, so there's 54 minutes to go from 27km away.
+  trip.update(_event(2, 29000))
+  trip.update(_event(4, 28000))
+  trip.update(_event(6, 27000))
+  assert round(trip.estimate_time_from_home()) == 54 * 60
+
+  # Only the recent legs count, so the estimate catches up with a change of speed.
+  for minutes, distance in ((8, 26500), (10, 26000), (12, 25500)):
+    trip.update(_event(minutes, distance))
+  assert round(trip.estimate_time_from_home()) == 102 * 60
+
+  # Waiting around (or going the wrong way) is too slow to estimate from.
+  for minutes in (14, 16, 18):
+    trip.update(_event(minutes, 25500))
+  assert trip.estimate_time_from_home() is None
+
+def test_TripEstimator_update_matches_rescanning():
+  generator = random.Random(0)
+  trip = estimator.TripEstimator(window_size=5)
+  events = [_event(0, 30000, 0)]
+  distance = 30000
+
+  for minutes in range(1, 600):
+    distance = max(51, distance - generator.randint(-200, 1500))
+    events.append(_event(minutes, distance))
+
+  # The running totals always match working the window out again from scratch.
+  for index, event in enumerate(events):
+    trip.update(event)
+    window = events[max(0, index - 5):index + 1]
+    legs = list(zip(window, window[1:]))
+    assert abs(trip.window_time - sum(b.timestamp - a.timestamp for a, b in legs)) < 1e-6
+    assert abs(trip.window_distance - \
+      sum(a.distance_from_home - b.distance_from_home for a, b in legs)) < 1e-6
+
+def test_TripEstimator_to_bytes():
+  trip = estimator.TripEstimator()
+  for event in _commute(finish=False):
+    trip.update(event)
+
+  # A trip is packed into a few bytes, and unpacks to the same trip.
+  data = trip.to_bytes()
+  assert len(data) < 200
+  restored = estimator.TripEstimator.from_bytes(data)
+  assert list(restored.legs) == list(trip.legs)
+  for name in ('window_time', 'window_distance', 'started_at', 'week_hour', 'from_work',
+    'last_timestamp', 'last_distance'):
+    assert getattr(restored, name) == getattr(trip, name)
+
+  # As does a trip that hasn't started.
+  restored = estimator.TripEstimator.from_bytes(estimator.TripEstimator().to_bytes())
+  assert restored.started_at is None and restored.last_distance is None and not restored.legs
+
+def test_CommuteHistory():
+  history = estimator.CommuteHistory()
+
+  # Durations are averaged by the hour of the week they started in.
+  assert history.get_typical_duration(17) is None
+  history.add(17, 3000)
+  history.add(17, 4000)
+  assert history.get_typical_duration(17) == 3500
+  assert history.get_typical_duration(18) is None
+  assert history.get_typical_duration(-1) is None
+
+  # The whole week packs into a few KB.
+  data = history.to_bytes()
+  assert len(data) == 12 * estimator.HOURS_IN_A_WEEK
+  assert estimator.CommuteHistory.from_bytes(data).get_typical_duration(17) == 3500
+
+def test_Commute():
+  commute = estimator.Commute()
+
+  # Finished commutes are added to the history, by the local hour they started in.
+  for event in _commute():
+    commute.update(event)
+  assert commute.history.get_typical_duration(17) == 122 * 60
+
+  # Another commute at the same time of the week blends in that history, along with its own speed
+  # and the routing estimate.
+  events = list(_commute(finish=False))
+  for event in events[:11]:
+    commute.update(event)
+  newest = events[10]
+  routing = newest.time_from_home
+  trip = commute.trip.estimate_time_from_home()
+  history = 122 * 60 - 20 * 60
+  assert commute.estimate_time_from_home(newest) == int((routing + trip + history * 0.5) / 2.5)
+
+  # It round-trips through the current event's attributes.
+  restored = estimator.Commute.from_item(commute.to_attributes())
+  assert restored.estimate_time_from_home(newest) == commute.estimate_time_from_home(newest)
+
+  # There's no estimate when there's no trip.
+  assert estimator.Commute.from_item(None).estimate_time_from_home(newest) is None
+
+def test_get_week_hour():
+  assert estimator.get_week_hour(_event(0, 30000)) == 17        # Monday at 5pm.
+  assert estimator.get_week_hour(_event(60 * 24 * 6, 30000)) == 6 * 24 + 17 # Sunday at 5pm.
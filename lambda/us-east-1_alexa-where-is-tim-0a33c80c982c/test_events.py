@@ -0,0 +1,189 @@
+from time import time
+from os import environ
+
+environ['VALID_EVENT_MAX_AGE_IN_SECONDS'] = '86400'
+environ['VALID_EVENT_MAX_ACCURACY_IN_METRES'] = '65'
+
+import events
+import functions
+import time_sources
+
+from stand_ins import FakeDynamoDB, make_event_item, generate_event_items
+
+def _make_table(items, partition='events'):
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('events')
+  dynamodb.add_index(
+    'events', 'newest', events.EVENT_PARTITION_ATTRIBUTE, events.EVENT_TIMESTAMP_ATTRIBUTE
+  )
+
+  for item in items:
+    item.update(events.get_index_attributes(item, partition))
+    dynamodb.put_items('events', [item])
+
+  return dynamodb
+
+def test_get_index_attributes():
+  event = make_event_item('abc', timestamp=1545980317, accuracy=12.5)
+  attributes = events.get_index_attributes(event, 'events')
+
+  assert attributes[events.EVENT_PARTITION_ATTRIBUTE] == {'S': 'events'}
+  assert attributes[events.EVENT_TIMESTAMP_ATTRIBUTE] == {'N': '1545980317'}
+  assert attributes[events.EVENT_ACCURACY_ATTRIBUTE] == {'N': '12.5'} # Numeric copy of the string.
+
+  # Events that already have a numeric accuracy are fine too.
+  event['event_accuracy_m'] = {'N': '30'}
+  attributes = events.get_index_attributes(event, 'events')
+  assert attributes[events.EVENT_ACCURACY_ATTRIBUTE] == {'N': '30'}
+
+def test_get_and_put_current_event():
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('current', hash_key=events.EVENT_PARTITION_ATTRIBUTE)
+  now = time()
+
+  # There's no current event to start with.
+  assert events.get_current_event(dynamodb, 'current', 'events') is None
+
+  # The first event becomes the current event, with the index attributes added.
+  assert events.put_current_event(dynamodb, 'current', 'events', make_event_item('a', now - 60))
+  current = events.get_current_event(dynamodb, 'current', 'events')
+  assert current.event_id == 'a'
+  assert dynamodb.get_item(TableName='current', Key={'event_partition': {'S': 'events'}})\
+    ['Item'][events.EVENT_TIMESTAMP_ATTRIBUTE] == {'N': str(int(now - 60))}
+
+  # Older events, and events at the same time, don't replace it.
+  for older in (make_event_item('b', now - 120), make_event_item('c', now - 60)):
+    assert not events.put_current_event(dynamodb, 'current', 'events', older)
+  assert events.get_current_event(dynamodb, 'current', 'events').event_id == 'a'
+
+  # Newer events do.
+  assert events.put_current_event(dynamodb, 'current', 'events', make_event_item('d', now - 30))
+  assert events.get_current_event(dynamodb, 'current', 'events').event_id == 'd'
+
+  # Each partition has its own current event.
+  assert events.get_current_event(dynamodb, 'current', 'others') is None
+
+def test_is_event_valid():
+  testable = lambda item: events.is_event_valid(functions.LocationEvent(item))
+
+  assert testable(make_event_item(1, time() - 60)) == True
+  assert testable(make_event_item(1, time() - 60, accuracy=100)) == False # Inaccurate
+  assert testable(make_event_item(1, time() - 90000)) == False # Too old
+
+def test_query_newest_valid_event():
+  now = time()
+  dynamodb = _make_table([
+    make_event_item('old', now - 90000),
+    make_event_item('valid', now - 600),
+    make_event_item('newest-valid', now - 300),
+    make_event_item('inaccurate', now - 60, accuracy=100),
+  ])
+
+  event = events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events')
+
+  # Returns the newest event that is accurate enough, skipping newer inaccurate ones.
+  assert event.event_id == 'newest-valid'
+
+  # Only the newest end of the index is read.
+  assert dynamodb.items_read['Query'] <= events.QUERY_PAGE_SIZE
+  assert dynamodb.calls['Scan'] == 0
+
+def test_query_newest_valid_event_pages_past_inaccurate_events():
+  now = time()
+  inaccurate = [make_event_item(n, now - n, accuracy=100) for n in range(1, 26)]
+  dynamodb = _make_table(inaccurate + [make_event_item('valid', now - 1000)])
+
+  event = events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events', page_size=10)
+
+  # Keeps following LastEvaluatedKey until a valid event turns up.
+  assert event.event_id == 'valid'
+  assert dynamodb.calls['Query'] == 3
+
+def test_query_newest_valid_event_with_no_valid_events():
+  now = time()
+  dynamodb = _make_table([make_event_item('old', now - 90000)])
+
+  # Returns None if there are no valid events.
+  assert events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events') is None
+
+  # Only reads events from its own partition.
+  dynamodb = _make_table([make_event_item('valid', now - 60)], partition='someone-else')
+  assert events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events') is None
+
+def test_scan_newest_valid_event():
+  now = time()
+  dynamodb = _make_table([
+    make_event_item('valid', now - 600),
+    make_event_item('newest-valid', now - 300),
+    make_event_item('inaccurate', now - 60, accuracy=100),
+  ])
+
+  assert events.scan_newest_valid_event(dynamodb, 'events').event_id == 'newest-valid'
+
+def test_scan_newest_valid_event_in_partition():
+  now = time()
+  dynamodb = _make_table([make_event_item('tim', now - 300)], partition='tim')
+  item = make_event_item('sam', now - 60)
+  item.update(events.get_index_attributes(item, 'sam'))
+  dynamodb.put_items('events', [item])
+
+  # Only events in the partition are considered, if one is given.
+  assert events.scan_newest_valid_event(dynamodb, 'events').event_id == 'sam'
+  assert events.scan_newest_valid_event(dynamodb, 'events', partition='tim').event_id == 'tim'
+  assert events.scan_newest_valid_event(dynamodb, 'events', 4, partition='tim').event_id == 'tim'
+  assert events.scan_newest_valid_event(dynamodb, 'events', partition='alex') is None
+
+def test_query_and_scan_agree():
+  dynamodb = _make_table(list(generate_event_items(2000, time(), max_age=2 * 86400)))
+
+  queried = events.query_newest_valid_event(dynamodb, 'events', 'newest', 'events')
+  scanned = events.scan_newest_valid_event(dynamodb, 'events')
+
+  assert queried.event_id == scanned.event_id
+
+def test_scan_newest_valid_event_follows_pagination():
+  now = time()
+  dynamodb = _make_table([make_event_item(n, now - 600 - n) for n in range(1, 50)] + \
+    [make_event_item('newest-valid', now - 300)])
+  dynamodb.max_page_bytes = 1000 # Just a few events per page.
+
+  # The newest event is on the last page, so it's only found if every page is read.
+  assert events.scan_newest_valid_event(dynamodb, 'events').event_id == 'newest-valid'
+  assert dynamodb.calls['Scan'] > 1
+
+def test_scan_newest_valid_event_in_segments():
+  dynamodb = _make_table(list(generate_event_items(2000, time(), max_age=2 * 86400)))
+  dynamodb.max_page_bytes = 20000
+
+  expected = events.scan_newest_valid_event(dynamodb, 'events')
+  for segments in (2, 3, 8):
+    assert events.scan_newest_valid_event(dynamodb, 'events', segments).event_id == \
+      expected.event_id
+
+  # Returns None if no segment has a valid event.
+  dynamodb = _make_table([make_event_item(n, time() - 90000) for n in range(10)])
+  assert events.scan_newest_valid_event(dynamodb, 'events', segments=4) is None
+
+def test_scan_newest_valid_event_projection():
+  item = make_event_item('valid', time() - 300, coordinates=(-37.8, 145))
+  item['time_from_home_driving'] = {'N': '900'}
+  dynamodb = _make_table([item])
+  pages = []
+  scan = dynamodb.scan
+  dynamodb.scan = lambda **params: pages.append(scan(**params)) or pages[-1]
+
+  # Only the attributes that are needed are fetched.
+  events.scan_newest_valid_event(dynamodb, 'events')
+  assert set(pages[-1]['Items'][0]) == set(events.EVENT_ATTRIBUTES) | \
+    {'time_from_home_public_transport'}
+
+  # Including the times from home the configured time sources read.
+  attributes = events.get_scan_attributes(time_sources.compile_sources('driving,distance'))
+  event = events.scan_newest_valid_event(dynamodb, 'events', attributes=attributes)
+  assert set(pages[-1]['Items'][0]) == set(events.EVENT_ATTRIBUTES) | {'time_from_home_driving'}
+  assert time_sources.resolve(event, time_sources.compile_sources('driving,distance')) == \
+    (900, 'driving')
+
+  # Everything is fetched without a projection.
+  events.scan_newest_valid_event(dynamodb, 'events', attributes=None)
+  assert events.EVENT_TIMESTAMP_ATTRIBUTE in pages[-1]['Items'][0]
@@ -3,7 +3,8 @@ import json
 
 from os import environ, getenv
 from time import time
-from pytest import mark
+from array import array
+from pytest import mark, raises
 from datetime import datetime
 from dateutil.tz import tzoffset
 
@@ -12,15 +13,73 @@ environ['VALID_EVENT_MAX_ACCURACY_IN_METRES'] = '65'
 environ['METRO_TRAINS_ENDPOINT'] = 'http://localhost/metrotrains'
 
 import functions
+import geo_index
+
+from stand_ins import FakeMetroTrainsServer, make_event_item, generate_event_items
 
 @mark.skip(reason="TODO: Need to work out how much to test this")
 def test_alexa_sound_effect():
   pass
 
+def test_as_location_event():
+  item = make_event_item('abc', 1545980317)
+  event = functions.as_location_event(item)
+
+  assert isinstance(event, functions.LocationEvent) # Decodes items.
+  assert functions.as_location_event(event) is event # Passes events through as they are.
+
+def _make_events():
+  now = time()
+  return [
+    make_event_item('valid', now - 600),
+    make_event_item('inaccurate', now - 60, accuracy=100),
+    make_event_item('newest-valid', now - 300),
+    make_event_item('old', now - 90000),
+    {'eventId': {'S': 'broken'}, 'event_date': {'S': 'not a date'}},
+  ]
+
+def test_get_event_columns(monkeypatch):
+  for numpy in (None, functions._get_numpy()):
+    monkeypatch.setattr(functions, '_numpy', numpy)
+    columns = functions.get_event_columns(_make_events())
+
+    assert list(columns['accuracy'][:4]) == [10, 100, 10, 10]
+    assert columns['distance_from_home'][0] == 5000
+    assert columns['time_from_home'][0] == 1200
+    assert columns['timestamp'][4] != columns['timestamp'][4] # Invalid values are NaN.
+
 def test_get_event_suburb():
   fake_event = {'event_address': {'S': '123 Main Street, Suburb, STATE'}}
   assert functions.get_event_suburb(fake_event) == 'Suburb'
 
+def test_get_event_suburb_from_coordinates(monkeypatch):
+  monkeypatch.setattr(geo_index, '_index', geo_index.GeoIndex(geo_index.build_index([
+    ('Richmond', -37.8230, 144.9980), ('Box Hill', -37.8190, 145.1250)
+  ])))
+
+  # The suburb in the address is used, even if the coordinates are nearer another suburb's centre.
+  event = make_event_item(1, 0, address={'S': '1 Main Street, Melbourne, VIC'},
+    coordinates=(-37.8200, 145.1200))
+  assert functions.get_event_suburb(event) == 'Melbourne'
+
+  # The suburb nearest to the coordinates is only used when the address can't be read.
+  event = make_event_item(1, 0, coordinates=(-37.8200, 145.1200))
+  del event['event_address']
+  assert functions.get_event_suburb(event) == 'Box Hill'
+  event = make_event_item(1, 0, address={'S': ''}, coordinates=(-37.8200, 145.1200))
+  assert functions.get_event_suburb(event) == 'Box Hill'
+
+  # And if they're too far from any suburb, or there's no index, there's no suburb to be found.
+  event = make_event_item(1, 0, coordinates=(-38.5, 146))
+  del event['event_address']
+  with raises(KeyError):
+    functions.get_event_suburb(event)
+  monkeypatch.setattr(geo_index, '_index', False)
+  event = make_event_item(1, 0, coordinates=(-37.8200, 145.1200))
+  del event['event_address']
+  with raises(KeyError):
+    functions.get_event_suburb(event)
+
 def test_get_event_timestamp():
   _test_get_event_timestamp(0)   # Correct timestamp returned with GMT
   _test_get_event_timestamp(+10) # Correct timestamp returned with positive offset
@@ -41,9 +100,25 @@ def _test_get_event_timestamp(offset):
 
   assert functions.get_event_timestamp(fake_event) == fake_timestamp
 
-@mark.skip(reason="TODO: Need to add mocking of the API endpoint for this")
-def test_get_metro_trains_line_data():
-  pass
+def test_get_metro_trains_line_data(monkeypatch):
+  with FakeMetroTrainsServer() as server:
+    monkeypatch.setattr(functions, 'METRO_TRAINS_ENDPOINT', server.endpoint)
+    monkeypatch.setattr(functions, '_metro_trains_client', None)
+
+    assert functions.get_metro_trains_line_data(86) == {'name': 'Craigieburn', 'status': 'suspended'}
+
+    # The same client is reused between calls.
+    assert functions.get_metro_trains_client() is functions.get_metro_trains_client()
+
+def test_get_readable_clock_time():
+  testable = functions.get_readable_clock_time
+
+  assert testable(datetime(2019, 1, 14, 17, 44)) == '5:45 pm' # Rounded to the nearest 5 minutes.
+  assert testable(datetime(2019, 1, 14, 17, 58)) == '6 pm'    # Minutes are left off on the hour.
+  assert testable(datetime(2019, 1, 14, 9, 5)) == '9:05 am'
+  assert testable(datetime(2019, 1, 14, 0, 1)) == '12 am'     # Midnight and midday are 12.
+  assert testable(datetime(2019, 1, 14, 12, 30)) == '12:30 pm'
+  assert testable(datetime(2019, 1, 14, 23, 58)) == '12 am'   # Rounded up past midnight.
 
 def test_get_readable_distance_from_metres():
   testable = functions.get_readable_distance_from_metres
@@ -53,6 +128,39 @@ def test_get_readable_distance_from_metres():
   assert testable(1499) == '1km' # Rounded down to nearest kilometre.
   assert testable(1500) == '2km' # Rounded up to nearest kilometre.
 
+def test_get_readable_distance_from_metres_matches_building_it(monkeypatch):
+  monkeypatch.setattr(functions, '_readable_metres', {})
+  monkeypatch.setattr(functions, '_readable_kilometres', {})
+
+  def built(distance):
+    return str(round(distance)) + 'm' if distance < 950 else str(round(distance / 1000)) + 'km'
+
+  # Every distance up to 20km - in whole and half metres, so rounding is covered both ways - and
+  # longer distances up to 2000km, read the same whether they're looked up or built, both the first
+  # time and once they've been remembered.
+  distances = list(range(-100, 20000)) + list(range(20000, 2000000, 499))
+  for _ in range(2):
+    for distance in distances:
+      assert functions.get_readable_distance_from_metres(distance) == built(distance)
+      assert functions.get_readable_distance_from_metres(distance + .5) == built(distance + .5)
+
+  # The tables stop growing once they're full, without changing what's returned.
+  monkeypatch.setattr(functions, 'READABLE_CACHE_SIZE', 10)
+  monkeypatch.setattr(functions, '_readable_kilometres', {})
+  for distance in range(0, 100000, 1000):
+    assert functions.get_readable_distance_from_metres(distance) == built(distance)
+  assert len(functions._readable_kilometres) == 10
+
+def test_get_readable_distances_from_metres():
+  testable = functions.get_readable_distances_from_metres
+
+  # Lists, `array`s and NumPy arrays all work, and missing values are None.
+  assert testable([949, 1500.0, float('nan')]) == ['949m', '2km', None]
+  assert testable(array('d', [949, 1500])) == ['949m', '2km']
+  if functions._get_numpy() is not None:
+    assert testable(functions._get_numpy().array([949.0, 1500.0])) == ['949m', '2km']
+  assert testable([]) == []
+
 def test_get_readable_time_from_seconds():
   testable = functions.get_readable_time_from_seconds
 
@@ -69,6 +177,40 @@ def test_get_readable_time_from_seconds():
   assert testable(6660) == "1 hour and 50 minutes" # 1 hr 51 min : Rounds to nearest 5.
   assert testable(7200) == "2 hours"   # Exact hour, with correct pluralisation for plural.
 
+def test_get_readable_time_from_seconds_matches_building_it(monkeypatch):
+  monkeypatch.setattr(functions, '_readable_times', {})
+
+  # Every second of a day (and some negative times) reads the same whether it's looked up or
+  # built, both the first time and once it's been remembered.
+  for step in (1, 7):
+    for seconds in range(-600, 86400, step):
+      assert functions.get_readable_time_from_seconds(seconds) == \
+        functions._build_readable_time(seconds)
+  assert len(functions._readable_times) == 1440 + 10
+
+  # Times that aren't whole seconds are still built, as they always have been.
+  assert functions.get_readable_time_from_seconds(3600.0) == '1.0 hour'
+  assert functions.get_readable_time_from_seconds(True) == '0 minutes'
+
+  # The table stops growing once it's full, without changing what's returned.
+  monkeypatch.setattr(functions, 'READABLE_CACHE_SIZE', 10)
+  monkeypatch.setattr(functions, '_readable_times', {})
+  for seconds in range(0, 86400, 30):
+    assert functions.get_readable_time_from_seconds(seconds) == \
+      functions._build_readable_time(seconds)
+  assert len(functions._readable_times) == 10
+
+def test_get_readable_times_from_seconds():
+  testable = functions.get_readable_times_from_seconds
+
+  # Lists, `array`s and NumPy arrays all work, times are truncated to whole seconds (just as for
+  # events), and missing values are None.
+  assert testable([60, 3600.7, float('nan')]) == ['1 minute', '1 hour', None]
+  assert testable(array('d', [60, 3600])) == ['1 minute', '1 hour']
+  if functions._get_numpy() is not None:
+    assert testable(functions._get_numpy().array([60.0, 3600.0])) == ['1 minute', '1 hour']
+  assert testable([]) == []
+
 def test_is_event_accurate_enough():
   fake_event = {'event_accuracy_m': {'S': ''}}
   valid_accuracy = getenv('VALID_EVENT_MAX_ACCURACY_IN_METRES')
@@ -113,12 +255,122 @@ def test_json_encode():
   # Returned string can be successfully loaded (and validated)
   assert sample_object['sample'] == json.loads(encoded_object)['sample']
 
+  # It's compact, with no whitespace between items
+  assert functions.json_encode({'a': 1, 'b': [2, 3]}) == '{"a":1,"b":[2,3]}'
+
+  # Alexa SDK models are encoded through their to_dict(), including enums and datetimes
+  from ask_sdk_model import SessionEndedRequest, SessionEndedReason
+  request = SessionEndedRequest(request_id='abc', timestamp=datetime(2019, 1, 14, 7, 30),
+    reason=SessionEndedReason.USER_INITIATED)
+  encoded_request = json.loads(functions.json_encode(request))
+  assert encoded_request['request_id'] == 'abc'
+  assert encoded_request['reason'] == 'USER_INITIATED'
+  assert encoded_request['timestamp'] == '2019-01-14T07:30:00'
+
+  # Anything else is encoded through its attributes, or failing that, as a string
+  class Sample:
+    def __init__(self):
+      self.sample = 12345
+
+  assert json.loads(functions.json_encode(Sample())) == {'sample': 12345}
+  assert json.loads(functions.json_encode({'sample': {1}})) == {'sample': '{1}'}
+
+def test_LocationEvent():
+  item = make_event_item('abc', 1545980317, accuracy=12.5, distance_from_home=1500,
+    distance_from_work=250.5, time_from_home=600, address={'S': '1 Main Street, Box Hill, VIC'})
+  item['time_from_home_driving'] = {'N': '300'}
+  event = functions.LocationEvent(item)
+
+  assert event.event_id == 'abc'
+  assert event.suburb == 'Box Hill'
+  assert event.timestamp == 1545980317
+  assert event.accuracy == 12.5
+  assert event.distance_from_home == 1500
+  assert event.distance_from_work == 250.5
+  assert event.time_from_home == 600
+  assert event.get_time_from_home('driving') == 300
+  assert sorted(event.time_from_home_modes) == ['driving', 'public_transport']
+
+  # Parsed values are remembered.
+  assert event.suburb is event.suburb
+  assert isinstance(event._accuracy, float)
+
+  # Doesn't hold on to the item, or allow new attributes.
+  assert not hasattr(event, '__dict__')
+
+  # Missing attributes raise a KeyError when used, not before.
+  event = functions.LocationEvent({'eventId': {'S': 'abc'}})
+  with raises(KeyError):
+    event.timestamp
+  with raises(KeyError):
+    event.get_time_from_home('walking')
+
 def test_maybe_pluralise():
   assert functions.maybe_pluralise('test', 0) == 'tests'  # Pluralises on 0
   assert functions.maybe_pluralise('test', 1) == 'test'   # Does not pluralise on 1
   assert functions.maybe_pluralise('test', 2) == 'tests'  # Pluralises on 2
   assert functions.maybe_pluralise('test', 11) == 'tests' # Pluralises on 11 (no confusion on the 1)
 
+def test_parse_event_date():
+  testable = functions.parse_event_date
+
+  # Gives identical results to the original strptime() parsing.
+  for event_date in [
+    '2018-12-30T17:58:37+11:00',
+    '2018-12-30T17:58:37-10:00',
+    '2018-12-30T17:58:37+00:00',
+    '2018-06-01T00:00:00+10:00',
+    '2018-12-30T17:58:37+0530',
+    '2018-1-5T7:08:09+11:00',
+  ]:
+    reference = datetime.strptime(event_date[:-3] + event_date[-2:] if ':' == event_date[-3:-2] \
+      else event_date, '%Y-%m-%dT%H:%M:%S%z').timestamp()
+    assert testable(event_date) == reference
+
+  # Rejects dates without an offset, as there's no way of knowing what time they are.
+  with raises(ValueError):
+    testable('2018-12-30T17:58:37')
+
+  # Remembers dates it has already parsed.
+  testable.cache_clear()
+  testable('2018-12-30T17:58:37+11:00')
+  testable('2018-12-30T17:58:37+11:00')
+  assert testable.cache_info().hits == 1
+
+def test_parse_event_date_without_fromisoformat(monkeypatch):
+  monkeypatch.setattr(functions, '_fromisoformat', None)
+  functions.parse_event_date.cache_clear()
+
+  # Before Python 3.7, dates are parsed with strptime() alone, to the same results.
+  assert functions.parse_event_date('2018-12-30T17:58:37+11:00') == 1546153117
+  assert functions.parse_event_date('2018-12-30T17:58:37+0530') == 1546172917
+  assert functions.parse_event_datetime('2018-12-30T17:58:37+11:00').utcoffset().seconds == 39600
+  with raises(ValueError):
+    functions.parse_event_date('2018-12-30T17:58:37')
+  functions.parse_event_date.cache_clear()
+
+def test_select_newest_valid_event(monkeypatch):
+  events = _make_events()
+
+  for numpy in (None, functions._get_numpy()):
+    monkeypatch.setattr(functions, '_numpy', numpy)
+
+    # Selects the newest event that is accurate and new enough.
+    assert functions.select_newest_valid_event(events) == 2
+
+    # Returns None if there are no valid events.
+    assert functions.select_newest_valid_event(events[3:]) is None
+    assert functions.select_newest_valid_event([]) is None
+
+  # Agrees with checking each event one at a time.
+  events = list(generate_event_items(2000, time(), max_age=2 * 86400))
+  expected = max(
+    (event for event in events if functions.is_event_accurate_enough(event) and \
+      functions.is_timestamp_new_enough(functions.get_event_timestamp(event))),
+    key=functions.get_event_timestamp
+  )
+  assert events[functions.select_newest_valid_event(events)] is expected
+
 def test_round_to_nearest():
   assert functions.round_to_nearest(1) == 0    # Rounds down correctly with default increment
   assert functions.round_to_nearest(3) == 5    # Rounds up correctly with default increment
@@ -0,0 +1,80 @@
+from os import path
+from pytest import raises
+
+import geo_index
+
+SUBURBS = [
+  ('Richmond', -37.8230, 144.9980),
+  ('Abbotsford', -37.8045, 144.9988),
+  ('Box Hill', -37.8190, 145.1250),
+  ('Geelong', -38.1499, 144.3617),
+]
+
+def test_GeoIndex_find_suburb():
+  index = geo_index.GeoIndex(geo_index.build_index(SUBURBS))
+
+  # The nearest suburb is found, even from across a cell boundary.
+  assert index.find_suburb(-37.8230, 144.9980) == 'Richmond'
+  assert index.find_suburb(-37.8200, 145.0000) == 'Richmond'
+  assert index.find_suburb(-37.8100, 145.0000) == 'Abbotsford'
+  assert index.find_suburb(-37.8300, 145.0900) == 'Box Hill'
+  assert index.find_suburb(-38.1700, 144.3400) == 'Geelong'
+
+  # Nothing's found too far from any suburb, or outside the grid altogether.
+  assert index.find_suburb(-38.0000, 144.7000) is None
+  assert index.find_suburb(-33.8688, 151.2093) is None
+
+def test_GeoIndex_find_suburb_matches_searching_every_suburb():
+  index = geo_index.GeoIndex(geo_index.build_index(SUBURBS, max_distance=2000))
+
+  def nearest(latitude, longitude):
+    distances = [
+      (geo_index.get_distance(latitude, longitude, suburb_latitude, suburb_longitude), name)
+      for name, suburb_latitude, suburb_longitude in SUBURBS
+    ]
+    distance, name = min(distances)
+    return name if distance < 2000 else None
+
+  # Across a grid of points covering the suburbs and more, the index finds the same suburb.
+  for row in range(-5, 75):
+    for column in range(-5, 85):
+      latitude, longitude = -38.2 + row * 0.006, 144.3 + column * 0.01
+      assert index.find_suburb(latitude, longitude) == nearest(latitude, longitude)
+
+def test_GeoIndex_open(tmp_path):
+  filename = str(tmp_path / 'suburbs.idx')
+  with open(filename, 'wb') as file:
+    file.write(geo_index.build_index(SUBURBS))
+
+  # The index is memory-mapped from the file.
+  assert geo_index.GeoIndex.open(filename).find_suburb(-37.8230, 144.9980) == 'Richmond'
+
+  # And files that aren't an index are rejected.
+  with open(filename, 'wb') as file:
+    file.write(b'Not an index' * 10)
+  with raises(ValueError):
+    geo_index.GeoIndex.open(filename)
+
+def test_find_suburb(tmp_path, monkeypatch):
+  filename = str(tmp_path / 'suburbs.idx')
+  with open(filename, 'wb') as file:
+    file.write(geo_index.build_index(SUBURBS))
+
+  # The index is opened the first time it's needed, and kept.
+  monkeypatch.setattr(geo_index, 'GEO_INDEX_PATH', filename)
+  monkeypatch.setattr(geo_index, '_index', None)
+  assert geo_index.find_suburb(-37.8230, 144.9980) == 'Richmond'
+  assert geo_index.get_index() is geo_index.get_index()
+
+  # Without an index, nothing's found.
+  monkeypatch.setattr(geo_index, 'GEO_INDEX_PATH', str(tmp_path / 'missing.idx'))
+  monkeypatch.setattr(geo_index, '_index', None)
+  assert geo_index.find_suburb(-37.8230, 144.9980) is None
+  assert geo_index._index is False
+
+def test_bundled_suburbs():
+  csv = path.join(path.dirname(path.abspath(__file__)), 'suburbs.csv')
+  index = geo_index.GeoIndex(geo_index.build_index(geo_index.read_suburbs(csv)))
+
+  assert index.find_suburb(-37.8183, 144.9671) == 'Melbourne' # Flinders Street Station.
+  assert index.find_suburb(-37.8251, 144.9984) == 'Richmond'
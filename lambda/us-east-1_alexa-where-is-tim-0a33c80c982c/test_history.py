@@ -0,0 +1,137 @@
+from datetime import date
+
+import history
+import functions
+
+from stand_ins import FakeDynamoDB, generate_commute_items, make_event_item
+
+# Monday 14 January 2019, midnight in Melbourne.
+FIRST_DAY = 1547384400
+
+def _make_tables(days=60, partitions=(None,)):
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('events')
+  dynamodb.create_simple_table('history', hash_key='event_partition', range_key='month')
+  for seed, partition in enumerate(partitions):
+    dynamodb.put_items('events', generate_commute_items(days, FIRST_DAY, partition, seed=seed))
+  return dynamodb
+
+def _summarise(days, seed=0):
+  items = generate_commute_items(days, FIRST_DAY, seed=seed)
+  location_events = [functions.LocationEvent(item) for item in items]
+  return history.summarise_commutes(
+    [event for event in location_events if functions.is_event_accurate_enough(event)]
+  )
+
+def test_summarise_commutes():
+  summaries = _summarise(7)
+
+  # There's a commute on each weekday, leaving work between 5 and 6pm.
+  assert [summary.date for summary in summaries] == \
+    [date(2019, 1, day) for day in (14, 15, 16, 17, 18)]
+  for summary in summaries:
+    assert 17 * 3600 <= summary.departed_at <= 18 * 3600
+    assert 3000 < summary.duration < 12000
+    assert summary.times_from_home == {'public_transport': 3750, 'driving': 2000}
+
+def test_summarise_commutes_without_leaving_work():
+  events = [
+    functions.LocationEvent(make_event_item(minutes, FIRST_DAY + minutes * 60,
+      distance_from_home=distance, distance_from_work=30000 - distance))
+    for minutes, distance in ((0, 5000), (10, 2000), (20, 0))
+  ]
+
+  # A trip home that didn't start from work isn't a commute.
+  assert history.summarise_commutes(events) == []
+
+def test_pack_commutes():
+  summaries = [
+    history.DaySummary(date(2019, 1, 14), 61200, 65000, {'public_transport': 3750}),
+    history.DaySummary(date(2019, 1, 15), 62000, 66000, {'driving': 2000}),
+  ]
+
+  # Each commute takes 4 bytes for each of its day, departure, arrival, and modes of transport.
+  modes, data = history.pack_commutes(summaries)
+  assert modes == ['driving', 'public_transport']
+  assert len(data) == 2 * 5 * 4
+
+  # Modes a commute didn't have a routing estimate for are left out again when unpacked.
+  assert history.unpack_commutes(2019, 1, modes, data) == summaries
+
+  # As is everything, through a history table item.
+  item = history.to_history_item('tim', '2019-01', summaries)
+  assert history.from_history_item(item) == summaries
+
+def test_merge_commutes():
+  stored = [
+    history.DaySummary(date(2019, 1, 14), 61200, 65000),
+    history.DaySummary(date(2019, 1, 15), 62000, 66000),
+  ]
+  fresh = [
+    history.DaySummary(date(2019, 1, 15), 62000, 67000),
+    history.DaySummary(date(2019, 1, 16), 63000, 66000),
+  ]
+
+  # Days with fresh commutes replace those stored, and stored days without any are kept.
+  assert history.merge_commutes(stored, fresh) == [stored[0]] + fresh
+
+  # Except on the first day there are events for, which is kept as stored.
+  assert history.merge_commutes(stored, fresh, date(2019, 1, 15)) == stored + fresh[1:]
+
+def test_compact_history():
+  dynamodb = _make_tables(partitions=('tim', 'sam'))
+
+  # A dry run counts months without writing them.
+  assert history.compact_history(dynamodb, 'events', 'history', 'events', dry_run=True) == 6
+  assert dynamodb.calls['PutItem'] == 0
+
+  # Each person gets an item for each of January, February and March.
+  assert history.compact_history(dynamodb, 'events', 'history', 'events') == 6
+  assert len(dynamodb.tables['history'].items) == 6
+
+  # Which read back as the same commutes as summarising the events directly, in one query.
+  assert history.read_history(dynamodb, 'history', 'tim', '2019-01', '2019-12') == _summarise(60)
+  assert history.read_history(dynamodb, 'history', 'sam', '2019-01', '2019-12') == \
+    _summarise(60, seed=1)
+  assert dynamodb.calls['Query'] == 2
+
+def test_compact_history_after_events_expire():
+  dynamodb = _make_tables()
+  history.compact_history(dynamodb, 'events', 'history', 'events')
+
+  # Events expire part way through February, and part way through a day.
+  expired_before = FIRST_DAY + 24 * 86400 + 12 * 3600
+  dynamodb.create_simple_table('events')
+  dynamodb.put_items('events', [
+    item for item in generate_commute_items(60, FIRST_DAY)
+    if functions.LocationEvent(item).timestamp >= expired_before
+  ])
+
+  # Compacting again keeps the commutes from the expired events, so there's nothing to write.
+  assert history.compact_history(dynamodb, 'events', 'history', 'events') == 0
+  assert dynamodb.calls['PutItem'] == 3
+  assert history.read_history(dynamodb, 'history', 'events', '2019-01', '2019-12') == _summarise(60)
+
+  # And commutes since are added to the months already there.
+  dynamodb.put_items('events', [
+    item for item in generate_commute_items(70, FIRST_DAY)
+    if functions.LocationEvent(item).timestamp >= FIRST_DAY + 60 * 86400
+  ])
+  assert history.compact_history(dynamodb, 'events', 'history', 'events') == 1
+  assert history.read_history(dynamodb, 'history', 'events', '2019-01', '2019-12') == _summarise(70)
+
+def test_compact_history_default_partition():
+  dynamodb = _make_tables(days=7)
+  history.compact_history(dynamodb, 'events', 'history', 'events')
+
+  # Events without an event_partition are filed under the default.
+  assert len(history.read_history(dynamodb, 'history', 'events', '2019-01', '2019-01')) == 5
+
+def test_read_history_between_months():
+  dynamodb = _make_tables()
+  history.compact_history(dynamodb, 'events', 'history', 'events')
+
+  # Only the months asked for are read.
+  summaries = history.read_history(dynamodb, 'history', 'events', '2019-02', '2019-02')
+  assert summaries and all(summary.date.month == 2 for summary in summaries)
+  assert dynamodb.items_read['Query'] == 1
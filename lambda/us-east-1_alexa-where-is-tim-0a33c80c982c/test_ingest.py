@@ -0,0 +1,140 @@
+import json
+
+from time import time
+from os import environ
+
+environ['VALID_EVENT_MAX_AGE_IN_SECONDS'] = '86400'
+environ['VALID_EVENT_MAX_ACCURACY_IN_METRES'] = '65'
+
+import events
+import ingest
+
+from stand_ins import FakeDynamoDB, make_event_item
+
+def _stream_record(item, event_name='INSERT'):
+  record = {'eventSource': 'aws:dynamodb', 'eventName': event_name, 'dynamodb': {}}
+  if item is not None: record['dynamodb']['NewImage'] = item
+  return record
+
+def _sns_record(message):
+  return {'EventSource': 'aws:sns', 'Sns': {'Message': json.dumps(message)}}
+
+def _prepare(monkeypatch):
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('current', hash_key=events.EVENT_PARTITION_ATTRIBUTE)
+  monkeypatch.setattr(ingest, '_dynamodb', dynamodb)
+  monkeypatch.setattr(ingest, 'DYNAMODB_CURRENT_TABLE', 'current')
+  return dynamodb
+
+def test_get_event_items():
+  item = make_event_item('a', 1545980317)
+  records = {'Records': [
+    _stream_record(item),
+    _stream_record(None, 'REMOVE'),
+    _sns_record({'eventId': 'b', 'event_accuracy_m': '10', 'distance_from_home': 1500}),
+    {'eventSource': 'aws:sqs'},
+  ]}
+
+  # Stream images are used as they are, deletions and unknown sources are skipped, and SNS
+  # messages are converted into items.
+  assert list(ingest.get_event_items(records)) == [item, {
+    'eventId': {'S': 'b'}, 'event_accuracy_m': {'S': '10'}, 'distance_from_home': {'N': '1500'}
+  }]
+
+def test_to_item():
+
+  # Plain JSON values are converted to their DynamoDB types.
+  assert ingest.to_item({'a': 'text', 'b': 1.5, 'c': True, 'd': None, 'e': [1], 'f': {'g': 2}}) == {
+    'a': {'S': 'text'}, 'b': {'N': '1.5'}, 'c': {'BOOL': True}, 'd': {'NULL': True},
+    'e': {'L': [{'N': '1'}]}, 'f': {'M': {'g': {'N': '2'}}},
+  }
+
+  # Values that are already typed are kept as they are.
+  assert ingest.to_item({'a': {'N': '5'}}) == {'a': {'N': '5'}}
+
+def test_get_newest_valid_item():
+  now = time()
+  newest = make_event_item('newest', now - 60)
+  items = [
+    make_event_item('older', now - 120),
+    newest,
+    make_event_item('inaccurate', now, accuracy=1500),
+    {'eventId': {'S': 'broken'}},
+  ]
+
+  assert ingest.get_newest_valid_item(items) is newest
+  assert ingest.get_newest_valid_item([make_event_item('old', now - 90000)]) is None
+
+def test_lambda_handler(monkeypatch):
+  dynamodb = _prepare(monkeypatch)
+  now = time()
+
+  # The newest valid event in a batch becomes the current event.
+  result = ingest.lambda_handler({'Records': [
+    _stream_record(make_event_item('a', now - 120)),
+    _stream_record(make_event_item('b', now - 60)),
+  ]}, None)
+  assert result == {'received': 2, 'updated': True}
+  assert events.get_current_event(dynamodb, 'current', 'events').event_id == 'b'
+
+  # An event that arrives out of order doesn't replace a newer one.
+  out_of_order = make_event_item('c', now - 90)
+  result = ingest.lambda_handler({'Records': [_stream_record(out_of_order)]}, None)
+  assert result == {'received': 1, 'updated': False}
+  assert events.get_current_event(dynamodb, 'current', 'events').event_id == 'b'
+
+  # Invalid events aren't written at all.
+  inaccurate = make_event_item('d', now, accuracy=1500)
+  result = ingest.lambda_handler({'Records': [_stream_record(inaccurate)]}, None)
+  assert result == {'received': 1, 'updated': False}
+  assert dynamodb.calls['PutItem'] == 2
+
+  # Events from SNS work too.
+  message = {key: list(value.values())[0] for key, value in make_event_item('e', now).items()}
+  result = ingest.lambda_handler({'Records': [_sns_record(message)]}, None)
+  assert result == {'received': 1, 'updated': True}
+  assert events.get_current_event(dynamodb, 'current', 'events').event_id == 'e'
+
+def test_lambda_handler_for_each_person(monkeypatch):
+  dynamodb = _prepare(monkeypatch)
+  now = time()
+  tims = make_event_item('tim', now - 60)
+  tims.update(events.get_index_attributes(tims, 'tim'))
+  sams = make_event_item('sam', now - 120)
+  sams.update(events.get_index_attributes(sams, 'sam'))
+
+  # Each person's newest event is kept current in their own partition.
+  result = ingest.lambda_handler({'Records': [_stream_record(tims), _stream_record(sams)]}, None)
+  assert result == {'received': 2, 'updated': True}
+  assert events.get_current_event(dynamodb, 'current', 'tim').event_id == 'tim'
+  assert events.get_current_event(dynamodb, 'current', 'sam').event_id == 'sam'
+  assert events.get_current_event(dynamodb, 'current', 'events') is None
+
+def test_lambda_handler_estimates_time_from_home(monkeypatch):
+  dynamodb = _prepare(monkeypatch)
+  now = time()
+
+  def commute_event(minutes_ago, distance_from_home, distance_from_work=None):
+    return make_event_item(
+      'at-' + str(minutes_ago), now - minutes_ago * 60, distance_from_home=distance_from_home,
+      distance_from_work=30000 - distance_from_home if distance_from_work is None else \
+        distance_from_work,
+      time_from_home=distance_from_home // 10
+    )
+
+  # Leaving work, there's nothing to go on but the routing estimate.
+  ingest.lambda_handler({'Records': [_stream_record(commute_event(20, 30000, 0))]}, None)
+  current = events.get_current_event(dynamodb, 'current', 'events')
+  assert current.get_time_from_home('estimated') == current.time_from_home
+
+  # The trip is followed on from the state kept on the current event, across batches.
+  for minutes_ago, distance_from_home in ((10, 25000), (6, 23000), (2, 21000)):
+    ingest.lambda_handler({'Records': [
+      _stream_record(commute_event(minutes_ago, distance_from_home))
+    ]}, None)
+
+  # 9km in 18 minutes leaves 42 minutes to go, blended (at half weight, with just three legs so far)
+  # with the routing estimate of 35 minutes.
+  current = events.get_current_event(dynamodb, 'current', 'events')
+  assert current.event_id == 'at-2'
+  assert current.get_time_from_home('estimated') == int((35 * 60 + 42 * 60 * 0.5) / 1.5)
@@ -1,19 +1,443 @@
 
+import os
+import sys
+import json
+import logging
+import subprocess
+
+from time import time, sleep, monotonic
+from datetime import datetime
 from pytest import mark
 
+import cache
+import events
+import people
+import speech
+import functions
+import dynamodb_client
 import lambda_function
 
-@mark.skip(reason="TODO: Need to write")
+from stand_ins import FakeClock, FakeDynamoDB, make_event_item
+
+def _make_dynamodb(with_index=True, partitions=('events',), index_attributes=True):
+  now = time()
+  dynamodb = FakeDynamoDB()
+  dynamodb.create_simple_table('events')
+
+  if with_index:
+    dynamodb.add_index(
+      'events', 'newest', events.EVENT_PARTITION_ATTRIBUTE, events.EVENT_TIMESTAMP_ATTRIBUTE
+    )
+
+  for partition in partitions:
+    prefix = '' if partition == 'events' else partition + '-'
+    for event_id, age in (('older', 600), ('newer', 300)):
+      event = make_event_item(prefix + event_id, now - age)
+      if index_attributes:
+        event.update(events.get_index_attributes(event, partition))
+      dynamodb.put_items('events', [event])
+
+  return dynamodb
+
+def _make_registry():
+  return people.load_registry(json.dumps({
+    'tim': {'name': 'Tim', 'users': ['tims-household']},
+    'sam': {
+      'name': 'Sam', 'aliases': ['Sammy'], 'pronoun': 'she/her', 'timezone': 'Australia/Perth',
+      'metro_trains_line_id': 86, 'users': ['sams-household'],
+    },
+  }), 'events')
+
+def test_import_is_lazy():
+  """Heavy modules shouldn't be imported until they're needed, to keep cold starts fast."""
+
+  loaded_modules = subprocess.check_output(
+    [sys.executable, '-c', 'import sys, lambda_function; print(" ".join(sys.modules))'],
+    cwd=os.path.dirname(os.path.abspath(lambda_function.__file__)),
+    env=dict(os.environ, LOGGING_LEVEL='INFO'),
+  ).decode('utf-8').split()
+
+  for module in ['boto3', 'botocore', 'requests', 'pytz', 'numpy', 'metro_trains']:
+    assert module not in loaded_modules
+
+def test_get_dynamodb(monkeypatch):
+  monkeypatch.setattr(lambda_function, '_dynamodb', None)
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+
+  # The client is created on first use, and reused after that.
+  assert lambda_function.get_dynamodb() is lambda_function.get_dynamodb()
+
 def test_maybe_get_invalid_date_response():
-  pass
+  from datetime import datetime
 
-@mark.skip(reason="TODO: Need to write")
-def test_get_newest_valid_event():
-  pass
+  # Saturday, and the morning and early afternoon of a Monday.
+  assert "not at work today" in lambda_function.maybe_get_invalid_date_response(
+    datetime(2019, 1, 12, 17))
+  assert "too early" in lambda_function.maybe_get_invalid_date_response(datetime(2019, 1, 14, 9))
+  assert "bit too early" in lambda_function.maybe_get_invalid_date_response(
+    datetime(2019, 1, 14, 15))
 
-@mark.skip(reason="TODO: Need to write")
-def test_get_speech_text_response():
-  pass
+  # Monday evening.
+  assert lambda_function.maybe_get_invalid_date_response(datetime(2019, 1, 14, 17)) is False
+
+def test_get_newest_valid_event(monkeypatch):
+  clock = FakeClock()
+  dynamodb = _make_dynamodb()
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'event_cache', cache.TimedCache('Event', 30, 300, clock))
+  testable = lambda_function.get_newest_valid_event
+
+  # Reads from DynamoDB on a miss.
+  assert testable().event_id == 'newer'
+  assert dynamodb.calls['Query'] == 1
+
+  # Serves from the cache within the TTL.
+  clock.now += 30
+  assert testable().event_id == 'newer'
+  assert dynamodb.calls['Query'] == 1
+
+  # Refreshes with a query for newer events only, once stale.
+  clock.now += 1
+  newest = make_event_item('newest', time() - 60)
+  newest.update(events.get_index_attributes(newest, 'events'))
+  dynamodb.put_items('events', [newest])
+  assert testable().event_id == 'newest'
+  assert dynamodb.calls['Query'] == 2 and dynamodb.items_read['Query'] == 3
+
+  # Keeps the cached event if nothing newer is found.
+  clock.now += 31
+  assert testable().event_id == 'newest'
+  assert lambda_function.event_cache.refreshes == 1
+
+  # Reads everything again once beyond the max staleness.
+  clock.now += 301
+  assert testable().event_id == 'newest'
+  assert lambda_function.event_cache.evictions == 1
+
+def test_get_newest_valid_event_coalesced(monkeypatch):
+  from concurrent.futures import ThreadPoolExecutor
+
+  dynamodb = _make_dynamodb()
+  dynamodb.latency = 0.05
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'event_cache',
+    cache.TimedCache('Event', 30, 300, FakeClock()))
+
+  # A burst of requests that all miss the cache only read from DynamoDB once.
+  with ThreadPoolExecutor(max_workers=4) as pool:
+    results = list(pool.map(lambda _: lambda_function.get_newest_valid_event(), range(4)))
+
+  assert [event.event_id for event in results] == ['newer'] * 4
+  assert dynamodb.calls['Query'] == 1
+
+def test_get_newest_valid_event_unindexed(monkeypatch):
+  clock = FakeClock()
+  dynamodb = _make_dynamodb(index_attributes=False)
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'event_cache', cache.TimedCache('Event', 30, 300, clock))
+  monkeypatch.setattr(lambda_function, 'unindexed_partitions', set())
+  testable = lambda_function.get_newest_valid_event
+
+  # Events written without the index attributes aren't in the index, so the table is scanned.
+  assert testable().event_id == 'newer'
+  assert dynamodb.calls['Query'] == 1 and dynamodb.calls['Scan'] == 1
+
+  # And it's scanned again once stale, rather than only querying the index for newer events.
+  clock.now += 31
+  dynamodb.put_items('events', [make_event_item('newest', time() - 60)])
+  assert testable().event_id == 'newest'
+  assert dynamodb.calls['Query'] == 2 and dynamodb.calls['Scan'] == 2
+
+  # Until the index has events again.
+  clock.now += 31
+  indexed = make_event_item('indexed', time() - 30)
+  indexed.update(events.get_index_attributes(indexed, 'events'))
+  dynamodb.put_items('events', [indexed])
+  assert testable().event_id == 'indexed'
+  assert dynamodb.calls['Scan'] == 2
+  assert lambda_function.unindexed_partitions == set()
+
+def test_get_newest_valid_event_unavailable(monkeypatch):
+  clock = FakeClock()
+  dynamodb = _make_dynamodb()
+  breaker = dynamodb_client.CircuitBreaker('DynamoDB', threshold=2, reset_timeout=30, clock=clock)
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb_client.Client(dynamodb, breaker))
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'event_cache', cache.TimedCache('Event', 30, 300, clock))
+  now = datetime.now()
+
+  # While DynamoDB is throttling, the skill isn't sure where they are - without falling back to a
+  # scan, which would only add to the load.
+  dynamodb.throttle(2)
+  text = lambda_function.get_location_speech_text_response(now)
+  assert text == speech.render(lambda_function.speech_templates, 'no_event')
+  assert dynamodb.calls == {'Query': 1}
+
+  # Once the breaker is open, it says so without waiting on DynamoDB at all.
+  lambda_function.get_location_speech_text_response(now)
+  lambda_function.get_location_speech_text_response(now)
+  assert dynamodb.calls == {'Query': 2} and breaker.rejections == 1
+
+  # After it closes again, a stale cached event is still used if DynamoDB becomes unavailable.
+  clock.now += 30
+  assert lambda_function.get_newest_valid_event().event_id == 'newer'
+  clock.now += 31
+  dynamodb.throttle()
+  assert lambda_function.get_newest_valid_event().event_id == 'newer'
+  assert dynamodb.throttled == 3
+
+def test_read_newest_valid_event(monkeypatch):
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+
+  # Scans when no index is configured.
+  dynamodb = _make_dynamodb()
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', None)
+  assert lambda_function.read_newest_valid_event().event_id == 'newer'
+  assert dynamodb.calls['Scan'] == 1 and dynamodb.calls['Query'] == 0
+
+  # Queries the index when one is configured.
+  dynamodb = _make_dynamodb()
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  assert lambda_function.read_newest_valid_event().event_id == 'newer'
+  assert dynamodb.calls['Scan'] == 0 and dynamodb.calls['Query'] == 1
+
+  # Falls back to a scan when the index can't be queried.
+  dynamodb = _make_dynamodb(with_index=False)
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  assert lambda_function.read_newest_valid_event().event_id == 'newer'
+  assert dynamodb.calls['Scan'] == 1
+
+def test_get_newest_valid_event_for_each_person(monkeypatch):
+  dynamodb = _make_dynamodb(partitions=('tim', 'sam'))
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'event_cache',
+    cache.TimedCache('Event', 30, 300, FakeClock(), max_entries=1))
+  testable = lambda_function.get_newest_valid_event
+
+  # Each person's newest event is queried from their own partition - reading only their own events
+  # - and cached separately.
+  assert testable('tim').event_id == 'tim-newer'
+  assert testable('tim').event_id == 'tim-newer'
+  assert testable('sam').event_id == 'sam-newer'
+  assert dynamodb.calls['Query'] == 2 and dynamodb.items_read['Query'] == 4
+
+  # The least recently asked about person is evicted once the cache is full.
+  assert list(lambda_function.event_cache.entries) == ['sam']
+  assert testable('tim').event_id == 'tim-newer'
+  assert dynamodb.calls['Query'] == 3
+
+def test_read_newest_valid_event_for_each_person(monkeypatch):
+  dynamodb = _make_dynamodb(with_index=False, partitions=('tim', 'sam'))
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', None)
+  monkeypatch.setattr(lambda_function, 'people_registry', _make_registry())
+
+  # Scans of a table shared between people only find the person's own events.
+  assert lambda_function.read_newest_valid_event('tim').event_id == 'tim-newer'
+  assert lambda_function.read_newest_valid_event('sam').event_id == 'sam-newer'
+
+def test_read_newest_valid_event_from_current_table(monkeypatch):
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_CURRENT_TABLE', 'current')
+
+  dynamodb = _make_dynamodb()
+  dynamodb.create_simple_table('current', hash_key=events.EVENT_PARTITION_ATTRIBUTE)
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+
+  # Falls back to selecting the event when there's no current event yet.
+  assert lambda_function.read_newest_valid_event().event_id == 'newer'
+  assert dynamodb.calls['GetItem'] == 1 and dynamodb.calls['Query'] == 1
+
+  # Reads just the current event, once there is one.
+  events.put_current_event(dynamodb, 'current', 'events', make_event_item('current', time() - 60))
+  assert lambda_function.read_newest_valid_event().event_id == 'current'
+  assert dynamodb.calls['GetItem'] == 2 and dynamodb.calls['Query'] == 1
+
+  # Falls back again if the current event has gone stale.
+  stale = make_event_item('stale', time() - 90000)
+  stale.update(events.get_index_attributes(stale, 'events'))
+  dynamodb.put_items('current', [stale])
+  assert lambda_function.read_newest_valid_event().event_id == 'newer'
+  assert dynamodb.calls['GetItem'] == 3 and dynamodb.calls['Query'] == 2
+
+  # And if the current events table can't be read.
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_CURRENT_TABLE', 'missing')
+  assert lambda_function.read_newest_valid_event().event_id == 'newer'
+
+def _prepare_speech(monkeypatch, event, line_data=None, fetch_latency=0):
+  """Stubs out everything get_speech_text_response() depends on, to return the given values."""
+
+  def fake_get_metro_trains_line_data(line_id):
+    sleep(fetch_latency)
+    return line_data
+
+  monkeypatch.setattr(lambda_function, 'TIMEZONE', 'Australia/Melbourne')
+  monkeypatch.setattr(lambda_function, 'METRO_TRAINS_LINE_ID', 86 if line_data else 0)
+  monkeypatch.setattr(lambda_function, 'maybe_get_invalid_date_response',
+    lambda now, templates=None: False)
+  monkeypatch.setattr(lambda_function, 'get_newest_valid_event',
+    lambda partition=None: event and functions.LocationEvent(event))
+  monkeypatch.setattr(functions, 'get_metro_trains_line_data', fake_get_metro_trains_line_data)
+
+def test_get_speech_text_response(monkeypatch):
+  on_the_way = make_event_item(1, time(), distance_from_home=20000, distance_from_work=10000)
+  at_home = make_event_item(1, time(), distance_from_home=10, distance_from_work=30000)
+  suspended = {'name': 'Craigieburn', 'status': 'suspended'}
+
+  # Adds the train line status when it's relevant.
+  _prepare_speech(monkeypatch, on_the_way, suspended)
+  assert 'Craigieburn line is suspended' in lambda_function.get_speech_text_response()
+
+  # Leaves it out if no line is set.
+  _prepare_speech(monkeypatch, on_the_way)
+  assert 'Craigieburn' not in lambda_function.get_speech_text_response()
+
+  # Doesn't wait for the train line status when it isn't needed.
+  _prepare_speech(monkeypatch, at_home, suspended, fetch_latency=0.5)
+  started_at = monotonic()
+  assert 'home' in lambda_function.get_speech_text_response()
+  assert monotonic() - started_at < 0.25
+
+  # Nor when someone's close enough to home to be past the trains.
+  any_minute = make_event_item(1, time(), distance_from_home=400, distance_from_work=29600,
+    time_from_home=60)
+  _prepare_speech(monkeypatch, any_minute, suspended, fetch_latency=0.5)
+  started_at = monotonic()
+  assert 'any minute' in lambda_function.get_speech_text_response()
+  assert monotonic() - started_at < 0.25
+
+  # Says sorry if there's no valid event.
+  _prepare_speech(monkeypatch, None, suspended)
+  assert "not sure where" in lambda_function.get_speech_text_response()
+
+def test_get_speech_text_response_for_a_person(monkeypatch):
+  on_the_way = make_event_item(1, time(), distance_from_home=20000, distance_from_work=10000)
+  suspended = {'name': 'Craigieburn', 'status': 'suspended'}
+  registry = _make_registry()
+  _prepare_speech(monkeypatch, on_the_way, suspended)
+
+  partitions = []
+  def fake_get_newest_valid_event(partition=None):
+    partitions.append(partition)
+    return functions.LocationEvent(on_the_way)
+
+  monkeypatch.setattr(lambda_function, 'get_newest_valid_event', fake_get_newest_valid_event)
+  monkeypatch.setattr(lambda_function, 'METRO_TRAINS_LINE_ID', 0)
+
+  # The person's own event, pronouns and train line are used.
+  text = lambda_function.get_speech_text_response(registry.get('sam'))
+  assert partitions == ['sam']
+  assert 'she could be a lot later' in text and 'Craigieburn' in text
+
+  # Anything a person doesn't have set falls back to the skill's own configuration.
+  text = lambda_function.get_speech_text_response(registry.get('tim'))
+  assert partitions == ['sam', 'tim']
+  assert 'Craigieburn' not in text
+
+def test_get_location_speech_text_response_with_estimate(monkeypatch):
+  from datetime import datetime, timezone, timedelta
+  now = datetime(2019, 1, 14, 17, 30, tzinfo=timezone(timedelta(hours=11)))
+
+  # The estimate ingest.py adds is used over the routing time.
+  almost_home = make_event_item(1, now.timestamp() - 120, distance_from_home=1500,
+    distance_from_work=28500, time_from_home=600)
+  almost_home['time_from_home_estimated'] = {'N': '1200'}
+  _prepare_speech(monkeypatch, almost_home)
+  assert '20 minutes' in lambda_function.get_location_speech_text_response(now)
+
+  # The arrival time is from when the event was, not when it's asked about.
+  on_the_way = make_event_item(1, now.timestamp() - 600, distance_from_home=20000,
+    distance_from_work=10000, time_from_home=3000)
+  _prepare_speech(monkeypatch, on_the_way)
+  monkeypatch.setattr(speech.random, 'choice', lambda choices: choices[-1])
+  assert 'home at about 6:10 pm' in lambda_function.get_location_speech_text_response(now)
+
+def test_get_speech_text_response_train_adjusted_time(monkeypatch):
+  on_the_way = make_event_item(1, time(), distance_from_home=20000, distance_from_work=10000,
+    time_from_home=3000)
+  _prepare_speech(monkeypatch, on_the_way, {'name': 'Craigieburn', 'status': 'suspended'})
+  monkeypatch.setattr(speech.random, 'choice', lambda choices: choices[0])
+
+  # A suspended line adds half an hour onto the public transport time.
+  text = lambda_function.get_speech_text_response()
+  assert 'in around 1 hour and 20 minutes' in text and 'Craigieburn line is suspended' in text
+
+def test_get_speech_text_response_train_line_budget(monkeypatch):
+  on_the_way = make_event_item(1, time(), distance_from_home=20000, distance_from_work=10000)
+  suspended = {'name': 'Craigieburn', 'status': 'suspended'}
+
+  # Drops the train line status if it's too slow to arrive.
+  _prepare_speech(monkeypatch, on_the_way, suspended, fetch_latency=0.5)
+  monkeypatch.setattr(lambda_function, 'METRO_TRAINS_BUDGET_IN_SECONDS', 0.05)
+  started_at = monotonic()
+  assert 'Craigieburn' not in lambda_function.get_speech_text_response()
+  assert monotonic() - started_at < 0.25
+
+  # Drops it if fetching fails.
+  def failing_fetch(line_id):
+    raise ValueError('The Metro Trains line ID 86 could not be found.')
+
+  monkeypatch.setattr(functions, 'get_metro_trains_line_data', failing_fetch)
+  assert 'Craigieburn' not in lambda_function.get_speech_text_response()
+
+def test_keep_warm(monkeypatch):
+  from datetime import datetime, timezone
+
+  clock = FakeClock()
+  dynamodb = _make_dynamodb(partitions=('tim', 'sam'))
+  monkeypatch.setattr(lambda_function, '_dynamodb', dynamodb)
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_TABLE', 'events')
+  monkeypatch.setattr(lambda_function, 'DYNAMODB_INDEX', 'newest')
+  monkeypatch.setattr(lambda_function, 'TIMEZONE', 'Australia/Melbourne')
+  monkeypatch.setattr(lambda_function, 'METRO_TRAINS_LINE_ID', 82)
+  monkeypatch.setattr(lambda_function, 'people_registry', _make_registry())
+  monkeypatch.setattr(lambda_function, 'event_cache', cache.TimedCache('Event', 30, 300, clock))
+
+  line_ids = []
+  monkeypatch.setattr(functions, 'get_metro_trains_line_data', line_ids.append)
+
+  # At 5:30pm on a Monday in Melbourne, Tim's event and train line are refreshed - but it's only
+  # 2:30pm for Sam in Perth.
+  monday_evening = datetime(2019, 1, 14, 6, 30, tzinfo=timezone.utc)
+  assert lambda_function.keep_warm(monday_evening) == {'refreshed': ['tim']}
+  assert list(lambda_function.event_cache.entries) == ['tim'] and line_ids == [82]
+  assert lambda_function.get_newest_valid_event('tim').event_id == 'tim-newer'
+  assert dynamodb.calls['Query'] == 1
+
+  # Later pings refresh it again even while it's fresh, with a query for anything newer.
+  clock.now += 20
+  lambda_function.keep_warm(monday_evening)
+  assert lambda_function.event_cache.refreshes == 1 and dynamodb.calls['Query'] == 2
+
+  # Nothing is refreshed outside the evening, or on weekends.
+  for moment in (datetime(2019, 1, 14, 1, tzinfo=timezone.utc),
+    datetime(2019, 1, 12, 6, 30, tzinfo=timezone.utc)):
+    assert lambda_function.keep_warm(moment) == {'refreshed': []}
+  assert dynamodb.calls['Query'] == 2
+
+def test_lambda_handler_keep_warm(monkeypatch):
+  monkeypatch.setattr(lambda_function, 'keep_warm', lambda: {'refreshed': []})
+  scheduled_event = {'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}}
+
+  # Scheduled pings are answered before they reach the skill.
+  assert lambda_function.is_keep_warm_event(scheduled_event)
+  assert lambda_function.lambda_handler(scheduled_event, None) == {'refreshed': []}
+
+  # Anything else is for the skill.
+  assert not lambda_function.is_keep_warm_event({'request': {'type': 'LaunchRequest'}})
 
 @mark.skip(reason="TODO: Need to write")
 def test_GetLocationHandler_can_handle():
@@ -47,10 +471,129 @@ def test_CatchAllExceptionHandler_can_handle():
 def test_CatchAllExceptionHandler_handle():
   pass
 
-@mark.skip(reason="TODO: Need to write")
-def test_RequestLogger_process():
-  pass
+def _make_handler_input(person=None, user_id='amzn1.ask.account.test'):
+  from ask_sdk_model import RequestEnvelope, IntentRequest, Intent, Slot, Context, User
+  from ask_sdk_model.interfaces.system import SystemState
+  from ask_sdk_core.handler_input import HandlerInput
+  from ask_sdk_core.attributes_manager import AttributesManager
 
-@mark.skip(reason="TODO: Need to write")
-def test_ResponseLogger_process():
-  pass
+  slots = {'person': Slot(name='person', value=person)}
+  request_envelope = RequestEnvelope(
+    request=IntentRequest(
+      request_id='amzn1.echo-api.request.test', locale='en-AU',
+      intent=Intent(name='GetLocation', slots=slots)
+    ),
+    context=Context(system=SystemState(user=User(user_id=user_id))),
+  )
+  return HandlerInput(request_envelope, AttributesManager(request_envelope))
+
+def test_get_person(monkeypatch):
+  monkeypatch.setattr(lambda_function, 'people_registry', _make_registry())
+  testable = lambda_function.get_person
+
+  # Whoever in the asking household is asked about by name - or by an alias - or else the person in
+  # the household.
+  assert testable(_make_handler_input('Sammy', 'sams-household')).key == 'sam'
+  assert testable(_make_handler_input(None, 'sams-household')).key == 'sam'
+  assert testable(_make_handler_input(None, 'tims-household')).key == 'tim'
+
+  # Nobody from another household, and nobody for users who aren't in one.
+  assert testable(_make_handler_input('Sam', 'tims-household')) is None
+  assert testable(_make_handler_input(None, 'someone-else')) is None
+
+  # Nobody, if the name isn't known.
+  assert testable(_make_handler_input('Alex', 'tims-household')) is None
+
+  # Without PEOPLE, the one person is found whatever name they're asked about by.
+  monkeypatch.setattr(lambda_function, 'people_registry', people.load_registry(None, 'events'))
+  assert testable(_make_handler_input('Tim', 'someone-else')).key == 'events'
+
+def test_GetLocationHandler_handle_unknown_person(monkeypatch):
+  monkeypatch.setattr(lambda_function, 'people_registry', _make_registry())
+  handler = lambda_function.GetLocationHandler()
+  monkeypatch.setattr(lambda_function, 'get_speech_text_response',
+    lambda person: 'Location of ' + person.key)
+
+  response = handler.handle(_make_handler_input('Alex', 'tims-household'))
+  assert "I don't know who Alex is" in response.output_speech.ssml
+
+  # A household asking about someone in another household doesn't hear where they are.
+  response = handler.handle(_make_handler_input('Sam', 'tims-household'))
+  assert "I don't know who Sam is" in response.output_speech.ssml
+
+  # And neither does a user who isn't in any household.
+  response = handler.handle(_make_handler_input(None, 'someone-else'))
+  assert "I don't know who you'd like me to find" in response.output_speech.ssml
+  response = handler.handle(_make_handler_input(None, 'sams-household'))
+  assert 'Location of sam' in response.output_speech.ssml
+
+def test_RequestLogger_process(monkeypatch, caplog):
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 0)
+
+  # Nothing is encoded unless the log will be written.
+  def failing_encode(object):
+    raise AssertionError('The request should not have been encoded')
+
+  monkeypatch.setattr(functions, 'json_encode', failing_encode)
+  with caplog.at_level(logging.INFO, logger='lambda_function'):
+    lambda_function.RequestLogger().process(_make_handler_input())
+  assert caplog.records == []
+  monkeypatch.undo()
+
+  # At debug level, the request is logged.
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 0)
+  with caplog.at_level(logging.DEBUG, logger='lambda_function'):
+    lambda_function.RequestLogger().process(_make_handler_input())
+  assert 'Alexa Request: {' in caplog.text
+  assert '"intent":{"name":"GetLocation"' in caplog.text
+
+  # When sampled, the request is logged as JSON at info level.
+  caplog.clear()
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 1)
+  with caplog.at_level(logging.INFO, logger='lambda_function'):
+    lambda_function.RequestLogger().process(_make_handler_input())
+  logged = json.loads(caplog.records[0].getMessage())
+  assert logged['alexa_request']['request_id'] == 'amzn1.echo-api.request.test'
+
+def test_ResponseLogger_process(monkeypatch, caplog):
+  from ask_sdk_core.response_helper import ResponseFactory
+  response = ResponseFactory().speak('Tim is currently in Box Hill.').response
+
+  # Nothing is logged at info level when the request wasn't sampled.
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 0)
+  with caplog.at_level(logging.INFO, logger='lambda_function'):
+    lambda_function.ResponseLogger().process(_make_handler_input(), response)
+  assert caplog.records == []
+
+  # At debug level, the response is logged.
+  with caplog.at_level(logging.DEBUG, logger='lambda_function'):
+    lambda_function.ResponseLogger().process(_make_handler_input(), response)
+  assert 'Alexa Response: {' in caplog.text
+  assert 'Tim is currently in Box Hill.' in caplog.text
+
+  # The response is sampled along with its request, which it's logged with the ID of.
+  caplog.clear()
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 2)
+  handler_input = _make_handler_input()
+  handler_input.attributes_manager.request_attributes['log_sampled'] = True
+  with caplog.at_level(logging.INFO, logger='lambda_function'):
+    lambda_function.ResponseLogger().process(handler_input, response)
+  logged = json.loads(caplog.records[0].getMessage())
+  assert logged['alexa_request_id'] == 'amzn1.echo-api.request.test'
+  assert 'Box Hill' in logged['alexa_response']['output_speech']['ssml']
+
+def test_is_log_sampled(monkeypatch):
+
+  # Nothing is sampled by default.
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 0)
+  assert not any(lambda_function.is_log_sampled(_make_handler_input()) for _ in range(100))
+
+  # Roughly 1 in LOG_SAMPLE_RATE requests are sampled.
+  monkeypatch.setattr(lambda_function, 'LOG_SAMPLE_RATE', 4)
+  sampled = sum(lambda_function.is_log_sampled(_make_handler_input()) for _ in range(4000))
+  assert 800 < sampled < 1200
+
+  # The decision is only made once per request.
+  handler_input = _make_handler_input()
+  decisions = {lambda_function.is_log_sampled(handler_input) for _ in range(100)}
+  assert len(decisions) == 1
@@ -0,0 +1,138 @@
+import io
+import json
+import threading
+
+from pytest import fixture, raises
+
+import metrics
+
+@fixture
+def enabled(monkeypatch):
+  monkeypatch.setattr(metrics, 'ENABLED', True)
+  monkeypatch.setattr(metrics, 'METRICS_NAMESPACE', 'WhereIsTim')
+  monkeypatch.setattr(metrics, '_invocation', None)
+
+def _emit():
+  stream = io.StringIO()
+  metrics.emit(stream)
+  return stream.getvalue()
+
+def test_disabled(monkeypatch):
+  monkeypatch.setattr(metrics, 'ENABLED', False)
+
+  def function():
+    pass
+
+  # Functions and handlers are left as they are.
+  assert metrics.timed('Time')(function) is function
+  assert metrics.instrument_handler(function) is function
+
+  # Nothing is recorded or emitted.
+  metrics.start()
+  metrics.count('Count')
+  assert _emit() == ''
+
+def test_timed(enabled):
+
+  @metrics.timed('SampleTime')
+  def sample(value):
+    return value * 2
+
+  # Calls outside an invocation still work, but aren't recorded.
+  assert sample(2) == 4
+
+  # Times add up across calls in the same invocation.
+  metrics.start()
+  assert sample(3) == 6
+  sample(4)
+  value, unit = metrics._invocation.metrics['SampleTime']
+  assert unit == 'Milliseconds'
+  assert value > 0
+
+  # Times are recorded even if the function raises.
+  @metrics.timed('FailingTime')
+  def failing():
+    raise ValueError('Sample failure')
+
+  with raises(ValueError):
+    failing()
+  assert 'FailingTime' in metrics._invocation.metrics
+
+def test_timed_in_background_thread(enabled):
+
+  started = threading.Event()
+  finish = threading.Event()
+
+  @metrics.timed('BackgroundTime')
+  def background():
+    started.set()
+    finish.wait()
+
+  metrics.start()
+  first_invocation = metrics._invocation
+  thread = threading.Thread(target=background)
+  thread.start()
+  started.wait()
+
+  # A background call that finishes after its invocation is recorded against that invocation.
+  metrics.start()
+  finish.set()
+  thread.join()
+  assert 'BackgroundTime' in first_invocation.metrics
+  assert 'BackgroundTime' not in metrics._invocation.metrics
+
+def test_emit(enabled):
+  metrics.start()
+  metrics.set_property('RequestType', 'IntentRequest')
+  metrics.count('EventsRead', 10)
+  metrics.count('EventsRead', 5)
+  metrics.size('ResponseSize', 512)
+
+  output = _emit()
+
+  # Metrics are written as a single line of JSON.
+  assert output.count('\n') == 1
+  document = json.loads(output)
+
+  # The line is in CloudWatch Embedded Metric Format.
+  definition = document['_aws']['CloudWatchMetrics'][0]
+  assert definition['Namespace'] == 'WhereIsTim'
+  assert definition['Dimensions'] == [['RequestType']]
+  assert {'Name': 'EventsRead', 'Unit': 'Count'} in definition['Metrics']
+  assert {'Name': 'ResponseSize', 'Unit': 'Bytes'} in definition['Metrics']
+  assert isinstance(document['_aws']['Timestamp'], int)
+
+  # Values are totalled across the invocation.
+  assert document['RequestType'] == 'IntentRequest'
+  assert document['EventsRead'] == 15
+  assert document['ResponseSize'] == 512
+
+  # Nothing more is emitted until another invocation starts.
+  assert _emit() == ''
+
+def test_instrument_handler(enabled, capsys):
+
+  def handler(event, context):
+    metrics.count('EventsRead', 3)
+    return {'response': {}}
+
+  instrumented = metrics.instrument_handler(handler)
+  assert instrumented({'request': {'type': 'LaunchRequest', 'requestId': 'abc'}}, None) == \
+    {'response': {}}
+
+  # Each invocation emits one line, including the invocation time and payload sizes.
+  document = json.loads(capsys.readouterr().out)
+  assert document['RequestType'] == 'LaunchRequest'
+  assert document['RequestId'] == 'abc'
+  assert document['EventsRead'] == 3
+  assert document['InvocationTime'] >= 0
+  assert document['RequestSize'] > 0
+  assert document['ResponseSize'] == len('{"response": {}}')
+
+  # Metrics are still emitted if the handler fails.
+  def failing_handler(event, context):
+    raise ValueError('Sample failure')
+
+  with raises(ValueError):
+    metrics.instrument_handler(failing_handler)({}, None)
+  assert json.loads(capsys.readouterr().out)['RequestType'] == 'Unknown'
@@ -0,0 +1,69 @@
+from pytest import raises
+from requests import RequestException
+
+import metro_trains
+
+from stand_ins import FakeClock, FakeMetroTrainsServer
+
+def test_MetroTrainsClient_get_health_board():
+  clock = FakeClock()
+
+  with FakeMetroTrainsServer() as server:
+    client = metro_trains.MetroTrainsClient(server.endpoint, ttl=60, clock=clock)
+
+    # Fetches and parses the health board.
+    assert client.get_health_board()['82']['line_name'] == 'Alamein'
+    assert server.requests['total'] == 1
+
+    # Serves it from the cache within the TTL.
+    client.get_health_board()
+    assert server.requests['total'] == 1
+
+    # Revalidates with a conditional GET once stale.
+    clock.now += 61
+    assert client.get_health_board()['82']['line_name'] == 'Alamein'
+    assert server.requests['not_modified'] == 1
+
+    # Fetches the full board again when it has changed.
+    clock.now += 61
+    server.board = {'82': {'line_name': 'Alamein', 'alerts': [{'alert_type': 'major'}]}}
+    assert client.get_line_data(82)['status'] == 'major'
+    assert server.requests['total'] == 3
+
+def test_MetroTrainsClient_get_health_board_when_failing():
+  clock = FakeClock()
+
+  with FakeMetroTrainsServer() as server:
+    server.failing = True
+
+    # Raises if there's no last known board to fall back to.
+    with raises(RequestException):
+      metro_trains.MetroTrainsClient(server.endpoint, clock=clock).get_health_board()
+
+    # Otherwise, serves the last known board.
+    server.failing = False
+    client = metro_trains.MetroTrainsClient(server.endpoint, ttl=60, clock=clock)
+    client.get_health_board()
+    server.failing = True
+    clock.now += 61
+    assert client.get_line_data(84)['status'] == 'minor'
+
+def test_MetroTrainsClient_timeout():
+  with FakeMetroTrainsServer(latency=0.5) as server:
+    client = metro_trains.MetroTrainsClient(server.endpoint, read_timeout=0.1)
+
+    # Gives up on slow responses.
+    with raises(RequestException):
+      client.get_health_board()
+
+def test_MetroTrainsClient_get_line_data():
+  with FakeMetroTrainsServer() as server:
+    testable = metro_trains.MetroTrainsClient(server.endpoint).get_line_data
+
+    assert testable(82) == {'name': 'Alamein', 'status': 'good'}    # String alerts are good service.
+    assert testable(84) == {'name': 'Belgrave', 'status': 'minor'}  # The most recent alert is used.
+    assert testable(168307) == {'name': 'train', 'status': 'good'}  # Falls back without a name.
+
+    # Raises for unknown lines.
+    with raises(ValueError):
+      testable(1)
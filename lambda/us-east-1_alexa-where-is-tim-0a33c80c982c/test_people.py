@@ -0,0 +1,66 @@
+import json
+
+from pytest import raises
+
+import people
+
+def test_Person():
+  person = people.Person('sam', pronoun='she/her', metro_trains_line_id='86')
+
+  # Names default to the key, and configuration is parsed into the types the skill uses.
+  assert person.name == 'sam'
+  assert person.pronoun == ['she', 'her']
+  assert person.metro_trains_line_id == 86
+
+  # Anything not set is left as None, to fall back to the skill's own configuration.
+  assert person.timezone is None and people.Person('tim').pronoun is None
+
+def test_Registry_find():
+  registry = people.Registry([
+    people.Person('tim', 'Tim', users=['household']),
+    people.Person('sam', 'Sam', aliases=['Sammy Jo'], users=['household', 'sams-household']),
+    people.Person('alex', 'Alex', users=['alexs-household']),
+  ])
+
+  # People in the household asking are found by their name or an alias, however they're spoken.
+  assert registry.find('SAM', 'household').key == 'sam'
+  assert registry.find(' sammy  jo ', 'sams-household').key == 'sam'
+  assert registry.find('Jo', 'household') is None
+
+  # Otherwise, by the household asking - the first person in it if there's more than one.
+  assert registry.find(user_id='sams-household').key == 'sam'
+  assert registry.find(user_id='household').key == 'tim'
+
+  # Nobody can be found from outside their household, and users in no household find nobody.
+  assert registry.find('Alex', 'household') is None
+  assert registry.find('Tim', 'alexs-household') is None
+  assert registry.find(user_id='unknown') is None
+  assert registry.find('Tim', 'unknown') is None
+  assert registry.find() is None
+
+  # Unless there's just the one person, who anyone can ask about, by any name.
+  registry = people.load_registry(None, 'events')
+  assert registry.find(user_id='unknown').key == 'events'
+  assert registry.find('Tim', 'unknown').key == 'events'
+  assert registry.find('Sam').key == 'events'
+
+def test_load_registry():
+
+  # Without any configuration, there's just the one person, in the default partition.
+  registry = people.load_registry(None, 'events')
+  assert len(registry) == 1 and registry.default.key == 'events'
+  assert not registry.partitioned
+
+  # Otherwise, everyone configured is there, in their own partitions.
+  registry = people.load_registry(json.dumps({
+    'tim': {'name': 'Tim'}, 'sam': {'name': 'Sam', 'timezone': 'Australia/Perth'},
+  }), 'events')
+  assert len(registry) == 2 and registry.default.key == 'tim'
+  assert registry.get('sam').timezone == 'Australia/Perth'
+  assert registry.partitioned
+
+  # Configuration mistakes are reported.
+  with raises(ValueError):
+    people.load_registry(json.dumps({'tim': {'colour': 'blue'}}), 'events')
+  with raises(ValueError):
+    people.load_registry('{}', 'events')
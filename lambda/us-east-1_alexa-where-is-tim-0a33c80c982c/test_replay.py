@@ -0,0 +1,137 @@
+import gzip
+import json
+
+from datetime import date
+
+import replay
+import functions
+
+from stand_ins import generate_commute_items, make_event_item
+
+# Monday 14 January 2019, midnight in Melbourne.
+FIRST_DAY = 1547384400
+
+def _write_exports(directory, items):
+  """Writes half the items as a gzipped DynamoDB export, and half as a recorded scan page."""
+
+  export = str(directory.join('export.json.gz'))
+  with gzip.open(export, 'wt') as file:
+    file.writelines(json.dumps({'Item': item}) + '\n' for item in items[:len(items) // 2])
+
+  pages = str(directory.join('pages.json'))
+  with open(pages, 'w') as file:
+    file.write(json.dumps({'Items': items[len(items) // 2:]}) + '\n\n')
+
+  return [export, pages]
+
+def test_read_items(tmpdir):
+  items = list(generate_commute_items(7, FIRST_DAY))
+  counts = replay.Counter()
+
+  # Items are read the same from exports and from scan pages.
+  read = [
+    item for filename in _write_exports(tmpdir, items)
+    for item in replay.read_items(replay.read_lines(filename), counts)
+  ]
+  assert read == items and counts['items'] == len(items)
+
+  # Empty files have no lines.
+  empty = tmpdir.join('empty.json')
+  empty.write('')
+  assert list(replay.read_lines(str(empty))) == []
+
+def test_read_valid_events():
+  items = [
+    make_event_item('accurate', FIRST_DAY, accuracy=10),
+    make_event_item('inaccurate', FIRST_DAY, accuracy=1500),
+    {'eventId': {'S': 'unreadable'}},
+  ]
+  items[0]['event_partition'] = {'S': 'tim'}
+  counts = replay.Counter()
+
+  # Only accurate events are kept, with their partition.
+  partition_events = list(replay.read_valid_events(items, counts, 'events'))
+  assert [(partition, event.event_id) for partition, event in partition_events] == \
+    [('tim', 'accurate')]
+  assert counts == {'accurate': 1, 'inaccurate': 1, 'unreadable': 1}
+
+def test_reduce_newest_events():
+  events = [
+    ('tim', functions.LocationEvent(make_event_item(event_id, FIRST_DAY + offset)))
+    for event_id, offset in (('first', 0), ('second', 600), ('late', 7200))
+  ]
+  moments = [FIRST_DAY - 60, FIRST_DAY + 300, FIRST_DAY + 900, FIRST_DAY + 4000]
+
+  # Each moment gets the newest event before it, as long as it isn't too old.
+  newest = replay.reduce_newest_events(events, moments, max_age=3600)
+  assert {moment: event.event_id for (_, moment), event in newest.items()} == {
+    FIRST_DAY + 300: 'first', FIRST_DAY + 900: 'second', FIRST_DAY + 4000: 'second'
+  }
+
+def test_get_moments():
+  moments = replay.get_moments(date(2019, 1, 18), date(2019, 1, 21), every=30, hours=(16, 17))
+
+  # Every half hour from 4pm to 5pm on the Friday and the Monday, in Melbourne.
+  assert moments == [
+    FIRST_DAY + 4 * 86400 + 16 * 3600, FIRST_DAY + 4 * 86400 + 16.5 * 3600,
+    FIRST_DAY + 7 * 86400 + 16 * 3600, FIRST_DAY + 7 * 86400 + 16.5 * 3600,
+  ]
+
+def test_tune_ladder():
+  ladder = replay.tune_ladder({'almost_home': {'distance_from_home': 2500}})
+
+  # Only the limits asked for are changed.
+  assert ('almost_home', {'distance_from_home': 2500}, False) in ladder
+  assert ('at_home', {'distance_from_home': 50}, False) in ladder
+
+  # Rows that don't exist are caught.
+  try:
+    replay.tune_ladder({'nearly_home': {}})
+    assert False
+  except ValueError as error:
+    assert 'nearly_home' in str(error)
+
+def test_replay(tmpdir):
+  max_accuracy = functions.VALID_EVENT_MAX_ACCURACY_IN_METRES
+  exports = _write_exports(tmpdir, list(generate_commute_items(14, FIRST_DAY, 'tim')))
+  moments = replay.get_moments(date(2019, 1, 14), date(2019, 1, 25), every=30)
+
+  # Files read in separate processes have the same newest events as those read one by one.
+  newest, counts = replay.process_files(exports, moments)
+  assert replay.process_files(exports, moments, processes=2)[0].keys() == newest.keys()
+  assert counts['accurate'] + counts['inaccurate'] == counts['items']
+
+  # Each moment gets a location, from the same speech the skill uses.
+  said = list(replay.replay(newest, ['tim'], moments))
+  assert len(said) == len(moments)
+  assert {location for _, _, _, location, _ in said} >= {'at_work', 'on_the_way', 'at_home'}
+
+  # A tighter accuracy limit leaves fewer events, without changing the skill's own limit.
+  functions.VALID_EVENT_MAX_ACCURACY_IN_METRES = 5
+  try:
+    assert replay.process_files(exports, moments, max_accuracy=max_accuracy)[1] == counts
+  finally:
+    functions.VALID_EVENT_MAX_ACCURACY_IN_METRES = max_accuracy
+  assert replay.process_files(exports, moments, max_accuracy=5)[1]['accurate'] < \
+    counts['accurate']
+  assert functions.VALID_EVENT_MAX_ACCURACY_IN_METRES == max_accuracy
+
+def test_replay_checks_the_moment(tmpdir):
+  exports = _write_exports(tmpdir, list(generate_commute_items(7, FIRST_DAY, 'tim')))
+  moments = replay.get_moments(date(2019, 1, 14), date(2019, 1, 14), every=60, hours=(13, 18))
+  newest, _ = replay.process_files(exports, moments)
+
+  # Moments the skill wouldn't look anyone up at get the same answer it would have given.
+  said = [location for _, _, _, location, _ in replay.replay(newest, ['tim'], moments)]
+  assert said[:3] == ['too_early', 'bit_too_early', 'bit_too_early']
+  assert 'too_early' not in said[3:] and 'bit_too_early' not in said[3:]
+
+def test_main(tmpdir, capsys):
+  exports = _write_exports(tmpdir, list(generate_commute_items(7, FIRST_DAY)))
+
+  # A summary counts how often each location would have been said.
+  replay.main(exports + ['--first-day', '2019-01-14', '--last-day', '2019-01-18', '--summary',
+    '--processes', '1'])
+  lines = capsys.readouterr().out.splitlines()
+  assert lines[0] == 'person,location,times,share'
+  assert sum(int(line.split(',')[2]) for line in lines[1:]) == 5 * 18
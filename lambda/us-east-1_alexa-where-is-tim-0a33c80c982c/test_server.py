@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import asyncio
+import subprocess
+
+from time import sleep
+from pytest import raises
+
+import server
+
+FALLBACK_ENVELOPE = {
+  'version': '1.0',
+  'context': {'System': {
+    'application': {'applicationId': 'amzn1.ask.skill.test'}, 'user': {'userId': 'test'},
+  }},
+  'request': {
+    'type': 'IntentRequest', 'requestId': 'amzn1.echo-api.request.test', 'locale': 'en-AU',
+    'timestamp': '2019-01-14T07:30:00Z', 'intent': {'name': 'AMAZON.FallbackIntent'},
+  },
+}
+
+def _request(method='POST', path='/', body=b'', keep_alive=True):
+  return (
+    method + ' ' + path + ' HTTP/1.1\r\nHost: localhost\r\nContent-Length: ' + str(len(body)) + \
+    '\r\n' + ('' if keep_alive else 'Connection: close\r\n') + '\r\n'
+  ).encode('latin-1') + body
+
+async def _read_response(reader):
+  status_line = await reader.readline()
+  headers = {}
+  while True:
+    line = (await reader.readline()).decode('latin-1').strip()
+    if not line: break
+    name, _, value = line.partition(':')
+    headers[name.lower()] = value.strip()
+  body = await reader.readexactly(int(headers['content-length']))
+  return int(status_line.split()[1]), headers, json.loads(body)
+
+def _serve(testable, client):
+  """Starts a server on a free port, runs the client against it, then shuts the server down."""
+
+  async def run():
+    port = await testable.start('127.0.0.1', 0)
+    try:
+      return await client(*await asyncio.open_connection('127.0.0.1', port))
+    finally:
+      await testable.shutdown(timeout=1)
+
+  return server.run(run())
+
+def test_run(monkeypatch):
+  async def answer():
+    await asyncio.sleep(0)
+    return 42
+
+  # Coroutines run to completion, with or without asyncio.run() - which Python 3.6 doesn't have.
+  assert server.run(answer()) == 42
+  monkeypatch.delattr(asyncio, 'run')
+  assert server.run(answer()) == 42
+
+def test_read_request():
+  async def read(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await server.read_request(reader)
+
+  # Requests are kept alive unless they ask not to be.
+  assert server.run(read(_request(body=b'{}'))) == \
+    ('POST', '/', {'Host': 'localhost', 'Content-Length': '2'}, b'{}', True)
+  assert server.run(read(_request(keep_alive=False)))[4] == False
+
+  # A closed connection has no request.
+  assert server.run(read(b'')) is None
+
+  # Oversized bodies are refused before they're read.
+  try:
+    server.run(read(_request(body=b'x' * (server.SERVER_MAX_BODY_BYTES + 1))))
+    assert False
+  except server.RequestError as error:
+    assert error.status == 413
+
+def test_SkillServer():
+  testable = server.SkillServer(lambda body, headers: {'echo': json.loads(body)}, workers=2)
+
+  async def client(reader, writer):
+    responses = []
+    for request in (
+      _request(body=b'{"number": 1}'), _request(body=b'{"number": 2}'),
+      _request('GET', '/health'), _request('PUT'),
+    ):
+      writer.write(request)
+      responses.append(await _read_response(reader))
+    writer.close()
+    return responses
+
+  # Requests on the one connection are each handled in turn.
+  responses = _serve(testable, client)
+  assert [status for status, _, _ in responses] == [200, 200, 200, 405]
+  assert responses[1][2] == {'echo': {'number': 2}}
+  assert responses[1][1]['connection'] == 'keep-alive'
+  assert responses[2][2]['requests'] == 2
+
+def test_SkillServer_max_pending():
+  testable = server.SkillServer(lambda body, headers: {}, workers=1, max_pending=0)
+
+  async def client(reader, writer):
+    writer.write(_request(body=b'{}'))
+    return await _read_response(reader)
+
+  # Requests beyond the limit are turned away, rather than queued.
+  assert _serve(testable, client)[0] == 503
+  assert testable.stats.rejected == 1
+
+def test_SkillServer_failing_dispatch():
+  def failing_dispatch(body, headers):
+    raise ValueError('Failed')
+
+  testable = server.SkillServer(failing_dispatch, workers=1)
+
+  async def client(reader, writer):
+    writer.write(_request(body=b'{}'))
+    return await _read_response(reader)
+
+  assert _serve(testable, client)[0] == 500
+  assert testable.stats.errors == 1
+
+def test_SkillServer_shutdown():
+  def slow_dispatch(body, headers):
+    sleep(0.2)
+    return {'done': True}
+
+  testable = server.SkillServer(slow_dispatch, workers=1)
+
+  async def client(reader, writer):
+    writer.write(_request(body=b'{}'))
+    await asyncio.sleep(0.05)
+    shutdown = asyncio.ensure_future(testable.shutdown(timeout=1))
+    response = await _read_response(reader)
+    await shutdown
+    return response, await reader.read()
+
+  # A request that's being handled is finished before shutting down, and its connection closed.
+  (status, headers, body), rest = _serve(testable, client)
+  assert status == 200 and body == {'done': True}
+  assert headers['connection'] == 'close' and rest == b''
+
+def test_create_dispatcher():
+  dispatch = server.create_dispatcher(verify=False)
+
+  # Envelopes are handled by the skill's own handlers.
+  response = dispatch(json.dumps(FALLBACK_ENVELOPE).encode('utf-8'))
+  assert 'not sure exactly what' in response['response']['outputSpeech']['ssml']
+
+def test_create_dispatcher_verifies_by_default():
+  def verify_requests(**env):
+    environment = {name: value for name, value in os.environ.items()
+      if name != 'SERVER_VERIFY_REQUESTS'}
+    environment.update(env)
+    return subprocess.check_output(
+      [sys.executable, '-c', 'import server; print(server.SERVER_VERIFY_REQUESTS)'],
+      cwd=os.path.dirname(os.path.abspath(server.__file__)), env=environment,
+    ).decode('utf-8').strip()
+
+  # Requests are verified unless that's explicitly turned off.
+  assert verify_requests() == 'True'
+  assert verify_requests(SERVER_VERIFY_REQUESTS='false') == 'False'
+
+  # And if verifying them isn't possible, nothing is served rather than serving without it.
+  try:
+    import ask_sdk_webservice_support
+  except ImportError:
+    with raises(ImportError):
+      server.create_dispatcher()
@@ -0,0 +1,160 @@
+from pytest import mark, raises
+
+import speech
+import functions
+
+from datetime import datetime
+from stand_ins import make_event_item
+
+def test_compile_phrasing():
+
+  # Pronouns and sound effects are filled in.
+  assert speech.compile_phrasing("{they}'s waiting for {them}.", ['she', 'her']) == \
+    "she's waiting for her."
+  assert speech.compile_phrasing('Done!{sound:crowd_cheer_med_01}', ['he', 'him']) == \
+    'Done!' + functions.alexa_sound_effect('crowd_cheer_med_01')
+
+  # Other fields are left to be rendered.
+  assert speech.compile_phrasing('About {time} away.', ['he', 'him']) == 'About {time} away.'
+
+  # Braces in pronouns are kept as they are once rendered.
+  template = speech.Template(speech.compile_phrasing('{they} is {time} away.', ['{x}', 'y']))
+  assert template.render({'time': '5 minutes'}) == '{x} is 5 minutes away.'
+
+def test_Template_render():
+  template = speech.Template('In {suburb}, about {time} away.')
+
+  # Values can be given directly, or as functions to call.
+  assert template.render({'suburb': 'Box Hill', 'time': lambda: '5 minutes'}) == \
+    'In Box Hill, about 5 minutes away.'
+
+  # Functions for values the template doesn't use aren't called.
+  def unused():
+    raise AssertionError('This value should not have been worked out')
+
+  assert speech.Template('Nearly there!').render({'time': unused}) == 'Nearly there!'
+  assert speech.Template('{time} to go.').render({'time': '1 hour', 'suburb': unused}) == \
+    '1 hour to go.'
+
+def test_compile_templates():
+  templates = speech.compile_templates(['he', 'him'])
+
+  # Every phrasing is compiled, with nothing left to fill in but the per-request values.
+  assert set(templates) == set(speech.PHRASINGS)
+  for name, choices in templates.items():
+    assert len(choices) == len(speech.PHRASINGS[name])
+    for template in choices:
+      assert set(template.fields) <= {'time', 'suburb', 'arrival', 'line', 'person'}
+      assert '{they}' not in template.text and '{sound:' not in template.text
+
+  # Every row of the ladder has phrasings.
+  for name, _, _ in speech.LOCATION_LADDER:
+    assert name in templates
+
+def test_render():
+  templates = speech.compile_templates(['he', 'him'])
+  assert speech.render(templates, 'train_suspended', line='Craigieburn') == \
+    'However, Metro tells me the Craigieburn line is suspended, so he could be a lot later.'
+
+def test_render_location():
+  class TimeFromHome:
+    checked = 0
+    @property
+    def seconds(self):
+      self.checked += 1
+      return 600
+
+  templates = speech.compile_templates(['he', 'him'])
+  event = functions.LocationEvent(make_event_item(1, 1547445600,
+    address={'S': '1 Main Street, Box Hill, VIC'}))
+  now = datetime.fromtimestamp(1547445600)
+  time_from_home = TimeFromHome()
+
+  # Phrasings without any fields don't work anything out.
+  assert speech.render_location(templates, 'any_minute', event, now, time_from_home) == \
+    "he'll be here any minute!"
+  assert time_from_home.checked == 0
+
+  # And those with fields only work out the ones they use.
+  templates['on_the_way'] = [speech.Template('In {suburb}, about {time} away.')]
+  assert speech.render_location(templates, 'on_the_way', event, now, time_from_home) == \
+    'In Box Hill, about 10 minutes away.'
+  assert time_from_home.checked == 1
+
+def test_select_moment():
+
+  # Weekends, and weekdays before 4pm, aren't the moment to look for anyone.
+  assert speech.select_moment(datetime(2019, 1, 19, 17)) == 'not_at_work_today'
+  assert speech.select_moment(datetime(2019, 1, 14, 13, 59)) == 'too_early'
+  assert speech.select_moment(datetime(2019, 1, 14, 15, 59)) == 'bit_too_early'
+  assert speech.select_moment(datetime(2019, 1, 14, 16)) is None
+
+@mark.parametrize('values, expected', [
+  ({'distance_from_work': 10, 'distance_from_home': 30000, 'minutes_from_home': 60, 'hour': 16},
+    ('at_work', True)),
+  ({'distance_from_work': 50, 'distance_from_home': 30000, 'minutes_from_home': 60, 'hour': 17},
+    ('at_work_late', True)),
+  ({'distance_from_work': 51, 'distance_from_home': 30000, 'minutes_from_home': 60, 'hour': 17},
+    ('just_left_work', True)),
+  ({'distance_from_work': 30000, 'distance_from_home': 50, 'minutes_from_home': 0, 'hour': 18},
+    ('at_home', False)),
+  ({'distance_from_work': 30000, 'distance_from_home': 400, 'minutes_from_home': 1, 'hour': 18},
+    ('any_minute', False)),
+  ({'distance_from_work': 30000, 'distance_from_home': 400, 'minutes_from_home': 2, 'hour': 18},
+    ('around_the_corner', False)),
+  ({'distance_from_work': 30000, 'distance_from_home': 400, 'minutes_from_home': 0, 'hour': 18},
+    ('around_the_corner', False)),
+  ({'distance_from_work': 30000, 'distance_from_home': 400, 'minutes_from_home': 5, 'hour': 18},
+    ('under_5_minutes', False)),
+  ({'distance_from_work': 30000, 'distance_from_home': 200, 'minutes_from_home': 6, 'hour': 18},
+    ('almost_here', False)),
+  ({'distance_from_work': 30000, 'distance_from_home': 1800, 'minutes_from_home': 6, 'hour': 18},
+    ('almost_home', False)),
+  ({'distance_from_work': 20000, 'distance_from_home': 10000, 'minutes_from_home': 30, 'hour': 18},
+    ('on_the_way', True)),
+])
+def test_select_location(values, expected):
+  assert speech.select_location(speech.compile_ladder(), values) == expected
+
+def test_select_location_with_custom_ladder():
+  ladder = speech.compile_ladder((
+    ('close', {'distance_from_home': 100}, False),
+    ('far', {'distance_from_home': 1000}, True),
+  ))
+
+  assert speech.select_location(ladder, {'distance_from_home': 100}) == ('close', False)
+  assert speech.select_location(ladder, {'distance_from_home': 101}) == ('far', True)
+
+  # There's no catch-all row in this ladder.
+  with raises(ValueError):
+    speech.select_location(ladder, {'distance_from_home': 1001})
+
+  # Rows can have a lowest value too, as a (lowest, highest) pair.
+  ladder = speech.compile_ladder((
+    ('exactly_one', {'minutes_from_home': (1, 1)}, False),
+    ('up_to_two', {'minutes_from_home': [0, 2]}, False),
+  ))
+  assert speech.select_location(ladder, {'minutes_from_home': 0}) == ('up_to_two', False)
+  assert speech.select_location(ladder, {'minutes_from_home': 1}) == ('exactly_one', False)
+  assert speech.select_location(ladder, {'minutes_from_home': 2}) == ('up_to_two', False)
+  with raises(ValueError):
+    speech.select_location(ladder, {'minutes_from_home': -1})
+
+def test_select_location_with_lazy_values():
+  checked = []
+  def minutes_from_home():
+    checked.append(True)
+    return 30
+
+  # Values that are functions aren't called when the rows that match don't check them.
+  values = {
+    'distance_from_work': 10, 'distance_from_home': 30000, 'minutes_from_home': minutes_from_home,
+    'hour': 16,
+  }
+  assert speech.select_location(speech.compile_ladder(), values) == ('at_work', True)
+  assert not checked
+
+  # And are only called once when they are.
+  values.update(distance_from_work=20000, distance_from_home=10000)
+  assert speech.select_location(speech.compile_ladder(), values) == ('on_the_way', True)
+  assert checked == [True]
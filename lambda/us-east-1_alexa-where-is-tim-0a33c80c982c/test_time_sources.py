@@ -0,0 +1,80 @@
+from time import monotonic
+from pytest import raises
+
+import functions
+import time_sources
+
+from stand_ins import make_event_item
+
+def _event(distance_from_home=20000, time_from_home=3000, **times):
+  item = make_event_item(1, 1547445600, distance_from_home=distance_from_home,
+    distance_from_work=30000 - distance_from_home, time_from_home=time_from_home)
+  if time_from_home is None: del item['time_from_home_public_transport']
+  for mode, seconds in times.items():
+    item[functions.TIME_FROM_HOME_PREFIX + mode] = {'N': str(seconds)}
+  return functions.LocationEvent(item)
+
+def test_compile_sources():
+  sources = time_sources.compile_sources(' estimated, train_adjusted,,driving ')
+  assert [name for name, _, _ in sources] == ['estimated', 'train_adjusted', 'driving']
+  assert [slow for _, _, slow in sources] == [False, True, False]
+
+def test_get_attributes():
+  sources = time_sources.compile_sources(
+    'estimated,train_adjusted,public_transport,driving,distance'
+  )
+
+  # Each source's attribute is read once, and the distance doesn't need one of its own.
+  assert time_sources.get_attributes(sources) == (
+    'time_from_home_estimated', 'time_from_home_public_transport', 'time_from_home_driving'
+  )
+
+def test_resolve():
+  sources = time_sources.compile_sources('estimated,driving,public_transport,distance')
+
+  # The first source with a time is used.
+  assert time_sources.resolve(_event(estimated=2400, driving=1200), sources) == (2400, 'estimated')
+  assert time_sources.resolve(_event(driving=1200), sources) == (1200, 'driving')
+  assert time_sources.resolve(_event(), sources) == (3000, 'public_transport')
+
+  # The rough distance fallback is the last resort.
+  event = _event(time_from_home=None)
+  assert time_sources.resolve(event, sources) == (20000 // 6, 'distance')
+
+  # It's an error if there's no time at all.
+  with raises(ValueError):
+    time_sources.resolve(event, time_sources.compile_sources('public_transport'))
+
+def test_resolve_train_adjusted():
+  sources = time_sources.compile_sources('train_adjusted,public_transport')
+  fetched = []
+
+  def train_line_data(status='major'):
+    fetched.append(status)
+    return {'name': 'Craigieburn', 'status': status}
+
+  # The train line status adds on a delay.
+  lookups = {'train_line_data': train_line_data}
+  assert time_sources.resolve(_event(), sources, lookups) == (3000 + 1200, 'train_adjusted')
+  assert time_sources.resolve(_event(), sources, {'train_line_data': lambda: None}) == \
+    (3000, 'public_transport')
+
+  # But isn't waited for without a line, close to home, or after the deadline.
+  fetched.clear()
+  assert time_sources.resolve(_event(), sources) == (3000, 'public_transport')
+  assert time_sources.resolve(_event(1000, 600), sources, lookups) == (600, 'public_transport')
+  assert time_sources.resolve(_event(), sources, lookups, monotonic() - 1) == \
+    (3000, 'public_transport')
+  assert not fetched
+
+def test_TimeFromHome():
+  calls = []
+  def source(event, lookups):
+    calls.append(event)
+    return 600
+
+  # Nothing is worked out until the time is asked for, and then only once.
+  time_from_home = time_sources.TimeFromHome(_event(), (('test', source, False),))
+  assert not calls and time_from_home.source is None
+  assert time_from_home.seconds == 600 and time_from_home.seconds == 600
+  assert len(calls) == 1 and time_from_home.source == 'test'
@@ -0,0 +1,162 @@
+"""
+Where the time it'll take someone to get home comes from.
+
+Each source is a function that returns an event's time from home in seconds, or None if it doesn't
+have one. Sources are listed most accurate first in TIME_SOURCES, and worked through in one pass:
+the first to have a time wins, so less accurate sources are never worked out when a better one has
+a time. Sources are:
+
+  - `estimated`: the blended estimate ingest.py keeps on the current event - see estimator.py.
+  - `train_adjusted`: the public transport time, plus a delay for the train line's status. This
+    waits for the Metro Trains fetch that's already under way, so it's skipped once the deadline
+    has passed, and for anyone close enough to home to be past the trains.
+  - `distance`: a rough fallback rather than a routing estimate - just the distance from home at a
+    flat average speed, whatever the route or mode of transport. Every event has a distance, so
+    it's the last resort.
+  - Any other name, such as `public_transport` or `driving`, reads the event's own
+    `time_from_home_<name>` attribute.
+
+Nothing is worked out until the time is first asked for, because many responses - eg. when someone
+is at work or already home - never need it.
+
+@author Tim Malone <tim@timmalone.id.au>
+"""
+
+import functions
+
+from os import getenv
+from time import monotonic
+
+# The sources of a time from home to use, most accurate first, separated by commas.
+TIME_SOURCES = getenv('TIME_SOURCES', 'estimated,train_adjusted,public_transport,distance')
+
+# The flat average speed the distance fallback assumes over the distance from home, in metres per
+# second.
+DISTANCE_SOURCE_SPEED = 6
+
+# How much longer each train line status is likely to make the trip, in seconds.
+TRAIN_DELAYS_IN_SECONDS = {
+  'travel': 300,
+  'works': 600,
+  'minor': 600,
+  'major': 1200,
+  'suspended': 1800,
+}
+
+# Within this distance of home, in metres, someone is past the trains - as in speech.py, where this
+# is 'almost home' - so their status no longer holds them up.
+TRAIN_MAX_DISTANCE_FROM_HOME = 1800
+
+class TimeFromHome:
+  """
+  An event's time from home, worked out from the first of a list of sources to have one - but only
+  when it's first asked for.
+  """
+
+  __slots__ = ('event', 'sources', 'lookups', 'deadline', '_seconds', '_source')
+
+  def __init__(self, event, sources, lookups=None, deadline=None):
+    self.event = event
+    self.sources = sources
+    self.lookups = lookups or {}
+    self.deadline = deadline
+    self._source = None
+
+  def __repr__(self):
+    if self._source is None:
+      return 'TimeFromHome(unresolved)'
+    return 'TimeFromHome(' + str(self._seconds) + ' from ' + self._source + ')'
+
+  @property
+  def seconds(self):
+    if self._source is None:
+      self._seconds, self._source = resolve(self.event, self.sources, self.lookups, self.deadline)
+    return self._seconds
+
+  @property
+  def source(self):
+    """The name of the source the time came from, or None if it hasn't been worked out yet."""
+    return self._source
+
+def from_attribute(mode):
+  """A source that reads an event's own `time_from_home_<mode>` attribute."""
+
+  def source(event, lookups):
+    if mode not in event.time_from_home_modes:
+      return None
+    return event.get_time_from_home(mode)
+
+  return source
+
+def rough_time_from_distance(event, lookups):
+  """
+  The distance fallback: the distance from home at DISTANCE_SOURCE_SPEED. It knows nothing about the
+  route, the mode of transport or delays, so it's only for when no other source has a time.
+  """
+  return int(event.distance_from_home / DISTANCE_SOURCE_SPEED)
+
+def from_train_status(event, lookups):
+  get_train_line_data = lookups.get('train_line_data')
+
+  if get_train_line_data is None or event.distance_from_home <= TRAIN_MAX_DISTANCE_FROM_HOME:
+    return None
+
+  time_from_home = from_attribute('public_transport')(event, lookups)
+  if time_from_home is None:
+    return None
+
+  line_data = get_train_line_data()
+  if line_data is None:
+    return None
+
+  return time_from_home + TRAIN_DELAYS_IN_SECONDS.get(line_data['status'], 0)
+
+# The built-in sources, as functions and whether they may wait on something slow.
+SOURCES = {
+  'train_adjusted': (from_train_status, True),
+  'distance': (rough_time_from_distance, False),
+}
+
+# The event attributes each built-in source reads, beyond those every event is read with.
+SOURCE_ATTRIBUTES = {
+  'train_adjusted': (functions.TIME_FROM_HOME_PREFIX + 'public_transport',),
+  'distance': (),
+}
+
+def compile_sources(names=TIME_SOURCES):
+  """Looks up each named source, returning a tuple of (name, function, whether it's slow)."""
+  return tuple(
+    (name,) + SOURCES.get(name, (from_attribute(name), False))
+    for name in (name.strip() for name in names.split(',')) if name
+  )
+
+def get_attributes(sources):
+  """Returns the `time_from_home_*` event attributes the compiled sources read, without repeats."""
+  attributes = (
+    attribute for name, source, slow in sources
+    for attribute in SOURCE_ATTRIBUTES.get(name, (functions.TIME_FROM_HOME_PREFIX + name,))
+  )
+  return tuple(dict.fromkeys(attributes))
+
+def resolve(event, sources, lookups=None, deadline=None):
+  """
+  Returns an event's time from home in seconds, and the name of the source it came from, from the
+  first of the compiled sources to have one. Slow sources are skipped once the monotonic `deadline`
+  has passed. Raises a ValueError if none of them have a time.
+  """
+
+  lookups = lookups or {}
+
+  for name, source, slow in sources:
+    if slow and deadline is not None and monotonic() >= deadline:
+      continue
+
+    try:
+      seconds = source(event, lookups)
+    except (KeyError, ValueError):
+      seconds = None
+
+    if seconds is not None:
+      return seconds, name
+
+  raise ValueError('None of the time sources have a time from home for ' + repr(event))